@@ -12,6 +12,76 @@ import sys
 from setuptools import setup, find_packages
 
 
+# The C helper libraries, [name, sources, libraries]. These are the same
+# libraries as in SConstruct.
+c_libraries = [["c_image_manipulation", ["storm_control/hal4000/halLib/c_image_manipulation.c"], []],
+               ["focus_quality", ["storm_control/hal4000/focusLock/focus_quality.c"], []],
+               ["LMMoment", ["storm_control/hal4000/spotCounter/LMMoment.c"], []],
+               ["corr_2d_gauss", ["storm_control/sc_hardware/utility/corr_2d_gauss.c"], ["m"]],
+               ["af_lock", ["storm_control/sc_hardware/utility/af_lock.c"], ["fftw3", "m"]]]
+
+
+class BuildCLibraries(distutils.cmd.Command):
+    """
+    Build the C helper libraries into storm_control/c_libraries.
+
+    This uses scons if it is available, otherwise the libraries are
+    compiled directly with the default C compiler. Libraries that fail
+    to build are skipped, the Python code will use the numpy versions
+    instead.
+
+    On Windows we use the pre-compiled DLLs.
+    """
+    description = "build the C helper libraries"
+    user_options = []
+
+    def initialize_options(self):
+        pass
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        if (platform.system() == "Windows"):
+            print("Using pre-compiled C libraries.")
+            return
+
+        try:
+            subprocess.check_call(["scons", "-Q"])
+            return
+        except (OSError, subprocess.CalledProcessError):
+            print("scons failed or is not installed, building the C libraries with the default compiler.")
+
+        import distutils.ccompiler
+        import distutils.errors
+        import distutils.sysconfig
+
+        compiler = distutils.ccompiler.new_compiler()
+        distutils.sysconfig.customize_compiler(compiler)
+        output_dir = os.path.join("storm_control", "c_libraries")
+        for [name, sources, libraries] in c_libraries:
+            try:
+                objects = compiler.compile(sources,
+                                           output_dir = self.get_finalized_command("build").build_temp,
+                                           extra_postargs = ["-O3", "-Wall", "-fPIC"])
+                compiler.link_shared_lib(objects,
+                                         name,
+                                         output_dir = output_dir,
+                                         libraries = libraries)
+            except (distutils.errors.CompileError, distutils.errors.LinkError):
+                print("Could not build the", name, "library, the numpy version will be used.")
+
+
+class BuildPy(setuptools.command.build_py.build_py):
+    """
+    Build the C libraries before collecting the Python files so
+    that they get included as package data.
+    """
+    def run(self):
+        self.run_command("build_c")
+        super().run()
+
+
 version = "2.0"
 description = "STORM microscope control code."
 long_description = ""
@@ -28,7 +98,12 @@ setup(
     zip_safe=False,
     packages=find_packages(),
 
-    package_data={},
+    cmdclass={"build_c" : BuildCLibraries,
+              "build_py" : BuildPy},
+
+    package_data={"storm_control" : ["c_libraries/*.dll",
+                                     "c_libraries/*.dylib",
+                                     "c_libraries/*.so"]},
     exclude_package_data={},
     include_package_data=True,
 
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Compares the speed of the C libraries and their numpy versions
+at different frame sizes, and of the focus lock fitters at
+different ROI sizes.
+
+Usage:
+  python -m storm_control.c_libraries.benchmark [--reps 20]
+"""
+
+import argparse
+import numpy
+import time
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.focusLock.focusQuality as focusQuality
+import storm_control.hal4000.halLib.c_image_manipulation_c as cImageManipulation
+import storm_control.hal4000.spotCounter.lmmObjectFinder as lmmObjectFinder
+import storm_control.sc_hardware.utility.af_lock_c as afLockC
+import storm_control.sc_hardware.utility.corr_2d_gauss_c as corr2DGauss
+
+
+def createFrame(size):
+    """
+    A frame with a background and some spots.
+    """
+    image = numpy.random.poisson(100, size = (size, size)).astype(numpy.uint16)
+    for i in range(100):
+        [x, y] = numpy.random.randint(5, size - 5, size = 2)
+        image[x-1:x+2,y-1:y+2] += 500
+    return frame.Frame(image.flatten(), 0, size, size, "na")
+
+
+def createSpot(size, dx, dy, sigma):
+    """
+    An image with a background and a single spot near the center.
+    """
+    [x, y] = numpy.mgrid[0:size, 0:size]
+    x = x - (0.5 * size + dx)
+    y = y - (0.5 * size + dy)
+    image = 1000.0 * numpy.exp(-(x*x + y*y)/(2.0 * sigma * sigma))
+    return (numpy.random.poisson(100, size = (size, size)) + image).astype(numpy.uint16)
+
+
+def afLockFitter(size, use_numpy):
+    """
+    Find the offset between two images of the autofocus lock spot.
+    """
+    image1 = createSpot(size, 0.0, 0.0, 0.125 * size)
+    image2 = createSpot(size, 1.3, -2.4, 0.125 * size)
+    if use_numpy:
+        afc = afLockC.AFLockPy(offset = 100.0)
+    else:
+        afc = afLockC.AFLockC(offset = 100.0)
+    return [lambda : afc.findOffsetU16NM(image1, image2, verbose = False), afc.cleanup]
+
+
+def corrFitter(size, use_numpy):
+    """
+    Find the location of a spot in a ROI of the correlation lock.
+    """
+    roi = createSpot(size, 0.3, -0.7, 2.0).astype(numpy.float64)
+    roi -= numpy.min(roi)
+    if use_numpy:
+        c2dg = corr2DGauss.Corr2DGaussPyNCG(size = (size, size), sigma = 2.0)
+    else:
+        c2dg = corr2DGauss.Corr2DGaussCNCG(size = (size, size), sigma = 2.0, verbose = False)
+
+    def fit():
+        c2dg.setImage(roi)
+        return c2dg.maximize()
+
+    return [fit, c2dg.cleanup]
+
+
+def timeIt(fn, reps):
+    fn()
+    start = time.perf_counter()
+    for i in range(reps):
+        fn()
+    return (time.perf_counter() - start)/reps
+
+
+def benchmark(sizes, lock_sizes, reps):
+    lmmObjectFinder.initialize()
+
+    tests = [["rescaleImage",
+              cImageManipulation.image_manip is not None,
+              lambda f, use_numpy: cImageManipulation.rescaleImage(f.getData().reshape(f.image_y, f.image_x),
+                                                                   False, False, False,
+                                                                   [100, 1000], 65000,
+                                                                   use_numpy = use_numpy)],
+             ["imageGradient",
+              focusQuality.focus_quality is not None,
+              lambda f, use_numpy: focusQuality.imageGradient(f, use_numpy = use_numpy)],
+             ["findObjects",
+              lmmObjectFinder.lmmoment is not None,
+              lambda f, use_numpy: lmmObjectFinder.findObjects(f, 200, use_numpy = use_numpy)]]
+
+    print("{0:15s} {1:>6s} {2:>12s} {3:>12s} {4:>8s}".format("function", "size", "C (ms)", "numpy (ms)", "ratio"))
+    for [name, have_c, fn] in tests:
+        for size in sizes:
+            a_frame = createFrame(size)
+            t_numpy = 1000.0 * timeIt(lambda : fn(a_frame, True), reps)
+            if have_c:
+                t_c = 1000.0 * timeIt(lambda : fn(a_frame, False), reps)
+                print("{0:15s} {1:6d} {2:12.3f} {3:12.3f} {4:8.2f}".format(name, size, t_c, t_numpy, t_numpy/t_c))
+            else:
+                print("{0:15s} {1:6d} {2:>12s} {3:12.3f}".format(name, size, "NA", t_numpy))
+        print()
+
+    lmmObjectFinder.cleanUp()
+
+    lock_tests = [["corr_2d_gauss", corr2DGauss.c2dg is not None, corrFitter],
+                  ["af_lock", afLockC.af is not None, afLockFitter]]
+
+    for [name, have_c, fitter] in lock_tests:
+        for size in lock_sizes:
+            numpy.random.seed(size)
+            [fn, cleanup] = fitter(size, True)
+            t_numpy = 1000.0 * timeIt(fn, reps)
+            cleanup()
+            if have_c:
+                numpy.random.seed(size)
+                [fn, cleanup] = fitter(size, False)
+                t_c = 1000.0 * timeIt(fn, reps)
+                cleanup()
+                print("{0:15s} {1:6d} {2:12.3f} {3:12.3f} {4:8.2f}".format(name, size, t_c, t_numpy, t_numpy/t_c))
+            else:
+                print("{0:15s} {1:6d} {2:>12s} {3:12.3f}".format(name, size, "NA", t_numpy))
+        print()
+
+
+if (__name__ == "__main__"):
+
+    parser = argparse.ArgumentParser(description = 'C library versus numpy benchmark.')
+    parser.add_argument('--reps', dest='reps', type=int, required=False, default=20,
+                        help = "The number of repetitions for each test.")
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', required=False,
+                        default=[128, 256, 512, 1024, 2048],
+                        help = "The (square) frame sizes to test.")
+    parser.add_argument('--lock-sizes', dest='lock_sizes', type=int, nargs='+', required=False,
+                        default=[16, 32, 64, 128],
+                        help = "The (square) image sizes to test the focus lock fitters with.")
+
+    args = parser.parse_args()
+    benchmark(args.sizes, args.lock_sizes, args.reps)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -33,6 +33,7 @@ import storm_control.dave.sequenceViewer as sequenceViewer
 
 # Communication
 import storm_control.sc_library.tcpClient as tcpClient
+import storm_control.sc_library.tcpMessage as tcpMessage
 
 # UI
 import storm_control.dave.qtdesigner.dave_ui as daveUi
@@ -46,6 +47,8 @@ import storm_control.sc_library.parameters as params
 # This class handles the execution of commands that can be given to Dave
 #
 class CommandEngine(QtCore.QObject):
+    batch_done = QtCore.pyqtSignal(object)
+    batch_failed = QtCore.pyqtSignal(bool)
     done = QtCore.pyqtSignal()
     paused = QtCore.pyqtSignal()
     problem = QtCore.pyqtSignal(object)
@@ -60,9 +63,16 @@ class CommandEngine(QtCore.QObject):
         QtCore.QObject.__init__(self, parent)
 
         # Set defaults
+        self.batch = None
+        self.batch_message = None
         self.command = None
         
         self.test_mode = False
+
+        # Wait for the response to a batch of test messages before giving up on it.
+        self.batch_timer = QtCore.QTimer(self)
+        self.batch_timer.setSingleShot(True)
+        self.batch_timer.timeout.connect(self.handleBatchTimerDone)
         
         # HAL Client
         self.HALClient = tcpClient.TCPClient(port = 9000,
@@ -80,7 +90,39 @@ class CommandEngine(QtCore.QObject):
     #
     @hdebug.debug
     def abort(self):
-        self.command.abort()
+        if self.batch is not None:
+            self.stopBatch()
+            self.done.emit()
+        else:
+            self.command.abort()
+
+    ## startBatch
+    #
+    # Validate a list of HAL commands with a single 'Validate Batch' message.
+    # When HAL responds the batch_done signal is emitted with a list of the
+    # test messages. If HAL could not validate the batch the batch_failed
+    # signal is emitted instead, this is False if HAL does not support batches.
+    #
+    # @param commands A list of DaveActions.
+    #
+    def startBatch(self, commands):
+        self.batch = commands
+
+        delay = 0
+        messages = []
+        for command in self.batch:
+            message = command.getMessage()
+            message.setTestMode(True)
+            messages.append(message.toDict())
+            delay += command.lost_message_delay
+
+        self.batch_message = tcpMessage.TCPMessage(message_type = "Validate Batch",
+                                                   message_data = {"messages" : messages},
+                                                   test_mode = True)
+        
+        self.HALClient.messageReceived.connect(self.handleBatchReply)
+        self.batch_timer.start(delay)
+        self.HALClient.sendMessage(self.batch_message)
 
     ## startCommand
     #
@@ -126,6 +168,42 @@ class CommandEngine(QtCore.QObject):
         
         self.done.emit()
 
+    ## handleBatchReply
+    #
+    # Handle HAL's response to a batch of test messages.
+    #
+    # @param message A TCP message object
+    #
+    def handleBatchReply(self, message):
+        commands = self.batch
+        self.stopBatch()
+
+        # Check that this is the response to the batch and that HAL knows how
+        # to handle batches (older versions of HAL don't).
+        if not (message.getID() == self.batch_message.getID()):
+            self.batch_failed.emit(True)
+            return
+        
+        responses = message.getResponse("messages")
+        if message.hasError() or (responses is None):
+            self.batch_failed.emit(False)
+            return
+
+        if (len(responses) != len(commands)):
+            self.batch_failed.emit(True)
+            return
+
+        # The responses are checked by the DaveActions, see Dave.handleBatchDone().
+        self.batch_done.emit([tcpMessage.TCPMessage.fromDict(response) for response in responses])
+
+    ## handleBatchTimerDone
+    #
+    # HAL did not respond to a batch of test messages.
+    #
+    def handleBatchTimerDone(self):
+        self.stopBatch()
+        self.batch_failed.emit(True)
+
     ## handleErrorSignal
     #
     # Handle an error signal
@@ -142,6 +220,79 @@ class CommandEngine(QtCore.QObject):
         self.warning.emit(message)
         self.handleActionComplete(message)
 
+    ## stopBatch
+    #
+    # Stop waiting for HAL's response to a batch of test messages.
+    #
+    def stopBatch(self):
+        self.batch_timer.stop()
+        self.HALClient.messageReceived.disconnect(self.handleBatchReply)
+        self.batch = None
+
+## ValidationCache
+#
+# Stores the results of validating DaveActions so that when a sequence is
+# re-validated only the actions that have changed need to be sent to HAL
+# or Kilroy. The results are keyed by the action's message, including the
+# modification time of any files (i.e. parameters files) in the message.
+#
+# Only valid results are stored. The cache should be cleared when a
+# sequence is run as this can change the results, for example movies
+# that did not exist now do.
+#
+class ValidationCache(object):
+
+    ## __init__
+    #
+    def __init__(self):
+        self.results = {}
+
+    ## clear
+    #
+    # Remove all the results.
+    #
+    def clear(self):
+        self.results = {}
+
+    ## getKey
+    #
+    # @param dave_action A DaveAction.
+    #
+    # @return The cache key for the DaveAction.
+    #
+    def getKey(self, dave_action):
+        message = dave_action.getMessage()
+        if message is None:
+            return None
+        key = [dave_action.getActionType(), message.getType()]
+        message_data = message.getMessageData()
+        for name in sorted(message_data):
+            value = message_data[name]
+            key.append(name + "=" + repr(value))
+            if isinstance(value, str) and os.path.isfile(value):
+                key.append(os.path.getmtime(value))
+        return tuple(key)
+
+    ## getResult
+    #
+    # @param dave_action A DaveAction.
+    #
+    # @return [disk usage, duration] for the DaveAction or None if it needs to be validated.
+    #
+    def getResult(self, dave_action):
+        return self.results.get(self.getKey(dave_action))
+
+    ## setResult
+    #
+    # Store the result of (successfully) validating a DaveAction.
+    #
+    # @param dave_action A DaveAction.
+    #
+    def setResult(self, dave_action):
+        key = self.getKey(dave_action)
+        if key is not None:
+            self.results[key] = [dave_action.getUsage(), dave_action.getDuration()]
+
 ## Dave
 #
 # The main window of Dave.
@@ -160,7 +311,10 @@ class Dave(QtWidgets.QMainWindow):
         QtWidgets.QMainWindow.__init__(self, parent)
 
         # General.
+        self.batch_items = []
+        self.batch_size = 100
         self.directory = ""
+        self.n_unbatched = 0
         self.notifier = notifications.Notifier("", "", "", "")
         self.running = False
         self.settings = QtCore.QSettings("storm-control", "dave")
@@ -170,6 +324,8 @@ class Dave(QtWidgets.QMainWindow):
         self.skip_warning = False
         self.needs_hal = False
         self.needs_kilroy = False
+        self.use_batches = True
+        self.validation_cache = ValidationCache()
 
         # UI setup.
         self.ui = daveUi.Ui_MainWindow()
@@ -236,6 +392,8 @@ class Dave(QtWidgets.QMainWindow):
 
         # Command engine.
         self.command_engine = CommandEngine()
+        self.command_engine.batch_done.connect(self.handleBatchDone)
+        self.command_engine.batch_failed.connect(self.handleBatchFailed)
         self.command_engine.done.connect(self.handleDone)
         self.command_engine.problem.connect(self.handleProblem)
         self.command_engine.paused.connect(self.handlePauseFromCommandEngine)
@@ -338,6 +496,69 @@ class Dave(QtWidgets.QMainWindow):
             else:
                 self.handleDone()
 
+    ## handleBatchDone
+    #
+    # Handles HAL's response to a batch of test messages. Each response is
+    # handled by it's DaveAction, the same as the response to a single test
+    # message, so the errors and warnings are the same in both cases.
+    #
+    # @param messages A list of TCP message objects.
+    #
+    @hdebug.debug
+    def handleBatchDone(self, messages):
+        if not self.test_mode:
+            return
+
+        tree_view = self.ui.commandSequenceTreeView
+        index = 0
+        for i, [item, message] in enumerate(zip(self.batch_items, messages)):
+            dave_action = item.getDaveAction()
+            error_messages = []
+            warning_messages = []
+            dave_action.error_signal.connect(error_messages.append)
+            dave_action.warning_signal.connect(warning_messages.append)
+            dave_action.handleReply(message)
+            dave_action.error_signal.disconnect()
+            dave_action.warning_signal.disconnect()
+
+            # Errors and warnings are reported for the current command.
+            if error_messages or warning_messages:
+                tree_view.skipItems(i - index)
+                index = i
+                for error_message in error_messages:
+                    self.handleProblem(error_message)
+                for warning_message in warning_messages:
+                    self.handleWarning(warning_message)
+
+            tree_view.updateItemEstimates(item)
+            if item.isValid():
+                self.validation_cache.setResult(dave_action)
+
+        # Make the last command in the batch the current command.
+        tree_view.skipItems(len(self.batch_items) - 1 - index)
+        self.batch_items = []
+        self.handleDone()
+
+    ## handleBatchFailed
+    #
+    # HAL could not validate a batch of test messages, so the commands in the
+    # batch are validated one at a time.
+    #
+    # @param supported False if HAL does not support batches.
+    #
+    @hdebug.debug
+    def handleBatchFailed(self, supported):
+        if not self.test_mode:
+            return
+
+        if supported:
+            self.n_unbatched = len(self.batch_items) - 1
+        else:
+            self.use_batches = False
+        self.batch_items = []
+        self.command_engine.startCommand(self.ui.commandSequenceTreeView.getCurrentItem().getDaveAction(),
+                                         self.test_mode)
+
     ## handleClearWarnings
     #
     # Handle requests to clear warnings
@@ -407,6 +628,9 @@ class Dave(QtWidgets.QMainWindow):
         # Handle updating usage information if in test mode
         if self.test_mode:
             self.ui.commandSequenceTreeView.updateEstimates()
+            current_item = self.ui.commandSequenceTreeView.getCurrentItem()
+            if current_item.isValid():
+                self.validation_cache.setResult(current_item.getDaveAction())
 
         # Increment command to the next valid command / action.
         next_command = self.ui.commandSequenceTreeView.getNextItem()
@@ -440,7 +664,9 @@ class Dave(QtWidgets.QMainWindow):
             self.ui.remainingLabel.setText("Time Remaining: " + str(datetime.timedelta(seconds = est_time))[0:8])
 
             # Check for requested pause.
-            if self.running: 
+            if self.running and self.test_mode:
+                self.validateNext()
+            elif self.running: 
                 self.command_engine.startCommand(next_command.getDaveAction(), 
                                                  self.test_mode)
             else: 
@@ -578,21 +804,31 @@ class Dave(QtWidgets.QMainWindow):
                                               message_str)
 
         else: # Test mode
-            self.ui.commandSequenceTreeView.setCurrentItemValid(False)
-            message_str += "\nSuppress remaining warnings?"
-            if not self.skip_warning:
-                messageBox = QtWidgets.QMessageBox(parent = self)
-                messageBox.setWindowTitle("Invalid Command")
-                messageBox.setText(message_str)
-                messageBox.setStandardButtons(QtWidgets.QMessageBox.No |
-                                              QtWidgets.QMessageBox.YesToAll)
-                messageBox.setIcon(QtWidgets.QMessageBox.Warning)
-                messageBox.setDefaultButton(QtWidgets.QMessageBox.YesToAll)
-                button_ID = messageBox.exec_()
-                if button_ID == QtWidgets.QMessageBox.YesToAll:
-                    self.skip_warning = True # Skip additional warnings
+            self.handleInvalidItem(current_item, message_str)
 
-            print("Invalid command: " + current_item.getDaveAction().getDescriptor())
+    ## handleInvalidItem
+    #
+    # Marks an item as invalid when validating a sequence and (optionally) warns the user.
+    #
+    # @param item The DaveActionStandardItem that is not valid.
+    # @param message_str A string describing the problem.
+    #
+    def handleInvalidItem(self, item, message_str):
+        self.ui.commandSequenceTreeView.setItemValid(item, False)
+        message_str += "\nSuppress remaining warnings?"
+        if not self.skip_warning:
+            messageBox = QtWidgets.QMessageBox(parent = self)
+            messageBox.setWindowTitle("Invalid Command")
+            messageBox.setText(message_str)
+            messageBox.setStandardButtons(QtWidgets.QMessageBox.No |
+                                          QtWidgets.QMessageBox.YesToAll)
+            messageBox.setIcon(QtWidgets.QMessageBox.Warning)
+            messageBox.setDefaultButton(QtWidgets.QMessageBox.YesToAll)
+            button_ID = messageBox.exec_()
+            if button_ID == QtWidgets.QMessageBox.YesToAll:
+                self.skip_warning = True # Skip additional warnings
+
+        print("Invalid command: " + item.getDaveAction().getDescriptor())
 
     ## handleRunButton
     #
@@ -639,6 +875,9 @@ class Dave(QtWidgets.QMainWindow):
                 if not (button_ID == QtWidgets.QMessageBox.Yes):
                     return
 
+            # Running the sequence can change the validation results.
+            self.validation_cache.clear()
+
             # Start TCP communication
             self.validateAndStartTCP()
             
@@ -678,7 +917,9 @@ class Dave(QtWidgets.QMainWindow):
             self.ui.runButton.setEnabled(False)
             self.ui.abortButton.setEnabled(True)
             self.ui.validateSequenceButton.setEnabled(False)
+            self.n_unbatched = 0
             self.skip_warning = False
+            self.use_batches = True
             
             # Reset command properties.
             self.ui.commandSequenceTreeView.setAllValid(True)
@@ -688,9 +929,8 @@ class Dave(QtWidgets.QMainWindow):
             self.updateRunStatusDisplay()
             self.ui.commandSequenceTreeView.setTestMode(True)
 
-            # Send first command.
-            self.command_engine.startCommand(self.ui.commandSequenceTreeView.getCurrentItem().getDaveAction(),
-                                             self.test_mode)
+            # Send first command(s).
+            self.validateNext()
 
         # Mark all commands as invalid
         else: 
@@ -819,6 +1059,48 @@ class Dave(QtWidgets.QMainWindow):
     def updateRunStatusDisplay(self):
         self.ui.progressBar.setValue(self.ui.commandSequenceTreeView.getCurrentIndex())
         
+    ## validateNext
+    #
+    # Validate the current command. Commands that have already been validated
+    # are skipped, and if possible the current command and the HAL commands
+    # that follow it are sent to HAL as a single batch.
+    #
+    def validateNext(self):
+        tree_view = self.ui.commandSequenceTreeView
+        items = tree_view.getCurrentItems(self.batch_size)
+
+        # Use the cached results for commands that have not changed.
+        n_cached = 0
+        for item in items:
+            result = self.validation_cache.getResult(item.getDaveAction())
+            if result is None:
+                break
+            item.setUsageEstimates(*result)
+            tree_view.updateItemEstimates(item)
+            n_cached += 1
+
+        if (n_cached > 0):
+            tree_view.skipItems(n_cached - 1)
+            self.handleDone()
+            return
+
+        # Batch HAL commands.
+        if (self.n_unbatched > 0):
+            self.n_unbatched -= 1
+        elif self.use_batches and (items[0].getDaveAction().getActionType() == "hal"):
+            self.batch_items = []
+            for item in items:
+                dave_action = item.getDaveAction()
+                if (dave_action.getActionType() != "hal") or (self.validation_cache.getResult(dave_action) is not None):
+                    break
+                self.batch_items.append(item)
+
+            if (len(self.batch_items) > 1):
+                self.command_engine.startBatch([x.getDaveAction() for x in self.batch_items])
+                return
+
+        self.command_engine.startCommand(items[0].getDaveAction(), self.test_mode)
+
     ## validateAndStartTCP
     #
     # Determine that the required TCP communications are ready and start them if they are.
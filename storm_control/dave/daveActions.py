@@ -32,6 +32,9 @@ def addField(block, name, value):
 #
 class DaveAction(QtCore.QObject):
 
+    # The type of the action (i.e. "hal", "kilroy", ..)
+    action_type = "NA"
+
     # Define custom signal
     complete_signal = QtCore.pyqtSignal(object)
     error_signal = QtCore.pyqtSignal(object)
@@ -46,7 +49,7 @@ class DaveAction(QtCore.QObject):
         # Initialize parent class
         QtCore.QObject.__init__(self, None)
 
-        self.action_type = "NA"
+        self.descriptor = type(self).__name__[2:]
         self.disk_usage = 0
         self.duration = 0
         self.id = None
@@ -59,10 +62,9 @@ class DaveAction(QtCore.QObject):
         self.should_pause_default = False    # Default pause state for reset
         self.should_pause_after_error = True # Pause after an error
                 
-        # Initialize internal timer
-        self.lost_message_timer = QtCore.QTimer(self)
-        self.lost_message_timer.setSingleShot(True)
-        self.lost_message_timer.timeout.connect(self.handleTimerDone)
+        # The internal timer is created when the action is started as
+        # sequences can contain a very large number of actions.
+        self.lost_message_timer = None
         self.lost_message_delay = 2000 # Wait for a test message to be returned before issuing an error
         self.lost_message_should_use = False # Use the lost message timer when submitting real (not test) action
 
@@ -103,10 +105,7 @@ class DaveAction(QtCore.QObject):
     #
     def completeAction(self, message):
         if message.isTest():
-            time = message.getResponse("duration")
-            if time is not None: self.duration = time
-            space = message.getResponse("disk_usage")
-            if space is not None: self.disk_usage = space
+            self.setEstimates(message)
         self.complete_signal.emit(message)
 
     ## completeActionWithError
@@ -136,12 +135,26 @@ class DaveAction(QtCore.QObject):
     def getActionType(self):
         return self.action_type
 
+    ## describeNode
+    #
+    # This is used by the sequence viewer to label actions without
+    # having to create them, as sequences can contain a very large
+    # number of actions.
+    #
+    # @param node The node of an ElementTree.
+    #
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        return [None, cls.__name__[2:]]
+
     ## getDescriptor
     #
     # @return A string that describes the action.
     #
     def getDescriptor(self):
-        return type(self).__name__[2:]
+        return self.descriptor
 
     ## getDuration
     #
@@ -202,7 +215,8 @@ class DaveAction(QtCore.QObject):
     def handleReply(self, message, warning = False):
 
         # Stop lost message timer
-        self.lost_message_timer.stop()
+        if self.lost_message_timer is not None:
+            self.lost_message_timer.stop()
 
         # Check to see if the same message got returned
         if not (message.getID() == self.message.getID()):
@@ -261,6 +275,18 @@ class DaveAction(QtCore.QObject):
     def setDuration(self, duration):
         self.duration = duration
 
+    ## setEstimates
+    #
+    # Set the duration and disk usage from the response to a test message.
+    #
+    # @param message A TCP message object
+    #
+    def setEstimates(self, message):
+        time = message.getResponse("duration")
+        if time is not None: self.duration = time
+        space = message.getResponse("disk_usage")
+        if space is not None: self.disk_usage = space
+
     ## setup
     #
     # Perform post creation initialization.
@@ -305,6 +331,10 @@ class DaveAction(QtCore.QObject):
 
         self.tcp_client.messageReceived.connect(self.handleReply)
         if self.message.isTest() or self.lost_message_should_use:
+            if self.lost_message_timer is None:
+                self.lost_message_timer = QtCore.QTimer(self)
+                self.lost_message_timer.setSingleShot(True)
+                self.lost_message_timer.timeout.connect(self.handleTimerDone)
             self.lost_message_timer.start(self.lost_message_delay)
         self.tcp_client.sendMessage(self.message)
 
@@ -318,12 +348,13 @@ class DaveAction(QtCore.QObject):
 #
 class DACheckFocus(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
         self.num_focus_checks = 10 # A default number of focus checks
         self.focus_scan = False # The default is to not scan for focus
         self.scan_range = False # The range to scan for focus in microns
@@ -343,12 +374,18 @@ class DACheckFocus(DaveAction):
                 block.append(ElementTree.fromstring(ElementTree.tostring(pnode)))
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "Confirm Focus (" + str(float(self.num_focus_checks)/10) + " s window)"
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        num_focus_checks = 10
+        if node.find("num_focus_checks") is not None:
+            num_focus_checks = int(node.find("num_focus_checks").text)
+        return [None, "Confirm Focus (" + str(float(num_focus_checks)/10) + " s window)"]
                 
     ## handleReply
     #
@@ -392,6 +429,8 @@ class DACheckFocus(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Check Focus Lock",
                                              message_data = message_data)
 
+        [self.id, self.descriptor] = self.describeNode(node)
+
 
 ## DAClearWarnings
 #
@@ -399,11 +438,12 @@ class DACheckFocus(DaveAction):
 #
 class DAClearWarnings(DaveAction):
 
+    action_type = "dave"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
-        self.action_type = "dave"
 
     ## createETree
     #
@@ -415,12 +455,15 @@ class DAClearWarnings(DaveAction):
         block = ElementTree.Element(str(type(self).__name__))
         return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "Clear Dave warnings"
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        return [None, "Clear Dave warnings"]
 
     ## setup
     #
@@ -432,6 +475,8 @@ class DAClearWarnings(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Clear Warnings",
                                              message_data = {})
 
+        [self.id, self.descriptor] = self.describeNode(node)
+
     ## start
     #
     # Start the action, but in this case immediately issue an all clear.
@@ -460,13 +505,16 @@ class DADelay(DaveAction):
     #
     def __init__(self):
         DaveAction.__init__(self)
+
+        self.delay_timer = None
     
     ## abort
     #
     # Handle an external abort call
     #
     def abort(self):
-        self.delay_timer.stop()
+        if self.delay_timer is not None:
+            self.delay_timer.stop()
         self.completeAction(self.message)
 
     ## cleanUp
@@ -489,12 +537,15 @@ class DADelay(DaveAction):
             addField(block, "delay", delay)
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "pause for " + str(self.delay) + "ms"
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        return [None, "pause for " + str(int(node.find("delay").text)) + "ms"]
 
     ## handleTimerComplete
     #
@@ -510,11 +561,6 @@ class DADelay(DaveAction):
     # @param node The node of an ElementTree.
     #
     def setup(self, node):
-
-        # Prepare delay timer
-        self.delay_timer = QtCore.QTimer(self)
-        self.delay_timer.setSingleShot(True)
-        self.delay_timer.timeout.connect(self.handleTimerComplete)
         self.delay = int(node.find("delay").text)
         
         # Create message and add delay time for accurate dave time estimates
@@ -522,6 +568,8 @@ class DADelay(DaveAction):
                                              message_data = {"delay": self.delay});
         self.message.addResponse("duration", self.delay)
 
+        [self.id, self.descriptor] = self.describeNode(node)
+
     ## start
     #
     # Start the action.
@@ -535,6 +583,10 @@ class DADelay(DaveAction):
         if self.message.isTest():
             self.completeAction(self.message)
         else:
+            if self.delay_timer is None:
+                self.delay_timer = QtCore.QTimer(self)
+                self.delay_timer.setSingleShot(True)
+                self.delay_timer.timeout.connect(self.handleTimerComplete)
             self.delay_timer.start(self.delay)
             print("Delaying " + str(self.delay) + " ms")
 
@@ -544,11 +596,12 @@ class DADelay(DaveAction):
 #
 class DAEmail(DaveAction):
 
+    action_type = "dave"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
-        self.action_type = "dave"
         self.email_subject = ""
         self.email_body = ""
         
@@ -577,12 +630,18 @@ class DAEmail(DaveAction):
             # Return block
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "Email: " + self.email_subject
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        email_subject = ""
+        if node.find("subject") is not None:
+            email_subject = node.find("subject").text
+        return [None, "Email: " + email_subject]
 
     ## setup
     #
@@ -605,6 +664,8 @@ class DAEmail(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Dave Email",
                                              message_data = message_data)
 
+        [self.id, self.descriptor] = self.describeNode(node)
+
     ## start
     #
     # Start the action, but in this case immediately issue an all clear.
@@ -624,12 +685,13 @@ class DAEmail(DaveAction):
 #
 class DAFindSum(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
         self.min_sum = None
     ## createETree
     #
@@ -647,12 +709,15 @@ class DAFindSum(DaveAction):
             addField(block, "min_sum", find_sum)
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "find sum (minimum sum = " + str(self.min_sum) + ")"
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        return [None, "find sum (minimum sum = " + str(float(node.find("min_sum").text)) + ")"]
                 
     ## handleReply
     #
@@ -679,6 +744,8 @@ class DAFindSum(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Find Sum",
                                              message_data = {"min_sum": self.min_sum})
 
+        [self.id, self.descriptor] = self.describeNode(node)
+
 
 ## DAMoveStage
 #
@@ -686,6 +753,8 @@ class DAFindSum(DaveAction):
 #
 class DAMoveStage(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     # @param tcp_client A tcp communications object.
@@ -693,8 +762,6 @@ class DAMoveStage(DaveAction):
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
-
     ## createETree
     #
     # @param dict A dictionary.
@@ -710,12 +777,20 @@ class DAMoveStage(DaveAction):
             addField(block, "stage_y", stage_y)
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "move stage to " + str(self.stage_x) + ", " + str(self.stage_y)
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        stage_x = float(node.find("stage_x").text)
+        stage_y = float(node.find("stage_y").text)
+
+        # Create id to indicate required validation
+        a_id = "Move Stage stage_x: " + str(stage_x) + " stage_y: " + str(stage_y)
+        return [a_id, "move stage to " + str(stage_x) + ", " + str(stage_y)]
 
     ## setup
     #
@@ -730,10 +805,7 @@ class DAMoveStage(DaveAction):
                                              message_data = {"stage_x" : self.stage_x,
                                                              "stage_y" : self.stage_y})
 
-        # Create id to indicate required validation
-        self.id = self.message.getType() + " "
-        self.id += "stage_x: " + str(self.stage_x) + " "
-        self.id += "stage_y: " + str(self.stage_y)
+        [self.id, self.descriptor] = self.describeNode(node)
 
 ## DAPause
 #
@@ -767,12 +839,15 @@ class DAPause(DaveAction):
             block = ElementTree.Element(str(type(self).__name__))
             return block
         
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "pause"
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        return [None, "pause"]
 
     ## setup
     #
@@ -788,6 +863,8 @@ class DAPause(DaveAction):
         self.should_pause = True
         self.should_pause_default = True
 
+        [self.id, self.descriptor] = self.describeNode(node)
+
     ## start
     #
     # Start the action.
@@ -811,13 +888,13 @@ class DAPause(DaveAction):
 #
 class DARecenterPiezo(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
-
     ## createETree
     #
     # @param dictionary A dictionary.
@@ -830,12 +907,15 @@ class DARecenterPiezo(DaveAction):
             block = ElementTree.Element(str(type(self).__name__))
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "recenter piezo"
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        return [None, "recenter piezo"]
 
     ## setup
     #
@@ -846,19 +926,21 @@ class DARecenterPiezo(DaveAction):
     def setup(self, node):
         self.message = tcpMessage.TCPMessage(message_type = "Recenter Piezo")
 
+        [self.id, self.descriptor] = self.describeNode(node)
+
 ## DASetDirectory
 #
 # Change the Hal Directory.
 #
 class DASetDirectory(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
-
     ## createETree
     #
     # @param dictionary A dictionary.
@@ -872,12 +954,18 @@ class DASetDirectory(DaveAction):
             addField(block, "directory", directory)
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "change directory to " + self.directory
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        directory = node.find("directory").text
+
+        # Require validation
+        return ["Set Directory " + directory, "change directory to " + directory]
 
     ## setup
     #
@@ -890,9 +978,7 @@ class DASetDirectory(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Set Directory",
                                              message_data = {"directory": self.directory})
 
-        # Require validation
-        self.id = self.message.getType() + " "
-        self.id += self.directory
+        [self.id, self.descriptor] = self.describeNode(node)
 
 ## DASetFocusLockTarget
 #
@@ -900,13 +986,13 @@ class DASetDirectory(DaveAction):
 #
 class DASetFocusLockTarget(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
-
     ## createETree
     #
     # @param dictionary A dictionary.
@@ -920,12 +1006,15 @@ class DASetFocusLockTarget(DaveAction):
             addField(block, "lock_target", lock_target)
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "set focus lock target to " + str(self.lock_target)
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        return [None, "set focus lock target to " + str(float(node.find("lock_target").text))]
 
     ## setup
     #
@@ -938,6 +1027,8 @@ class DASetFocusLockTarget(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Set Lock Target",
                                              message_data = {"lock_target" : self.lock_target})
 
+        [self.id, self.descriptor] = self.describeNode(node)
+
 
 ## DASetParameters
 #
@@ -945,13 +1036,13 @@ class DASetFocusLockTarget(DaveAction):
 #
 class DASetParameters(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
-
         # Allow for a longer delay in case the parameters need to be initialized
         self.lost_message_delay = 15000
 
@@ -968,12 +1059,32 @@ class DASetParameters(DaveAction):
             addField(block, "parameters", parameters)
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "set parameters to " + str(self.parameters)
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        parameters = cls.parseParameters(node)
+
+        # Require validation
+        return ["Set Parameters " + str(parameters), "set parameters to " + str(parameters)]
+
+    ## parseParameters
+    #
+    # @param node The node of an ElementTree.
+    #
+    # @return The parameters name (or index) that node specifies.
+    #
+    @staticmethod
+    def parseParameters(node):
+        p_node = node.find("parameters")
+        if (p_node.attrib["type"] == "int"):
+            return int(p_node.text)
+        else:
+            return p_node.text
 
     ## setup
     #
@@ -982,17 +1093,11 @@ class DASetParameters(DaveAction):
     # @param node The node of an ElementTree.
     #
     def setup(self, node):
-        p_node = node.find("parameters")
-        if (p_node.attrib["type"] == "int"):
-            self.parameters = int(node.find("parameters").text)
-        else:
-            self.parameters = node.find("parameters").text
+        self.parameters = self.parseParameters(node)
         self.message = tcpMessage.TCPMessage(message_type = "Set Parameters",
                                              message_data = {"parameters" : self.parameters})
 
-        # Require validation
-        self.id = self.message.getType() + " "
-        self.id += str(self.parameters)
+        [self.id, self.descriptor] = self.describeNode(node)
 
 ## DASetProgression
 #
@@ -1000,13 +1105,13 @@ class DASetParameters(DaveAction):
 #
 class DASetProgression(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
-
     ## createETree
     #
     # @param dictionary A dictionary.
@@ -1022,12 +1127,20 @@ class DASetProgression(DaveAction):
                 block.append(ElementTree.fromstring(ElementTree.tostring(pnode)))
             return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "set progressions to " + self.type
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        a_id = None
+
+        # Require validation only for provided filenames
+        if node.find("filename") is not None:
+            a_id = "Set Progression " + node.find("filename").text
+        return [a_id, "set progressions to " + node.find("type").text]
 
     ## setup
     #
@@ -1068,10 +1181,7 @@ class DASetProgression(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Set Progression",
                                              message_data = message_data)
 
-        # Require validation only for provided filenames
-        if node.find("filename") is not None:
-            self.id = self.message.getType() + " "
-            self.id += node.find("filename").text   
+        [self.id, self.descriptor] = self.describeNode(node)
 
 ## DATakeMovie
 #
@@ -1079,12 +1189,13 @@ class DASetProgression(DaveAction):
 #
 class DATakeMovie(DaveAction):
 
+    action_type = "hal"
+
     ## __init__
     #
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "hal"
         self.properties = {"name" : None,
                            "length" : None,
                            "min_spots" : None,
@@ -1137,15 +1248,33 @@ class DATakeMovie(DaveAction):
 
                 return block
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        if (self.min_spots > 0):
-            return "take movie " + self.name + ", " + str(self.length) + " frames, " + str(self.min_spots) + " minimum spots"
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        name = node.find("name").text
+        length = int(node.find("length").text)
+
+        min_spots = 0
+        if node.find("min_spots") is not None:
+            min_spots = int(node.find("min_spots").text)
+
+        # Require validation.
+        #
+        # FIXME: This should be the message type, length and parameters?
+        #
+        a_id = str(length) + " "
+        if node.find("parameters") is not None:
+            a_id = node.find("parameters").text
+
+        if (min_spots > 0):
+            return [a_id, "take movie " + name + ", " + str(length) + " frames, " + str(min_spots) + " minimum spots"]
         else:
-            return "take movie " + self.name + ", " + str(self.length) + " frames"
+            return [a_id, "take movie " + name + ", " + str(length) + " frames"]
 
     ## handleReply
     #
@@ -1200,14 +1329,7 @@ class DATakeMovie(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Take Movie",
                                              message_data = message_data)
 
-        # Require validation.
-        #
-        # FIXME: This should be '+=' not '='?
-        #
-        self.id = self.message.getType() + " "
-        self.id = str(self.length) + " "
-        if message_data["parameters"] is not None:
-            self.id = str(message_data["parameters"])
+        [self.id, self.descriptor] = self.describeNode(node)
 
 ## DAValveProtocol
 #
@@ -1215,6 +1337,8 @@ class DATakeMovie(DaveAction):
 #
 class DAValveProtocol(DaveAction):
 
+    action_type = "kilroy"
+
     ## __init__
     #
     # Initialize the valve protocol action
@@ -1222,7 +1346,6 @@ class DAValveProtocol(DaveAction):
     def __init__(self):
         DaveAction.__init__(self)
 
-        self.action_type = "kilroy"
         self.properties = {"name" : None}
 
     ## createETree
@@ -1240,12 +1363,16 @@ class DAValveProtocol(DaveAction):
         else:
             return None
 
-    ## getDescriptor
+    ## describeNode
     #
-    # @return A string that describes the action.
+    # @param node The node of an ElementTree.
     #
-    def getDescriptor(self):
-        return "valve protocol " + self.protocol_name
+    # @return [id, descriptor] of the action that node describes.
+    #
+    @classmethod
+    def describeNode(cls, node):
+        # Require validation.
+        return [node.text, "valve protocol " + node.text]
 
     ## setup
     #
@@ -1260,12 +1387,7 @@ class DAValveProtocol(DaveAction):
         self.message = tcpMessage.TCPMessage(message_type = "Kilroy Protocol",
                                              message_data = {"name": self.protocol_name})
 
-        # Require validation.
-        #
-        # FIXME: This should be '+=' not '='?
-        #
-        self.id = self.message.getType() + " "
-        self.id = self.protocol_name        
+        [self.id, self.descriptor] = self.describeNode(node)
 
 #
 # The MIT License
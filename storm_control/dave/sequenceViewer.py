@@ -15,6 +15,73 @@ import storm_control.dave.daveActions as daveActions
 
 DaveActionType = QtGui.QStandardItem.UserType
 
+
+## PrefixSum
+#
+# A Fenwick (binary indexed) tree. This is used to get the estimated time
+# and disk usage of the remaining actions without having to walk through
+# all of them. Changing a value and getting a sum are both O(log n).
+#
+class PrefixSum(object):
+
+    ## __init__
+    #
+    def __init__(self):
+        self.tree = [0]
+        self.values = []
+
+    ## append
+    #
+    # @param value The value to add to the end of the list.
+    #
+    def append(self, value):
+        self.values.append(value)
+        i = len(self.values)
+
+        # The new node is the sum of the values from i - lowbit(i) to i.
+        total = value
+        j = i - 1
+        while (j > i - (i & (-i))):
+            total += self.tree[j]
+            j -= j & (-j)
+        self.tree.append(total)
+
+    ## prefix
+    #
+    # @param index The index to sum up to.
+    #
+    # @return The sum of the values before index.
+    #
+    def prefix(self, index):
+        total = 0
+        i = min(index, len(self.values))
+        while (i > 0):
+            total += self.tree[i]
+            i -= i & (-i)
+        return total
+
+    ## set
+    #
+    # @param index The index of the value to change.
+    # @param value The new value.
+    #
+    def set(self, index, value):
+        delta = value - self.values[index]
+        if (delta == 0):
+            return
+        self.values[index] = value
+        i = index + 1
+        while (i < len(self.tree)):
+            self.tree[i] += delta
+            i += i & (-i)
+
+    ## total
+    #
+    # @return The sum of all the values.
+    #
+    def total(self):
+        return self.prefix(len(self.values))
+
 ## DaveActionStandardItem
 #
 # A QStandardItem specialized to hold a DaveAction.
@@ -23,22 +90,58 @@ class DaveActionStandardItem(QtGui.QStandardItem):
 
     ## __init__
     #
+    # The DaveAction is only created when it is needed, sequences can
+    # contain hundreds of thousands of actions. The id, type and
+    # description of the action are taken from the DaveAction class.
+    #
     # @param node A XML node describing the DaveAction.
     #
     def __init__(self, node):
-        dave_action_class = getattr(daveActions, node.tag)
-        self.dave_action = dave_action_class()
-        self.dave_action.setup(node)
+        self.dave_action = None
+        self.node = node
         self.valid = True
 
-        QtGui.QStandardItem.__init__(self, self.dave_action.getDescriptor())
+        # These are kept here so that they are not lost when the
+        # DaveAction is released.
+        self.disk_usage = 0
+        self.duration = 0
+
+        # The position of this item in DaveStandardItemModel's lists.
+        self.index_all = None
+        self.index_test = None
+
+        da_class = getattr(daveActions, self.node.tag)
+        [self.action_id, descriptor] = da_class.describeNode(self.node)
+        self.action_type = da_class.action_type
+
+        QtGui.QStandardItem.__init__(self, descriptor)
         self.setFlags(QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled)
 
+    ## createDaveAction
+    #
+    # @return A new DaveAction created from the XML node.
+    #
+    def createDaveAction(self):
+        dave_action = getattr(daveActions, self.node.tag)()
+        dave_action.setup(self.node)
+        return dave_action
+
+    ## getActionType
+    #
+    # @return The type of the DaveAction associated with this item (i.e. "hal").
+    #
+    def getActionType(self):
+        return self.action_type
+
     ## getDaveAction
     #
     # @return The DaveAction associated with this item.
     #
     def getDaveAction(self):
+        if self.dave_action is None:
+            self.dave_action = self.createDaveAction()
+            self.dave_action.setDiskUsage(self.disk_usage)
+            self.dave_action.setDuration(self.duration)
         return self.dave_action
 
     ## getDaveActionID
@@ -46,7 +149,17 @@ class DaveActionStandardItem(QtGui.QStandardItem):
     # @return The id associated with the DaveAction associated with this item.
     #
     def getDaveActionID(self):
-        return self.dave_action.getID()
+        return self.action_id
+
+    ## getEstimates
+    #
+    # @return [duration, disk usage] of the DaveAction associated with this item.
+    #
+    def getEstimates(self):
+        if self.dave_action is not None:
+            return [self.dave_action.getDuration(), self.dave_action.getUsage()]
+        else:
+            return [self.duration, self.disk_usage]
 
     ## isValid
     #
@@ -61,8 +174,21 @@ class DaveActionStandardItem(QtGui.QStandardItem):
     # @param duration The estimated duration of the action
     #
     def setUsageEstimates(self, disk_usage, duration):
-        self.dave_action.setDiskUsage(disk_usage)
-        self.dave_action.setDuration(duration)
+        self.disk_usage = disk_usage
+        self.duration = duration
+        if self.dave_action is not None:
+            self.dave_action.setDiskUsage(disk_usage)
+            self.dave_action.setDuration(duration)
+
+    ## releaseDaveAction
+    #
+    # Release the DaveAction associated with this item, it will be
+    # created again if it is needed.
+    #
+    def releaseDaveAction(self):
+        if self.dave_action is not None:
+            [self.duration, self.disk_usage] = self.getEstimates()
+            self.dave_action = None
 
     ## setValid
     #
@@ -154,6 +280,18 @@ class DaveCommandTreeViewer(QtWidgets.QTreeView):
         if self.dv_model is not None:
             return self.dv_model.getCurrentItem()
 
+    ## getCurrentItems
+    #
+    # @param n_items (Optional) The maximum number of items, defaults to all of them.
+    #
+    # @return A list of DaveActionStandardItems starting with the current item.
+    #
+    def getCurrentItems(self, n_items = None):
+        if self.dv_model is not None:
+            return self.dv_model.getCurrentItems(n_items)
+        else:
+            return []
+
     ## getEstimates
     #
     # @return [time, space] estimates for the run.
@@ -310,6 +448,15 @@ class DaveCommandTreeViewer(QtWidgets.QTreeView):
         QtWidgets.QTreeView.setModel(self, self.dv_model)
         self.viewportUpdate()
 
+    ## setItemValid
+    #
+    # @param an_item A DaveActionStandardItem.
+    # @param is_valid True/False determines the validity of the item(s).
+    #
+    def setItemValid(self, an_item, is_valid):
+        if self.dv_model is not None:
+            self.dv_model.setItemValid(an_item, is_valid)
+
     ## setTestMode
     #
     # @param test_mode True/False sets the test mode of the DaveStandardItemModel.
@@ -318,11 +465,28 @@ class DaveCommandTreeViewer(QtWidgets.QTreeView):
         if self.dv_model is not None:
             self.dv_model.setTestMode(test_mode)
 
+    ## skipItems
+    #
+    # @param n_items The number of items to move the current item forward by.
+    #
+    def skipItems(self, n_items):
+        if self.dv_model is not None:
+            self.dv_model.skipItems(n_items)
+            self.viewportUpdate()
+
     ## updateEstimates
     #
     def updateEstimates(self):
         if self.dv_model is not None:
             self.dv_model.updateEstimates()
+
+    ## updateItemEstimates
+    #
+    # @param an_item A DaveActionStandardItem.
+    #
+    def updateItemEstimates(self, an_item):
+        if self.dv_model is not None:
+            self.dv_model.updateItemEstimates(an_item)
         
     ## viewportUpdate
     #
@@ -347,13 +511,22 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
         QtGui.QStandardItemModel.__init__(self)
 
         self.dave_action_index = 0
-        self.dave_actions_cur = []   # The active list of DaveActionStandardItems
         self.dave_actions_all = []   # The full list of DaveActionStandardItems
+        self.dave_actions_cur = self.dave_actions_all # The active list of DaveActionStandardItems
         
         # Lists for fast validation.
         self.dave_actions_test = []  # A list of actions to validate
         self.dave_actions_test_dict = dict() # A dictionary of test ids and lists of actions that have these
 
+        # Prefix sums of the duration and disk usage of the valid actions
+        # for fast time remaining and run size estimates.
+        self.duration_all = PrefixSum()
+        self.duration_test = PrefixSum()
+        self.usage_all = PrefixSum()
+        self.usage_test = PrefixSum()
+        self.duration_cur = self.duration_all
+        self.usage_cur = self.usage_all
+
         self.test_mode = False
 
     ## addItem
@@ -361,21 +534,23 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     # @param dave_action_si A DaveActionStandardItem.
     #
     def addItem(self, dave_action_si):
+        [duration, usage] = self.getItemEstimates(dave_action_si)
+
+        dave_action_si.index_all = len(self.dave_actions_all)
         self.dave_actions_all.append(dave_action_si)
-        self.dave_actions_cur.append(dave_action_si) # Build current actions simultaneously
+        self.duration_all.append(duration)
+        self.usage_all.append(usage)
         
         # Check if action requires validation
-        action_id = dave_action_si.getDaveAction().getID()
+        action_id = dave_action_si.getDaveActionID()
         if action_id is not None:
-            # Check for existing id
-            is_present = False
-            for id_value in self.dave_actions_test_dict.keys():
-                if action_id == id_value:
-                    is_present = True
 
             # Add to list if the id is not currently on the id list
-            if not is_present:
+            if not action_id in self.dave_actions_test_dict:
+                dave_action_si.index_test = len(self.dave_actions_test)
                 self.dave_actions_test.append(dave_action_si)
+                self.duration_test.append(duration)
+                self.usage_test.append(usage)
                 self.dave_actions_test_dict[action_id] = [dave_action_si] # Start list
             else: # Add to current list of actions with the same id
                 self.dave_actions_test_dict[action_id].append(dave_action_si)
@@ -387,7 +562,7 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     def getActionTypes(self):
         types = []
         for item in self.dave_actions_cur:
-            type = item.getDaveAction().getActionType()
+            type = item.getActionType()
             if not type in types:
                 types.append(type)
         return types
@@ -406,6 +581,30 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     def getCurrentItem(self):
         return self.dave_actions_cur[self.dave_action_index]
 
+    ## getCurrentItems
+    #
+    # @param n_items The maximum number of items, None for all of them.
+    #
+    # @return A list of DaveActionStandardItems starting with the current item.
+    #
+    def getCurrentItems(self, n_items):
+        if n_items is None:
+            return self.dave_actions_cur[self.dave_action_index:]
+        else:
+            return self.dave_actions_cur[self.dave_action_index:self.dave_action_index + n_items]
+
+    ## getItemEstimates
+    #
+    # @param an_item A DaveActionStandardItem.
+    #
+    # @return [duration, disk usage] of the item, these are 0 if the item is not valid.
+    #
+    def getItemEstimates(self, an_item):
+        if an_item.isValid():
+            return an_item.getEstimates()
+        else:
+            return [0, 0]
+
     ## getNextItem
     #
     # @param skip_invalid True/False to skip invalid commands.
@@ -413,6 +612,7 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     # @return The next DaveActionStandardItem or none if there are no more items.
     #
     def getNextItem(self, skip_invalid):
+        self.releaseItems(self.dave_action_index, self.dave_action_index + 1)
         self.dave_action_index += 1
 
         # If requested, skip over invalid commands.
@@ -439,25 +639,14 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     # @return An estimate of how much time is left in the run.
     #
     def getRemainingTime(self, start = 0):
-        est_time = 0
-        i = start
-        while (i < len(self.dave_actions_cur)):
-            item = self.dave_actions_cur[i]
-            if item.isValid():
-                est_time += item.getDaveAction().getDuration()
-            i += 1
-        return est_time
+        return self.duration_cur.total() - self.duration_cur.prefix(start)
 
     ## getRunSize
     #
     # @return An estimate of the run size.
     #
     def getRunSize(self):
-        est_space = 0
-        for item in self.dave_actions_cur:
-            if item.isValid():
-                est_space += item.getDaveAction().getUsage()
-        return est_space
+        return self.usage_cur.total()
 
     ## haveNextItem
     #
@@ -480,6 +669,18 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
                 all_valid = False
         return all_valid
 
+    ## releaseItems
+    #
+    # Release the DaveActions of items that are done so that the number
+    # of DaveActions in memory does not grow with the length of the run.
+    #
+    # @param start The index of the first item.
+    # @param stop The index after the last item.
+    #
+    def releaseItems(self, start, stop):
+        for item in self.dave_actions_cur[start:stop]:
+            item.releaseDaveAction()
+
     ## resetItemIndex
     #
     # Reset to the first DaveActionStandardItem.
@@ -494,6 +695,7 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     def setAllValid(self, valid):
         for item in self.dave_actions_all:
             item.setValid(valid)
+            self.updateSums(item)
 
     ## setCurrentItem
     #
@@ -513,21 +715,28 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
     # @param is_Valid True/False determines the validity of the currentItem(s)
     #
     def setCurrentItemValid(self, is_valid):
+        self.setItemValid(self.dave_actions_cur[self.dave_action_index], is_valid)
+
+    ## setItemValid
+    #
+    # @param an_item A DaveActionStandardItem.
+    # @param is_valid True/False determines the validity of the item(s)
+    #
+    def setItemValid(self, an_item, is_valid):
         if self.test_mode:
-            # Find current id
-            current_item = self.dave_actions_cur[self.dave_action_index]
-            current_action = current_item.getDaveAction()
-            current_id = current_action.getID()
+            # Find the item's id
+            item_id = an_item.getDaveActionID()
 
-            print(current_id, is_valid)
+            print(item_id, is_valid)
             
             # Change validity of all actions that have this id
-            for item in self.dave_actions_test_dict[current_id]:
+            for item in self.dave_actions_test_dict[item_id]:
                 item.setValid(is_valid)
+                self.updateSums(item)
                 
         else: # Not used
-            item = self.dave_actions_cur[self.dave_action_index]
-            item.setValid(is_valid)
+            an_item.setValid(is_valid)
+            self.updateSums(an_item)
                     
     ## setTestMode
     #
@@ -538,65 +747,109 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
             if not test_mode: # Toggle off test mode
                 self.test_mode = False
                 self.dave_actions_cur = self.dave_actions_all # Recover full list
+                self.duration_cur = self.duration_all
+                self.usage_cur = self.usage_all
                 self.resetItemIndex()
         else:
             if test_mode:
                 self.test_mode = True
                 self.dave_actions_cur = self.dave_actions_test # Set to test list
+                self.duration_cur = self.duration_test
+                self.usage_cur = self.usage_test
                 self.resetItemIndex()
 
+    ## skipItems
+    #
+    # @param n_items The number of items to move the current item forward by.
+    #
+    def skipItems(self, n_items):
+        new_index = min(self.dave_action_index + n_items, len(self.dave_actions_cur) - 1)
+        self.releaseItems(self.dave_action_index, new_index)
+        self.dave_action_index = new_index
+
     ## updateEstimates
     #
     def updateEstimates(self):
+        self.updateItemEstimates(self.dave_actions_cur[self.dave_action_index])
+
+    ## updateItemEstimates
+    #
+    # @param an_item A DaveActionStandardItem.
+    #
+    def updateItemEstimates(self, an_item):
         if self.test_mode: # Only needed in test mode
 
-            # Find current id and the current disk usage and duration.
-            current_item = self.dave_actions_cur[self.dave_action_index]
-            current_action = current_item.getDaveAction()
-            current_id = current_action.getID()
-            disk_usage = current_action.getUsage()
-            duration = current_action.getDuration()
+            # Find the item's disk usage and duration.
+            [duration, disk_usage] = an_item.getEstimates()
             
             # Update usage estimated for all actions that have this id.
-            for item in self.dave_actions_test_dict[current_id]:
+            for item in self.dave_actions_test_dict[an_item.getDaveActionID()]:
                 item.setUsageEstimates(disk_usage, duration)
+                self.updateSums(item)
+
+    ## updateSums
+    #
+    # Update the duration and disk usage prefix sums after a change to an item.
+    #
+    # @param an_item A DaveActionStandardItem.
+    #
+    def updateSums(self, an_item):
+        [duration, usage] = self.getItemEstimates(an_item)
+        self.duration_all.set(an_item.index_all, duration)
+        self.usage_all.set(an_item.index_all, usage)
+        if an_item.index_test is not None:
+            self.duration_test.set(an_item.index_test, duration)
+            self.usage_test.set(an_item.index_test, usage)
 
 ## parseSequenceFile
 #
+# The file is parsed incrementally so that the XML for the whole sequence
+# is never in memory at the same time as the model.
+#
 # @param xml_file The xml_file to parse to create the command sequence.
 #
 # @return A DaveStandardItemModel object for using in a DaveCommandTreeViewer.
 #
 def parseSequenceFile(xml_file):
     model = DaveStandardItemModel()
-    xml = ElementTree.parse(xml_file).getroot()
-    recursiveParse(model, model, xml)
+    branches = [model]
+    action_depth = 0
+    is_root = True
+    for [event, node] in ElementTree.iterparse(xml_file, events = ("start", "end")):
+        if is_root:
+            root = node
+            is_root = False
+
+        elif (event == "start"):
+
+            # Everything is either a branch.
+            if (action_depth == 0) and (node.tag == "branch"):
+                parent = QtGui.QStandardItem(node.get("name", "NA"))
+                parent.setFlags(QtCore.Qt.ItemIsEnabled)
+                branches[-1].appendRow(parent)
+                branches.append(parent)
+
+            # Or a leaf (DaveAction).
+            else:
+                action_depth += 1
+
+        elif (action_depth > 0):
+            action_depth -= 1
+            if (action_depth == 0):
+                action = DaveActionStandardItem(node)
+                model.addItem(action)
+                branches[-1].appendRow(action)
+
+        elif (node.tag == "branch"):
+            branches.pop()
+
+            # The branch's actions are all in the model now.
+            node.clear()
+
+    # Free the XML nodes that were already handled.
+    root.clear()
     return model
 
-## recursiveParse
-#
-# Recursively parse the XML tree.
-#
-# @param model The root DaveStandardItemModel.
-# @param model_branch_model A branch of a DaveStandardItemModel.
-# @param xml_branch The current xml branch
-# 
-def recursiveParse(model, model_branch, xml_branch):
-    for node in xml_branch:
-
-        # Everything is either a branch.
-        if (node.tag == "branch"):
-            parent = QtGui.QStandardItem(node.get("name", "NA"))
-            parent.setFlags(QtCore.Qt.ItemIsEnabled)
-            model_branch.appendRow(parent)
-            recursiveParse(model, parent, node)
-
-        # Or a leaf (DaveAction).
-        else:
-            action = DaveActionStandardItem(node)
-            model.addItem(action)
-            model_branch.appendRow(action)
-
 #
 # The MIT License
 #
@@ -18,7 +18,7 @@ import os
 import sys
 import traceback
 from xml.etree import ElementTree
-from xml.dom import minidom
+from xml.sax.saxutils import quoteattr
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
@@ -63,11 +63,7 @@ class XMLRecipeParser(QtWidgets.QWidget):
         self.loop_variable_names = []
         self.loop_iterator = []
 
-        self.flat_sequence = []
-        self.flat_sequence_xml = []
         self.xml_sequence_file_path = output_filename
-        
-        self.da_primitives_xml = []
 
         # A convenient list of dave actions required for parsing a <movie> tag
         self.movie_da_actions = [daveActions.DAMoveStage(),
@@ -88,10 +84,6 @@ class XMLRecipeParser(QtWidgets.QWidget):
     # @param flat_sequence The element tree that contains a flat sequence of higher order commands, e.g. <movie>
     #
     def convertToDaveXMLPrimitives(self, primitives_xml, flat_sequence):
-        if self.verbose:
-            print("---------------------------------------------------------")
-            print("Converting to Dave Primitives")
-        
         # Loop over all children
         for child in flat_sequence:
             if child.tag == "branch": # Generate block and call recursively to handle elements in blocks
@@ -185,6 +177,37 @@ class XMLRecipeParser(QtWidgets.QWidget):
 
         return new_parent
 
+    ## expandSequence
+    #
+    # A generator that expands the <loop> and <variable_entry> tags of a command
+    # sequence one command at a time, so that the flat sequence is never in memory.
+    #
+    # @param parent The element tree to be expanded.
+    #
+    # @return Yields ["branch", name], ["end", None] at the start and end of
+    #         each branch and ["command", element] for each higher order command.
+    #
+    def expandSequence(self, parent):
+        for child in parent:
+            if child.tag == "loop":
+                loop_name = child.attrib["name"]
+                loop_ID = self.loop_variable_names.index(loop_name)
+                yield ["branch", loop_name]
+                for local_iterator in range(len(self.loop_variables[loop_ID])):
+                    self.loop_iterator[loop_ID] = local_iterator # Store iterator for updating names
+                    yield from self.expandSequence(child)
+                yield ["end", None]
+                self.loop_iterator[loop_ID] = -1
+            elif child.tag == "variable_entry":
+                loop_ID = self.loop_variable_names.index(child.attrib["name"])
+                yield from self.expandSequence(self.loop_variables[loop_ID][self.loop_iterator[loop_ID]])
+            elif child.tag == "branch":
+                yield ["branch", child.attrib["name"]]
+                yield from self.expandSequence(child)
+                yield ["end", None]
+            else:
+                yield ["command", self.copyChildren([child], ElementTree.Element("sequence"))[0]]
+
     ## handleLoop
     #
     # Handles iteration of loop variables and naming of branches corresponding to loops
@@ -366,20 +389,7 @@ class XMLRecipeParser(QtWidgets.QWidget):
         for command_sequence in self.command_sequences:
             command_sequence = self.replaceItems(command_sequence)
 
-        # Create flat command sequence and convert to new xml element tree
-        self.flat_sequence = ElementTree.Element("sequence")
-        self.flat_sequence.text = "\n" # Clean up display
-
-        # Fill sequence from command sequence elements
-        for command_sequence in self.command_sequences:
-            self.copyChildren(command_sequence, self.flat_sequence)
-
-        # Create Dave action primitives
-        self.da_primitives_xml = ElementTree.Element("sequence")
-        self.da_primitives_xml.text = "\n"
-        self.convertToDaveXMLPrimitives(self.da_primitives_xml, self.flat_sequence)
-
-        # Save dave primitives
+        # Expand the command sequences, convert them to Dave primitives and save.
         self.saveDavePrimitives()
 
     ## parseXMLExperiment
@@ -430,18 +440,22 @@ class XMLRecipeParser(QtWidgets.QWidget):
     #
     # Save the final dave primitives sequence.
     #
+    # Each command is converted and written as soon as it is expanded, so
+    # memory use does not depend on the length of the sequence.
+    #
     def saveDavePrimitives(self):
         if self.xml_sequence_file_path == "":
             self.xml_sequence_file_path = QtWidgets.QFileDialog.getSaveFileName(self,
                                                                                 "Save XML Sequence",
                                                                                 self.directory,
                                                                                 "*.xml")[0]
+        if self.verbose:
+            print("---------------------------------------------------------")
+            print("Converting to Dave Primitives")
+
         try:
-            out_fp = open(self.xml_sequence_file_path, "w")
-            rough_string = ElementTree.tostring(self.da_primitives_xml, 'utf-8')        
-            reparsed = minidom.parseString(rough_string)
-            out_fp.write(reparsed.toprettyxml(indent="  ", encoding = "ISO-8859-1").decode())
-            out_fp.close()
+            with open(self.xml_sequence_file_path, "w", encoding = "utf-8") as out_fp:
+                self.writeDavePrimitives(out_fp)
             self.wrote_XML = True
         except:
             QtWidgets.QMessageBox.information(self,
@@ -449,6 +463,33 @@ class XMLRecipeParser(QtWidgets.QWidget):
                                               traceback.format_exc())
             self.xml_sequence_file_path = ""
 
+    ## writeDavePrimitives
+    #
+    # Write the dave primitives sequence.
+    #
+    # @param out_fp The file to write to.
+    #
+    def writeDavePrimitives(self, out_fp):
+        out_fp.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n")
+        out_fp.write("<sequence>\n")
+        level = 1
+        for command_sequence in self.command_sequences:
+            for [event, value] in self.expandSequence(command_sequence):
+                if (event == "branch"):
+                    out_fp.write("  " * level + "<branch name=" + quoteattr(value) + ">\n")
+                    level += 1
+                elif (event == "end"):
+                    level -= 1
+                    out_fp.write("  " * level + "</branch>\n")
+                else:
+                    primitives_xml = ElementTree.Element("sequence")
+                    self.convertToDaveXMLPrimitives(primitives_xml, [value])
+                    for primitive in primitives_xml:
+                        ElementTree.indent(primitive, space = "  ", level = level)
+                        primitive.tail = None
+                        out_fp.write("  " * level + ElementTree.tostring(primitive, encoding = "unicode") + "\n")
+        out_fp.write("</sequence>\n")
+
     ## writtenXMLPath
     #
     # Determine if an XML file was written.
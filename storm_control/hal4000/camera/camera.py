@@ -41,6 +41,19 @@ class Camera(halModule.HalModule):
         self.film_settings = None
         self.is_master = None
 
+        # There can be a lot of cameras, so only ask for the
+        # messages that we actually handle.
+        self.subscriptions = {"configuration",
+                              "configure1",
+                              "current parameters",
+                              "get functionality",
+                              "new parameters",
+                              "shutter clicked",
+                              "start camera",
+                              "start film",
+                              "stop camera",
+                              "stop film"}
+
         camera_params = module_params.get("camera")
         a_module = importlib.import_module(camera_params.get("module_name"))
         a_class = getattr(a_module, camera_params.get("class_name"))
@@ -243,15 +243,16 @@ class CameraControl(QtCore.QThread):
         Data from the camera should go through this method on it's
         way to the camera functionality object.
         """
-        for frame in frames:
-            if self.film_length is not None:
+        if self.film_length is not None:
 
-                # This keeps us from emitting more than the expected number
-                # of newFrame signals.
+            # This keeps us from emitting more than the expected number
+            # of frames.
+            for i, frame in enumerate(frames):
                 if (frame.frame_number >= self.film_length):
+                    frames = frames[:i]
                     break
                 
-            self.camera_functionality.newFrame.emit(frame)
+        self.camera_functionality.emitFrames(frames)
 
     def newParameters(self, parameters):
         """
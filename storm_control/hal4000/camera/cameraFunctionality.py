@@ -11,6 +11,7 @@ import copy
 
 from PyQt5 import QtCore
 
+import storm_control.hal4000.camera.frame as frame
 import storm_control.hal4000.halLib.halFunctionality as halFunctionality
 
 
@@ -24,9 +25,17 @@ class CameraFunctionality(halFunctionality.HalFunctionality):
 
     During a parameter change feed.feed and display.display disconnect
     from camera functionalities and then request new ones.
+
+    New frames are available either one at a time from the newFrame
+    signal or in batches (frame.FrameBatch) from the newFrames signal. 
+    Consumers that can handle batches should use the newFrames signal
+    as this will reduce the number of signals that need to be emitted
+    when the camera is running fast. A signal is only emitted if
+    something is connected to it.
     """
     emccdGain = QtCore.pyqtSignal(int)
     newFrame = QtCore.pyqtSignal(object)
+    newFrames = QtCore.pyqtSignal(object)
     parametersChanged = QtCore.pyqtSignal()
     shutter = QtCore.pyqtSignal(bool)
     started = QtCore.pyqtSignal()
@@ -72,6 +81,21 @@ class CameraFunctionality(halFunctionality.HalFunctionality):
         # Not used, kept because it may be useful for enforcing invalid functionalities?
         return copy.deepcopy(self)
 
+    def emitFrames(self, frames):
+        """
+        Emit a list of new frames, as a batch and/or as
+        single frames depending on what is connected.
+        """
+        if (len(frames) == 0):
+            return
+        
+        if (self.receivers(self.newFrames) > 0):
+            self.newFrames.emit(frame.FrameBatch(frames))
+
+        if (self.receivers(self.newFrame) > 0):
+            for a_frame in frames:
+                self.newFrame.emit(a_frame)
+        
     def getCameraName(self):
         return self.camera_name
 
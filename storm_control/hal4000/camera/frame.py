@@ -6,10 +6,17 @@ or the data from a feed and it's meta-information.
 Notes: 
  (1) The numpy data field (np_data) is expected to
      be of type numpy.uint16.
+
+ (2) FrameBatch is a batch of (consecutive) frames from the
+     same camera or feed. These are what is emitted by the
+     newFrames signal of the camera functionality.
  
 Hazen 3/17
 """
 
+import numpy
+
+
 class Frame(object):
     """
     Class for the storage of a single frame of camera data
@@ -47,6 +54,54 @@ class Frame(object):
         return self.np_data.ctypes.data
 
 
+class FrameBatch(object):
+    """
+    Class for the storage of a batch of frames from a single
+    camera or feed.
+
+    The frames are available individually with getFrames() or as 
+    a single contiguous numpy.uint16 array with shape (n, y, x) using
+    getData(). The contiguous array is only created if requested.
+    """
+    def __init__(self, frames, **kwds):
+        """
+        frames - A list of Frame objects, these are all expected to
+                 be the same size.
+        """
+        super().__init__(**kwds)
+        self.frames = frames
+        self.np_data = None
+
+        self.image_x = self.frames[0].image_x
+        self.image_y = self.frames[0].image_y
+        self.which_camera = self.frames[0].which_camera
+
+    def __len__(self):
+        return len(self.frames)
+    
+    def getData(self):
+        """
+        Returns the frames in the batch as a (n, y, x) numpy array.
+        """
+        if self.np_data is None:
+            self.np_data = numpy.empty((len(self.frames), self.image_y, self.image_x), dtype = numpy.uint16)
+            for i, a_frame in enumerate(self.frames):
+                self.np_data[i] = a_frame.getData().reshape((self.image_y, self.image_x))
+        return self.np_data
+
+    def getFirstFrameNumber(self):
+        return self.frames[0].frame_number
+
+    def getFrames(self):
+        return self.frames
+
+    def getLastFrame(self):
+        return self.frames[-1]
+
+    def getLastFrameNumber(self):
+        return self.frames[-1].frame_number
+
+
 #
 # The MIT License
 #
@@ -11,6 +11,7 @@ import random
 import time
 from PyQt5 import QtCore
 
+import storm_control.sc_library.framePool as framePool
 import storm_control.sc_library.parameters as params
 import storm_control.hal4000.camera.cameraControl as cameraControl
 import storm_control.hal4000.camera.cameraFunctionality as cameraFunctionality
@@ -25,6 +26,8 @@ class NoneCameraControl(cameraControl.CameraControl):
         
         self.fake_frame = 0
         self.fake_frame_size = [0,0]
+        self.frame_pool = None
+        self.min_exposure_time = config.get("min_exposure_time", 0.010)
         self.pause_time = config.get("mean_pause", 0.1)
 
         #
@@ -52,11 +55,11 @@ class NoneCameraControl(cameraControl.CameraControl):
         self.parameters.set("exposure_time", params.ParameterRangeFloat(description = "Exposure time (seconds)", 
                                                                         name = "exposure_time", 
                                                                         value = 0.02,
-                                                                        min_value = 0.01,
+                                                                        min_value = self.min_exposure_time,
                                                                         max_value = 10.0))
         self.parameters.setv("max_intensity", 512)
         
-        chip_size = 512
+        chip_size = config.get("chip_size", 512)
         for pname in ["x_start", "x_end", "y_start", "y_end"]:
             self.parameters.getp(pname).setMaximum(chip_size)
 
@@ -126,16 +129,19 @@ class NoneCameraControl(cameraControl.CameraControl):
 
             # Configure camera.
             p = self.parameters
-            if (p.get("exposure_time") < 0.010):
-                p.set("exposure_time", 0.010)
+            if (p.get("exposure_time") < self.min_exposure_time):
+                p.set("exposure_time", self.min_exposure_time)
 
             p.set("fps", 1.0/p.get("exposure_time"))
 
             self.fake_frame_size = [size_x, size_y]
-            self.fake_frame = numpy.zeros(size_x * size_y, dtype = numpy.uint16)
-            for i in range(size_x):
-                for j in range(size_y):
-                    self.fake_frame[j*size_x+i] = i % 128 + j % 128
+            if self.frame_pool is None:
+                self.frame_pool = framePool.FramePool(frame_size = size_x * size_y)
+            else:
+                self.frame_pool.resize(size_x * size_y)
+            x_ramp = numpy.arange(size_x, dtype = numpy.uint16) % 128
+            y_ramp = numpy.arange(size_y, dtype = numpy.uint16) % 128
+            self.fake_frame = (y_ramp[:,None] + x_ramp[None,:]).flatten()
 
             if running:
                 self.startCamera()
@@ -149,9 +155,16 @@ class NoneCameraControl(cameraControl.CameraControl):
         
         self.running = True
         self.thread_started = True
+        next_frame_time = time.perf_counter()
         while(self.running):
-            aframe = frame.Frame(numpy.roll(self.fake_frame,
-                                            int(self.frame_number * self.parameters.get("roll"))),
+
+            # This is numpy.roll(), but into a buffer from the frame pool.
+            np_data = self.frame_pool.getBuffer()
+            shift = int(self.frame_number * self.parameters.get("roll")) % np_data.size
+            np_data[shift:] = self.fake_frame[:np_data.size - shift]
+            np_data[:shift] = self.fake_frame[np_data.size - shift:]
+
+            aframe = frame.Frame(np_data,
                                  self.frame_number,
                                  self.fake_frame_size[0],
                                  self.fake_frame_size[1],
@@ -165,9 +178,16 @@ class NoneCameraControl(cameraControl.CameraControl):
             # Emit new data signal.
             self.newData.emit([aframe])
 
-            # Sleep if we're still running.
+            # Sleep until the next frame is due if we're still running. This
+            # keeps the frame rate steady regardless of how long it took to
+            # create this frame.
             if self.running:
-                self.msleep(int(1000.0 * self.parameters.get("exposure_time")))
+                next_frame_time += self.parameters.get("exposure_time")
+                sleep_time = next_frame_time - time.perf_counter()
+                if (sleep_time > 0.0):
+                    time.sleep(sleep_time)
+                else:
+                    next_frame_time = time.perf_counter()
 
         # Also pause on stop.
         #time.sleep(random.expovariate(1.0/self.pause_time))
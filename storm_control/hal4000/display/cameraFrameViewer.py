@@ -198,6 +198,10 @@ class CameraFrameViewer(QtWidgets.QFrame):
         self.display_timer.timeout.connect(self.handleDisplayTimer)
         self.display_timer.start()
 
+    def cleanUp(self):
+        self.display_timer.stop()
+        self.camera_widget.cleanUp()
+
     def contextMenuEvent(self, event):
         menu = QtWidgets.QMenu(self)
         menu.addAction(self.ui.infoAct)
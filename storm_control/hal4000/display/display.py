@@ -24,6 +24,15 @@ class Display(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"configuration",
+                              "configure1",
+                              "current parameters",
+                              "get functionality",
+                              "new parameters",
+                              "show",
+                              "start",
+                              "start film",
+                              "stop film"}
 
         self.have_stage = False
         self.is_classic = (module_params.get("ui_type") == "classic")
@@ -16,6 +16,7 @@ import numpy
 
 from PyQt5 import QtCore
 
+import storm_control.sc_library.framePool as framePool
 import storm_control.sc_library.halExceptions as halExceptions
 import storm_control.sc_library.parameters as params
 
@@ -77,6 +78,7 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
         self.feed_name = feed_name
         self.feed_parameters = self.parameters
         self.frame_number = 0
+        self.frame_pool = None
         self.frame_slice = None
         self.number_connections = 0
         self.x_pixels = 0
@@ -96,7 +98,7 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
         assert(self.number_connections == 0)
         self.number_connections += 1
         
-        self.cam_fn.newFrame.connect(self.handleNewFrame)
+        self.cam_fn.newFrames.connect(self.handleNewFrames)
         self.cam_fn.started.connect(self.handleStarted)
         self.cam_fn.stopped.connect(self.handleStopped)
 
@@ -109,7 +111,7 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
         self.number_connections += 1
         
         if self.cam_fn is not None:
-            self.cam_fn.newFrame.disconnect(self.handleNewFrame)
+            self.cam_fn.newFrames.disconnect(self.handleNewFrames)
             self.cam_fn.started.disconnect(self.handleStarted)
             self.cam_fn.stopped.disconnect(self.handleStopped)
 
@@ -125,13 +127,17 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
         """
         return self.feed_name
 
-    def handleNewFrame(self, new_frame):
-        sliced_data = self.sliceFrame(new_frame)
-        self.newFrame.emit(frame.Frame(sliced_data,
-                                       new_frame.frame_number,
-                                       self.x_pixels,
-                                       self.y_pixels,
-                                       self.camera_name))
+    def handleNewFrames(self, frame_batch):
+        """
+        Process a batch of frames from the camera, then emit
+        the resulting feed frames (if any) as a single batch.
+        """
+        feed_frames = []
+        for new_frame in frame_batch.getFrames():
+            feed_frame = self.processFrame(new_frame)
+            if feed_frame is not None:
+                feed_frames.append(feed_frame)
+        self.emitFrames(feed_frames)
 
     def handleStarted(self):
         self.started.emit()
@@ -160,6 +166,18 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
     def isMaster(self):
         return False
 
+    def processFrame(self, new_frame):
+        """
+        Sub-classes should override this to create a feed frame from
+        a camera frame. Return None if there is no new feed frame.
+        """
+        sliced_data = self.sliceFrame(new_frame)
+        return frame.Frame(sliced_data,
+                           new_frame.frame_number,
+                           self.x_pixels,
+                           self.y_pixels,
+                           self.camera_name)
+
     def reset(self):
         self.frame_number = 0
 
@@ -189,6 +207,7 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
 
         self.x_pixels = p.get("x_pixels")
         self.y_pixels = p.get("y_pixels")
+        self.frame_pool = framePool.FramePool(frame_size = self.x_pixels * self.y_pixels)
 
         if (p.get("x_pixels") != self.cam_fn.getParameter("x_pixels")) or\
            (p.get("y_pixels") != self.cam_fn.getParameter("y_pixels")):
@@ -233,8 +252,9 @@ class FeedFunctionality(cameraFunctionality.CameraFunctionality):
         else:
             w = new_frame.image_x
             h = new_frame.image_y
-            sliced_frame = numpy.reshape(new_frame.np_data, (h,w))[self.frame_slice]
-            return numpy.ascontiguousarray(sliced_frame)
+            sliced_frame = self.frame_pool.getBuffer().reshape((self.y_pixels, self.x_pixels))
+            numpy.copyto(sliced_frame, numpy.reshape(new_frame.np_data, (h,w))[self.frame_slice])
+            return sliced_frame
 
     def toggleShutter(self):
         assert False
@@ -251,29 +271,34 @@ class FeedFunctionalityAverage(FeedFunctionality):
         self.counts = 0
         self.frames_to_average = self.parameters.get("frames_to_average")
 
-    def handleNewFrame(self, new_frame):
+    def processFrame(self, new_frame):
         sliced_data = self.sliceFrame(new_frame)
 
+        # The accumulator is allocated once and then re-used.
         if self.average_frame is None:
-            self.average_frame = sliced_data.astype(numpy.uint32)
+            self.average_frame = numpy.zeros(sliced_data.shape, dtype = numpy.uint32)
+
+        if (self.counts == 0):
+            numpy.copyto(self.average_frame, sliced_data)
         else:
             self.average_frame += sliced_data
         self.counts += 1
 
         if (self.counts == self.frames_to_average):
-            average_frame = self.average_frame/self.frames_to_average
-            self.newFrame.emit(frame.Frame(average_frame.astype(numpy.uint16),
-                                           self.frame_number,
-                                           self.x_pixels,
-                                           self.y_pixels,
-                                           self.camera_name))
-            self.average_frame = None
+            average_frame = self.frame_pool.getBuffer().reshape(self.average_frame.shape)
+            numpy.floor_divide(self.average_frame, self.frames_to_average, out = self.average_frame)
+            numpy.copyto(average_frame, self.average_frame, casting = "unsafe")
+            feed_frame = frame.Frame(average_frame,
+                                     self.frame_number,
+                                     self.x_pixels,
+                                     self.y_pixels,
+                                     self.camera_name)
             self.counts = 0
             self.frame_number += 1
+            return feed_frame
 
     def reset(self):
         super().reset()
-        self.average_frame = None
         self.counts = 0
         
     
@@ -288,16 +313,16 @@ class FeedFunctionalityInterval(FeedFunctionality):
         self.capture_frames = list(map(int, temp.split(",")))
         self.cycle_length = self.parameters.get("cycle_length")
 
-    def handleNewFrame(self, new_frame):
-        sliced_data = self.sliceFrame(new_frame)
-        
+    def processFrame(self, new_frame):
         if (new_frame.frame_number % self.cycle_length) in self.capture_frames:
-            self.newFrame.emit(frame.Frame(sliced_data,
-                                           self.frame_number,
-                                           self.x_pixels,
-                                           self.y_pixels,
-                                           self.camera_name))
+            sliced_data = self.sliceFrame(new_frame)
+            feed_frame = frame.Frame(sliced_data,
+                                     self.frame_number,
+                                     self.x_pixels,
+                                     self.y_pixels,
+                                     self.camera_name)
             self.frame_number += 1
+            return feed_frame
 
 
 class FeedFunctionalitySlice(FeedFunctionality):
@@ -449,6 +474,15 @@ class Feeds(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"configuration",
+                              "configure1",
+                              "configure2",
+                              "get feed names",
+                              "get functionality",
+                              "new parameters",
+                              "start film",
+                              "stop film",
+                              "updated parameters"}
         self.camera_names = []
         self.feed_controller = None
         self.feed_names = []
@@ -280,8 +280,11 @@ class FilmBox(QtWidgets.QGroupBox):
             self.will_overwrite = False
             self.ui.filenameLabel.setStyleSheet("QLabel { color: black}")
         
-    def updateFrames(self, new_number):
-        self.ui.framesText.setText(str(new_number))
+    def updateFrames(self, new_number, number_dropped = 0):
+        if (number_dropped > 0):
+            self.ui.framesText.setText(str(new_number) + " (" + str(number_dropped) + " dropped)")
+        else:
+            self.ui.framesText.setText(str(new_number))
 
     def updateSize(self, new_size):
         if (new_size < 1000.0):
@@ -325,9 +328,36 @@ class Film(halModule.HalModule):
     
     It is this complicated because we also allow 'Fixed Length' films whose
     length is set by a feed rather than directly by a camera.
+
+    The (optional) configuration section controls how the image writers 
+    save the frames:
+
+       writer_queue_depth - If greater than zero, each image writer saves
+                            frames in it's own thread with a queue of this
+                            many frames.
+
+       writer_drop_frames - If True, frames that arrive when the writer queue
+                            is full are dropped (and counted) instead of
+                            waiting for the writer thread to catch up.
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"change directory",
+                              "configuration",
+                              "configure1",
+                              "current parameters",
+                              "live mode",
+                              "new parameters",
+                              "new shutters file",
+                              "ready to film",
+                              "start",
+                              "start camera",
+                              "start film request",
+                              "stop camera",
+                              "stop film",
+                              "stop film request",
+                              "updated parameters",
+                              "wait for"}
 
         self.camera_functionalities = []
         self.feed_names = None
@@ -341,9 +371,16 @@ class Film(halModule.HalModule):
         self.timing_functionality = None
         self.wait_for = []
         self.waiting_on = []
+        self.writer_config = {"drop_frames" : False,
+                              "queue_depth" : 0}
         self.writers = None
         self.writers_stopped_timer = QtCore.QTimer(self)
 
+        if module_params.has("configuration"):
+            configuration = module_params.get("configuration")
+            self.writer_config["drop_frames"] = configuration.get("writer_drop_frames", False)
+            self.writer_config["queue_depth"] = configuration.get("writer_queue_depth", 0)
+
         try:
             self.logfile_fp = open(module_params.get("directory") + "image_log.txt", "a")
         except FileNotFoundError:
@@ -437,14 +474,13 @@ class Film(halModule.HalModule):
     def handleNewFrame(self, frame_number):
         self.number_frames = frame_number + 1
 
-        # Update display of the number of frames.
-        self.view.updateFrames(self.number_frames)
-
-        # Update display of the (total) storage used.
+        # Update display of the (total) storage used and the number
+        # of frames that the writers had to drop, if any.
         total_size = 0.0
         for writer in self.writers:
             total_size += writer.getSize()
         self.view.updateSize(total_size)
+        self.view.updateFrames(self.number_frames, self.numberDropped())
         
     def handleResponses(self, message):
 
@@ -618,6 +654,13 @@ class Film(halModule.HalModule):
             message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
                                                               data = {"parameters" : self.view.getParameters()}))
 
+            # Record how many frames the image writers dropped.
+            if (self.writer_config["queue_depth"] > 0):
+                dropped_param = params.ParameterInt(name = "dropped_frames",
+                                                    value = self.numberDropped())
+                message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
+                                                                  data = {"acquisition" : [dropped_param]}))
+
         elif message.isType("stop film request"):
             if (self.film_state != "run"):
                 raise halExceptions.HalException("Stop film request received while not filming.")
@@ -630,6 +673,16 @@ class Film(halModule.HalModule):
             if self.module_name in message.getData()["module names"]:
                 self.wait_for.append(message.getSourceName())
 
+    def numberDropped(self):
+        """
+        Returns the total number of frames dropped by the image writers.
+        """
+        number_dropped = 0
+        if self.writers is not None:
+            for writer in self.writers:
+                number_dropped += writer.getNumberDropped()
+        return number_dropped
+    
     def setLockout(self, state, acquisition_parameters = None):
         self.locked_out = state
         if acquisition_parameters is not None:
@@ -691,7 +744,9 @@ class Film(halModule.HalModule):
         if self.film_settings.isSaved():
             for camera in self.camera_functionalities:
                 if camera.getParameter("saved"):
-                    self.writers.append(imagewriters.createFileWriter(camera, self.film_settings))
+                    self.writers.append(imagewriters.createFileWriter(camera,
+                                                                      self.film_settings,
+                                                                      writer_config = self.writer_config))
         if (len(self.writers) == 0):
             self.view.updateSize(0.0)
         
@@ -747,7 +802,8 @@ class Film(halModule.HalModule):
                 self.writers_stopped_timer.start()
                 return
 
-        # Close writers.
+        # Close writers. This will block until any frames that are still
+        # in the writer queues have been saved.
         for writer in self.writers:
             writer.closeWriter()
 
@@ -86,6 +86,10 @@ class FocusLockView(halDialog.HalDialog):
     def amLocked(self):
         return self.ui.lockButton.isChecked()
     
+    def cleanUp(self, qt_settings):
+        self.lock_display.cleanUp()
+        super().cleanUp(qt_settings)
+
     def getParameters(self):
         return self.parameters
 
@@ -165,8 +169,9 @@ class FocusLockView(halDialog.HalDialog):
         for attr in params.difference(parameters, self.parameters):
             self.parameters.setv(attr, parameters.get(attr))
         self.lock_display.newParameters(parameters)
-        for mode in self.modes:
-            mode.newParameters(self.parameters)
+        with lockModes.LockMode.mutex:
+            for mode in self.modes:
+                mode.newParameters(self.parameters)
 
     def setFunctionality(self, name, functionality):
         #
@@ -187,6 +192,9 @@ class FocusLockView(halDialog.HalDialog):
             self.setEnabled(True)
             self.newParameters(self.parameters)
 
+    def setLockLoop(self, lock_loop):
+        self.lock_display.setLockLoop(lock_loop)
+
     def setLockTargetSpinBox(self, new_value):
         self.ui.lockTargetSpinBox.valueChanged.disconnect(self.handleLockTarget)
         self.ui.lockTargetSpinBox.setValue(int(1000.0 * new_value))
@@ -213,6 +221,16 @@ class FocusLock(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"configuration",
+                              "configure1",
+                              "configure2",
+                              "lock jump",
+                              "new parameters",
+                              "show",
+                              "start",
+                              "start film",
+                              "stop film",
+                              "tcp message"}
         self.configuration = module_params.get("configuration")
 
         self.control = lockControl.LockControl(configuration = module_params.get("configuration"))
@@ -220,6 +238,7 @@ class FocusLock(halModule.HalModule):
                                   configuration = module_params.get("configuration"))
         self.view.halDialogInit(qt_settings,
                                 module_params.get("setup_name") + " focus lock")
+        self.view.setLockLoop(self.control.getLockLoop())
 
         # Connect signals.
         self.control.controlMessage.connect(self.handleControlMessage)
@@ -236,6 +255,7 @@ class FocusLock(halModule.HalModule):
         
     def cleanUp(self, qt_settings):
         self.view.cleanUp(qt_settings)
+        self.control.cleanUp()
 
     def handleControlMessage(self, message):
         self.sendMessage(message)
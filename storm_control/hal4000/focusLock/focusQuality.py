@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """
-Python interface to the focus_quality library.
+Python interface to the focus_quality library, and numpy focus
+quality metrics for the optimal lock.
 
 Hazen 10/13
 """
@@ -9,26 +10,231 @@ import ctypes
 import numpy
 from numpy.ctypeslib import ndpointer
 import os
+import scipy.optimize
 import sys
 
 import storm_control.c_libraries.loadclib as loadclib
 
-focus_quality = loadclib.loadCLibrary("focus_quality")
+try:
+    focus_quality = loadclib.loadCLibrary("focus_quality")
 
-c_imageGradient = focus_quality.imageGradient
-c_imageGradient.argtypes = [ndpointer(dtype=numpy.uint16),
-                            ctypes.c_int,
-                            ctypes.c_int]
-c_imageGradient.restype = ctypes.c_float
+    c_imageGradient = focus_quality.imageGradient
+    c_imageGradient.argtypes = [ndpointer(dtype=numpy.uint16),
+                                ctypes.c_int,
+                                ctypes.c_int]
+    c_imageGradient.restype = ctypes.c_float
 
+except OSError:
+    print("C focus quality library not found, reverting to numpy.")
+    focus_quality = None
 
-def imageGradient(frame):
+
+def imageGradient(frame, use_numpy = False):
     """
     Returns the magnitude of the image gradient in the x direction.
     """
-    return c_imageGradient(frame.getData(),
-                           frame.image_x,
-                           frame.image_y)
+    if (focus_quality is not None) and (not use_numpy):
+        return c_imageGradient(frame.getData(),
+                               frame.image_x,
+                               frame.image_y)
+    else:
+        return imageGradientNumpy(frame)
+
+
+def imageGradientNumpy(frame):
+    """
+    The numpy version of imageGradient(). Like the C version the
+    image is treated as signed 16 bit and the last column is not
+    included in the sum.
+    """
+    image = numpy.ascontiguousarray(frame.getData(), dtype = numpy.uint16).view(numpy.int16)
+    image = image.reshape((frame.image_y, frame.image_x)).astype(numpy.int32)
+    diff = numpy.abs(numpy.diff(image, axis = 1))
+    diff = numpy.sum(diff, dtype = numpy.int64)
+    total = numpy.sum(image[:,:-1], dtype = numpy.int64)
+    return float(numpy.float32(diff)/numpy.float32(total))
+
+
+#
+# Numpy focus quality metrics. These all work on a (float32) image
+# from focusImage() and are normalized by the image intensity, so
+# they don't change much with the laser power / sample brightness.
+#
+def brenner(image):
+    """
+    The Brenner gradient, the mean of the squared difference between
+    pixels two columns apart.
+    """
+    diff = image[:,2:] - image[:,:-2]
+    return float(numpy.mean(diff * diff)/max(numpy.mean(image)**2, 1.0))
+
+
+def focusImage(frame, roi_size = 0, subsample = 1):
+    """
+    Returns the (float32) image from the center roi_size x roi_size
+    pixels of the frame, keeping every subsample'th row and column.
+    A roi_size of 0 is the whole frame.
+    """
+    image = frame.getData().reshape((frame.image_y, frame.image_x))
+    if (roi_size > 0):
+        x_start = max(0, (frame.image_x - roi_size)//2)
+        y_start = max(0, (frame.image_y - roi_size)//2)
+        image = image[y_start:y_start+roi_size,x_start:x_start+roi_size]
+    return image[::subsample,::subsample].astype(numpy.float32)
+
+
+def focusQuality(frame, metric = "gradient", roi_size = 0, subsample = 1):
+    """
+    Returns the focus quality of a frame using one of the metrics.
+
+    The 'gradient' metric of the whole frame is the same as
+    imageGradient() so it uses the C library if it is available.
+    """
+    if (metric == "gradient") and (roi_size == 0) and (subsample == 1):
+        return imageGradient(frame)
+    return metrics[metric](focusImage(frame, roi_size = roi_size, subsample = subsample))
+
+
+def gradient(image):
+    """
+    The magnitude of the image gradient in the x direction, this is
+    the numpy version of imageGradient() for a focusImage().
+    """
+    diff = numpy.sum(numpy.abs(numpy.diff(image, axis = 1)))
+    return float(diff/max(numpy.sum(image[:,:-1]), 1.0))
+
+
+def laplacianVariance(image):
+    """
+    The variance of the (4 neighbor) Laplacian of the image.
+    """
+    laplacian = (image[1:-1,:-2] + image[1:-1,2:] + image[:-2,1:-1] + image[2:,1:-1] - 4.0 * image[1:-1,1:-1])
+    return float(numpy.var(laplacian)/max(numpy.mean(image)**2, 1.0))
+
+
+metrics = {"brenner" : brenner,
+           "gradient" : gradient,
+           "laplacian" : laplacianVariance}
+
+
+class FocusScan(object):
+    """
+    Finds the z position (QPD offset) with the best focus quality
+    during a z scan.
+
+    The measurements are added one frame at a time and averaged for
+    each scan step. As each step is finished we check whether the
+    quality peak is bracketed, i.e. whether there is a step on both
+    sides of the best step where the quality is significantly lower.
+    If it is, a parabola is fit to the best step and it's neighbors
+    and the scan can stop early.
+    """
+    def __init__(self, drop_fraction = 0.2, n_sigma = 3.0, **kwds):
+        """
+        drop_fraction - The quality on both sides of the peak must be lower
+                        than the peak by at least this fraction of the range
+                        of the measured qualities.
+        n_sigma - .. and by at least this many standard errors.
+        """
+        super().__init__(**kwds)
+        self.drop_fraction = drop_fraction
+        self.n_sigma = n_sigma
+        self.reset()
+
+    def addMeasurement(self, z, quality):
+        """
+        Add a measurement to the current step.
+        """
+        self.step_n += 1
+        self.step_sums += [z, quality, quality * quality]
+
+    def fitPeak(self):
+        """
+        Returns the z position of the peak of a parabola through the
+        best step and its neighbors on each side. This is the z of the
+        best step if the parabola does not have a maximum.
+        """
+        [z, q, sem] = self.getSteps()
+        order = numpy.argsort(z)
+        z = z[order]
+        q = q[order]
+        i = int(numpy.argmax(q))
+        lo = max(0, i - 2)
+        hi = min(z.size, i + 3)
+        if ((hi - lo) < 3):
+            return float(z[i])
+
+        [a, b, c] = numpy.polyfit(z[lo:hi], q[lo:hi], 2)
+        if (a >= 0.0):
+            return float(z[i])
+        return float(numpy.clip(-0.5 * b / a, z[lo], z[hi-1]))
+
+    def fitPeakGaussian(self):
+        """
+        Returns the center of a gaussian fit to all of the steps,
+        or the z position of the best step if the fit fails.
+        """
+        [z, q, sem] = self.getSteps()
+        i = int(numpy.argmax(q))
+        fitfunc = lambda p, x: p[0] + p[1] * numpy.exp(- (x - p[2]) * (x - p[2]) * p[3])
+        errfunc = lambda p: fitfunc(p, z) - q
+        p0 = [numpy.min(q),
+              numpy.max(q) - numpy.min(q),
+              z[i],
+              9.0] # empirically determined width parameter
+        [p1, success] = scipy.optimize.leastsq(errfunc, p0[:])
+        if (success in [1, 2, 3, 4]) and (numpy.min(z) <= p1[2] <= numpy.max(z)):
+            return float(p1[2])
+        print("> fit for optimal lock failed.")
+        return float(z[i])
+
+    def getNumberSteps(self):
+        return len(self.steps)
+
+    def getSteps(self):
+        """
+        Returns [z, quality, standard error of the quality] for
+        each step.
+        """
+        steps = numpy.array(self.steps).reshape(-1, 3)
+        return [steps[:,0], steps[:,1], steps[:,2]]
+
+    def isBracketed(self):
+        if (len(self.steps) < 3):
+            return False
+
+        [z, q, sem] = self.getSteps()
+        i = int(numpy.argmax(q))
+        q_range = q[i] - numpy.min(q)
+        if (q_range <= 0.0):
+            return False
+
+        for side in [(z < z[i]), (z > z[i])]:
+            if not numpy.any(side):
+                return False
+            drop = q[i] - q[side]
+            noise = self.n_sigma * numpy.sqrt(sem[i]**2 + sem[side]**2)
+            if not numpy.any((drop >= self.drop_fraction * q_range) & (drop > noise)):
+                return False
+        return True
+
+    def nextStep(self):
+        """
+        Finish the current step. Returns True if the peak is bracketed.
+        """
+        if (self.step_n > 0):
+            n = self.step_n
+            [z, q, q2] = self.step_sums/n
+            sem = numpy.sqrt(max(q2 - q * q, 0.0)/n)
+            self.steps.append([z, q, sem])
+        self.step_n = 0
+        self.step_sums = numpy.zeros(3)
+        return self.isBracketed()
+
+    def reset(self):
+        self.step_n = 0
+        self.step_sums = numpy.zeros(3)
+        self.steps = []
 
 
 
@@ -3,6 +3,11 @@
 This class handles focus lock control, i.e. updating the
 position if the focus lock is locked, etc.
 
+The QPD readings are handled by lockLoop.LockLoop in it's own
+thread. Everything in this class happens in the GUI thread, so
+calls that change the state of the current lock mode need to
+hold lockModes.LockMode.mutex.
+
 Hazen 04/17
 """
 
@@ -11,6 +16,9 @@ import tifffile
 
 import storm_control.hal4000.halLib.halMessage as halMessage
 
+import storm_control.hal4000.focusLock.lockLoop as lockLoop
+import storm_control.hal4000.focusLock.lockModes as lockModes
+
 
 class LockControl(QtCore.QObject):
     controlMessage = QtCore.pyqtSignal(object)
@@ -27,20 +35,31 @@ class LockControl(QtCore.QObject):
 
         # These are used for diagnostics.
         self.diagnostics_mode = configuration.get("diagnostics_mode", False)
-        self.tiff_counter = None
         self.tiff_fp = None
+
+        # The focus lock control loop.
+        self.lock_loop = lockLoop.LockLoop(update_period = configuration.get("update_period", 0))
         
         # Qt timer for checking focus lock
         self.check_focus_timer = QtCore.QTimer()
         self.check_focus_timer.setSingleShot(True)
         self.check_focus_timer.timeout.connect(self.handleCheckFocusLock)
         
+    def cleanUp(self):
+        self.lock_loop.cleanUp()
+
+    def getLockLoop(self):
+        return self.lock_loop
+
     def getLockModeName(self):
         return self.lock_mode.getName()
     
     def getLockTarget(self):
         return self.lock_mode.getLockTarget()
 
+    def getLoopStatistics(self):
+        return self.lock_loop.getStatistics()
+
     def getQPDSumSignal(self):
         return self.lock_mode.getQPDState()["sum"]
 
@@ -112,7 +131,8 @@ class LockControl(QtCore.QObject):
             self.current_state = None
 
     def handleJump(self, delta_z):
-        self.lock_mode.handleJump(delta_z)
+        with lockModes.LockMode.mutex:
+            self.lock_mode.handleJump(delta_z)
 
     def handleLockStarted(self, on):
         """
@@ -124,7 +144,8 @@ class LockControl(QtCore.QObject):
             self.stopLock()
         
     def handleLockTarget(self, new_target):
-        self.lock_mode.setLockTarget(new_target)
+        with lockModes.LockMode.mutex:
+            self.lock_mode.setLockTarget(new_target)
 
     def handleModeChanged(self, new_mode):
         """
@@ -137,83 +158,43 @@ class LockControl(QtCore.QObject):
         if self.lock_mode is not None:
             self.lock_mode.done.disconnect(self.handleDone)
 
-        self.lock_mode = new_mode
-        self.lock_mode.done.connect(self.handleDone)
+        with lockModes.LockMode.mutex:
+            self.lock_mode = new_mode
+            self.lock_mode.done.connect(self.handleDone)
 
-        # FIXME: We only need to do this once, maybe not that big a deal.
-        self.lock_mode.setZStageFunctionality(self.z_stage_functionality)
+            # FIXME: We only need to do this once, maybe not that big a deal.
+            self.lock_mode.setZStageFunctionality(self.z_stage_functionality)
 
-        self.z_stage_functionality.recenter()
+            self.z_stage_functionality.recenter()
+        self.lock_loop.setLockMode(self.lock_mode)
 
     def handleNewFrame(self, frame):
-        if self.offset_fp is not None:
-            frame_number = frame.frame_number + 1
-            pos_dict = self.lock_mode.getQPDState()
-            is_good = int(pos_dict["is_good"])
-            offset = pos_dict["offset"]
-            power = pos_dict["sum"]
-            stage_z = self.z_stage_functionality.getCurrentPosition()
-
-            # In diagnostics mode, add a column for the current tiff image from the QPD.
-            if self.tiff_counter is not None:
-                self.offset_fp.write("{0:d} {1:.6f} {2:.6f} {3:.6f} {4:0d} {5:0d}\n".format(frame_number,
-                                                                                            offset,
-                                                                                            power,
-                                                                                            stage_z,
-                                                                                            is_good,
-                                                                                            self.tiff_counter))
-
-            # Otherwise save as normal.
-            else:
-                self.offset_fp.write("{0:d} {1:.6f} {2:.6f} {3:.6f} {4:0d}\n".format(frame_number,
-                                                                                     offset,
-                                                                                     power,
-                                                                                     stage_z,
-                                                                                     is_good))
-        self.lock_mode.handleNewFrame(frame)
-
-    def handleQPDUpdate(self, qpd_dict):
-        """
-        Basically this is where all the action happens. The current
-        mode tells us to move (or not) based on the current QPD signal, 
-        then we poll the QPD again by calling the getOffset() method.
-
-        Note: Some QPDs are configured so that after the first call to 
-              getOffset() they will continuously emit the qpdUpdate() 
-              signal. We always call getOffset() again anyway, but if 
-              this was changed there is no guarantee that we'd stop
-              getting this signal from the QPD.
-        """
-        # Even if the current QPD reading is bad the mode needs to know, so
-        # just pass the QPD reading through here.
-        #
-        # Reasons:
-        #
-        # 1. If the QPD is always bad then the mode will have LockMode.qpd_state
-        #    as 'None' and this will be a problem when we query for state
-        #    at the end of a film.
-        #
-        # 2. If the QPD reading goes bad the mode will keep a stale value
-        #    of the QPD state.
-        #
-        # FIXME: If we have a qpd_functionality and a z_stage_functionality but
-        #        are missing some other functionality then self.lock_mode could
-        #        be None. Not sure whether it is best to just fail here as we do
-        #        now or whether we should check for this.
-        #
-        self.lock_mode.handleQPDUpdate(qpd_dict)
-
-        # Save image if we have a valid tiff counter.
-        #
-        # There is some kind of race condition here as checking self.tiff_fp
-        # will sometimes fail. Not sure if checking self.tiff_counter will
-        # always work.
-        if self.tiff_counter is not None:
-            self.tiff_counter += 1
-            self.tiff_fp.save(self.lock_mode.getQPDState()["image"])
-            
-        # Poll QPD again.
-        self.qpd_functionality.getOffset()
+        with lockModes.LockMode.mutex:
+            if self.offset_fp is not None:
+                frame_number = frame.frame_number + 1
+                pos_dict = self.lock_mode.getQPDState()
+                is_good = int(pos_dict["is_good"])
+                offset = pos_dict["offset"]
+                power = pos_dict["sum"]
+                stage_z = self.z_stage_functionality.getCurrentPosition()
+
+                # In diagnostics mode, add a column for the current tiff image from the QPD.
+                if self.lock_loop.tiff_counter is not None:
+                    self.offset_fp.write("{0:d} {1:.6f} {2:.6f} {3:.6f} {4:0d} {5:0d}\n".format(frame_number,
+                                                                                                offset,
+                                                                                                power,
+                                                                                                stage_z,
+                                                                                                is_good,
+                                                                                                self.lock_loop.tiff_counter))
+
+                # Otherwise save as normal.
+                else:
+                    self.offset_fp.write("{0:d} {1:.6f} {2:.6f} {3:.6f} {4:0d}\n".format(frame_number,
+                                                                                         offset,
+                                                                                         power,
+                                                                                         stage_z,
+                                                                                         is_good))
+            self.lock_mode.handleNewFrame(frame)
 
     def handleTCPMessage(self, message):
         """
@@ -281,7 +262,7 @@ class LockControl(QtCore.QObject):
 
         elif tcp_message.isType("Set Lock Target"):
             if not tcp_message.isTest():
-                self.lock_mode.setLockTarget(tcp_message.getData("lock_target"))
+                self.handleLockTarget(tcp_message.getData("lock_target"))
             return True
         
         return False
@@ -296,7 +277,6 @@ class LockControl(QtCore.QObject):
     def setFunctionality(self, name, functionality):
         if (name == "qpd"):
             self.qpd_functionality = functionality
-            self.qpd_functionality.qpdUpdate.connect(self.handleQPDUpdate)
         elif (name == "z_stage"):
             self.z_stage_functionality = functionality
 
@@ -309,7 +289,7 @@ class LockControl(QtCore.QObject):
         if (self.qpd_functionality is not None) and (self.z_stage_functionality is not None):
             self.working = True
             # Start polling the QPD.
-            self.qpd_functionality.getOffset()
+            self.lock_loop.start(self.qpd_functionality)
         
     def startFilm(self, film_settings):
         # Open file to save the lock status at each frame.
@@ -318,9 +298,9 @@ class LockControl(QtCore.QObject):
 
                 # Only save images when in diagnostics mode and only for a QPDCameraFunctionality.
                 if self.diagnostics_mode and (self.qpd_functionality.getType() == "camera"):
-                    self.tiff_counter = 0
                     self.tiff_fp = tifffile.TiffWriter(film_settings.getBasename() + "_qpd.tif",
                                                        bigtiff = True)
+                    self.lock_loop.setTiffFile(self.tiff_fp)
 
                 self.offset_fp = open(film_settings.getBasename() + ".off", "w")
 
@@ -335,12 +315,14 @@ class LockControl(QtCore.QObject):
             if waveform is not None:
                 self.controlMessage.emit(halMessage.HalMessage(m_type = "daq waveforms",
                                                                data = {"waveforms" : [waveform]}))
-                
-            self.lock_mode.startFilm()
+
+            with lockModes.LockMode.mutex:
+                self.lock_mode.startFilm()
         
     def startLock(self, lock_target = None):
         if self.working:
-            self.lock_mode.startLock(lock_target)
+            with lockModes.LockMode.mutex:
+                self.lock_mode.startLock(lock_target)
 
     def startLockBehavior(self, sub_mode_name, sub_mode_params):
         """
@@ -350,7 +332,8 @@ class LockControl(QtCore.QObject):
         calling this function.
         """
         if self.working:
-            self.lock_mode.startLockBehavior(sub_mode_name, sub_mode_params)
+            with lockModes.LockMode.mutex:
+                self.lock_mode.startLockBehavior(sub_mode_name, sub_mode_params)
 
     def stopFilm(self):
         if self.working:
@@ -359,15 +342,17 @@ class LockControl(QtCore.QObject):
                 self.offset_fp = None
                 
             if self.tiff_fp is not None:
-                self.tiff_counter = None
+                self.lock_loop.setTiffFile(None)
                 self.tiff_fp.close()
                 self.tiff_fp = None
-                
-            self.lock_mode.stopFilm()
+
+            with lockModes.LockMode.mutex:
+                self.lock_mode.stopFilm()
 
         self.timing_functionality.newFrame.disconnect(self.handleNewFrame)
         self.timing_functionality = None
 
     def stopLock(self):
         if self.working:
-            self.lock_mode.stopLock()
+            with lockModes.LockMode.mutex:
+                self.lock_mode.stopLock()
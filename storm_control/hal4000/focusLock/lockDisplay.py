@@ -14,13 +14,27 @@ import storm_control.hal4000.qtdesigner.lockdisplay_ui as lockdisplayUi
 class LockDisplay(QtWidgets.QGroupBox):
     """
     The lock display UI group box.
+
+    The QPD readings are handled in the focus lock loop thread. The
+    display widgets get the most recent reading from the loop at a
+    fixed (display) rate, so drawing does not slow down the lock and
+    the GUI is not overwhelmed by a fast QPD.
     """
+    # Emitted with the most recent QPD reading.
+    qpdUpdate = QtCore.pyqtSignal(dict)
+
     def __init__(self, configuration = None, jump_signal = None, **kwds):
         super().__init__(**kwds)
         self.ir_laser_functionality = None
         self.ir_on = False
         self.ir_power = configuration.get("ir_power", 0)
+        self.lock_loop = None
         self.q_qpd_display = None
+        self.qpd_counter = 0
+
+        self.display_timer = QtCore.QTimer(self)
+        self.display_timer.setInterval(configuration.get("display_period", 50))
+        self.display_timer.timeout.connect(self.handleDisplayTimer)
 
         # UI setup
         self.ui = lockdisplayUi.Ui_GroupBox()
@@ -52,6 +66,15 @@ class LockDisplay(QtWidgets.QGroupBox):
         layout.setContentsMargins(2,2,2,2)
         layout.addWidget(self.q_qpd_sum_display)
 
+    def cleanUp(self):
+        self.display_timer.stop()
+
+    def handleDisplayTimer(self):
+        [counter, qpd_state] = self.lock_loop.getQPDState()
+        if (counter != self.qpd_counter) and (qpd_state is not None):
+            self.qpd_counter = counter
+            self.qpdUpdate.emit(qpd_state)
+
     def handleGoodLock(self, good_lock):
         self.q_qpd_offset_display.handleGoodLock(good_lock)
     
@@ -108,8 +131,8 @@ class LockDisplay(QtWidgets.QGroupBox):
                 self.ui.irSlider.hide()
 
         elif (name == "qpd"):
-            self.q_qpd_offset_display.setFunctionality(functionality)
-            self.q_qpd_sum_display.setFunctionality(functionality)
+            self.q_qpd_offset_display.setFunctionality(functionality, qpd_update = self.qpdUpdate)
+            self.q_qpd_sum_display.setFunctionality(functionality, qpd_update = self.qpdUpdate)
 
             # Display the output of a QPD.
             if (functionality.getType() == "qpd"):
@@ -121,7 +144,7 @@ class LockDisplay(QtWidgets.QGroupBox):
                 layout.addWidget(self.q_qpd_display)
                 self.ui.qpdXText.show()
                 self.ui.qpdYText.show()
-                self.q_qpd_display.setFunctionality(functionality)
+                self.q_qpd_display.setFunctionality(functionality, qpd_update = self.qpdUpdate)
 
             # Display AF camera output.
             elif (functionality.getType() == "af_camera"):
@@ -129,7 +152,7 @@ class LockDisplay(QtWidgets.QGroupBox):
                 layout = QtWidgets.QGridLayout(self.ui.qpdFrame)
                 layout.setContentsMargins(0,0,0,0)
                 layout.addWidget(self.q_qpd_display)
-                self.q_qpd_display.setFunctionality(functionality)
+                self.q_qpd_display.setFunctionality(functionality, qpd_update = self.qpdUpdate)
 
             # Display QPD camera output.
             elif (functionality.getType() == "qpd_camera"):
@@ -137,7 +160,7 @@ class LockDisplay(QtWidgets.QGroupBox):
                 layout = QtWidgets.QGridLayout(self.ui.qpdFrame)
                 layout.setContentsMargins(0,0,0,0)
                 layout.addWidget(self.q_qpd_display)
-                self.q_qpd_display.setFunctionality(functionality)
+                self.q_qpd_display.setFunctionality(functionality, qpd_update = self.qpdUpdate)
                 
             else:
                 raise Exception("Unknown QPD type.")
@@ -145,6 +168,10 @@ class LockDisplay(QtWidgets.QGroupBox):
         elif (name == "z_stage"):
             self.q_stage_display.setFunctionality(functionality)
 
+    def setLockLoop(self, lock_loop):
+        self.lock_loop = lock_loop
+        self.display_timer.start()
+
 
 #
 # FIXME? It is not clear that having the GUIs for different types of focus locks here
@@ -190,9 +217,15 @@ class QCamDisplay(QtWidgets.QWidget):
             self.setToolTip(self.tooltips[0])
         self.update()
 
-    def setFunctionality(self, functionality):
+    def setFunctionality(self, functionality, qpd_update = None):
+        """
+        qpd_update is the signal to get the QPD readings from, the
+        default is the functionalities qpdUpdate signal.
+        """
         self.functionality = functionality
-        self.functionality.qpdUpdate.connect(self.handleQPDUpdate)
+        if qpd_update is None:
+            qpd_update = self.functionality.qpdUpdate
+        qpd_update.connect(self.handleQPDUpdate)
         self.minimum_inc = functionality.getMinimumInc()
 
 
@@ -636,13 +669,15 @@ class QQPDDisplay(QStatusDisplay):
         painter.setBrush(color)
         painter.drawEllipse(self.convert(self.x_value) - 7, self.convert(self.y_value) - 7, 6, 6)
 
-    def setFunctionality(self, functionality):
+    def setFunctionality(self, functionality, qpd_update = None):
         super().setFunctionality(functionality)
         self.scale_max = self.functionality.getParameter("max_voltage")
         self.scale_min = self.functionality.getParameter("min_voltage")
         
         self.scale_range = 1.0/(self.scale_max - self.scale_min)
-        self.functionality.qpdUpdate.connect(self.updateValue)        
+        if qpd_update is None:
+            qpd_update = self.functionality.qpdUpdate
+        qpd_update.connect(self.updateValue)
 
     def updateValue(self, qpd_dict):
         if self.isEnabled():
@@ -675,7 +710,7 @@ class QQPDOffsetDisplay(QOffsetDisplay):
     def handleUpdateTimer(self):
         self.q_label.setText("{0:.1f}".format(self.value))
                 
-    def setFunctionality(self, functionality):
+    def setFunctionality(self, functionality, qpd_update = None):
         super().setFunctionality(functionality)
         self.has_center_bar = self.functionality.getParameter("offset_has_center_bar")
         self.scale_max = 1000.0 * self.functionality.getParameter("offset_maximum")
@@ -684,7 +719,9 @@ class QQPDOffsetDisplay(QOffsetDisplay):
         self.warning_low = 1000.0 * self.functionality.getParameter("offset_warning_low")
 
         self.scale_range = 1.0/(self.scale_max - self.scale_min)
-        self.functionality.qpdUpdate.connect(self.updateValue)
+        if qpd_update is None:
+            qpd_update = self.functionality.qpdUpdate
+        qpd_update.connect(self.updateValue)
 
     def updateValue(self, qpd_dict):
         if self.isEnabled() and qpd_dict["is_good"]:
@@ -741,7 +778,7 @@ class QQPDSumDisplay(QStatusDisplay):
         painter.drawRect(2, self.height() - self.convert(self.value),
                          self.width() - 5, self.convert(self.value))
             
-    def setFunctionality(self, functionality):
+    def setFunctionality(self, functionality, qpd_update = None):
         super().setFunctionality(functionality)
         self.scale_max = self.functionality.getParameter("sum_maximum")
         self.scale_min = self.functionality.getParameter("sum_minimum")
@@ -751,7 +788,9 @@ class QQPDSumDisplay(QStatusDisplay):
             self.warning_low = self.functionality.getParameter("sum_warning_low")
 
         self.scale_range = 1.0/(self.scale_max - self.scale_min)
-        self.functionality.qpdUpdate.connect(self.updateValue)        
+        if qpd_update is None:
+            qpd_update = self.functionality.qpdUpdate
+        qpd_update.connect(self.updateValue)
 
     def updateValue(self, qpd_dict):
         if self.isEnabled():
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+The focus lock control loop. This runs in its own (high priority)
+thread, so the time between a QPD reading and the z stage move
+does not depend on how busy the GUI / HAL is.
+
+The loop gets the QPD readings, passes them to the current lock
+mode (which moves the z stage) and then asks the QPD for the next
+reading. If an update period is specified the next reading is
+requested at a fixed interval after the previous request, otherwise
+it is requested immediately.
+
+The QPD functionality is moved to the loop thread while the loop is
+running, so neither the requests nor the readings have to go through
+the GUI thread's event loop.
+
+The GUI gets the latest QPD reading with getQPDState(), this is just
+a reference to a dictionary that the loop replaces, so the GUI never
+has to wait for the loop (or the other way around).
+
+Access to the lock modes is serialized with lockModes.LockMode.mutex.
+"""
+import numpy
+import time
+
+from PyQt5 import QtCore
+
+import storm_control.hal4000.focusLock.lockModes as lockModes
+
+
+class LoopStatistics(object):
+    """
+    Keeps the most recent measurements of the loop timing (in
+    milliseconds) in ring buffers.
+    """
+    names = ["control", "period", "qpd"]
+
+    def __init__(self, size = 1000, **kwds):
+        """
+        control - Time from receiving the QPD reading to finishing the z stage move.
+        period - Time between QPD readings.
+        qpd - Time from requesting a QPD reading to receiving it.
+        """
+        super().__init__(**kwds)
+        self.size = size
+        self.reset()
+
+    def getStatistics(self):
+        """
+        Returns a dictionary with the count, mean, 99th percentile
+        and maximum of each of the measurements.
+        """
+        stats = {}
+        for name in self.names:
+            n = min(self.counts[name], self.size)
+            values = self.values[name][:n]
+            if (n > 0):
+                stats[name] = {"count" : self.counts[name],
+                               "max" : float(numpy.max(values)),
+                               "mean" : float(numpy.mean(values)),
+                               "p99" : float(numpy.percentile(values, 99))}
+            else:
+                stats[name] = {"count" : 0, "max" : 0.0, "mean" : 0.0, "p99" : 0.0}
+        return stats
+
+    def record(self, name, value):
+        self.values[name][self.counts[name] % self.size] = value
+        self.counts[name] += 1
+
+    def reset(self):
+        self.counts = {}
+        self.values = {}
+        for name in self.names:
+            self.counts[name] = 0
+            self.values[name] = numpy.zeros(self.size)
+
+
+class LockLoop(QtCore.QObject):
+    """
+    Create this in the GUI thread, it moves itself to its own thread.
+    """
+    # Emitted to request a new QPD reading.
+    pollQPD = QtCore.pyqtSignal()
+
+    def __init__(self, update_period = 0, **kwds):
+        """
+        update_period - The time between QPD requests in milliseconds,
+                        0 is as fast as the QPD can respond.
+        """
+        super().__init__(**kwds)
+        self.lock_mode = None
+        self.qpd_counter = 0
+        self.qpd_functionality = None
+        self.qpd_state = None
+        self.running = False
+        self.statistics = LoopStatistics()
+        self.t_poll = None
+        self.t_received = None
+        self.tiff_counter = None
+        self.tiff_fp = None
+        self.update_period = update_period
+
+        self.poll_timer = QtCore.QTimer(self)
+        self.poll_timer.setSingleShot(True)
+        self.poll_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.poll_timer.timeout.connect(self.handlePollTimer)
+
+        self.loop_thread = QtCore.QThread()
+        self.moveToThread(self.loop_thread)
+
+    def cleanUp(self):
+        self.running = False
+        if self.loop_thread.isRunning():
+            QtCore.QMetaObject.invokeMethod(self,
+                                            "handleStop",
+                                            QtCore.Qt.BlockingQueuedConnection)
+        self.loop_thread.quit()
+        self.loop_thread.wait()
+
+        stats = self.statistics.getStatistics()
+        if (stats["period"]["count"] > 0):
+            print("> focus lock loop timing (ms), mean / 99% / max")
+            for name in LoopStatistics.names:
+                print(">  {0:s} {1:.2f} / {2:.2f} / {3:.2f}".format(name,
+                                                                   stats[name]["mean"],
+                                                                   stats[name]["p99"],
+                                                                   stats[name]["max"]))
+
+    def getQPDState(self):
+        """
+        Returns [counter, qpd_state], the counter increases with each
+        new QPD reading.
+        """
+        return [self.qpd_counter, self.qpd_state]
+
+    def getStatistics(self):
+        return self.statistics.getStatistics()
+
+    @QtCore.pyqtSlot()
+    def handlePollTimer(self):
+        self.poll()
+
+    @QtCore.pyqtSlot(dict)
+    def handleQPDUpdate(self, qpd_dict):
+        """
+        This is called in the loop thread.
+        """
+        t_received = time.perf_counter()
+        if self.t_poll is not None:
+            self.statistics.record("qpd", 1000.0 * (t_received - self.t_poll))
+        if self.t_received is not None:
+            self.statistics.record("period", 1000.0 * (t_received - self.t_received))
+        self.t_received = t_received
+
+        # Even if the current QPD reading is bad the mode needs to know,
+        # otherwise it will keep a stale value of the QPD state.
+        with lockModes.LockMode.mutex:
+            if self.lock_mode is not None:
+                self.lock_mode.handleQPDUpdate(qpd_dict)
+
+            # Save the QPD image (diagnostics mode).
+            if self.tiff_fp is not None:
+                self.tiff_counter += 1
+                self.tiff_fp.save(qpd_dict["image"])
+        self.statistics.record("control", 1000.0 * (time.perf_counter() - t_received))
+
+        self.qpd_state = qpd_dict
+        self.qpd_counter += 1
+
+        # Poll QPD again.
+        if not self.running:
+            return
+        if (self.update_period > 0) and (self.t_poll is not None):
+            wait = self.update_period - 1000.0 * (time.perf_counter() - self.t_poll)
+            if (wait > 0.5):
+                self.poll_timer.start(int(round(wait)))
+                return
+        self.poll()
+
+    @QtCore.pyqtSlot()
+    def handleStop(self):
+        """
+        This is called in the loop thread. The timer has to be stopped and
+        the QPD functionality moved back to the main thread from here.
+        """
+        self.poll_timer.stop()
+        if self.qpd_functionality is not None:
+            if (self.qpd_functionality.thread() == self.loop_thread):
+                self.qpd_functionality.moveToThread(QtCore.QCoreApplication.instance().thread())
+            self.qpd_functionality = None
+
+    def poll(self):
+        self.t_poll = time.perf_counter()
+        self.pollQPD.emit()
+
+    def setLockMode(self, lock_mode):
+        with lockModes.LockMode.mutex:
+            self.lock_mode = lock_mode
+
+    def setTiffFile(self, tiff_fp):
+        """
+        Set the file to save the QPD images in, or None to stop saving.
+        """
+        with lockModes.LockMode.mutex:
+            self.tiff_fp = tiff_fp
+            if tiff_fp is None:
+                self.tiff_counter = None
+            else:
+                self.tiff_counter = 0
+
+    def start(self, qpd_functionality):
+        """
+        Start the loop thread and request the first QPD reading.
+
+        The QPD readings are always queued, so a QPD that responds
+        immediately does not make the loop recursive.
+        """
+        self.qpd_functionality = qpd_functionality
+        if (qpd_functionality.parent() is None) and (qpd_functionality.thread() == QtCore.QThread.currentThread()):
+            qpd_functionality.moveToThread(self.loop_thread)
+        qpd_functionality.qpdUpdate.connect(self.handleQPDUpdate, QtCore.Qt.QueuedConnection)
+        self.pollQPD.connect(qpd_functionality.getOffset)
+        self.running = True
+        self.loop_thread.start(QtCore.QThread.HighestPriority)
+        self.poll()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -7,7 +7,7 @@ Hazen 05/15
 """
 import math
 import numpy
-import scipy.optimize
+import threading
 import tifffile
 import time
 
@@ -472,6 +472,10 @@ class LockMode(QtCore.QObject):
     # Emitted when the current lock target is changed.
     lockTarget = QtCore.pyqtSignal(float)
 
+    # The QPD readings are handled in the focus lock loop thread, everything
+    # else that changes the state of a lock mode should hold this lock.
+    mutex = threading.RLock()
+
     # The current QPD state. This is a class rather than an instance
     # variable so it is still available even when we change lock modes.
     qpd_state = None
@@ -630,7 +634,8 @@ class JumpLockMode(LockMode, FindSumMixin, LockedMixin, ScanMixin):
         """
         Restarts the focus lock when the relock timer fires.
         """
-        self.startLock()
+        with LockMode.mutex:
+            self.startLock()
 
 
 #
@@ -706,9 +711,15 @@ class OptimalLockMode(AlwaysOnLockMode):
     At the start of filming the stage is moved in a triangle wave. 
     First it goes up to bracket_step, then down to -bracket_step 
     and then finally back to zero. At each point along the way the 
-    focus quality & offset are recorded. When the stage returns to 
-    zero, the data is fit with a gaussian and the lock target is 
-    set to the offset corresponding to the center of the gaussian.
+    focus quality & offset are recorded. The lock target is set to
+    the offset with the best focus quality.
+
+    The focus quality measurements are averaged at each z step. If
+    the quality peak is bracketed the scan stops early, and the lock
+    target is the peak of a parabola fit to the steps around the
+    best step. Otherwise, when the stage returns to zero, the steps
+    are fit with a gaussian and the lock target is the center of
+    the gaussian.
     """
     def __init__(self, parameters = None, **kwds):
         kwds["parameters"] = parameters
@@ -716,15 +727,18 @@ class OptimalLockMode(AlwaysOnLockMode):
         self.name = "Optimal"
         self.olm_bracket_step = None
         self.olm_counter = 0
-        self.olm_fvalues = None
+        self.olm_metric = "gradient"
         self.olm_mode = "none"
         self.olm_pname = "optimal_mode"
         self.olm_quality_threshold = 0
         self.olm_relative_z = None
+        self.olm_roi_size = 0
+        self.olm_scan = focusQuality.FocusScan()
         self.olm_scan_hold = None
         self.olm_scan_step = None
         self.olm_scan_state = "na"
-        self.olm_zvalues = None
+        self.olm_stop_early = True
+        self.olm_subsample = 1
 
         # Add optimal lock specific parameters.
         p = self.parameters.addSubSection(self.olm_pname)
@@ -733,11 +747,20 @@ class OptimalLockMode(AlwaysOnLockMode):
                                          value = 1000.0,
                                          min_value = 10.0,
                                          max_value = 10000.0))
+        p.add(params.ParameterSetString(description = "Focus quality metric",
+                                        name = "quality_metric",
+                                        value = "gradient",
+                                        allowed = sorted(focusQuality.metrics.keys())))
         p.add(params.ParameterRangeFloat(description = "Minimum 'quality' signal",
                                          name = "quality_threshold",
                                          value = 0.0,
                                          min_value = 0.0,
                                          max_value = 1000.0))        
+        p.add(params.ParameterRangeInt(description = "Size of the (center) region to measure the focus quality in pixels, 0 is the whole frame",
+                                       name = "roi_size",
+                                       value = 0,
+                                       min_value = 0,
+                                       max_value = 4096))
         p.add(params.ParameterRangeFloat(description = "Step size in z in nanometers",
                                          name = "scan_step",
                                          value = 100.0,
@@ -748,6 +771,19 @@ class OptimalLockMode(AlwaysOnLockMode):
                                        value = 10,
                                        min_value = 1,
                                        max_value = 100))
+        p.add(params.ParameterSetBoolean(description = "Stop the scan once the focus quality peak is found",
+                                         name = "stop_early",
+                                         value = True))
+        p.add(params.ParameterRangeInt(description = "Only use every Nth pixel to measure the focus quality",
+                                       name = "subsample",
+                                       value = 1,
+                                       min_value = 1,
+                                       max_value = 16))
+
+    def finishScan(self, optimum):
+        print("> optimal Target:", optimum, "(" + str(self.olm_scan.getNumberSteps()) + " steps)")
+        self.olm_mode = "none"
+        self.startLock(target = optimum)
 
     def handleNewFrame(self, frame):
         """
@@ -755,16 +791,22 @@ class OptimalLockMode(AlwaysOnLockMode):
         the focus quality of the frame and moves the piezo to its next position.
         """
         if (self.olm_mode == "optimizing"):
-            quality = focusQuality.imageGradient(frame)
+            quality = focusQuality.focusQuality(frame,
+                                                metric = self.olm_metric,
+                                                roi_size = self.olm_roi_size,
+                                                subsample = self.olm_subsample)
             if (quality > self.olm_quality_threshold):
-                self.olm_zvalues[self.olm_counter] = LockMode.qpd_state["offset"]
-                self.olm_fvalues[self.olm_counter] = quality
+                self.olm_scan.addMeasurement(LockMode.qpd_state["offset"], quality)
                 self.olm_counter += 1
 
                 if ((self.olm_counter % self.olm_scan_hold) == 0):
 
+                    # Stop if we have found the peak.
+                    if self.olm_scan.nextStep() and self.olm_stop_early:
+                        self.finishScan(self.olm_scan.fitPeak())
+
                     # Scan up
-                    if (self.olm_scan_state == "scan up"):
+                    elif (self.olm_scan_state == "scan up"):
                         if (self.olm_relative_z >= self.olm_bracket_step):
                             self.olm_scan_state = "scan down"
                         else:
@@ -782,28 +824,7 @@ class OptimalLockMode(AlwaysOnLockMode):
                     # Scan back to zero                            
                     else: 
                         if (self.olm_relative_z >= 0.0):
-                            n = self.olm_counter - 1
-
-                            # Fit offset data to a 1D gaussian (lorentzian would be better?)
-                            zvalues = self.olm_zvalues[0:n]
-                            fvalues = self.olm_fvalues[0:n]
-                            fitfunc = lambda p, x: p[0] + p[1] * numpy.exp(- (x - p[2]) * (x - p[2]) * p[3])
-                            errfunc = lambda p: fitfunc(p, zvalues) - fvalues
-                            p0 = [numpy.min(fvalues),
-                                  numpy.max(fvalues) - numpy.min(fvalues),
-                                  zvalues[numpy.argmax(fvalues)],
-                                  9.0] # empirically determined width parameter
-                            p1, success = scipy.optimize.leastsq(errfunc, p0[:])
-                            if (success == 1):
-                                optimum = p1[2]
-                            else:
-                                print("> fit for optimal lock failed.")
-                                # hope that this is close enough
-                                optimum = zvalues[numpy.argmax(fvalues)]
-
-                            print("> optimal Target:", optimum)
-                            self.olm_mode = "none"
-                            self.startLock(target = optimum)
+                            self.finishScan(self.olm_scan.fitPeakGaussian())
                         else:
                             self.olm_relative_z += self.olm_scan_step
                             LockMode.z_stage_functionality.goRelative(self.olm_scan_step)
@@ -817,18 +838,20 @@ class OptimalLockMode(AlwaysOnLockMode):
         self.olm_relative_z = 0.0
         self.olm_scan_state = "scan up"
         self.olm_counter = 0
-        size_guess = round(self.olm_scan_hold * (self.olm_bracket_step / self.olm_scan_step) * 6)
-        self.olm_fvalues = numpy.zeros(size_guess)
-        self.olm_zvalues = numpy.zeros(size_guess)
+        self.olm_scan.reset()
                             
     def newParameters(self, parameters):
         if hasattr(super(), "newParameters"):
             super().newParameters(parameters)
         p = parameters.get(self.olm_pname)
         self.olm_bracket_step = 0.001 * p.get("bracket_step")
+        self.olm_metric = p.get("quality_metric")
         self.olm_quality_threshold = p.get("quality_threshold")
+        self.olm_roi_size = p.get("roi_size")
         self.olm_scan_step = 0.001 * p.get("scan_step")
         self.olm_scan_hold = p.get("scan_hold")
+        self.olm_stop_early = p.get("stop_early")
+        self.olm_subsample = p.get("subsample")
 
     def startFilm(self):
         if self.amLocked():
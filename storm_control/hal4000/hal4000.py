@@ -36,6 +36,7 @@ import storm_control.hal4000.halLib.halDialog as halDialog
 import storm_control.hal4000.halLib.halMessage as halMessage
 import storm_control.hal4000.halLib.halMessageBox as halMessageBox
 import storm_control.hal4000.halLib.halModule as halModule
+import storm_control.hal4000.halLib.halProfiler as halProfiler
 import storm_control.hal4000.qtWidgets.qtAppIcon as qtAppIcon
 
 
@@ -59,6 +60,13 @@ class HalController(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"add to menu",
+                              "add to ui",
+                              "change directory",
+                              "start",
+                              "start film",
+                              "stop film",
+                              "tests done"}
 
         if (module_params.get("ui_type") == "classic"):
             self.view = ClassicView(module_params = module_params,
@@ -388,8 +396,9 @@ class HalCore(QtCore.QObject):
         self.qt_settings = QtCore.QSettings("storm-control", "hal4000" + config.get("setup_name").lower())
         self.queued_messages = deque()
         self.queued_messages_timer = QtCore.QTimer(self)
+        self.routes = {}
         self.running = True # This is solely for the benefit of unit tests.
-        self.sent_messages = []
+        self.sent_messages = {}
         self.strict = config.get("strict", False)
 
         self.queued_messages_timer.setInterval(0)
@@ -466,6 +475,7 @@ class HalCore(QtCore.QObject):
         # Connect signals.
         for module in self.modules:
             module.newMessage.connect(self.handleMessage)
+            module.subscriptionsChanged.connect(self.handleSubscriptionsChanged)
 
         # Create messages.
         #
@@ -567,6 +577,23 @@ class HalCore(QtCore.QObject):
                 return m_child
         assert False, "UI element " + name + " not found."
 
+    def getRecipients(self, m_type):
+        """
+        Returns the list of modules that should receive messages of
+        type m_type. Modules that have not declared any subscriptions
+        receive everything. The lists are cached by message type and
+        preserve the module load order.
+        """
+        if not m_type in self.routes:
+            self.routes[m_type] = list(filter(lambda x: x.isSubscribed(m_type), self.modules))
+        return self.routes[m_type]
+
+    def handleSubscriptionsChanged(self):
+        """
+        A module changed its subscriptions, so the cached routes are stale.
+        """
+        self.routes = {}
+
     def handleErrors(self, message):
         """
         Handle errors in messages from 'core'
@@ -599,6 +626,7 @@ class HalCore(QtCore.QObject):
             halMessage.validateData(validator, message)
             
         message.logEvent("queued")
+        message.t_queued = halProfiler.timestamp()
 
         self.queued_messages.append(message)
 
@@ -611,8 +639,8 @@ class HalCore(QtCore.QObject):
         and performs message finalization.
         """
 
-        # Remove message from list of sent messages.
-        self.sent_messages.remove(message)
+        # Remove message from the table of sent messages.
+        del self.sent_messages[message.m_id]
 
         # Disconnect messages processed signal.
         message.processed.disconnect(self.handleProcessed)
@@ -620,6 +648,9 @@ class HalCore(QtCore.QObject):
         # Call message finalizer.
         message.finalize()
 
+        # Record message timing (if we are profiling).
+        halProfiler.recordMessage(message)
+
         # Always exit on exceptions in strict mode.
         if self.strict and message.hasErrors():
             for m_error in message.getErrors():
@@ -675,7 +706,7 @@ class HalCore(QtCore.QObject):
             #
             if cur_message.sync and (len(self.sent_messages) > 0):
                 print("> waiting for the following to be processed:")
-                for message in self.sent_messages:
+                for message in self.sent_messages.values():
                     text = "  '" + message.m_type + "' from " + message.getSourceName() + ", "
                     text += str(message.getRefCount()) + " module(s) have not responded yet."
                     print(text)
@@ -701,13 +732,21 @@ class HalCore(QtCore.QObject):
                     # Otherwise send the message.
                     else:
                         cur_message.logEvent("sent")
+                        cur_message.t_sent = halProfiler.timestamp()
 
                         cur_message.processed.connect(self.handleProcessed)
-                        self.sent_messages.append(cur_message)
-                        for module in self.modules:
-                            cur_message.ref_count += 1
+                        self.sent_messages[cur_message.m_id] = cur_message
+
+                        recipients = self.getRecipients(cur_message.m_type)
+                        cur_message.ref_count += len(recipients)
+                        for module in recipients:
                             module.handleMessage(cur_message)
 
+                        # Nobody is interested in this message, so it is
+                        # already processed.
+                        if (len(recipients) == 0):
+                            self.handleProcessed(cur_message)
+
                     # Process any remaining messages with immediate timeout.
                     if (len(self.queued_messages) > 0):
                         self.startMessageTimer()
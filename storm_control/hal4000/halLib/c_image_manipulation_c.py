@@ -64,6 +64,9 @@ def compare(image1, image2):
         print("Images are not the same size!")
         return
 
+    if image_manip is None:
+        return int(numpy.count_nonzero(image1.ravel() != image2.ravel()))
+    
     return image_manip.compare(image1, image2, image1.size)
 
 
@@ -141,18 +144,19 @@ def rescaleImage(image, flip_h, flip_v, transpose, display_range, saturated_valu
         if transpose:
             image = numpy.transpose(image)
         
-        rescaled = image.astype(numpy.float64)
-        rescaled = max_range*(rescaled - display_range[0])/(display_range[1] - display_range[0])
-        rescaled[(rescaled > max_range)] = max_range 
-        rescaled[(rescaled < 0.0)] = 0.0
+        # This follows the order of the operations in the C library
+        # so that we get the same answer. The operations are done in
+        # place to limit the number of temporary arrays.
+        rescaled = numpy.subtract(image, float(display_range[0]), dtype = numpy.float64)
+        rescaled *= max_range/float(display_range[1] - display_range[0])
+        numpy.clip(rescaled, 0.0, max_range, out = rescaled)
         
         # Check for saturated pixels
-        if saturated_value is not None:
-            rescaled[(image >= saturated_value)] = 255.0
+        rescaled[(image >= saturated_value)] = 255.0
 
         # Convert to contiguous uint8 array.
         rescaled += 0.5
-        rescaled = rescaled.astype(numpy.uint8, order='C')
+        rescaled = numpy.ascontiguousarray(rescaled.astype(numpy.uint8))
 
     return [rescaled, image_min, image_max]
 
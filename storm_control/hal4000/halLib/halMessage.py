@@ -276,6 +276,10 @@ class HalMessage(QtCore.QObject):
         self.source = source
         self.sync = sync
 
+        # These are set by HAL core for the benefit of halProfiler.
+        self.t_queued = None
+        self.t_sent = None
+
         global message_id
         self.m_id = message_id
         message_id += 1
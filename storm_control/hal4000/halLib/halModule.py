@@ -17,6 +17,7 @@ import storm_control.sc_library.halExceptions as halExceptions
 
 import storm_control.hal4000.halLib.halMessage as halMessage
 import storm_control.hal4000.halLib.halMessageBox as halMessageBox
+import storm_control.hal4000.halLib.halProfiler as halProfiler
 
 
 threadpool = QtCore.QThreadPool.globalInstance()
@@ -44,6 +45,7 @@ def runWorkerTask(module, message, task, job_time_ms = None):
     message.incRefCount()
     ct_task = HalWorker(job_time_ms = job_time_ms,
                         message = message,
+                        module_name = module.module_name,
                         task = task)
     ct_task.hwsignaler.workerDone.connect(module.handleWorkerDone)
     ct_task.hwsignaler.workerError.connect(module.handleWorkerError)
@@ -77,10 +79,11 @@ class HalWorker(QtCore.QRunnable):
     Set a timeout for the worker by using a value for job_time_ms 
     that is greater than 0.
     """
-    def __init__(self, job_time_ms = -1, message = None, task = None, **kwds):
+    def __init__(self, job_time_ms = -1, message = None, module_name = "", task = None, **kwds):
         super().__init__(**kwds)
         self.job_time_ms = job_time_ms
         self.message = message
+        self.module_name = module_name
         self.task = task
         self.task_complete = False
             
@@ -92,7 +95,8 @@ class HalWorker(QtCore.QRunnable):
     def run(self):
         self.hwsignaler.workerStarted.emit(self.message,
                                            self.job_time_ms)
-        
+
+        start = halProfiler.timestamp()
         try:
             self.task()
         except Exception as exception:
@@ -101,6 +105,7 @@ class HalWorker(QtCore.QRunnable):
                                              traceback.format_exc())
         finally:
             self.task_complete = True
+            halProfiler.recordHandled(self.message, self.module_name, start, worker = True)
             
         self.hwsignaler.workerDone.emit(self.message)
 
@@ -127,15 +132,22 @@ class HalModule(QtCore.QObject):
     Conventions:
        1. self.view is the GUI view, if any that is associated with this module.
        2. self.control is the controller, if any.
+       3. self.subscriptions is the set of message types that this module
+          handles. If this is None (the default) the module will receive
+          all messages. Modules that change this after __init__() must use
+          setSubscriptions(), subscribe() or unsubscribe() as HAL core
+          caches the message routing.
 
     """
     newMessage = QtCore.pyqtSignal(object)
+    subscriptionsChanged = QtCore.pyqtSignal()
 
     def __init__(self, module_name = "", **kwds):
         super().__init__(**kwds)
         self.module_name = module_name
 
         self.queued_messages = deque()
+        self.subscriptions = None
         self.worker = None
 
         # Timer for workers.
@@ -286,6 +298,39 @@ class HalModule(QtCore.QObject):
             self.worker_timer.setInterval(job_time_ms)
             self.worker_timer.start()
 
+    def isSubscribed(self, m_type):
+        """
+        Returns True if this module wants to receive messages of type m_type.
+        """
+        if self.subscriptions is None:
+            return True
+        return (m_type in self.subscriptions)
+
+    def setSubscriptions(self, subscriptions):
+        """
+        Set the message types that this module handles, None for all of them.
+        """
+        if subscriptions is not None:
+            subscriptions = set(subscriptions)
+        self.subscriptions = subscriptions
+        self.subscriptionsChanged.emit()
+
+    def subscribe(self, m_type):
+        """
+        Start receiving messages of type m_type.
+        """
+        if self.subscriptions is not None:
+            self.subscriptions.add(m_type)
+            self.subscriptionsChanged.emit()
+
+    def unsubscribe(self, m_type):
+        """
+        Stop receiving messages of type m_type.
+        """
+        if self.subscriptions is not None:
+            self.subscriptions.discard(m_type)
+            self.subscriptionsChanged.emit()
+
     def handleWorkerTimer(self):
         """
         If this timer fires that means the worker took longer than
@@ -319,6 +364,7 @@ class HalModule(QtCore.QObject):
         # Get the next message from the queue.
         message = self.queued_messages.popleft()
 
+        start = halProfiler.timestamp()
         try:
             self.processMessage(message)
         except Exception as exception:
@@ -326,6 +372,7 @@ class HalModule(QtCore.QObject):
                                                         message = str(exception),
                                                         m_exception = exception,
                                                         stack_trace = traceback.format_exc()))
+        halProfiler.recordHandled(message, self.module_name, start)
         message.decRefCount(name = self.module_name)
 
         # Check if this is being handled by a worker. If it is then we
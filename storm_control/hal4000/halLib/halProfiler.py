@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+In process profiling of HAL message handling.
+
+When profiling is enabled HAL core records when each message was
+queued, sent and processed, and the modules record how long they
+took to handle each message (either in processMessage() or in a
+worker). These records are kept in fixed size ring buffers so that
+they can be queried while HAL is running without the overhead of
+the hdebug logger.
+
+Profiling is enabled with startProfiling(), usually by the
+profiler.profiler module.
+"""
+
+import numpy
+import time
+
+from PyQt5 import QtCore
+
+
+a_profiler = None
+
+handled_dtype = numpy.dtype([("m_id", numpy.int64),
+                             ("m_type", numpy.int32),
+                             ("module", numpy.int32),
+                             ("worker", numpy.bool_),
+                             ("start", numpy.float64),
+                             ("duration", numpy.float64)])
+
+message_dtype = numpy.dtype([("m_id", numpy.int64),
+                             ("m_type", numpy.int32),
+                             ("source", numpy.int32),
+                             ("queued", numpy.float64),
+                             ("sent", numpy.float64),
+                             ("processed", numpy.float64)])
+
+
+def getProfiler():
+    global a_profiler
+    return a_profiler
+
+def isProfiling():
+    global a_profiler
+    return a_profiler is not None
+
+def recordHandled(message, module_name, start, worker = False):
+    """
+    Called by HalModule and HalWorker when they have finished
+    handling a message. start is the value of timestamp() when
+    handling began.
+    """
+    global a_profiler
+    if a_profiler is not None:
+        a_profiler.addHandled(message, module_name, start, timestamp(), worker)
+
+def recordMessage(message):
+    """
+    Called by HAL core when a message has been processed.
+    """
+    global a_profiler
+    if a_profiler is not None:
+        a_profiler.addMessage(message, timestamp())
+
+def startProfiling(size = 10000):
+    global a_profiler
+    a_profiler = HalProfiler(size = size)
+    return a_profiler
+
+def stopProfiling():
+    global a_profiler
+    a_profiler = None
+
+def timestamp():
+    return time.perf_counter()
+
+
+class RingBuffer(object):
+    """
+    A fixed size numpy structured array that overwrites the oldest
+    records once it is full.
+    """
+    def __init__(self, dtype = None, size = None, **kwds):
+        super().__init__(**kwds)
+        self.data = numpy.zeros(size, dtype = dtype)
+        self.n_added = 0
+
+    def add(self, record):
+        self.data[self.n_added % self.data.size] = record
+        self.n_added += 1
+
+    def getData(self):
+        """
+        Returns a copy of the records, oldest first.
+        """
+        if (self.n_added <= self.data.size):
+            return self.data[:self.n_added].copy()
+        index = self.n_added % self.data.size
+        return numpy.concatenate((self.data[index:], self.data[:index]))
+
+    def getNumberAdded(self):
+        return self.n_added
+
+    def reset(self):
+        self.n_added = 0
+
+
+class HalProfiler(object):
+    """
+    Message and module handling time records.
+
+    Strings (message types and module names) are stored as indices
+    into self.names to keep the records compact.
+
+    All times are in seconds, relative to the profiler start time.
+    """
+    def __init__(self, size = 10000, **kwds):
+        super().__init__(**kwds)
+        self.handled = RingBuffer(dtype = handled_dtype, size = size)
+        self.messages = RingBuffer(dtype = message_dtype, size = size)
+        self.mutex = QtCore.QMutex()
+        self.name_index = {}
+        self.names = []
+        self.t0 = timestamp()
+
+    def addHandled(self, message, module_name, start, stop, worker):
+        # This could be called from a worker thread.
+        self.mutex.lock()
+        self.handled.add((message.m_id,
+                          self.getIndex(message.m_type),
+                          self.getIndex(module_name),
+                          worker,
+                          start - self.t0,
+                          stop - start))
+        self.mutex.unlock()
+
+    def addMessage(self, message, processed):
+        if (message.t_queued is None) or (message.t_sent is None):
+            return
+        self.mutex.lock()
+        self.messages.add((message.m_id,
+                           self.getIndex(message.m_type),
+                           self.getIndex(message.getSourceName()),
+                           message.t_queued - self.t0,
+                           message.t_sent - self.t0,
+                           processed - self.t0))
+        self.mutex.unlock()
+
+    def getHandled(self):
+        self.mutex.lock()
+        data = self.handled.getData()
+        self.mutex.unlock()
+        return data
+
+    def getHandlingStats(self):
+        """
+        Returns a dictionary keyed by module name with the number of
+        messages handled and the mean, maximum and total handling
+        times in milliseconds.
+        """
+        return self.summarize(self.getHandled(), "module", "duration")
+
+    def getHistogram(self, module_name = None, m_type = None, bins = None):
+        """
+        Returns a histogram of the handling times (in milliseconds),
+        optionally restricted to a single module and / or message type.
+        The default bins are logarithmically spaced from 1us to 10s.
+        """
+        if bins is None:
+            bins = numpy.logspace(-3, 4, 29)
+
+        handled = self.getHandled()
+        mask = numpy.ones(handled.size, dtype = numpy.bool_)
+        if module_name is not None:
+            mask = mask & (handled["module"] == self.name_index.get(module_name, -1))
+        if m_type is not None:
+            mask = mask & (handled["m_type"] == self.name_index.get(m_type, -1))
+        return numpy.histogram(1000.0 * handled["duration"][mask], bins = bins)
+
+    def getIndex(self, name):
+        if not name in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def getMessages(self):
+        self.mutex.lock()
+        data = self.messages.getData()
+        self.mutex.unlock()
+        return data
+
+    def getMessageStats(self):
+        """
+        Returns a dictionary keyed by message type with the number of
+        messages and the mean, maximum and total time in milliseconds
+        between sending and finalization.
+        """
+        messages = self.getMessages()
+        stats = self.summarize(messages, "m_type", messages["processed"] - messages["sent"])
+
+        # Also include how long the messages waited in HAL's queue.
+        queued = messages["sent"] - messages["queued"]
+        for name in stats:
+            mask = (messages["m_type"] == self.name_index[name])
+            stats[name]["mean queued"] = 1000.0 * float(numpy.mean(queued[mask]))
+        return stats
+
+    def reset(self):
+        self.mutex.lock()
+        self.handled.reset()
+        self.messages.reset()
+        self.mutex.unlock()
+
+    def saveTrace(self, filename):
+        """
+        Save all the records. If the filename ends in '.npz' this is saved
+        in numpy's (compact) binary format, otherwise it is saved as a CSV
+        file.
+        """
+        handled = self.getHandled()
+        messages = self.getMessages()
+        names = numpy.array(self.names)
+
+        if filename.endswith(".npz"):
+            numpy.savez(filename, handled = handled, messages = messages, names = names)
+            return
+
+        with open(filename, "w") as fp:
+            fp.write("record,m_id,m_type,name,worker,start,duration,queued,sent,processed\n")
+            for elt in handled:
+                fp.write(",".join(["handled",
+                                   str(elt["m_id"]),
+                                   names[elt["m_type"]],
+                                   names[elt["module"]],
+                                   str(int(elt["worker"])),
+                                   "{0:.6f}".format(elt["start"]),
+                                   "{0:.6f}".format(elt["duration"]),
+                                   "", "", ""]) + "\n")
+            for elt in messages:
+                fp.write(",".join(["message",
+                                   str(elt["m_id"]),
+                                   names[elt["m_type"]],
+                                   names[elt["source"]],
+                                   "", "", "",
+                                   "{0:.6f}".format(elt["queued"]),
+                                   "{0:.6f}".format(elt["sent"]),
+                                   "{0:.6f}".format(elt["processed"])]) + "\n")
+
+    def summarize(self, records, field, times):
+        if isinstance(times, str):
+            times = records[times]
+        stats = {}
+        for index in numpy.unique(records[field]):
+            mask = (records[field] == index)
+            m_times = 1000.0 * times[mask]
+            stats[self.names[index]] = {"count" : int(m_times.size),
+                                        "max" : float(numpy.max(m_times)),
+                                        "mean" : float(numpy.mean(m_times)),
+                                        "total" : float(numpy.sum(m_times))}
+        return stats
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
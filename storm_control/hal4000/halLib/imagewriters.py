@@ -2,20 +2,30 @@
 """
 Image file writers for various formats.
 
+Writers receive frames in batches from the newFrames signal of the
+camera / feed functionality. They can either save the frames directly
+in the slot (the default) or hand them off to a bounded queue that is drained by a 
+dedicated writer thread. The latter keeps a slow disk (or a slow
+TIFF encode) from stalling HAL's event loop.
+
 Hazen 03/17
 """
 
 import copy
 import datetime
+import queue
 import struct
 import tifffile
 import time
+import traceback
 
 from PyQt5 import QtCore
 
 import storm_control.sc_library.halExceptions as halExceptions
 import storm_control.sc_library.parameters as params
 
+import storm_control.hal4000.camera.frame as frame
+
 
 class ImageWriterException(halExceptions.HalException):
     pass
@@ -36,39 +46,91 @@ def availableFileFormats(test_mode):
     else:
         return [".dax", ".tif", ".big.tif"]
 
-def createFileWriter(camera_functionality, film_settings):
+def createFileWriter(camera_functionality, film_settings, writer_config = None):
     """
     This is convenience function which creates the appropriate file writer
     based on the filetype.
+
+    writer_config is an optional dictionary with the keys 'queue_depth' and
+    'drop_frames'. If 'queue_depth' is greater than zero the frames will be 
+    saved by a separate writer thread.
     """
+    if writer_config is None:
+        writer_config = {}
+    kwds = {"camera_functionality" : camera_functionality,
+            "drop_frames" : writer_config.get("drop_frames", False),
+            "film_settings" : film_settings,
+            "queue_depth" : writer_config.get("queue_depth", 0)}
+    
     ft = film_settings.getFiletype()
     if (ft == ".dax"):
-        return DaxFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+        return DaxFile(**kwds)
     elif (ft == ".big.tif"):
-        return TIFFile(bigtiff = True,
-                       camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+        return TIFFile(bigtiff = True, **kwds)
     elif (ft == ".spe"):
-        return SPEFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+        return SPEFile(**kwds)
     elif (ft == ".test"):
-        return TestFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+        return TestFile(**kwds)
     elif (ft == ".tif"):
-        return TIFFile(camera_functionality = camera_functionality,
-                       film_settings = film_settings)
+        return TIFFile(**kwds)
     else:
         raise ImageWriterException("Unknown output file format '" + ft + "'")
 
 
-class BaseFileWriter(object):
+class WriterThread(QtCore.QThread):
+    """
+    Saves the frame batches that are in the queue using the writers 
+    writeFrames() method. There is one of these per writer, i.e.
+    per camera / feed that is being saved.
+
+    A None in the queue means that there are no more frames.
+    """
+    def __init__(self, frame_queue = None, writer = None, **kwds):
+        super().__init__(**kwds)
+        self.error = None
+        self.frame_queue = frame_queue
+        self.writer = writer
 
-    def __init__(self, camera_functionality = None, film_settings = None, **kwds):
+    def run(self):
+        while True:
+            frame_batch = self.frame_queue.get()
+            if frame_batch is None:
+                break
+
+            # Once there has been an error we just drain the queue, the
+            # error will be raised by the writer in the main thread.
+            if self.error is None:
+                try:
+                    self.writer.writeFrames(frame_batch)
+                except Exception as exception:
+                    self.error = [exception, traceback.format_exc()]
+
+
+class BaseFileWriter(object):
+    """
+    Sub-classes should override writeFrame() to actually save the
+    frame, or writeFrames() if they can do something more efficient
+    with a batch of frames. If saveFrames() is overridden then the
+    sub-class needs to call saveFrames() in this class for the frames
+    to be saved.
+
+    queue_depth - If this is greater than zero, frames are saved in a
+                  separate thread with a queue of (at most) this many
+                  frame batches between the camera and the thread.
+
+    drop_frames - What to do when the queue is full. If this is True the
+                  frame batch is dropped (and the frames counted), otherwise
+                  we wait for the writer thread to make space in the queue.
+    """
+    def __init__(self, camera_functionality = None, drop_frames = False, film_settings = None, queue_depth = 0, **kwds):
         super().__init__(**kwds)
         self.cam_fn = camera_functionality
+        self.drop_frames = drop_frames
         self.film_settings = film_settings
+        self.frame_queue = None
+        self.number_dropped = 0
         self.stopped = False
+        self.writer_thread = None
 
         # This is the frame size in MB.
         self.frame_size = self.cam_fn.getParameter("bytes_per_frame") *  0.000000953674
@@ -80,26 +142,92 @@ class BaseFileWriter(object):
             self.basename += "_" + self.cam_fn.getParameter("extension")
         self.filename = self.basename + self.film_settings.getFiletype()
 
+        # Start the writer thread.
+        if (queue_depth > 0):
+            self.frame_queue = queue.Queue(maxsize = queue_depth)
+            self.writer_thread = WriterThread(frame_queue = self.frame_queue,
+                                              writer = self)
+            self.writer_thread.start(QtCore.QThread.NormalPriority)
+
         # Connect the camera functionality.
-        self.cam_fn.newFrame.connect(self.saveFrame)
+        self.cam_fn.newFrames.connect(self.saveFrames)
         self.cam_fn.stopped.connect(self.handleStopped)
 
+    def checkWriterError(self):
+        """
+        Raise any error that occured in the writer thread.
+        """
+        if (self.writer_thread is not None) and (self.writer_thread.error is not None):
+            [exception, stack_trace] = self.writer_thread.error
+            raise ImageWriterException("Writing " + self.filename + " failed with " + str(exception) + "\n" + stack_trace)
+        
     def closeWriter(self):
+        """
+        Sub-classes should call this first as it flushes any frames that
+        are still in the queue before the file is closed.
+        """
         assert self.stopped
-        self.cam_fn.newFrame.disconnect(self.saveFrame)
+        self.cam_fn.newFrames.disconnect(self.saveFrames)
         self.cam_fn.stopped.disconnect(self.handleStopped)
 
+        if self.writer_thread is not None:
+            self.frame_queue.put(None)
+            self.writer_thread.wait()
+            self.checkWriterError()
+
+    def getNumberDropped(self):
+        return self.number_dropped
+    
     def getSize(self):
         return self.frame_size * self.number_frames
+
+    def getQueueSize(self):
+        """
+        Returns the number of frame batches waiting to be saved.
+        """
+        if self.frame_queue is not None:
+            return self.frame_queue.qsize()
+        return 0
     
     def handleStopped(self):
         self.stopped = True
 
+    def isQueued(self):
+        return self.writer_thread is not None
+    
     def isStopped(self):
         return self.stopped
         
-    def saveFrame(self):
-        self.number_frames += 1
+    def saveFrames(self, frame_batch):
+        if self.writer_thread is None:
+            self.writeFrames(frame_batch)
+
+        else:
+            self.checkWriterError()
+            if self.drop_frames:
+                try:
+                    self.frame_queue.put_nowait(frame_batch)
+                except queue.Full:
+                    self.number_dropped += len(frame_batch)
+                    return
+            else:
+                self.frame_queue.put(frame_batch)
+
+        self.number_frames += len(frame_batch)
+
+    def writeFrame(self, a_frame):
+        """
+        Override this to save the frame, this may be called
+        from the writer thread.
+        """
+        pass
+
+    def writeFrames(self, frame_batch):
+        """
+        This may be called from the writer thread.
+        """
+        for a_frame in frame_batch.getFrames():
+            self.writeFrame(a_frame)
 
 
 class DaxFile(BaseFileWriter):
@@ -132,8 +260,7 @@ class DaxFile(BaseFileWriter):
                 inf_fp.write("y_end = " + h + "\n")
             inf_fp.close()
 
-    def saveFrame(self, frame):
-        super().saveFrame()
+    def writeFrame(self, frame):
         np_data = frame.getData()
         np_data.tofile(self.fp)
 
@@ -178,8 +305,7 @@ class SPEFile(BaseFileWriter):
         self.fp.seek(1446)
         self.fp.write(struct.pack("i", self.number_frames))
 
-    def saveFrame(self, frame):
-        super().saveFrame()
+    def writeFrame(self, frame):
         np_data = frame.getData()
         np_data.tofile(self.file_ptrs[index])
 
@@ -198,9 +324,9 @@ class TestFile(DaxFile):
         time.sleep(1.0)
         super().closeWriter()
 
-    def saveFrame(self, frame):
+    def saveFrames(self, frame_batch):
         if (self.number_frames < 1):
-            super().saveFrame(frame)
+            super().saveFrames(frame.FrameBatch(frame_batch.getFrames()[:1]))
     
     
 class TIFFile(BaseFileWriter):
@@ -220,17 +346,22 @@ class TIFFile(BaseFileWriter):
             self.tif = tifffile.TiffWriter(self.filename,
                                            imagej = True)
 
+        # Newer versions of tifffile renamed TiffWriter.save() to TiffWriter.write().
+        if hasattr(self.tif, "write"):
+            self.tif_write = self.tif.write
+        else:
+            self.tif_write = self.tif.save
+
     def closeWriter(self):
         super().closeWriter()
         self.tif.close()
         
-    def saveFrame(self, frame):
-        super().saveFrame()
+    def writeFrame(self, frame):
         image = frame.getData()
-        self.tif.save(image.reshape((frame.image_y, frame.image_x)),
-                      metadata = self.metadata,
-                      resolution = self.resolution, 
-                      contiguous = True)
+        self.tif_write(image.reshape((frame.image_y, frame.image_x)),
+                       metadata = self.metadata,
+                       resolution = self.resolution, 
+                       contiguous = True)
 
 
 #
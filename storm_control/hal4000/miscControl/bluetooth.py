@@ -427,6 +427,10 @@ class BlueToothModule(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"configuration",
+                              "configure1",
+                              "film lockout",
+                              "new parameters"}
         self.configuration = module_params.get("configuration")
 
         self.bt_control = BluetoothControl(config = module_params.get("configuration"))
@@ -250,6 +250,11 @@ class SCMOSCalibration(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"change directory",
+                              "configuration",
+                              "configure1",
+                              "show",
+                              "start"}
         self.number_fn_requested = 0
 
         self.view = SCMOSCalibrationView(module_name = self.module_name)
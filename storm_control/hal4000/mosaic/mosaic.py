@@ -48,6 +48,10 @@ class Mosaic(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"configure1",
+                              "new parameters",
+                              "stop film",
+                              "tcp message"}
 
         self.parameters = module_params.get("parameters")
         for param in self.parameters.getAttrs():
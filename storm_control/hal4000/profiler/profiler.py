@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Profiles HAL's message handling.
+
+This turns on halLib.halProfiler and provides access to the results,
+either with a 'get profile' message or with a 'Get Profile' TCP
+message. The response is the handling time statistics by module
+and the processing time statistics by message type (in milliseconds).
+
+The histogram of the handling times is available with a 'get histogram'
+message or with a 'Get Histogram' TCP message. These can optionally be
+restricted to a single module and / or message type. The response is
+the bin edges and the counts in each bin.
+
+This module is optional, add it to the setup configuration file to
+enable profiling.
+
+If 'trace_file' is specified in the configuration then the complete
+trace is saved when HAL closes. Use a '.npz' extension for a binary
+trace, otherwise it is saved as a CSV file.
+"""
+
+import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.halLib.halModule as halModule
+import storm_control.hal4000.halLib.halProfiler as halProfiler
+
+
+class Profiler(halModule.HalModule):
+    """
+    HAL message profiler.
+    """
+    def __init__(self, module_params = None, qt_settings = None, **kwds):
+        super().__init__(**kwds)
+
+        ring_size = 10000
+        self.trace_file = None
+        if module_params.has("configuration"):
+            configuration = module_params.get("configuration")
+            ring_size = configuration.get("ring_size", ring_size)
+            if configuration.has("trace_file"):
+                self.trace_file = configuration.get("trace_file")
+
+        # Start profiling here so that we also get the configuration messages.
+        self.profiler = halProfiler.startProfiling(size = ring_size)
+
+        self.subscriptions = {"get histogram",
+                              "get profile",
+                              "tcp message"}
+
+        # Request a histogram of the handling times.
+        halMessage.addMessage("get histogram",
+                              validator = {"data" : {"message type" : [False, str],
+                                                     "module name" : [False, str]},
+                                           "resp" : {"bins" : [True, list],
+                                                     "counts" : [True, list]}})
+
+        # Request the current profile.
+        halMessage.addMessage("get profile",
+                              validator = {"data" : None,
+                                           "resp" : {"handling" : [True, dict],
+                                                     "messages" : [True, dict]}})
+
+    def cleanUp(self, qt_settings):
+        if self.trace_file is not None:
+            self.profiler.saveTrace(self.trace_file)
+        halProfiler.stopProfiling()
+
+    def getHistogram(self, module_name, m_type):
+        [counts, bins] = self.profiler.getHistogram(module_name = module_name, m_type = m_type)
+        return {"bins" : bins.tolist(),
+                "counts" : counts.tolist()}
+
+    def processMessage(self, message):
+
+        if message.isType("get histogram"):
+            data = message.getData()
+            if data is None:
+                data = {}
+            message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
+                                                              data = self.getHistogram(data.get("module name"),
+                                                                                       data.get("message type"))))
+
+        elif message.isType("get profile"):
+            message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
+                                                              data = {"handling" : self.profiler.getHandlingStats(),
+                                                                      "messages" : self.profiler.getMessageStats()}))
+
+        elif message.isType("tcp message"):
+            tcp_message = message.getData()["tcp message"]
+            if tcp_message.isType("Get Profile"):
+                if not tcp_message.isTest():
+                    tcp_message.addResponse("handling", self.profiler.getHandlingStats())
+                    tcp_message.addResponse("messages", self.profiler.getMessageStats())
+                message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
+                                                                  data = {"handled" : True}))
+
+            elif tcp_message.isType("Get Histogram"):
+                if not tcp_message.isTest():
+                    histogram = self.getHistogram(tcp_message.getData("module_name"),
+                                                  tcp_message.getData("message_type"))
+                    tcp_message.addResponse("bins", histogram["bins"])
+                    tcp_message.addResponse("counts", histogram["counts"])
+                message.addResponse(halMessage.HalMessageResponse(source = self.module_name,
+                                                                  data = {"handled" : True}))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
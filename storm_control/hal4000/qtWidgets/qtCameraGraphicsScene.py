@@ -3,14 +3,114 @@
 A QGraphicsScene and a QGraphicsItem customized for displaying
 data from a camera.
 
+The frames are converted to images by a RenderWorker in the HAL
+thread pool. Only the most recent frame is rendered, frames that
+arrive while the worker is busy replace the frame that is waiting.
+Large frames are binned down to (about) the resolution they will
+be displayed at before they are rescaled, so the cost of displaying
+a frame depends on the size of the view rather than the size of the
+camera.
+
 Hazen 3/17.
 """
+import numpy
+import threading
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
-import numpy
-
 import storm_control.hal4000.halLib.c_image_manipulation_c as c_image
+import storm_control.hal4000.halLib.halModule as halModule
+
+
+def binImage(image, bin_size):
+    """
+    Returns the maximum of each bin_size x bin_size block of the image,
+    the maximum so that bright spots and saturated pixels are still
+    visible. Extra rows / columns at the edge of the image are dropped.
+    """
+    if (bin_size == 1):
+        return image
+    [h, w] = [image.shape[0]//bin_size, image.shape[1]//bin_size]
+    image = image[:h*bin_size,:w*bin_size]
+
+    # This is a lot faster than image.reshape().max().
+    rows = image[0::bin_size].copy()
+    for i in range(1, bin_size):
+        numpy.maximum(rows, image[i::bin_size], out = rows)
+    binned = rows[:,0::bin_size].copy()
+    for i in range(1, bin_size):
+        numpy.maximum(binned, rows[:,i::bin_size], out = binned)
+    return binned
+
+
+def renderFrame(frame, bin_size = 1, click_pos = (0, 0), color_lut = None, display_range = (0, 200), saturated_value = None):
+    """
+    Convert a frame to a QImage.
+
+    frame - A camera.frame.Frame object.
+    bin_size - Bin the frame by this factor before rescaling.
+    click_pos - (x, y) position to return the intensity at (frame coordinates).
+    color_lut - A list of 256 QtGui.qRgb() values.
+    display_range - [image value that equals 0, image value that equals 255].
+    saturated_value - The value at which pixels are saturated, or None.
+
+    Returns a dictionary with the image and the image information or
+    None if the frame is not the expected size.
+    """
+    #
+    # For reasons lost in the mists of time 'frame' is a 1D numpy array
+    # and needs to be reshaped before rescaling and converting to a QImage.
+    #
+    w = frame.image_x
+    h = frame.image_y
+    image_data = frame.getData()
+    try:
+        image_data = image_data.reshape((h,w))
+    except ValueError as e:
+        print("Got an image with an unexpected size, ", image_data.shape, "expected [", w, ",", h, "]")
+        return None
+
+    bin_size = max(1, min(bin_size, w, h))
+    binned = binImage(image_data, bin_size)
+
+    # Rescale the image & record it's minimum and maximum.
+    [temp, image_min, image_max] = c_image.rescaleImage(binned,
+                                                        False,
+                                                        False,
+                                                        False,
+                                                        display_range,
+                                                        saturated_value)
+    if (bin_size > 1):
+        image_min = int(numpy.min(image_data))
+
+    # Create QImage. The number of bytes per line is specified as it is not
+    # necessarily a multiple of 4 for a binned image.
+    q_image = QtGui.QImage(temp.data, temp.shape[1], temp.shape[0], temp.shape[1], QtGui.QImage.Format_Indexed8)
+    q_image.ndarray = temp
+
+    # Set the images color table. If you don't do this Qt will segfault
+    # without giving you a traceback or any kind of warning message..
+    if color_lut is None:
+        color_lut = grayLUT()
+    q_image.setColorTable(color_lut)
+
+    # Record the intensity where the user last clicked on the image.
+    [xl, yl] = click_pos
+    if ((xl >= 0) and (xl < w) and (yl >= 0) and (yl < h)):
+        intensity_info = int(image_data[yl, xl])
+    else:
+        intensity_info = 0
+
+    return {"bin_size" : bin_size,
+            "frame_number" : frame.frame_number,
+            "image_max" : image_max,
+            "image_min" : image_min,
+            "intensity_info" : intensity_info,
+            "q_image" : q_image}
+
+
+def grayLUT():
+    return [QtGui.qRgb(i, i, i) for i in range(256)]
 
 
 class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
@@ -27,11 +127,13 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
     def __init__(self, **kwds):
         super().__init__(**kwds)
 
+        self.bin_size = 1
         self.chip_size_changed = False
         self.chip_x = 0
         self.chip_y = 0
         self.click_x = 0
         self.click_y = 0
+        self.color_lut = grayLUT()
         self.colortable = None
         self.display_range = [0, 200]
         self.display_saturated_pixels = False
@@ -47,6 +149,9 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         self.scale_x = 1
         self.scale_y = 1
 
+        self.render_worker = RenderWorker()
+        self.render_worker.rw_signaler.imageReady.connect(self.handleImageReady)
+
     def boundingRect(self):
         chip_rect = QtCore.QRectF(0, 0, self.chip_x, self.chip_y)
 
@@ -56,14 +161,45 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
             self.chip_size_changed = False
         return chip_rect
 
+    def cleanUp(self):
+        self.render_worker.cleanUp()
+
     def getAutoScale(self):
         return [self.image_min, self.image_max]
 
+    def getBinSize(self, w, h):
+        """
+        Returns how much to bin a w x h frame by so that a bin is
+        about the size of a pixel in the view.
+        """
+        scene = self.scene()
+        if (scene is None) or (len(scene.views()) == 0):
+            return 1
+        # The size of a scene pixel in the view, this works with
+        # the flips / transposes of the camera view.
+        view = scene.views()[0]
+        rect = view.viewportTransform().mapRect(QtCore.QRectF(0, 0, 1, 1))
+        zoom = min(rect.width(), rect.height()) * view.devicePixelRatioF()
+        zoom *= min(self.scale_x, self.scale_y)
+        if (zoom <= 0.0):
+            return 1
+        return max(1, min(int(1.0/zoom), w, h))
+
     def getImage(self):
         return self.q_image
     
     def getIntensityInfo(self):
         return [self.click_x, self.click_y, self.intensity_info]
+
+    def handleImageReady(self, image_info):
+        self.bin_size = image_info["bin_size"]
+        self.image_max = image_info["image_max"]
+        self.image_min = image_info["image_min"]
+        self.intensity_info = image_info["intensity_info"]
+        self.q_image = image_info["q_image"]
+
+        # Force re-paint.
+        self.update()
         
     def newColorTable(self, colortable):
         self.colortable = colortable
@@ -72,6 +208,12 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         else:
             self.display_saturated_pixels = False
 
+        # Create the look up table once, rather than every time we get a new image.
+        if self.colortable:
+            self.color_lut = [QtGui.qRgb(*self.colortable[i][:3]) for i in range(256)]
+        else:
+            self.color_lut = grayLUT()
+
     def newConfiguration(self, camera_functionality):
         [chip_x, chip_y] = camera_functionality.getChipSize()
         [self.frame_x_offset, self.frame_y_offset] = camera_functionality.getFrameZeroZero()
@@ -91,9 +233,12 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
     def paint(self, painter, option, widget):
         if self.q_image is not None:
 
-            # Draw the image.
-            painter.drawImage(self.frame_x_offset,
-                              self.frame_y_offset,
+            # Draw the image, scaling to compensate for the camera binning
+            # and the binning of the frame when it was rendered.
+            painter.drawImage(QtCore.QRectF(self.frame_x_offset,
+                                            self.frame_y_offset,
+                                            self.q_image.width() * self.bin_size * self.scale_x,
+                                            self.q_image.height() * self.bin_size * self.scale_y),
                               self.q_image)
             
             # Draw the grid into the buffer.
@@ -116,21 +261,6 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         self.click_x = cx
         self.click_y = cy
 
-    def setColorTable(self):
-        """
-        Sets the color table of the new image. If you don't do this Qt
-        will segfault without giving you a traceback or any kind of
-        warning message..
-        """
-        if self.colortable:
-            for i in range(256):
-                self.q_image.setColor(i, QtGui.qRgb(self.colortable[i][0], 
-                                                    self.colortable[i][1], 
-                                                    self.colortable[i][2]))
-        else:
-            for i in range(256):
-                self.q_image.setColor(i,QtGui.qRgb(i,i,i))        
-
     def setShowGrid(self, show):
         self.draw_grid = show
         
@@ -139,59 +269,97 @@ class QtCameraGraphicsItem(QtWidgets.QGraphicsItem):
         
     def updateImageWithFrame(self, frame):
         """
-        Convert the frame to a QImage, then call update() to display it.
+        Send the frame to the render worker, update() is called when
+        the image is ready.
         """
-        #
-        # For reasons lost in the mists of time 'frame' is a 1D numpy array
-        # and needs to be reshaped before rescaling and converting to a QImage.
-        #
-        w = frame.image_x
-        h = frame.image_y
-        image_data = frame.getData()
-        try:
-            image_data = image_data.reshape((h,w))
-        except ValueError as e:
-            print("Got an image with an unexpected size, ", image_data.shape, "expected [", w, ",", h, "]")
-            return
-
         max_intensity = self.max_intensity
         if not self.display_saturated_pixels:
             max_intensity = None
 
-        # Rescale the image & record it's minimum and maximum.
-        [temp, self.image_min, self.image_max] = c_image.rescaleImage(image_data,
-                                                                      False,
-                                                                      False,
-                                                                      False,
-                                                                      self.display_range,
-                                                                      max_intensity)
-        
-        # Create QImage & re-scale to compensate for binning, if any.
-        temp_image = QtGui.QImage(temp.data, w, h, QtGui.QImage.Format_Indexed8)
-        if (self.scale_x != 1) or (self.scale_y != 1):
-            self.q_image = temp_image.scaled(w * self.scale_x, h * self.scale_y)
-        else:
-            self.q_image = temp_image
-        self.q_image.ndarray = temp
-
-        # Set the images color table.
-        self.setColorTable()
-
-        # Record the intensity where the user last clicked on the image.
-        # self.click_x and self.click_y are in frame coordinates.
-        xl = self.click_x
-        yl = self.click_y
-        if ((xl >= 0) and (xl < w) and (yl >= 0) and (yl < h)):
-            self.intensity_info = image_data[yl, xl]
-        else:
-            self.intensity_info = 0
-
-        # Force re-paint.
-        self.update()
+        self.render_worker.render(frame,
+                                  {"bin_size" : self.getBinSize(frame.image_x, frame.image_y),
+                                   "click_pos" : (self.click_x, self.click_y),
+                                   "color_lut" : self.color_lut,
+                                   "display_range" : tuple(self.display_range),
+                                   "saturated_value" : max_intensity})
 
 
 class QtCameraGraphicsScene(QtWidgets.QGraphicsScene):
     pass
+
+
+class RenderWorker(QtCore.QRunnable):
+    """
+    Runnable for converting frames to images. This keeps rendering
+    until there are no frames waiting. There is only ever one frame
+    waiting, the most recent one.
+    """
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.busy = False
+        self.dropped = 0
+        self.idle = threading.Condition()
+        self.pending = None
+        self.rw_signaler = RenderWorkerSignaler()
+        self.running = True
+        self.threadpool = halModule.threadpool
+
+        self.setAutoDelete(False)
+
+    def cleanUp(self):
+        """
+        Drop the waiting frame (if any) and wait for the current
+        frame to finish rendering.
+        """
+        with self.idle:
+            self.running = False
+            self.pending = None
+            self.idle.wait_for(lambda : not self.busy)
+
+    def getDropped(self):
+        return self.dropped
+
+    def isBusy(self):
+        with self.idle:
+            return self.busy
+
+    def render(self, frame, settings):
+        """
+        frame is a camera.frame.Frame, settings is a dictionary with the
+        keyword arguments for renderFrame().
+        """
+        with self.idle:
+            if not self.running:
+                return
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = [frame, settings]
+            if self.busy:
+                return
+            self.busy = True
+        self.threadpool.start(self)
+
+    def run(self):
+        while True:
+            with self.idle:
+                if self.pending is None:
+                    self.busy = False
+                    self.idle.notify_all()
+                    return
+                [frame, settings] = self.pending
+                self.pending = None
+
+            image_info = renderFrame(frame, **settings)
+            if image_info is not None:
+                self.rw_signaler.imageReady.emit(image_info)
+
+
+class RenderWorkerSignaler(QtCore.QObject):
+    """
+    Signal class used by the RenderWorker to indicate that
+    a new image is ready.
+    """
+    imageReady = QtCore.pyqtSignal(dict)
         
         
 #
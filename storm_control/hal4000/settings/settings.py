@@ -42,6 +42,16 @@ class Settings(halModule.HalModule):
     
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"configure1",
+                              "configure2",
+                              "get parameters",
+                              "initial parameters",
+                              "new parameters file",
+                              "parameters changed",
+                              "set parameters",
+                              "start film",
+                              "stop film",
+                              "wait for"}
         self.locked_out = False
         self.wait_for = []
         self.waiting_on = []
@@ -7,7 +7,9 @@ Hazen 05/17
 """
 import numpy
 
-from PyQt5 import QtGui, QtWidgets
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+import storm_control.hal4000.spotCounter.stormImage as stormImage
 
 
 class SpotWidget(QtWidgets.QWidget):
@@ -122,13 +124,20 @@ class SpotGraph(SpotWidget):
 
         
 class SpotPicture(SpotWidget):
-
+    """
+    Shows a preview of the STORM image that is accumulated from the
+    localizations. The preview is updated at most every
+    update_interval milliseconds.
+    """
     def __init__(self,
                  camera_fn = None,
                  pixel_size = None,
                  scale_bar_len = None,
+                 shutters_info = None,
+                 storm_zoom = 8,
+                 update_interval = 200,
                  **kwds):
-        super().__init__(**kwds)
+        super().__init__(shutters_info = shutters_info, **kwds)
         
         self.scale_bar_len = int(round(1.0e-3 * scale_bar_len/pixel_size))
 
@@ -141,6 +150,18 @@ class SpotPicture(SpotWidget):
         # For rendering an intermediate picture.
         self.q_pixmap = QtGui.QPixmap(xp, yp)
 
+        # The STORM image.
+        self.storm_image = stormImage.STORMImage(image_x = camera_fn.getParameter("x_pixels"),
+                                                 image_y = camera_fn.getParameter("y_pixels"),
+                                                 preview_scale = self.scale,
+                                                 shutters_info = shutters_info,
+                                                 zoom = storm_zoom)
+
+        self.update_timer = QtCore.QTimer(self)
+        self.update_timer.setInterval(update_interval)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.timeout.connect(self.updatePixmap)
+
         # Figure out transform matrix.
         #
         # FIXME: Duplicated from qtWidgets.qtCameraGraphicsView
@@ -171,6 +192,8 @@ class SpotPicture(SpotWidget):
         self.setFixedSize(xp, yp)
 
     def clearPicture(self):
+        self.update_timer.stop()
+        self.storm_image.clear()
         painter = QtGui.QPainter(self.q_pixmap)
         color = QtGui.QColor(0,0,0)
         painter.setPen(color)
@@ -189,29 +212,33 @@ class SpotPicture(SpotWidget):
         painter.setBrush(QtGui.QColor(255,255,255))
         painter.drawRect(5, 5, 5 + self.scale_bar_len, 5)
 
+    def getSTORMImage(self):
+        return self.storm_image
+
     def savePicture(self, filename):
+        self.updatePixmap()
         self.q_pixmap.save(filename + ".png", "PNG", -1)
+        self.storm_image.save(filename)
+
+    def setShuttersInfo(self, shutters_info):
+        super().setShuttersInfo(shutters_info)
+        if hasattr(self, "storm_image"):
+            self.storm_image.setShuttersInfo(shutters_info)
         
     def updateImage(self, frame_number, locs):
+        self.storm_image.addLocalizations(frame_number, locs)
+        if not self.update_timer.isActive():
+            self.update_timer.start()
 
-        # Figure out color. If it is None we don't draw anything.
-        color = self.colors[frame_number % self.cycle_length]
-        if color is None:
-            return
-
-        # Add alpha value. Need to make a copy or the changes
-        # will flow back to the original list.
-        color = color.copy()
-        color.append(5)
-        
-        x = numpy.round(self.scale*locs[0])
-        y = numpy.round(self.scale*locs[1])
+    def updatePixmap(self):
+        """
+        Draw the preview of the STORM image.
+        """
+        rgb = numpy.ascontiguousarray(self.storm_image.getRGBPreview())
+        q_image = QtGui.QImage(rgb.data, rgb.shape[1], rgb.shape[0], rgb.shape[1] * 3, QtGui.QImage.Format_RGB888)
 
         painter = QtGui.QPainter(self.q_pixmap)
         painter.setTransform(self.transform)
-        painter.setPen(QtGui.QColor(*color))
-        
-        for i in range(x.size):
-            painter.drawPoint(int(x[i]),
-                              int(y[i]))
+        painter.drawImage(QtCore.QRectF(0, 0, self.q_pixmap.width(), self.q_pixmap.height()), q_image)
+        painter.end()
         self.update()
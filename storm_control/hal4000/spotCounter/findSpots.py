@@ -2,9 +2,16 @@
 """
 Analyze frames using QRunnables and QThreadPool.
 
+Frames are queued and the workers analyze them in batches. If the
+analysis falls behind, frames are dropped following the drop policy,
+either the newest frames (those that just arrived) or the oldest
+frames (those that are waiting in the queue).
+
 Hazen 05/17
 """
-import time
+import collections
+import numpy
+import threading
 
 from PyQt5 import QtCore
 
@@ -12,27 +19,29 @@ import storm_control.hal4000.halLib.halModule as halModule
 import storm_control.hal4000.spotCounter.lmmObjectFinder as lmmObjectFinder
 
 
+class SpotCounterException(Exception):
+    pass
+
+
 class AnalysisWorker(QtCore.QRunnable):
     """
-    Runnable for performing image analysis.
+    Runnable for performing image analysis. This keeps analyzing
+    batches of frames from the spot counter until there are none
+    left.
     """
-    def __init__(self, **kwds):
+    def __init__(self, spot_counter = None, **kwds):
         super().__init__(**kwds)
         self.aw_signaler = AnalysisWorkerSignaler()
-        self.frame_analysis = None
-        self.busy = False
+        self.spot_counter = spot_counter
 
-    def isBusy(self):
-        return self.busy
-        
     def run(self):
-        self.frame_analysis.analyzeImage()
-        self.aw_signaler.analysisDone.emit(self.frame_analysis)
-        self.busy = False
-        
-    def setFrameAnalysis(self, frame_analysis):
-        self.frame_analysis = frame_analysis
-        self.busy = True
+        while True:
+            batch = self.spot_counter.getBatch(self)
+            if batch is None:
+                return
+            analyzeBatch(batch, use_numpy = self.spot_counter.use_numpy)
+            for frame_analysis in batch:
+                self.aw_signaler.analysisDone.emit(frame_analysis)
 
 
 class AnalysisWorkerSignaler(QtCore.QObject):
@@ -79,42 +88,123 @@ class FrameAnalysis(QtCore.QObject):
     def getLocalizations(self):
         return [self.x_locs[:self.locs_count],
                 self.y_locs[:self.locs_count]]
-        
+
+    def getShape(self):
+        return (self.frame.image_y, self.frame.image_x)
+
+    def setResults(self, results):
+        [self.x_locs, self.y_locs, self.locs_count] = results
+
+        # The analysis is done, so we don't need to keep the frame.
+        self.frame = FrameInfo(self.frame)
+
+
+class FrameInfo(object):
+    """
+    What we keep of a frame once it has been analyzed. The frame
+    data can then go back to the camera's frame pool.
+    """
+    def __init__(self, frame, **kwds):
+        super().__init__(**kwds)
+        self.frame_number = frame.frame_number
+        self.image_x = frame.image_x
+        self.image_y = frame.image_y
+        self.which_camera = frame.which_camera
+
+
+def analyzeBatch(batch, use_numpy = True):
+    """
+    Analyze a list of FrameAnalysis objects. With numpy the frames
+    that are the same size and have the same threshold are analyzed
+    together as a single stack.
+    """
+    if not use_numpy:
+        for frame_analysis in batch:
+            frame_analysis.analyzeImage()
+            frame_analysis.frame = FrameInfo(frame_analysis.frame)
+        return
+
+    groups = collections.OrderedDict()
+    for frame_analysis in batch:
+        key = (frame_analysis.getShape(), frame_analysis.threshold)
+        if not key in groups:
+            groups[key] = []
+        groups[key].append(frame_analysis)
+
+    for [[shape, threshold], group] in groups.items():
+        images = numpy.empty((len(group),) + shape, dtype = numpy.uint16)
+        for i, frame_analysis in enumerate(group):
+            images[i] = frame_analysis.frame.getData().reshape(shape)
+        for frame_analysis, results in zip(group, lmmObjectFinder.findObjectsBatch(images, threshold)):
+            frame_analysis.setResults(results)
+
 
 class SpotCounter(QtCore.QObject):
     imageProcessed = QtCore.pyqtSignal(object)
 
-    def __init__(self, max_threads = None, max_size = 0, **kwds):
+    def __init__(self,
+                 batch_size = 8,
+                 drop_policy = "newest",
+                 engine = "auto",
+                 max_pending = None,
+                 max_threads = None,
+                 max_size = 0,
+                 **kwds):
+        """
+        batch_size - The maximum number of frames a worker analyzes at once.
+        drop_policy - "newest" or "oldest", which frames to drop when
+                      the queue is full.
+        engine - "numpy", "c" (the LMMoment library) or "auto", which
+                 uses the C library if it is available.
+        max_pending - The maximum number of frames that can wait in
+                      the queue, the default (None or 0) is max_threads * batch_size.
+        max_threads - The maximum number of workers.
+        max_size - Frames with more pixels than this are not analyzed.
+        """
         super().__init__(**kwds)
 
+        if not drop_policy in ["newest", "oldest"]:
+            raise SpotCounterException("Unknown drop policy '" + str(drop_policy) + "'")
+        if not engine in ["auto", "c", "numpy"]:
+            raise SpotCounterException("Unknown engine '" + str(engine) + "'")
+
+        if (max_pending is None) or (max_pending <= 0):
+            max_pending = max_threads * batch_size
+
+        self.batch_size = batch_size
+        self.drop_policy = drop_policy
         self.dropped = 0
+        self.idle = threading.Condition()
+        self.max_pending = max_pending
         self.max_size = max_size
+        self.pending = collections.deque()
         self.threadpool = halModule.threadpool
         self.total = 0
         self.workers = []
 
         # Create analysis workers.
         for i in range(max_threads):
-            aw = AnalysisWorker()
+            aw = AnalysisWorker(spot_counter = self)
             aw.setAutoDelete(False)
             aw.aw_signaler.analysisDone.connect(self.handleAnalysisDone)
             self.workers.append(aw)
+        self.idle_workers = list(self.workers)
 
         # Initialize object finder.
         lmmObjectFinder.initialize()
+        if (engine == "auto"):
+            self.use_numpy = (lmmObjectFinder.lmmoment is None)
+        else:
+            self.use_numpy = (engine == "numpy")
             
     def cleanUp(self):
 
-        # Wait for workers to finish.
-        still_busy = True
-        while still_busy:
-            all_busy = False
-            for worker in self.workers:
-                if worker.isBusy():
-                    all_busy = True
-                    break
-            still_busy = all_busy
-            time.sleep(0.1)
+        # Drop any frames that are still waiting, then wait for the
+        # workers to finish the batches they are working on.
+        with self.idle:
+            self.dropped += len(self.pending)
+            self.pending.clear()
+            self.idle.wait_for(lambda : (len(self.idle_workers) == len(self.workers)))
         
         # Object finder cleanup.
         lmmObjectFinder.cleanUp()
@@ -122,31 +212,56 @@ class SpotCounter(QtCore.QObject):
         # Print statistics.
         print("> spot counter dropped", self.dropped, "images out of", self.total, "total images")
 
+    def getBatch(self, worker):
+        """
+        Called by the workers to get the next batch of frames to analyze. This
+        returns None, and the worker is idle again, if there are none.
+        """
+        with self.idle:
+            if (len(self.pending) == 0):
+                self.idle_workers.append(worker)
+                self.idle.notify_all()
+                return None
+            return [self.pending.popleft() for i in range(min(self.batch_size, len(self.pending)))]
+
+    def isBusy(self):
+        """
+        Returns True if there are frames waiting or being analyzed.
+        """
+        with self.idle:
+            return (len(self.pending) > 0) or (len(self.idle_workers) < len(self.workers))
+
     def handleAnalysisDone(self, frame_analysis):
         self.imageProcessed.emit(frame_analysis)
         
     def newFrameToAnalyze(self, camera_name, frame, threshold):
+        self.newFramesToAnalyze(camera_name, [frame], threshold)
+
+    def newFramesToAnalyze(self, camera_name, frames, threshold):
         
         # Check if the current camera image is small
         # enough that we can analyze it.
-        if ((frame.image_x * frame.image_y) > self.max_size):
+        if ((frames[0].image_x * frames[0].image_y) > self.max_size):
             return
         
-        self.total += 1
-
-        # Check if there is a thread available to analyze the image.
-        was_dropped = True
-        for worker in self.workers:
-            if not worker.isBusy():
-                worker.setFrameAnalysis(FrameAnalysis(camera_name = camera_name,
-                                                      frame = frame,
-                                                      threshold = threshold))
-                self.threadpool.start(worker)
-                was_dropped = False
-                break
-
-        if was_dropped:
-            self.dropped += 1
+        self.total += len(frames)
+
+        with self.idle:
+            for frame in frames:
+                if (len(self.pending) >= self.max_pending):
+                    self.dropped += 1
+                    if (self.drop_policy == "newest"):
+                        continue
+                    self.pending.popleft()
+                self.pending.append(FrameAnalysis(camera_name = camera_name,
+                                                  frame = frame,
+                                                  threshold = threshold))
+
+            # Start more workers if there are enough frames for them.
+            n_active = len(self.workers) - len(self.idle_workers)
+            while (len(self.idle_workers) > 0) and (len(self.pending) > n_active * self.batch_size):
+                self.threadpool.start(self.idle_workers.pop())
+                n_active += 1
 
 
 #
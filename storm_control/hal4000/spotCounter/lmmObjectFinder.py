@@ -16,15 +16,37 @@ import sys
 
 import storm_control.c_libraries.loadclib as loadclib
 
-lmmoment = False
+lmmoment = None
 max_locs = 1000
 
+#
+# The peak shape used by LMMoment.c, 1 is the boundary
+# and 2 is the center. This is used by the numpy version.
+#
+bsize = 5
+peak = numpy.array([[0, 0, 0, 1, 1, 1, 0, 0, 0],
+                    [0, 0, 1, 2, 2, 2, 1, 0, 0],
+                    [0, 1, 2, 2, 2, 2, 2, 1, 0],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [0, 1, 2, 2, 2, 2, 2, 1, 0],
+                    [0, 0, 1, 2, 2, 2, 1, 0, 0],
+                    [0, 0, 0, 1, 1, 1, 0, 0, 0]])
+[bdy_dx, bdy_dy] = numpy.nonzero(peak == 1)
+bdy_dx -= (bsize - 1)
+bdy_dy -= (bsize - 1)
+[cnt_dx, cnt_dy] = numpy.nonzero(peak == 2)
+cnt_dx -= (bsize - 1)
+cnt_dy -= (bsize - 1)
+
 
 def cleanUp():
     """
     Called at program shutdown to free arrays allocated in C.
     """
-    lmmoment.cleanup()
+    if lmmoment is not None:
+        lmmoment.cleanup()
 
 
 def initialize():
@@ -34,7 +56,12 @@ def initialize():
     """
     
     global lmmoment
-    lmmoment = loadclib.loadCLibrary("LMMoment")
+    try:
+        lmmoment = loadclib.loadCLibrary("LMMoment")
+    except OSError:
+        print("C LMMoment library not found, reverting to numpy.")
+        lmmoment = None
+        return
 
     lmmoment.initialize.argtypes = []
     lmmoment.cleanup.argtypes = []
@@ -48,10 +75,13 @@ def initialize():
     lmmoment.initialize()
 
 
-def findObjects(frame, threshold):
+def findObjects(frame, threshold, use_numpy = False):
     """
     Find the objects in the image.
     """
+    if (lmmoment is None) or use_numpy:
+        return findObjectsNumpy(frame, threshold)
+    
     x = numpy.zeros((max_locs), dtype = numpy.float32)
     y = numpy.zeros((max_locs), dtype = numpy.float32)
     n = ctypes.c_int(max_locs)
@@ -65,6 +95,105 @@ def findObjects(frame, threshold):
     return [x, y, n.value]
 
 
+def findObjectsNumpy(frame, threshold):
+    """
+    The numpy version of findObjects(). This gives the same results as
+    the C library, including treating the image as signed 16 bit.
+    """
+    image = numpy.ascontiguousarray(frame.getData(), dtype = numpy.uint16)
+    image = image.reshape((1, frame.image_y, frame.image_x))
+    return findObjectsBatch(image, threshold)[0]
+
+
+def findObjectsBatch(images, threshold):
+    """
+    Find the objects in a stack of images of the same size, (n, y, x).
+    All of the images are analyzed with a single set of numpy operations,
+    which release the GIL, so this works well in several threads at once.
+
+    Returns a list with [x, y, n] for each image.
+    """
+    images = numpy.ascontiguousarray(images, dtype = numpy.uint16).view(numpy.int16)
+    [n_images, size_x, size_y] = images.shape
+
+    results = []
+    for i in range(n_images):
+        results.append([numpy.zeros((max_locs), dtype = numpy.float32),
+                        numpy.zeros((max_locs), dtype = numpy.float32),
+                        0])
+    if (size_x <= 2*bsize) or (size_y <= 2*bsize):
+        return results
+
+    def shifted(dx, dy):
+        return images[:,bsize+dx:size_x-bsize+dx,bsize+dy:size_y-bsize+dy]
+
+    # Local maxima. The comparison is strict for the neighbors that come
+    # before the pixel in the C scan order and not strict for those after.
+    cur = shifted(0, 0)
+    mask = numpy.greater(cur, shifted(-1, -1))
+    temp = numpy.empty_like(mask)
+    for [dx, dy] in [[-1, 0], [-1, 1], [0, -1], [1, -1]]:
+        mask &= numpy.greater(cur, shifted(dx, dy), out = temp)
+    for [dx, dy] in [[0, 1], [1, 0], [1, 1]]:
+        mask &= numpy.greater_equal(cur, shifted(dx, dy), out = temp)
+
+    # numpy.nonzero() returns the maxima grouped by image in C scan order.
+    [pf, px, py] = numpy.nonzero(mask)
+    px += bsize
+    py += bsize
+
+    # Peaks must be above the boundary pixels by at least threshold. Most
+    # of the maxima are noise, so check a few of the boundary pixels first.
+    height = images[pf, px, py].astype(numpy.int32)
+    for [dx, dy] in [[-bsize+1, 0], [bsize-1, 0], [0, -bsize+1], [0, bsize-1]]:
+        keep = (height >= (images[pf, px + dx, py + dy].astype(numpy.int32) + threshold))
+        pf = pf[keep]
+        px = px[keep]
+        py = py[keep]
+        height = height[keep]
+
+    # Then check all of them, the (truncated) mean of the boundary pixels
+    # must also be positive.
+    bdy = images[pf[:,None], px[:,None] + bdy_dx, py[:,None] + bdy_dy].astype(numpy.int32)
+    is_peak = numpy.all(height[:,None] >= (bdy + threshold), axis = 1)
+    bdy_sum = numpy.sum(bdy, axis = 1)
+    mean = numpy.where(bdy_sum >= 0, bdy_sum // bdy_dx.size, -((-bdy_sum) // bdy_dx.size))
+    is_peak &= (mean > 0)
+
+    pf = pf[is_peak]
+    px = px[is_peak]
+    py = py[is_peak]
+    mean = mean[is_peak]
+
+    # Keep at most max_locs peaks per image.
+    starts = numpy.searchsorted(pf, numpy.arange(n_images + 1))
+    keep = (numpy.arange(pf.size) - starts[pf]) < max_locs
+    pf = pf[keep]
+    px = px[keep]
+    py = py[keep]
+    mean = mean[keep]
+    starts = numpy.searchsorted(pf, numpy.arange(n_images + 1))
+
+    # First moment of the center pixels.
+    cnt = images[pf[:,None], px[:,None] + cnt_dx, py[:,None] + cnt_dy] - mean[:,None]
+    total = numpy.sum(cnt, axis = 1)
+    sumx = numpy.dot(cnt, cnt_dx)
+    sumy = numpy.dot(cnt, cnt_dy)
+
+    good = (total > 0)
+    total[~good] = 1
+    total = total.astype(numpy.float32)
+    x = numpy.where(good, py.astype(numpy.float32) + sumy.astype(numpy.float32)/total, -1.0)
+    y = numpy.where(good, px.astype(numpy.float32) + sumx.astype(numpy.float32)/total, -1.0)
+
+    for i in range(n_images):
+        n = starts[i+1] - starts[i]
+        results[i][0][:n] = x[starts[i]:starts[i+1]]
+        results[i][1][:n] = y[starts[i]:starts[i+1]]
+        results[i][2] = int(n)
+    return results
+
+
 #
 # The MIT License
 #
@@ -52,13 +52,14 @@ class Analyzer(QtCore.QObject):
         self.spot_picture = displaySpots.SpotPicture(camera_fn = camera_fn,
                                                      pixel_size = pixel_size,
                                                      scale_bar_len = parameters.get("scale_bar_len"),
-                                                     shutters_info = shutters_info)
+                                                     shutters_info = shutters_info,
+                                                     storm_zoom = parameters.get("storm_zoom"))
 
-        self.camera_fn.newFrame.connect(self.handleNewFrame)
+        self.camera_fn.newFrames.connect(self.handleNewFrames)
         self.spot_counter.imageProcessed.connect(self.handleProcessedImage)
 
     def cleanUp(self):
-        self.camera_fn.newFrame.disconnect(self.handleNewFrame)
+        self.camera_fn.newFrames.disconnect(self.handleNewFrames)
         self.spot_counter.imageProcessed.disconnect(self.handleProcessedImage)
         
     def getCameraName(self):
@@ -73,10 +74,10 @@ class Analyzer(QtCore.QObject):
     def getSpotPicture(self):
         return self.spot_picture
     
-    def handleNewFrame(self, frame):
-        self.spot_counter.newFrameToAnalyze(self.camera_fn.getCameraName(),
-                                            frame,
-                                            self.threshold)
+    def handleNewFrames(self, frame_batch):
+        self.spot_counter.newFramesToAnalyze(self.camera_fn.getCameraName(),
+                                             frame_batch.getFrames(),
+                                             self.threshold)
         
     def handleProcessedImage(self, frame_analysis):
         if (frame_analysis.getCameraName() == self.camera_fn.getCameraName()):
@@ -211,6 +212,14 @@ class SpotCounter(halModule.HalModule):
 
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"changing parameters",
+                              "configuration",
+                              "configure1",
+                              "new parameters",
+                              "show",
+                              "start",
+                              "start film",
+                              "stop film"}
         self.analyzers = []
         self.basename = None
         self.feed_names = []
@@ -220,7 +229,11 @@ class SpotCounter(halModule.HalModule):
 
         configuration = module_params.get("configuration")
 
-        self.spot_counter = findSpots.SpotCounter(max_threads = configuration.get("max_threads"),
+        self.spot_counter = findSpots.SpotCounter(batch_size = configuration.get("batch_size", 8),
+                                                  drop_policy = configuration.get("drop_policy", "newest"),
+                                                  engine = configuration.get("engine", "auto"),
+                                                  max_pending = configuration.get("max_pending", 0),
+                                                  max_threads = configuration.get("max_threads"),
                                                   max_size = configuration.get("max_size"))
 
         self.view = SpotCounterView(module_name = self.module_name,
@@ -245,6 +258,12 @@ class SpotCounter(halModule.HalModule):
                                                        min_value = 100,
                                                        max_value = 10000))
 
+        self.parameters.add(params.ParameterRangeInt(description = "STORM image pixels per camera pixel",
+                                                     name = "storm_zoom",
+                                                     value = 8,
+                                                     min_value = 1,
+                                                     max_value = 16))
+
         self.parameters.add(params.ParameterRangeInt(description = "Spot detection threshold (camera counts)",
                                                      name = "threshold",
                                                      value = 250,
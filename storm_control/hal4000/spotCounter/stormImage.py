@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+Accumulates the spot counter localizations into a (rough) STORM
+image while the film is being taken.
+
+The image is a histogram of the localizations with zoom bins per
+camera pixel. There is a separate image for each of the colors in
+the shutter sequence. The images are stored as tiles, tiles are only
+created when they contain a localization, so large zooms are OK even
+if only part of the camera field is labeled.
+
+Localizations are added in batches, and the downsampled preview for
+the GUI is only re-calculated for the tiles that changed.
+"""
+import numpy
+import tifffile
+
+
+class STORMImage(object):
+
+    def __init__(self,
+                 batch_size = 20000,
+                 image_x = None,
+                 image_y = None,
+                 preview_scale = 2,
+                 shutters_info = None,
+                 tile_pixels = 64,
+                 zoom = 8,
+                 **kwds):
+        """
+        batch_size - Add the localizations to the image when this many are waiting.
+        image_x, image_y - The camera image size in pixels.
+        preview_scale - The (approximate) zoom of the preview image.
+        shutters_info - A illumination.xmlParser.ShuttersInfo object, or None.
+        tile_pixels - The size of a tile in camera pixels.
+        zoom - The number of STORM image pixels per camera pixel.
+        """
+        super().__init__(**kwds)
+        self.batch_size = batch_size
+        self.image_x = image_x
+        self.image_y = image_y
+        self.zoom = int(zoom)
+
+        self.tile_size = tile_pixels * self.zoom
+        self.n_tiles_x = (self.image_x * self.zoom - 1)//self.tile_size + 1
+        self.n_tiles_y = (self.image_y * self.zoom - 1)//self.tile_size + 1
+
+        # The preview is binned by this factor, which must divide the zoom
+        # so that the bins are the same size in every tile.
+        self.preview_bin = max(1, self.zoom // max(1, int(preview_scale)))
+        while ((self.zoom % self.preview_bin) != 0):
+            self.preview_bin -= 1
+        self.preview_tile_size = self.tile_size // self.preview_bin
+
+        self.setShuttersInfo(shutters_info)
+
+    def addLocalizations(self, frame_number, locs):
+        """
+        locs is [x, y] as returned by FrameAnalysis.getLocalizations().
+        """
+        color = self.frame_colors[frame_number % len(self.frame_colors)]
+        if color is None:
+            return
+
+        self.pending[color].append(locs)
+        self.n_pending += locs[0].size
+        self.n_locs += locs[0].size
+        if (self.n_pending >= self.batch_size):
+            self.flush()
+
+    def assemble(self, tiles, tile_size, dtype):
+        image = numpy.zeros((self.n_tiles_y * tile_size, self.n_tiles_x * tile_size), dtype = dtype)
+        for tid, tile in tiles.items():
+            ty = tid // self.n_tiles_x
+            tx = tid % self.n_tiles_x
+            image[ty*tile_size:(ty+1)*tile_size,tx*tile_size:(tx+1)*tile_size] = tile
+        size_y = self.image_y * self.zoom // (self.tile_size // tile_size)
+        size_x = self.image_x * self.zoom // (self.tile_size // tile_size)
+        return image[:size_y,:size_x]
+
+    def clear(self):
+        self.n_locs = 0
+        self.n_pending = 0
+        self.pending = {}
+        self.previews = {}
+        self.tiles = {}
+        for color in self.colors:
+            self.pending[color] = []
+            self.previews[color] = {}
+            self.tiles[color] = {}
+
+    def flush(self):
+        """
+        Add the waiting localizations to the image.
+        """
+        for color in self.colors:
+            if (len(self.pending[color]) == 0):
+                continue
+            x = numpy.concatenate([locs[0] for locs in self.pending[color]])
+            y = numpy.concatenate([locs[1] for locs in self.pending[color]])
+            self.pending[color] = []
+
+            # Bad localizations are at (-1, -1).
+            ix = numpy.floor(x * self.zoom).astype(numpy.int64)
+            iy = numpy.floor(y * self.zoom).astype(numpy.int64)
+            mask = (x >= 0.0) & (y >= 0.0) & (ix < self.image_x * self.zoom) & (iy < self.image_y * self.zoom)
+            ix = ix[mask]
+            iy = iy[mask]
+
+            tile_id = (iy // self.tile_size) * self.n_tiles_x + (ix // self.tile_size)
+            offset = (iy % self.tile_size) * self.tile_size + (ix % self.tile_size)
+
+            order = numpy.argsort(tile_id, kind = "stable")
+            tile_id = tile_id[order]
+            offset = offset[order]
+            [tile_ids, starts] = numpy.unique(tile_id, return_index = True)
+            ends = numpy.append(starts[1:], tile_id.size)
+
+            tiles = self.tiles[color]
+            for [tid, start, end] in zip(tile_ids.tolist(), starts, ends):
+                if not tid in tiles:
+                    tiles[tid] = numpy.zeros((self.tile_size, self.tile_size), dtype = numpy.uint32)
+                numpy.add.at(tiles[tid].reshape(-1), offset[start:end], 1)
+                self.previews[color].pop(tid, None)
+
+        self.n_pending = 0
+
+    def getColors(self):
+        return self.colors
+
+    def getImage(self, color):
+        """
+        Returns the full STORM image for a color as a numpy.uint32 array.
+        """
+        self.flush()
+        return self.assemble(self.tiles[color], self.tile_size, numpy.uint32)
+
+    def getNumberLocalizations(self):
+        return self.n_locs
+
+    def getPreview(self, color):
+        """
+        Returns the binned STORM image for a color.
+        """
+        self.flush()
+        previews = self.previews[color]
+        for tid, tile in self.tiles[color].items():
+            if not tid in previews:
+                pts = self.preview_tile_size
+                previews[tid] = tile.reshape(pts, self.preview_bin, pts, self.preview_bin).sum(axis = (1, 3), dtype = numpy.uint32)
+        return self.assemble(previews, self.preview_tile_size, numpy.uint32)
+
+    def getRGBPreview(self, percentile = 99.5):
+        """
+        Returns the preview as a (y, x, 3) numpy.uint8 array with each
+        color scaled so that percentile of the (non-zero) pixels are
+        not saturated.
+        """
+        rgb = None
+        for color in self.colors:
+            preview = self.getPreview(color)
+            if rgb is None:
+                rgb = numpy.zeros(preview.shape + (3,), dtype = numpy.float32)
+            nonzero = preview[(preview > 0)]
+            if (nonzero.size == 0):
+                continue
+            scale = max(1.0, numpy.percentile(nonzero, percentile))
+            intensity = numpy.minimum(preview.astype(numpy.float32)/scale, 1.0)
+            rgb += intensity[:,:,None] * numpy.array(color, dtype = numpy.float32)
+        if rgb is None:
+            return numpy.zeros(self.previewShape() + (3,), dtype = numpy.uint8)
+        return numpy.minimum(rgb, 255.0).astype(numpy.uint8)
+
+    def previewShape(self):
+        return (self.image_y * self.zoom // self.preview_bin, self.image_x * self.zoom // self.preview_bin)
+
+    def save(self, basename):
+        """
+        Save the STORM images as a tif file, one page per color.
+        """
+        self.flush()
+        with tifffile.TiffWriter(basename + "_storm.tif") as tif:
+            tif_write = tif.write if hasattr(tif, "write") else tif.save
+            for color in self.colors:
+                tif_write(self.getImage(color),
+                          description = "color " + ",".join(map(str, color)) + ", zoom " + str(self.zoom))
+
+    def setShuttersInfo(self, shutters_info):
+        """
+        Frames with the color None are not added to the image. Changing
+        the shutters information clears the image.
+        """
+        if shutters_info is None:
+            self.frame_colors = [None]
+        else:
+            self.frame_colors = []
+            for color in shutters_info.getColorData()[:shutters_info.getFrames()]:
+                if color is None:
+                    self.frame_colors.append(None)
+                else:
+                    self.frame_colors.append(tuple(color))
+
+        self.colors = []
+        for color in self.frame_colors:
+            if (color is not None) and not (color in self.colors):
+                self.colors.append(color)
+        self.clear()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -342,6 +342,50 @@ class TCPActionTakeMovie(TCPAction):
         return False    
 
     
+class TCPBatch(object):
+    """
+    This is used to validate a batch of test messages that were sent
+    as a single 'Validate Batch' TCP message. The messages are handled
+    one at a time exactly as if they had been sent individually.
+    """
+    def __init__(self, tcp_message = None, **kwds):
+        super().__init__(**kwds)
+        self.busy = False
+        self.responses = []
+        self.tcp_message = tcp_message
+        self.tcp_messages = []
+        for message_dict in self.tcp_message.getData("messages", []):
+            self.tcp_messages.append(tcpMessage.TCPMessage.fromDict(message_dict))
+
+    def addResponse(self, tcp_message):
+        self.responses.append(tcp_message.toDict())
+
+    def getNextMessage(self):
+        return self.tcp_messages[len(self.responses)]
+
+    def getNumberResponses(self):
+        return len(self.responses)
+
+    def getTCPMessage(self):
+        """
+        Return the 'Validate Batch' message with the responses added.
+        """
+        self.tcp_message.addResponse("messages", self.responses)
+        return self.tcp_message
+    
+    def isBusy(self):
+        """
+        True if we are in the process of sending a message to HAL.
+        """
+        return self.busy
+
+    def isDone(self):
+        return (len(self.responses) == len(self.tcp_messages))
+
+    def setBusy(self, busy):
+        self.busy = busy
+
+
 class Controller(QtCore.QObject):
     """
     This is the interface between HAL and a TCP client such as Dave. Most messages
@@ -368,8 +412,15 @@ class Controller(QtCore.QObject):
     4. 'Take Movie'
     In this sequence 1 and 2 can happen in parallel.
 
-    Note also the expectation that the TCP client does not send another message
-    until it gets a response to the first message.
+    The TCP client can send more messages without waiting for the response to
+    the first message. These are queued and handled one at a time in the order
+    in which they were received. Clients should use the message ID to match
+    responses to messages.
+
+    Test messages can also be sent as a batch in a single 'Validate Batch'
+    message, this is much faster than sending them one at a time when
+    validating long sequences. The response is the same message with the
+    responses to each of the test messages.
     """
     controlAction = QtCore.pyqtSignal(object)
     controlMessage = QtCore.pyqtSignal(object)
@@ -377,6 +428,9 @@ class Controller(QtCore.QObject):
     
     def __init__(self, parallel_mode = None, server = None, verbose = True, **kwds):
         super().__init__(**kwds)
+        self.batch = None
+        self.current_message = None
+        self.message_queue = []
         self.parallel_mode = None
         self.server = server
         self.test_directory = None
@@ -394,15 +448,65 @@ class Controller(QtCore.QObject):
         data = tcp_action.getData()
         if "parameters" in data:
             self.test_parameters = data["parameters"]
-        tcp_action.sendResponse(self.server)
+        tcp_action.sendResponse(self)
 
     def cleanUp(self):
         self.server.close()
         
+    def handleBatch(self):
+        """
+        Send the messages in a batch to HAL until we get to one that
+        is handled by an action, or send the response to the TCP client
+        if all the messages in the batch have been handled.
+        """
+        while not self.batch.isDone():
+            n_responses = self.batch.getNumberResponses()
+            tcp_message = self.batch.getNextMessage()
+
+            # Only test messages can be batched.
+            if not tcp_message.isTest():
+                tcp_message.setError(True, "Only test messages can be validated in a batch.")
+                self.batch.addResponse(tcp_message)
+                continue
+
+            self.batch.setBusy(True)
+            self.processMessage(tcp_message)
+            self.batch.setBusy(False)
+
+            # No response yet, so this message is being handled by an action.
+            if (self.batch.getNumberResponses() == n_responses):
+                return
+
+        batch = self.batch
+        self.batch = None
+        self.sendMessage(batch.getTCPMessage())
+
     def handleLostConnection(self):
+        self.batch = None
+        self.current_message = None
+        self.message_queue = []
         self.gotConnection.emit(False)
 
     def handleMessageReceived(self, tcp_message):
+        """
+        Queue messages from the TCP client, they are handled one at a time.
+        """
+        self.message_queue.append(tcp_message)
+        self.handleQueue()
+
+    def handleNewConnection(self):
+        self.gotConnection.emit(True)
+
+    def handleQueue(self):
+        """
+        Start on the next message in the queue, if any, unless we are
+        still handling a message.
+        """
+        if (self.current_message is None) and (len(self.message_queue) > 0):
+            self.current_message = self.message_queue.pop(0)
+            self.processMessage(self.current_message)
+
+    def processMessage(self, tcp_message):
         """
         TCP message handling.
         """
@@ -411,7 +515,18 @@ class Controller(QtCore.QObject):
             print(tcp_message)
             print("")
 
-        if tcp_message.isType('Check Focus Lock'):
+        if tcp_message.isType("Validate Batch"):
+            if not tcp_message.isTest():
+                tcp_message.setError(True, "'Validate Batch' is only supported in test mode.")
+            elif self.batch is not None:
+                tcp_message.setError(True, "Batches cannot be nested.")
+            else:
+                self.batch = TCPBatch(tcp_message = tcp_message)
+                self.handleBatch()
+                return
+            self.sendMessage(tcp_message)
+
+        elif tcp_message.isType('Check Focus Lock'):
             # This is supposed to ensure that everything else, like stage moves is complete.
             self.controlMessage.emit(halMessage.SyncMessage())
             
@@ -441,9 +556,9 @@ class Controller(QtCore.QObject):
                     #
                     self.controlMessage.emit(halMessage.HalMessage(m_type = "change directory",
                                                                    data = {"directory" : directory},
-                                                                   finalizer = lambda : self.server.sendMessage(tcp_message)))
+                                                                   finalizer = lambda : self.sendMessage(tcp_message)))
                     return
-            self.server.sendMessage(tcp_message)
+            self.sendMessage(tcp_message)
 
         elif tcp_message.isType("Set Parameters"):
             if tcp_message.isTest():
@@ -456,8 +571,8 @@ class Controller(QtCore.QObject):
 
             # Check that movie length is valid.
             if (tcp_message.getData("length") is None) or (tcp_message.getData("length") < 1):
-                tcp_message.setError(True, str(message.getData("length")) + " is an invalid movie length.")
-                self.server.sendMessage(tcp_message)
+                tcp_message.setError(True, str(tcp_message.getData("length")) + " is an invalid movie length.")
+                self.sendMessage(tcp_message)
                 return
 
             # Check that the requested directory (if any) exists.
@@ -465,7 +580,7 @@ class Controller(QtCore.QObject):
                 directory = tcp_message.getData("directory")
                 if not os.path.exists(directory):
                     tcp_message.setError(True, "The directory '" + directory + "' does not exist.")
-                    self.server.sendMessage(tcp_message)
+                    self.sendMessage(tcp_message)
                     return
                     
             # Some messy logic here to check if we will over-write a existing films? For now, just
@@ -478,7 +593,7 @@ class Controller(QtCore.QObject):
                 filename = os.path.join(directory, tcp_message.getData("name")) + ".xml"
                 if os.path.exists(filename):
                     tcp_message.setError(True, "The movie file '" + filename + "' already exists.")
-                    self.server.sendMessage(tcp_message)
+                    self.sendMessage(tcp_message)
                     return
 
             # More messy logic here to return film size, time, etc..
@@ -492,7 +607,7 @@ class Controller(QtCore.QObject):
                 # Otherwise calculate based on the current parameters.
                 else:
                     calculateMovieStats(tcp_message, self.test_parameters)
-                    self.server.sendMessage(tcp_message)                    
+                    self.sendMessage(tcp_message)                    
             else:
                 action = TCPActionTakeMovie(tcp_message = tcp_message)
                 self.controlAction.emit(action)
@@ -505,10 +620,31 @@ class Controller(QtCore.QObject):
                 msg = halMessage.HalMessage(m_type = "tcp message",
                                             data = {"tcp message" : tcp_message})
                 self.controlMessage.emit(msg)
-                self.server.sendMessage(tcp_message)
-                
-    def handleNewConnection(self):
-        self.gotConnection.emit(True)
+                self.sendMessage(tcp_message)
+
+    def sendMessage(self, tcp_message):
+        """
+        Send a response to the TCP client, or if we are handling a batch
+        of messages add the response to the batch.
+        """
+        if self.batch is None:
+            self.server.sendMessage(tcp_message)
+
+            # Continue with the next message in the queue. As with batches
+            # this is done with a timer so that the TCPControl module can
+            # finalize the action first.
+            if tcp_message is self.current_message:
+                self.current_message = None
+                QtCore.QTimer.singleShot(0, self.handleQueue)
+        else:
+            self.batch.addResponse(tcp_message)
+
+            # If this was the response to a message that was handled by an
+            # action we need to continue with the batch. This is done with
+            # a timer so that the TCPControl module can finalize the action
+            # before the next message in the batch is handled.
+            if not self.batch.isBusy():
+                QtCore.QTimer.singleShot(0, self.handleBatch)
 
     def setDirectory(self, directory):
         self.test_directory = directory
@@ -523,6 +659,11 @@ class TCPControl(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"change directory",
+                              "changing parameters",
+                              "configure2",
+                              "film lockout",
+                              "updated parameters"}
         self.control_action = None
 
         configuration = module_params.get("configuration")
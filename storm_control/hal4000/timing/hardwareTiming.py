@@ -103,6 +103,16 @@ class HardwareTiming(halModule.HalModule):
     """
     def __init__(self, module_params = None, qt_settings = None, **kwds):
         super().__init__(**kwds)
+        self.subscriptions = {"configuration",
+                              "configure1",
+                              "current parameters",
+                              "get functionality",
+                              "new parameters",
+                              "start",
+                              "start camera",
+                              "start film",
+                              "stop camera",
+                              "stop film"}
         self.film_settings = None
         self.hardware_timing_functionality = None
 
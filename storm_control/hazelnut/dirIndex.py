@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+#
+# A persistent index of the files in a source directory (and it's
+# sub-directories). For each file the index stores the size and the
+# modification time. It also records, for each destination, which
+# files were transferred (and their size, modification time and
+# checksum at the time). A file that has changed since it was
+# transferred counts as not transferred.
+#
+# The index is updated from the watchdog events while Hazelnut is
+# running. The rest of the time it is brought up to date with
+# reconcile(). This only lists the directories whose modification time
+# has changed, so it does not have to stat every file on the
+# acquisition disk.
+#
+# Note that changing a file in place does not change the modification
+# time of it's directory, so reconcile() does not notice this. This
+# is okay for movies as HAL writes the XML file last.
+#
+
+import hashlib
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+# Increment this when the tables change, older indexes are rebuilt.
+index_version = 2
+
+
+class DirIndex(object):
+    """
+    The paths in the index are relative to the directory.
+    """
+    def __init__(self, directory, index_file = None):
+        self.directory = os.path.abspath(directory)
+        self.lock = threading.RLock()
+        self.pending = set()
+
+        # By default the index is not kept in the directory as we don't
+        # want it's changes to look like the changes from HAL.
+        if index_file is None:
+            index_dir = os.path.join(os.path.expanduser("~"), ".hazelnut")
+            if not os.path.exists(index_dir):
+                os.makedirs(index_dir)
+            index_file = os.path.join(index_dir, hashlib.sha1(self.directory.encode()).hexdigest() + ".db")
+
+        # The watchdog events arrive in the watchdog thread.
+        self.db = sqlite3.connect(index_file, check_same_thread = False)
+        if (self.db.execute("PRAGMA user_version").fetchone()[0] != index_version):
+            for table in ["dirs", "files", "transfers"]:
+                self.db.execute("DROP TABLE IF EXISTS " + table)
+            self.db.execute("PRAGMA user_version = " + str(index_version))
+        self.db.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_dir ON files (dir)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS transfers (path TEXT, destination TEXT, size INTEGER, " +
+                        "mtime INTEGER, checksum TEXT, PRIMARY KEY (path, destination))")
+        self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.db.close()
+
+    def flush(self):
+        """
+        Update the index with the files from the watchdog events.
+        """
+        with self.lock:
+            pending = self.pending
+            self.pending = set()
+            for fullpath_name in pending:
+                path = os.path.relpath(fullpath_name, self.directory)
+                if path.startswith(os.pardir):
+                    continue
+                if (path == os.curdir):
+                    path = ""
+
+                try:
+                    st = os.stat(fullpath_name)
+                except OSError:
+                    st = None
+
+                if st is None:
+                    self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+                    self.db.execute("DELETE FROM transfers WHERE path = ?", (path,))
+                    self.removeTree(path)
+
+                elif stat.S_ISDIR(st.st_mode):
+                    self.reconcile(path)
+
+                else:
+                    row = self.db.execute("SELECT size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+                    if (row != (st.st_size, st.st_mtime_ns)):
+                        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                        (path, os.path.dirname(path), st.st_size, st.st_mtime_ns))
+            self.db.commit()
+
+    def fullPath(self, path):
+        if path:
+            return os.path.join(self.directory, path)
+        return self.directory
+
+    def getFiles(self, destination = None):
+        """
+        Returns the (relative) paths of the files. If destination is not None
+        only the files that have not been transferred to it are returned.
+        """
+        with self.lock:
+            if destination is None:
+                return [row[0] for row in self.db.execute("SELECT path FROM files")]
+            return [row[0] for row in self.db.execute("SELECT files.path FROM files LEFT JOIN transfers ON " +
+                                                      "(transfers.path = files.path) AND (transfers.destination = ?) AND " +
+                                                      "(transfers.size = files.size) AND (transfers.mtime = files.mtime) " +
+                                                      "WHERE transfers.path IS NULL",
+                                                      (destination,))]
+
+    def getTransferred(self, destination):
+        """
+        Returns the (relative) paths of the files that have been transferred to destination.
+        """
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT files.path FROM files JOIN transfers ON " +
+                                                      "(transfers.path = files.path) AND (transfers.destination = ?) AND " +
+                                                      "(transfers.size = files.size) AND (transfers.mtime = files.mtime)",
+                                                      (destination,))]
+
+    def isTransferred(self, path, destination):
+        with self.lock:
+            row = self.db.execute("SELECT files.path FROM files JOIN transfers ON " +
+                                  "(transfers.path = files.path) AND (transfers.destination = ?) AND " +
+                                  "(transfers.size = files.size) AND (transfers.mtime = files.mtime) " +
+                                  "WHERE files.path = ?",
+                                  (destination, path)).fetchone()
+        return (row is not None)
+
+    def listDirectory(self, path, mtime):
+        """
+        A helper function for reconcile(). Updates the files in
+        a directory and returns it's sub-directories.
+        """
+        known = {}
+        for [f_path, size, f_mtime] in self.db.execute("SELECT path, size, mtime FROM files WHERE dir = ?", (path,)):
+            known[f_path] = (size, f_mtime)
+
+        changed = []
+        sub_dirs = []
+        with os.scandir(self.fullPath(path)) as entries:
+            for entry in entries:
+                e_path = os.path.join(path, entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks = False):
+                        sub_dirs.append(e_path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        if (known.pop(e_path, None) != (st.st_size, st.st_mtime_ns)):
+                            changed.append((e_path, path, st.st_size, st.st_mtime_ns))
+
+                # The file was removed while we were listing the directory.
+                except OSError:
+                    continue
+
+        self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", changed)
+        self.db.executemany("DELETE FROM files WHERE path = ?", [(f_path,) for f_path in known])
+        self.db.executemany("DELETE FROM transfers WHERE path = ?", [(f_path,) for f_path in known])
+
+        # Don't record the modification time if it is very recent, files could
+        # still be added that won't change it (the resolution can be coarse).
+        if ((time.time_ns() - mtime) < 2000000000):
+            mtime = None
+        self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (path, mtime))
+        return sub_dirs
+
+    def markTransferred(self, path, destination, checksum, mtime = None):
+        """
+        Record that a file was transferred to destination. If mtime (a
+        timestamp) is specified the file is only marked if it has not
+        been changed since then. Returns True if the file was marked.
+        """
+        try:
+            st = os.stat(self.fullPath(path))
+        except OSError:
+            return False
+        if mtime is not None and (st.st_mtime > (mtime + 1.0e-3)):
+            return False
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                            (path, os.path.dirname(path), st.st_size, st.st_mtime_ns))
+            self.db.execute("INSERT OR REPLACE INTO transfers VALUES (?, ?, ?, ?, ?)",
+                            (path, destination, st.st_size, st.st_mtime_ns, checksum))
+            self.db.commit()
+        return True
+
+    def reconcile(self, path = ""):
+        """
+        Bring the index (for path) up to date with the directory. Only
+        the directories whose modification time has changed are listed.
+
+        Returns the number of directories that were listed.
+        """
+        with self.lock:
+            dirs = {}
+            sub_dirs = {}
+            for [d_path, mtime] in self.db.execute("SELECT path, mtime FROM dirs"):
+                dirs[d_path] = mtime
+                if d_path:
+                    sub_dirs.setdefault(os.path.dirname(d_path), []).append(d_path)
+
+            listed = 0
+            seen = set()
+            todo = [path]
+            while (len(todo) > 0):
+                d_path = todo.pop()
+                try:
+                    mtime = os.stat(self.fullPath(d_path)).st_mtime_ns
+                except OSError:
+                    continue
+                seen.add(d_path)
+                if (dirs.get(d_path, -1) == mtime):
+                    todo.extend(sub_dirs.get(d_path, []))
+                else:
+                    try:
+                        todo.extend(self.listDirectory(d_path, mtime))
+                    except OSError:
+                        seen.remove(d_path)
+                        continue
+                    listed += 1
+
+            # Remove directories that no longer exist.
+            for d_path in dirs:
+                if not (d_path in seen) and ((path == "") or d_path.startswith(path + os.sep)):
+                    self.db.execute("DELETE FROM dirs WHERE path = ?", (d_path,))
+                    self.db.execute("DELETE FROM transfers WHERE path IN (SELECT path FROM files WHERE dir = ?)", (d_path,))
+                    self.db.execute("DELETE FROM files WHERE dir = ?", (d_path,))
+            self.db.commit()
+            return listed
+
+    def removeTree(self, path):
+        """
+        Remove a directory and everything in it from the index.
+        """
+        start = path + os.sep
+        end = path + chr(ord(os.sep) + 1)
+        with self.lock:
+            self.db.execute("DELETE FROM dirs WHERE (path = ?) OR ((path >= ?) AND (path < ?))", (path, start, end))
+            self.db.execute("DELETE FROM files WHERE (path >= ?) AND (path < ?)", (start, end))
+            self.db.execute("DELETE FROM transfers WHERE (path >= ?) AND (path < ?)", (start, end))
+
+    def update(self, fullpath_name):
+        """
+        Called with the path of a file (or directory) that was created, changed,
+        moved or deleted. The index is updated the next time flush() is called.
+        """
+        with self.lock:
+            self.pending.add(fullpath_name)
@@ -11,7 +11,6 @@
 
 import datetime
 import os
-import shutil
 import sys
 import time
 import watchdog
@@ -21,7 +20,9 @@ import watchdog.observers
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 import destination
+import dirIndex
 import qtdesigner.hazelnut_ui as hazelnutUi
+import transferEngine
 
 
 class DirObject(object):
@@ -45,6 +46,12 @@ class DirObject(object):
     def getDirectory(self):
         return self.directory
 
+    def getName(self):
+        """
+        A name that identifies this directory as a destination.
+        """
+        return self.directory
+
     def getFiles(self):
         temp = self.files
         self.files = []
@@ -55,15 +62,21 @@ class DirObjectFileSystem(DirObject):
     """
     Specialized for the file system protocol.
     """
-    def __init__(self, directory, local = True):
+    def __init__(self, directory, local = True, index_file = None):
         DirObject.__init__(self)
+        self.checksum = "sha1"
+        self.chunk_size = 8 * 1024 * 1024
+        self.destination = None
         self.directory = directory
+        self.index = None
+        self.last_write = 0.0
         self.watcher = None
 
-        # Don't watchdog remote directories.
+        # Don't index or watchdog remote directories.
         if not local:
             return
 
+        self.index = dirIndex.DirIndex(directory, index_file = index_file)
         self.watchDirectory(True)
                 
     def addFile(self, fullpath_name):
@@ -78,20 +91,73 @@ class DirObjectFileSystem(DirObject):
         for ext in DirObject.movie_extensions:
             fullpath_name = basename + ext
             if os.path.exists(fullpath_name):
-                partialpath_name = fullpath_name[(len(self.directory)+1):]
-                f_object = FileObject(fullpath_name,
-                                      partialpath_name,
-                                      datetime.datetime.fromtimestamp(os.path.getmtime(fullpath_name)))
-                self.files.append(f_object)
+                self.addFileObject(fullpath_name)
+
+    def addFileObject(self, fullpath_name):
+        partialpath_name = fullpath_name[(len(self.directory)+1):]
+        if (self.index is not None) and (self.destination is not None):
+            if self.index.isTransferred(partialpath_name, self.destination):
+                return
+        f_object = FileObject(fullpath_name,
+                              partialpath_name,
+                              datetime.datetime.fromtimestamp(os.path.getmtime(fullpath_name)))
+        self.files.append(f_object)
+
+    def fileChanged(self, fullpath_name):
+        self.index.update(fullpath_name)
+
+    def fileModified(self, fullpath_name):
+        self.last_write = time.time()
+        self.index.update(fullpath_name)
 
     def getCurrentFiles(self):
         """
-        Get all the current files in the directory (and it's sub-directories).
+        Get all the current files in the directory (and it's sub-directories)
+        that have not been transferred to the current destination. The index
+        only lists the directories that have changed since it was last updated.
+        """
+        self.index.reconcile()
+        for partialpath_name in self.index.getFiles(destination = self.destination):
+            [basename, ext] = os.path.splitext(os.path.join(self.directory, partialpath_name))
+            if not (ext.lower() in DirObject.movie_extensions):
+                continue
+
+            # Only movies that HAL has finished.
+            if os.path.exists(basename + ".xml"):
+                self.addFileObject(basename + ext)
+
+    def getFiles(self):
+        if self.index is not None:
+            self.index.flush()
+        return DirObject.getFiles(self)
+
+    def getName(self):
+        return "file://" + os.path.abspath(self.directory)
+
+    def isAcquiring(self, timeout = 2.0):
+        """
+        Returns True if a file in the directory was written to
+        in the last timeout seconds, i.e. HAL is taking a movie.
         """
-        for (path_original, dirs, files) in os.walk(self.directory):
-            for filename in files:
-                self.addFile(os.path.join(path_original, filename))
+        return ((time.time() - self.last_write) < timeout)
+
+    def markTransferred(self, file_object):
+        """
+        Record in the index that this file was transferred to the current destination.
+        """
+        if (self.index is not None) and (self.destination is not None):
+            self.index.markTransferred(file_object.getPartialPathName(),
+                                       self.destination,
+                                       file_object.getChecksum(),
+                                       mtime = file_object.getMTime().timestamp())
                 
+    def setDestination(self, destination):
+        """
+        Set the name of the destination (DirObject.getName()) that the
+        files are being transferred to.
+        """
+        self.destination = destination
+
     def shouldTransfer(self, file_object):
         dest_file = os.path.join(self.directory, file_object.getPartialPathName())
         if os.path.exists(dest_file):
@@ -102,30 +168,26 @@ class DirObjectFileSystem(DirObject):
                 return False
         return True
         
-    def transferFile(self, file_object, callback):
+    def transferFile(self, file_object, callback, throttle = None):
         """
         The callback function expects an integer in the range 0-100 that
         indicates the current progress of the transfer.
         """
         dest_file = os.path.join(self.directory, file_object.getPartialPathName())
 
-        # For GUI testing.
-        if True:
-            for i in range(10):
-                callback(10 * i)
-                time.sleep(0.1)
-            return
-
         # Make a directory if necessary first.
-        #
-        # FIXME: Limited to a single level?
-        #
         dest_dir = os.path.dirname(dest_file)
         if not os.path.exists(dest_dir):
             os.makedirs(dest_dir)
 
-        # Copy the file.
-        shutil.copyfile(file_object.getFullPathName(), dest_file)
+        # Copy the file, this resumes a partial copy and verifies the checksum.
+        checksum = transferEngine.copyFile(file_object.getFullPathName(),
+                                           dest_file,
+                                           callback = callback,
+                                           algorithm = self.checksum,
+                                           chunk_size = self.chunk_size,
+                                           throttle = throttle)
+        file_object.setChecksum(checksum)
         
     def watchDirectory(self, start):
 
@@ -140,6 +202,7 @@ class DirObjectFileSystem(DirObject):
         # Stop directory watchdog.            
         else:
             self.watcher.stop()
+            self.index.flush()
 
 
 class DirObjectSFTP(DirObject):
@@ -148,6 +211,7 @@ class DirObjectSFTP(DirObject):
     """
     def __init__(self, sftp_transport, destination_directory):
         DirObject.__init__(self)
+        self.directory = destination_directory
         self.sftp_transport = sftp_transport
         self.sftp_client = self.sftp_transport.open_sftp_client()
 
@@ -162,6 +226,10 @@ class DirObjectSFTP(DirObject):
             msg_box.exec_()
             self.sftp_client = None
             
+    def getName(self):
+        [host, port] = self.sftp_transport.getpeername()[:2]
+        return "sftp://" + str(self.sftp_transport.get_username()) + "@" + host + ":" + str(port) + "/" + self.directory
+
     def shouldTransfer(self, file_object):
         try:
             sftp_attr = self.sftp_client.stat(file_object.getPartialPathName())
@@ -175,10 +243,17 @@ class DirObjectSFTP(DirObject):
         else:
             return False
         
-    def transferFile(self, file_object, callback):
+    def transferFile(self, file_object, callback, throttle = None):
         assert (self.sftp_client is not None)
-        
-        sftp_callback = lambda bytes_trans, bytes_total : callback(int(100.0 * bytes_trans/bytes_total))
+
+        # paramiko calls this after every block, so this is also where we throttle.
+        bytes_done = [0]
+        def sftp_callback(bytes_trans, bytes_total):
+            if throttle is not None:
+                throttle.wait(bytes_trans - bytes_done[0])
+            bytes_done[0] = bytes_trans
+            callback(int(100.0 * bytes_trans/bytes_total))
+
         self.sftp_client.put(file_object.getFullPathName(),
                              file_object.getPartialPathName(),
                              callback = sftp_callback)
@@ -189,6 +264,7 @@ class FileObject(object):
     A class for keeping track of the relevant details of a single file.
     """
     def __init__(self, fullpath_name, partialpath_name, mtime):
+        self.checksum = None
         self.fullpath_name = fullpath_name
         self.mtime = mtime
         self.partialpath_name = partialpath_name
@@ -199,6 +275,9 @@ class FileObject(object):
     def __str__(self):
         return self.partialpath_name + " " + self.mtime.strftime("%c")
 
+    def getChecksum(self):
+        return self.checksum
+
     def getFullPathName(self):
         return self.fullpath_name
     
@@ -211,6 +290,9 @@ class FileObject(object):
     def isNewerThan(self, a_time):
         return (self.mtime > a_time)
 
+    def setChecksum(self, checksum):
+        self.checksum = checksum
+
 
 class FileSystemWatcher(watchdog.events.FileSystemEventHandler):
 
@@ -219,8 +301,20 @@ class FileSystemWatcher(watchdog.events.FileSystemEventHandler):
         self.dir_object = dir_object
         
     def on_created(self, event):
+        self.dir_object.fileChanged(event.src_path)
         self.dir_object.addFile(event.src_path)
 
+    def on_deleted(self, event):
+        self.dir_object.fileChanged(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.dir_object.fileModified(event.src_path)
+
+    def on_moved(self, event):
+        self.dir_object.fileChanged(event.src_path)
+        self.dir_object.fileChanged(event.dest_path)
+
 
 class Window(QtWidgets.QMainWindow):
 
@@ -249,6 +343,7 @@ class Window(QtWidgets.QMainWindow):
 
         self.ui.startPushButton.pressed.connect(self.handleStartButton)
 
+        self.ui.transferQueueMVC.fileTransferred.connect(self.handleFileTransferred)
         self.ui.transferQueueMVC.transferStarted.connect(self.handleStarted)
         self.ui.transferQueueMVC.transferStopped.connect(self.handleStopped)
 
@@ -274,8 +369,12 @@ class Window(QtWidgets.QMainWindow):
                 self.ui.destinationLabel.setText(str(dest[2]))
             self.ui.transferQueueMVC.addDestination(self.destination_dir_obj)
             if self.source_dir_obj is not None:
+                self.queueSourceFiles()
                 self.ui.startPushButton.setEnabled(True)
 
+    def handleFileTransferred(self, file_object):
+        self.source_dir_obj.markTransferred(file_object)
+
     def handleQuit(self, boolean):
         self.close()
 
@@ -305,12 +404,22 @@ class Window(QtWidgets.QMainWindow):
                 self.source_dir_obj.watchDirectory(False)
             
             self.source_dir_obj = DirObjectFileSystem(new_directory)
-            self.source_dir_obj.getCurrentFiles()
             self.ui.sourceLabel.setText(new_directory)
-            self.ui.transferQueueMVC.clearFileObjects()
-            self.handleUpdateTimer()
+            self.queueSourceFiles()
             self.update_timer.start()
 
+    def queueSourceFiles(self):
+        """
+        (Re)fill the transfer queue with the files in the source directory
+        that have not been transferred to the current destination.
+        """
+        if self.destination_dir_obj is not None:
+            self.source_dir_obj.setDestination(self.destination_dir_obj.getName())
+        self.source_dir_obj.getFiles()
+        self.source_dir_obj.getCurrentFiles()
+        self.ui.transferQueueMVC.clearFileObjects()
+        self.handleUpdateTimer()
+
     def handleStarted(self):
         self.ui.startPushButton.setText("Stop")
         self.ui.startPushButton.setEnabled(True)
@@ -325,6 +434,9 @@ class Window(QtWidgets.QMainWindow):
         for src_file in self.source_dir_obj.getFiles():
             self.ui.transferQueueMVC.addFileObject(src_file)        
 
+        # Slow down transfers while HAL is writing a movie.
+        self.ui.transferQueueMVC.setAcquiring(self.source_dir_obj.isAcquiring())
+
         
 if (__name__ == '__main__'):
 
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+#
+# The file transfer engine. Files are copied by a pool of worker
+# threads in large chunks. The copy is first written to a '.partial'
+# file so that an interrupted transfer can be resumed, and it is
+# only renamed to the final name once it's checksum has been
+# verified against the checksum of the source file.
+#
+# Transfers can be throttled, this is so that they don't compete
+# for the disk with HAL while it is writing a movie.
+#
+
+import hashlib
+import os
+import threading
+import time
+
+from PyQt5 import QtCore
+
+
+class TransferException(Exception):
+    pass
+
+
+class Throttle(object):
+    """
+    Limits the (total) rate at which the workers read / write data.
+    """
+    def __init__(self, rate = 0):
+        """
+        rate - Bytes per second, 0 is no limit.
+        """
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.t_next = time.perf_counter()
+
+    def getRate(self):
+        return self.rate
+
+    def setRate(self, rate):
+        with self.lock:
+            self.rate = rate
+
+    def wait(self, n_bytes):
+        """
+        Wait until it is okay to transfer n_bytes.
+        """
+        with self.lock:
+            if (self.rate <= 0):
+                return
+            now = time.perf_counter()
+            t_start = max(self.t_next, now)
+            self.t_next = t_start + n_bytes/self.rate
+        if (t_start > now):
+            time.sleep(t_start - now)
+
+
+def checksumFile(filename, size = None, algorithm = "sha1", chunk_size = 8388608, throttle = None):
+    """
+    Returns the hashlib object for the first size bytes of filename, or
+    the whole file if size is None.
+    """
+    checksum = hashlib.new(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(filename, "rb") as fp:
+        remaining = size
+        while (remaining is None) or (remaining > 0):
+            if throttle is not None:
+                throttle.wait(chunk_size)
+            if remaining is None:
+                n_read = fp.readinto(buf)
+            else:
+                n_read = fp.readinto(view[:min(chunk_size, remaining)])
+                remaining -= n_read
+            if (n_read == 0):
+                break
+            checksum.update(view[:n_read])
+    if (remaining is not None) and (remaining > 0):
+        raise TransferException(filename + " is smaller than expected.")
+    return checksum
+
+
+def copyFile(source, destination, callback = None, algorithm = "sha1", chunk_size = 8388608, throttle = None):
+    """
+    Copy source to destination and returns the checksum of the file.
+
+    The callback function expects an integer in the range 0-100 that
+    indicates the current progress of the transfer.
+    """
+    try:
+        return copyFileChunked(source, destination, callback, algorithm, chunk_size, throttle, True)
+
+    # If the copy does not verify try again once from the beginning, the
+    # problem might have been a bad partial file from an earlier transfer.
+    except TransferException:
+        return copyFileChunked(source, destination, callback, algorithm, chunk_size, throttle, False)
+
+
+def copyFileChunked(source, destination, callback, algorithm, chunk_size, throttle, resume):
+    """
+    A helper function for copyFile().
+    """
+    partial = destination + ".partial"
+    source_stat = os.stat(source)
+    total = source_stat.st_size
+
+    # Check if there is a partial copy that we can resume. This is only
+    # okay if the source has not changed since the partial copy was made.
+    offset = 0
+    if resume and os.path.exists(partial):
+        partial_stat = os.stat(partial)
+        if (partial_stat.st_size <= total) and (partial_stat.st_mtime >= source_stat.st_mtime):
+            offset = partial_stat.st_size
+
+    # Get the checksum of the part that we don't have to copy.
+    if (offset > 0):
+        checksum = checksumFile(source,
+                                size = offset,
+                                algorithm = algorithm,
+                                chunk_size = chunk_size,
+                                throttle = throttle)
+    else:
+        checksum = hashlib.new(algorithm)
+
+    # Copy the rest.
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    copied = offset
+    with open(source, "rb") as fp_in:
+        with open(partial, "r+b" if (offset > 0) else "wb") as fp_out:
+            fp_in.seek(offset)
+            fp_out.seek(offset)
+            while True:
+                if throttle is not None:
+                    throttle.wait(chunk_size)
+                n_read = fp_in.readinto(buf)
+                if (n_read == 0):
+                    break
+                fp_out.write(view[:n_read])
+                checksum.update(view[:n_read])
+                copied += n_read
+                if callback is not None and (total > 0):
+                    callback(int(100.0 * copied/total))
+            fp_out.flush()
+            os.fsync(fp_out.fileno())
+
+    # Verify the copy.
+    dest_checksum = checksumFile(partial, algorithm = algorithm, chunk_size = chunk_size)
+    if (dest_checksum.hexdigest() != checksum.hexdigest()):
+        os.remove(partial)
+        raise TransferException("Checksum of " + destination + " does not match " + source)
+
+    # Rename and give the copy the same time stamps as the source.
+    os.replace(partial, destination)
+    os.utime(destination, (source_stat.st_atime, source_stat.st_mtime))
+
+    if callback is not None:
+        callback(100)
+    return checksum.hexdigest()
+
+
+class TransferEngine(QtCore.QObject):
+    """
+    Runs file transfers on a pool of worker threads.
+    """
+    transferComplete = QtCore.pyqtSignal(object, str)
+    transferProgress = QtCore.pyqtSignal(object, int)
+
+    def __init__(self, max_workers = 2, acquiring_rate = 10.0, idle_rate = 0.0, **kwds):
+        """
+        acquiring_rate - Transfer rate in MB/s when HAL is acquiring.
+        idle_rate - Transfer rate in MB/s otherwise, 0 is as fast as possible.
+        """
+        super().__init__(**kwds)
+        self.acquiring = False
+        self.acquiring_rate = acquiring_rate
+        self.idle_rate = idle_rate
+        self.throttle = Throttle()
+        self.workers = {}
+
+        self.threadpool = QtCore.QThreadPool(self)
+        self.threadpool.setMaxThreadCount(max_workers)
+
+    def getMaxWorkers(self):
+        return self.threadpool.maxThreadCount()
+
+    def getNumberRunning(self):
+        return len(self.workers)
+
+    def handleTransferComplete(self, tq_item, error):
+        del self.workers[id(tq_item)]
+        self.transferComplete.emit(tq_item, error)
+
+    def isIdle(self):
+        return (len(self.workers) == 0)
+
+    def setAcquiring(self, acquiring):
+        """
+        Call this to let the engine know if HAL is currently writing a movie.
+        """
+        self.acquiring = acquiring
+        self.updateRate()
+
+    def setMaxWorkers(self, max_workers):
+        self.threadpool.setMaxThreadCount(max_workers)
+
+    def setRates(self, acquiring_rate, idle_rate):
+        self.acquiring_rate = acquiring_rate
+        self.idle_rate = idle_rate
+        self.updateRate()
+
+    def transfer(self, dir_object, tq_item):
+        """
+        Transfer the file of tq_item (a TransferQueueStandardItem) to dir_object.
+        """
+        worker = TransferWorker(dir_object, tq_item, self.throttle)
+        worker.tw_signaler.transferComplete.connect(self.handleTransferComplete)
+        worker.tw_signaler.transferProgress.connect(self.transferProgress)
+        self.workers[id(tq_item)] = worker
+        self.threadpool.start(worker)
+
+    def updateRate(self):
+        if self.acquiring:
+            self.throttle.setRate(1.0e6 * self.acquiring_rate)
+        else:
+            self.throttle.setRate(1.0e6 * self.idle_rate)
+
+    def waitForDone(self, msecs = -1):
+        return self.threadpool.waitForDone(msecs)
+
+
+class TransferWorkerSignaler(QtCore.QObject):
+    transferComplete = QtCore.pyqtSignal(object, str)
+    transferProgress = QtCore.pyqtSignal(object, int)
+
+
+class TransferWorker(QtCore.QRunnable):
+    """
+    Transfers a single file.
+    """
+    def __init__(self, dir_object, tq_item, throttle, **kwds):
+        super().__init__(**kwds)
+        self.dir_object = dir_object
+        self.throttle = throttle
+        self.tq_item = tq_item
+        self.tw_signaler = TransferWorkerSignaler()
+
+        self.setAutoDelete(False)
+
+    def run(self):
+        error = ""
+        file_object = self.tq_item.getFileObject()
+
+        # The engine has to hear about every transfer that ends, otherwise
+        # the item is stuck in the queue and the worker slot is lost. Note
+        # that the SFTP transfers can raise paramiko exceptions.
+        try:
+            if self.dir_object.shouldTransfer(file_object):
+                callback = lambda x: self.tw_signaler.transferProgress.emit(self.tq_item, x)
+                self.dir_object.transferFile(file_object, callback, throttle = self.throttle)
+        except Exception as exception:
+            error = str(exception)
+            if not error:
+                error = type(exception).__name__
+        finally:
+            self.tw_signaler.transferComplete.emit(self.tq_item, error)
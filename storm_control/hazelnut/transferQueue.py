@@ -1,14 +1,15 @@
 #!/usr/bin/env python
 #
-# Handles the transfer queue GUI and also file transfer.
+# Handles the transfer queue GUI. The file transfers are done
+# by the transfer engine.
 #
 # Hazen 08/16
 #
 
-import time
-
 from PyQt5 import QtCore, QtGui, QtWidgets
 
+import transferEngine
+
 
 #
 # Transfer Queue related.
@@ -68,8 +69,10 @@ class TransferQueueListViewDelegate(QtWidgets.QStyledItemDelegate):
         #style = option.widget.style()
         #style.drawControl(QtGui.QStyle.CE_ItemViewItem, option, painter, option.widget)
 
-        # Draw text.
+        # Draw text, failed transfers are red.
         color = QtGui.QColor(0,0,0)
+        if (tq_item.getStatus() == "failed"):
+            color = QtGui.QColor(255,0,0)
         painter.setPen(color)
         painter.setBrush(color)
 
@@ -129,6 +132,7 @@ class TransferQueueStandardItemModel(QtGui.QStandardItemModel):
 
     
 class TransferQueueMVC(QtWidgets.QListView):
+    fileTransferred = QtCore.pyqtSignal(object)
     transferStarted = QtCore.pyqtSignal()
     transferStopped = QtCore.pyqtSignal()
     
@@ -138,8 +142,7 @@ class TransferQueueMVC(QtWidgets.QListView):
     def __init__(self, parent = None):
         QtWidgets.QListView.__init__(self, parent)
         self.destination_dir_obj = None
-        self.max_threads = 1
-        self.running_threads = []
+        self.tr_engine = transferEngine.TransferEngine(max_workers = 1, parent = self)
         self.tr_timer = QtCore.QTimer(self)
 
         self.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
@@ -147,6 +150,10 @@ class TransferQueueMVC(QtWidgets.QListView):
         # Configure transfer timer.
         self.tr_timer.setInterval(100)
         self.tr_timer.timeout.connect(self.handleTrTimer)
+
+        # Configure transfer engine.
+        self.tr_engine.transferComplete.connect(self.handleTransferComplete)
+        self.tr_engine.transferProgress.connect(self.handleTransferProgress)
         
         # Transfer queue model.
         self.tq_model = TransferQueueStandardItemModel(self)
@@ -173,45 +180,47 @@ class TransferQueueMVC(QtWidgets.QListView):
 
     def handleTrTimer(self):
         """
-        Create threads for files that need to transferred.
+        Give the transfer engine the files that need to transferred.
         Files at the top of the queue go first.
         """
-        tr_max = self.max_threads - len(self.running_threads)
-        if (tr_max > self.tq_model.rowCount()):
-            tr_max = self.tq_model.rowCount()
-        for i in range(tr_max):
+        tr_max = self.tr_engine.getMaxWorkers() - self.tr_engine.getNumberRunning()
+        for i in range(self.tq_proxy_model.rowCount()):
+            if (tr_max <= 0):
+                break
             proxy_index = self.tq_proxy_model.index(i, 0)
             source_index = self.tq_proxy_model.mapToSource(proxy_index)
             source_item = self.tq_model.itemFromIndex(source_index)
-            source_item.setStatus("in_transfer")
-            tr_thread = TransferThread(self.destination_dir_obj, source_item)
-            tr_thread.transferComplete.connect(self.handleTransferComplete)
-            tr_thread.transferProgress.connect(self.handleTransferProgress)
-            tr_thread.start(QtCore.QThread.NormalPriority)
-            self.running_threads.append(tr_thread)
-
-    def handleTransferComplete(self, tr_thread):
-        tq_item = tr_thread.getTQItem()
-        
-        # Remove this from the list of items in the transfer queue.
-        source_index = self.tq_model.indexFromItem(tq_item)
-        self.tq_model.removeRow(source_index.row())
+            if (source_item.getStatus() == "queued"):
+                source_item.setStatus("in_transfer")
+                self.tr_engine.transfer(self.destination_dir_obj, source_item)
+                tr_max -= 1
 
-        # Throw away this thread.
-        tr_thread.transferComplete.disconnect()
-        tr_thread.transferProgress.disconnect()
-        self.running_threads.remove(tr_thread)
+    def handleTransferComplete(self, tq_item, error):
 
-        # Check if the timer has stopped and no other threads are running.
+        # Leave failed transfers in the queue (but don't retry them).
+        if error:
+            print("Transfer of", tq_item.getFileObject().getFullPathName(), "failed,", error)
+            tq_item.setStatus("failed")
+
+        # Otherwise remove this from the list of items in the transfer queue.
+        else:
+            self.fileTransferred.emit(tq_item.getFileObject())
+            source_index = self.tq_model.indexFromItem(tq_item)
+            self.tq_model.removeRow(source_index.row())
+
+        # Check if the timer has stopped and no other transfers are running.
         if not self.amTransferring():
-            if (len(self.running_threads) == 0):
+            if self.tr_engine.isIdle():
                 self.transferStopped.emit()
 
     def handleTransferProgress(self, tq_item, progress):
         tq_item.setProgress(progress)
                                
+    def setAcquiring(self, acquiring):
+        self.tr_engine.setAcquiring(acquiring)
+
     def setMaxThreads(self, new_max):
-        self.max_threads = new_max
+        self.tr_engine.setMaxWorkers(new_max)
         
     def startTransfer(self):
         self.tr_timer.start()
@@ -219,29 +228,5 @@ class TransferQueueMVC(QtWidgets.QListView):
 
     def stopTransfer(self):
         self.tr_timer.stop()
-        if (len(self.running_threads) == 0):
+        if self.tr_engine.isIdle():
             self.transferStopped.emit()
-
-
-#
-# Thread class for file transfers.
-#
-class TransferThread(QtCore.QThread):
-    transferComplete = QtCore.pyqtSignal(object)
-    transferProgress = QtCore.pyqtSignal(object, int)
-
-    def __init__(self, dir_object, tq_item):
-        QtCore.QThread.__init__(self)
-        self.dir_object = dir_object
-        self.tq_item = tq_item
-
-    def getTQItem(self):
-        return self.tq_item
-    
-    def run(self):
-        file_object = self.tq_item.getFileObject()
-        if self.dir_object.shouldTransfer(file_object):
-            callback = lambda x: self.transferProgress.emit(self.tq_item, x)
-            self.dir_object.transferFile(file_object, callback)
-        self.transferComplete.emit(self)
-
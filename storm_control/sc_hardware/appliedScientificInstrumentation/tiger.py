@@ -27,6 +27,9 @@ class Tiger(RS232.RS232):
         self.y = 0
         self.z = 0
 
+        # Tiger responses end with '\r\n'.
+        kwds["response_terminator"] = "\r\n"
+
         # Try and connect to the controller.
         try:
             super().__init__(**kwds)
@@ -15,6 +15,7 @@ import ctypes
 import ctypes.util
 import numpy
 
+import storm_control.sc_library.framePool as framePool
 import storm_control.sc_library.halExceptions as halExceptions
 
 # Hamamatsu constants.
@@ -229,12 +230,16 @@ class HCamData(object):
 
     Using numpy makes a lot more sense anyways..
     """
-    def __init__(self, size = None, **kwds):
+    def __init__(self, np_array = None, size = None, **kwds):
         """
-        Create a data object of the appropriate size.
+        Create a data object of the appropriate size, or use
+        the (pre-allocated) storage in np_array.
         """
         super().__init__(**kwds)
-        self.np_array = numpy.ascontiguousarray(numpy.empty(int(size/2), dtype=numpy.uint16))
+        if np_array is None:
+            self.np_array = numpy.ascontiguousarray(numpy.empty(int(size/2), dtype=numpy.uint16))
+        else:
+            self.np_array = np_array
         self.size = size
 
     def __getitem__(self, slice):
@@ -259,8 +264,9 @@ class HamamatsuCamera(object):
     Basic camera interface class.
     
     This version uses the Hamamatsu library to allocate camera buffers.
-    Storage for the data from the camera is allocated dynamically and
-    copied out of the camera buffers.
+    The data from the camera is copied out of the camera buffers into
+    storage from a frame pool, so once the pool is large enough there
+    are no more allocations.
     """
     def __init__(self, camera_id = None, **kwds):
         """
@@ -273,6 +279,7 @@ class HamamatsuCamera(object):
         self.debug = False
         self.encoding = 'utf-8'
         self.frame_bytes = 0
+        self.frame_pool = None
         self.frame_x = 0
         self.frame_y = 0
         self.last_frame_number = 0
@@ -326,6 +333,12 @@ class HamamatsuCamera(object):
         self.frame_y = self.getPropertyValue("image_height")[0]
         self.frame_bytes = self.getPropertyValue("image_framebytes")[0]
 
+        # Create / resize the frame pool.
+        if self.frame_pool is None:
+            self.frame_pool = framePool.FramePool(frame_size = int(self.frame_bytes/2))
+        else:
+            self.frame_pool.resize(int(self.frame_bytes/2))
+
 
     def checkStatus(self, fn_return, fn_name= "unknown"):
         """
@@ -409,8 +422,9 @@ class HamamatsuCamera(object):
                                                 ctypes.byref(paramlock)),
                              "dcambuf_lockframe")
 
-            # Create storage for the frame & copy into this storage.
-            hc_data = HCamData(self.frame_bytes)
+            # Get storage for the frame & copy into this storage.
+            hc_data = HCamData(np_array = self.frame_pool.getBuffer(),
+                               size = self.frame_bytes)
             hc_data.copyData(paramlock.buf)
 
             frames.append(hc_data)
@@ -804,20 +818,26 @@ class HamamatsuCameraMR(HamamatsuCamera):
     to the basic class, which performs one allocation and (I believe)
     two copies for each frame that is acquired.
     
-    WARNING: There is the potential here for chaos. Since the memory
-             is now shared there is the possibility that downstream code
-             will try and access the same bit of memory at the same time
-             as the camera and this could end badly.
-
-    FIXME: Use lockbits (and unlockbits) to avoid memory clashes?
-           This would probably also involve some kind of reference 
-           counting scheme.
+    By default the frames are copied out of the ring buffer into storage
+    from the frame pool. This costs one memory copy per frame, but no
+    allocations, and downstream code can hold onto the frames for as long
+    as it likes without the camera overwriting them.
+
+    If copy_frames is False the ring buffer memory is handed out directly.
+    A slot that is still in use downstream (using the frame pool reference
+    counting scheme) when the camera re-uses it is copied into the frame
+    pool instead, so that the new frame does not share memory with the
+    old one. The holder of the old frame will still see it change, so
+    this mode is only safe if the frames are released quickly. The number
+    of these slots is reported when the acquisition stops.
     """
-    def __init__(self, **kwds):
+    def __init__(self, copy_frames = True, **kwds):
         super().__init__(**kwds)
 
-        self.hcam_data = []
+        self.copy_frames = copy_frames
         self.hcam_ptr = False
+        self.n_overwritten = 0
+        self.ring_pool = None
         self.old_frame_bytes = -1
 
     def getFrames(self):
@@ -832,7 +852,17 @@ class HamamatsuCameraMR(HamamatsuCamera):
         """
         frames = []
         for n in self.newFrames():
-            frames.append(self.hcam_data[n])
+            in_use = (not self.copy_frames) and self.ring_pool.inUse(n)
+            if in_use:
+                self.n_overwritten += 1
+            if self.copy_frames or in_use:
+                hc_data = HCamData(np_array = self.frame_pool.getBuffer(),
+                                   size = self.frame_bytes)
+                hc_data.copyData(self.hcam_ptr[n])
+                frames.append(hc_data)
+            else:
+                frames.append(HCamData(np_array = self.ring_pool.buffers[n],
+                                       size = self.frame_bytes))
 
         return [frames, [self.frame_x, self.frame_y]]
 
@@ -859,14 +889,16 @@ class HamamatsuCameraMR(HamamatsuCamera):
             else:
                 self.number_image_buffers = n_buffers
 
-            # Allocate new image buffers.
+            # Allocate new image buffers. These are stored in a (fixed
+            # size) frame pool so that we can check whether or not they
+            # are still in use.
             ptr_array = ctypes.c_void_p * self.number_image_buffers
             self.hcam_ptr = ptr_array()
-            self.hcam_data = []
+            self.ring_pool = framePool.FramePool(frame_size = int(self.frame_bytes/2),
+                                                 max_buffers = self.number_image_buffers,
+                                                 n_buffers = self.number_image_buffers)
             for i in range(self.number_image_buffers):
-                hc_data = HCamData(self.frame_bytes)
-                self.hcam_ptr[i] = hc_data.getDataPtr()
-                self.hcam_data.append(hc_data)
+                self.hcam_ptr[i] = self.ring_pool.buffers[i].ctypes.data
 
             self.old_frame_bytes = self.frame_bytes
 
@@ -917,6 +949,10 @@ class HamamatsuCameraMR(HamamatsuCamera):
         print("max camera backlog was:", self.max_backlog)
         self.max_backlog = 0
 
+        if (self.n_overwritten > 0):
+            print(">> Warning! hamamatsu camera ring buffer slots overwritten while still in use:", self.n_overwritten)
+        self.n_overwritten = 0
+
 
 #
 # Testing.
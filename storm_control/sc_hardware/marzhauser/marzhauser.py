@@ -24,7 +24,8 @@ class MarzhauserRS232(RS232.RS232):
         self.x = 0.0
         self.y = 0.0
 
-        # RS232 stuff
+        # RS232 stuff, Marzhauser responses end with '\r'.
+        kwds["response_terminator"] = "\r"
         try:
             super().__init__(**kwds)
             test = self.commWithResp("?version")
@@ -9,7 +9,14 @@ import time
 from PyQt5 import QtCore
 
 import storm_control.sc_hardware.utility.af_lock_c as afLC
-import storm_control.sc_hardware.utility.sa_lock_peak_finder as slpf
+import storm_control.sc_hardware.utility.np_lock_peak_finder as nlpf
+
+# Finding/fitting using the storm-analysis project, if it is available.
+slpf = None
+try:
+    import storm_control.sc_hardware.utility.sa_lock_peak_finder as slpf
+except ModuleNotFoundError as mnfe:
+    print(">> Warning! Storm analysis lock fitting module not found, using numpy. <<")
 
 import storm_control.sc_hardware.pointGrey.spinnaker as spinnaker
 
@@ -205,8 +212,12 @@ class AFLockCamera(LockCamera):
         t2 = list(map(int, parameters.get("roi2").split(",")))
         self.roi2 = (slice(t2[0], t2[1]), slice(t2[2], t2[3]))
 
-        self.afc = afLC.AFLockC(offset = parameters.get("background"),
-                                downsample = parameters.get("downsample"))
+        if afLC.af is not None:
+            self.afc = afLC.AFLockC(offset = parameters.get("background"),
+                                    downsample = parameters.get("downsample"))
+        else:
+            self.afc = afLC.AFLockPy(offset = parameters.get("background"),
+                                     downsample = parameters.get("downsample"))
 
         assert (self.reps >= self.min_good), "'reps' must be >= 'min_good'."
 
@@ -297,9 +308,10 @@ class SSLockCamera(LockCamera):
         self.x_off = numpy.zeros(self.reps)
         self.y_off = numpy.zeros(self.reps)
 
-        self.lpf = slpf.LockPeakFinder(offset = 0,
-                                       sigma = parameters.get("sigma"),
-                                       threshold = parameters.get("threshold"))
+        lpf_module = slpf if (slpf is not None) else nlpf
+        self.lpf = lpf_module.LockPeakFinder(offset = 0,
+                                             sigma = parameters.get("sigma"),
+                                             threshold = parameters.get("threshold"))
 
         assert (self.reps >= self.min_good), "'reps' must be >= 'min_good'."
 
@@ -2,10 +2,24 @@
 """
 Wraps the pySerial library for RS232 communication.
 
+Reads wait for the data to arrive (up to a deadline) instead of
+sleeping for a fixed time. If the hardware ends it's responses
+with a known terminator set response_terminator, then a response
+is complete as soon as the terminator arrives. Otherwise it is
+complete once response_window has passed and no more data has
+arrived for wait_time.
+
+Commands can also be queued with commAsync(), these are sent by
+an I/O thread (one per port). If response_terminator is set the
+queued commands are pipelined.
+
 Hazen 3/09
 """
 
+import concurrent.futures
+import queue
 import serial
+import threading
 import time
 
 
@@ -19,7 +33,11 @@ class RS232(object):
                  baudrate = None,
                  encoding = 'utf-8',
                  end_of_line = "\r",
+                 pipeline_depth = 8,
                  port = None,
+                 response_terminator = None,
+                 response_timeout = None,
+                 response_window = None,
                  timeout = 1.0e-3,
                  wait_time = 1.0e-2,
                  **kwds):
@@ -28,14 +46,36 @@ class RS232(object):
         timeout - The RS-232 time out value.
         baudrate - The RS-232 communication speed, e.g. 9800.
         end_of_line - What character(s) are used to indicate the end of a line.
+        pipeline_depth - The maximum number of queued commands to send before
+                         reading their responses (needs response_terminator).
+        response_terminator - What character(s) the hardware uses to indicate the
+                              end of a response, None if this is not known.
+        response_timeout - How long to wait for a response, the default is
+                           10 * wait_time.
+        response_window - If there is no response_terminator, the minimum time to
+                          read a response for, the default is 10 * wait_time.
         wait_time - How long to wait between polling events before it is decided 
                     that there is no new data available on the port. 
         """
         super().__init__(**kwds)
         self.encoding = encoding
         self.end_of_line = end_of_line
+        self.io_queue = queue.Queue()
+        self.io_thread = None
         self.live = True
+        self.lock = threading.RLock()
+        self.pipeline_depth = pipeline_depth
+        self.response_terminator = response_terminator
+        self.response_timeout = response_timeout
+        self.response_window = response_window
+        self.rx_buffer = b""
         self.wait_time = wait_time
+
+        if self.response_timeout is None:
+            self.response_timeout = 10 * self.wait_time
+        if self.response_window is None:
+            self.response_window = 10 * self.wait_time
+
         try:
             self.tty = serial.Serial(port, baudrate, timeout = timeout)
             self.tty.flush()
@@ -44,33 +84,40 @@ class RS232(object):
             print("RS232 Error:", type(e), str(e))
             self.live = False
 
+    def commAsync(self, command, callback = None):
+        """
+        Queue a command, this is sent by the I/O thread after any other
+        queued commands. Returns a concurrent.futures.Future for the
+        response. If callback is specified it is called (in the I/O
+        thread) with the response.
+        """
+        future = concurrent.futures.Future()
+        if callback is not None:
+            future.add_done_callback(lambda x: callback(x.result()))
+
+        with self.lock:
+            if self.io_thread is None:
+                self.io_thread = threading.Thread(target = self.ioLoop, daemon = True)
+                self.io_thread.start()
+        self.io_queue.put([command, future])
+        return future
+
     def commWithResp(self, command):
         """
         Send a command and wait (a little) for a response.
         """
-        self.sendCommand(command)
-        time.sleep(10 * self.wait_time)
-        response = ""
-        response_len = self.tty.inWaiting()
-        while response_len:
-            response += self.read(response_len)
-            time.sleep(self.wait_time)
-            response_len = self.tty.inWaiting()
-        if len(response) > 0:
-            return response
+        with self.lock:
+            self.sendCommand(command)
+            return self.readResponse()
 
     def getResponse(self):
         """
         Wait (a little) for a response.
         """
-        response = ""
-        response_len = self.tty.inWaiting()
-        while response_len:
-            response += self.read(response_len)
-            time.sleep(self.wait_time)
-            response_len = self.tty.inWaiting()
-        if len(response) > 0:
-            return response
+        with self.lock:
+            response = self.readQuiet(0.0)
+            if len(response) > 0:
+                return response.decode(self.encoding)
 
     def getStatus(self):
         """
@@ -78,10 +125,119 @@ class RS232(object):
         """
         return self.live
 
+    def ioLoop(self):
+        """
+        The I/O thread, this sends the queued commands and reads their responses.
+        """
+        while True:
+            commands = [self.io_queue.get()]
+            if commands[0] is None:
+                return
+
+            # Send more than one command at a time if we can tell
+            # where each response ends.
+            if self.response_terminator is not None:
+                while (len(commands) < self.pipeline_depth) and not self.io_queue.empty():
+                    commands.append(self.io_queue.get())
+            if commands[-1] is None:
+                self.io_queue.put(commands.pop())
+
+            # Errors are passed on to the futures, the thread has to keep
+            # running otherwise the futures of later commands never finish.
+            with self.lock:
+                try:
+                    for [command, future] in commands:
+                        self.sendCommand(command)
+                    for [command, future] in commands:
+                        future.set_result(self.readResponse())
+                except Exception as e:
+                    for [command, future] in commands:
+                        if not future.done():
+                            future.set_exception(e)
+
     def read(self, response_len):
-        response = self.tty.read(response_len)
+        response = self.rx_buffer + self.tty.read(max(0, response_len - len(self.rx_buffer)))
+        self.rx_buffer = b""
         return response.decode(self.encoding)
 
+    def readBytes(self, timeout):
+        """
+        Wait up to timeout seconds for data to arrive, returns
+        all the data that is available.
+        """
+        deadline = time.perf_counter() + timeout
+        port_timeout = self.tty.timeout
+        try:
+            while True:
+                remaining = deadline - time.perf_counter()
+                if (remaining <= 0.0):
+                    return b""
+
+                # Don't wait longer than the time remaining.
+                if not port_timeout or (port_timeout > remaining):
+                    self.tty.timeout = remaining
+                data = self.tty.read(1)
+                if data:
+                    return data + self.tty.read(self.tty.in_waiting)
+        finally:
+            if (self.tty.timeout != port_timeout):
+                self.tty.timeout = port_timeout
+
+    def readQuiet(self, timeout, window = 0.0):
+        """
+        Wait up to timeout seconds for data to arrive, then read until
+        window seconds have passed and no more data arrives for wait_time
+        seconds. The window is for hardware whose responses can pause
+        part way through.
+        """
+        end_of_window = time.perf_counter() + window
+        response = self.rx_buffer
+        self.rx_buffer = b""
+        if (len(response) == 0):
+            response = self.readBytes(timeout)
+        if (len(response) > 0):
+            while True:
+                data = self.readBytes(max(self.wait_time, end_of_window - time.perf_counter()))
+                if not data:
+                    break
+                response += data
+        return response
+
+    def readResponse(self):
+        """
+        Read a response, this is None if there was no response.
+        """
+        if self.response_terminator is None:
+            response = self.readQuiet(self.response_timeout, self.response_window)
+        else:
+            response = self.readUntil(self.response_terminator, self.response_timeout)
+        if (len(response) > 0):
+            return response.decode(self.encoding)
+
+    def readUntil(self, terminator, timeout):
+        """
+        Read until terminator, or until timeout seconds have passed. Returns
+        the data up to and including the terminator, any data after the
+        terminator is kept for the next read.
+        """
+        terminator = terminator.encode(self.encoding)
+        deadline = time.perf_counter() + timeout
+        index = self.rx_buffer.find(terminator)
+        while (index == -1):
+            data = self.readBytes(deadline - time.perf_counter())
+            if not data:
+                break
+            self.rx_buffer += data
+            index = self.rx_buffer.find(terminator, max(0, len(self.rx_buffer) - len(data) - len(terminator) + 1))
+
+        if (index == -1):
+            response = self.rx_buffer
+            self.rx_buffer = b""
+        else:
+            response = self.rx_buffer[:index + len(terminator)]
+            self.rx_buffer = self.rx_buffer[index + len(terminator):]
+        return response
+
     def readline(self):
         response = self.tty.readline()
         return response.decode(self.encoding).strip()
@@ -94,6 +250,10 @@ class RS232(object):
         """
         Closes the RS-232 port.
         """
+        if self.io_thread is not None:
+            self.io_queue.put(None)
+            self.io_thread.join()
+            self.io_thread = None
         if self.live:
             self.tty = None
 
@@ -102,22 +262,22 @@ class RS232(object):
         Waits much longer for a response. This is the method to use if
         you are sure that the hardware will respond eventually. If you
         don't set end_of_response then it will automatically be the
-        end_of_line character, and this will return once it finds the
-        first end_of_line character.
+        end_of_line character, and this will return everything that is
+        available once it finds the first end_of_line character.
         """
         if not end_of_response:
             end_of_response = str(self.end_of_line)
-        attempts = 0
-        response = ""
-        index = -1
-        while (index == -1) and (attempts < max_attempts):
-            response_len = self.tty.inWaiting()
-            if response_len > 0:
-                response += self.read(response_len)
-            time.sleep(self.wait_time)
-            index = response.find(end_of_response)
-            attempts += 1
-        return response
+        end_of_response = end_of_response.encode(self.encoding)
+        deadline = time.perf_counter() + max_attempts * self.wait_time
+        with self.lock:
+            response = self.rx_buffer
+            self.rx_buffer = b""
+            while (response.find(end_of_response) == -1):
+                data = self.readBytes(deadline - time.perf_counter())
+                if not data:
+                    break
+                response += data
+        return response.decode(self.encoding)
 
     def write(self, string):
         self.tty.write(string.encode(self.encoding))
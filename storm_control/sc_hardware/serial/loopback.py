@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+A scriptable loopback serial device for testing and benchmarking
+the RS232 class without any hardware. This uses a pseudo-terminal
+so it only works on posix systems.
+
+The device reads commands that end with end_of_line and replies
+using responses. This is either a dictionary of command / response
+pairs or a function that is called with the command and returns
+the response (or None for no response).
+"""
+
+import os
+import select
+import threading
+import time
+import tty
+
+
+class Loopback(object):
+
+    def __init__(self,
+                 delay = 0.0,
+                 end_of_line = "\r",
+                 encoding = "utf-8",
+                 responses = None,
+                 **kwds):
+        """
+        delay - How long to wait before responding to a command.
+        end_of_line - What character(s) terminate a command.
+        responses - A dictionary or a function.
+        """
+        super().__init__(**kwds)
+        self.commands = []
+        self.delay = delay
+        self.encoding = encoding
+        self.end_of_line = end_of_line.encode(encoding)
+        self.responses = responses
+        self.running = True
+
+        if self.responses is None:
+            self.responses = {}
+
+        [self.master, self.slave] = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.slave)
+        os.close(self.master)
+
+    def getCommands(self):
+        """
+        Returns the commands that the device has received.
+        """
+        return self.commands
+
+    def getPort(self):
+        """
+        Returns the name of the port to give to RS232.
+        """
+        return os.ttyname(self.slave)
+
+    def getResponse(self, command):
+        if callable(self.responses):
+            return self.responses(command)
+        return self.responses.get(command)
+
+    def run(self):
+        buf = b""
+        while self.running:
+            [ready, w, x] = select.select([self.master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                buf += os.read(self.master, 4096)
+            except OSError:
+                return
+
+            index = buf.find(self.end_of_line)
+            while (index != -1):
+                command = buf[:index].decode(self.encoding)
+                buf = buf[index + len(self.end_of_line):]
+                self.commands.append(command)
+                response = self.getResponse(command)
+                if response is not None:
+                    if (self.delay > 0.0):
+                        time.sleep(self.delay)
+                    os.write(self.master, response.encode(self.encoding))
+                index = buf.find(self.end_of_line)
+
+
+if (__name__ == "__main__"):
+
+    # Measure the round trip time of commWithResp().
+    import storm_control.sc_hardware.serial.RS232 as RS232
+
+    loopback = Loopback(responses = lambda x: x + "\r")
+    for terminator in [None, "\r"]:
+        rs232 = RS232.RS232(baudrate = 115200,
+                            port = loopback.getPort(),
+                            response_terminator = terminator)
+        start = time.perf_counter()
+        for i in range(100):
+            rs232.commWithResp("test " + str(i))
+        print("response_terminator", repr(terminator), "{0:.3f}ms".format(10.0 * (time.perf_counter() - start)))
+
+        start = time.perf_counter()
+        futures = [rs232.commAsync("test " + str(i)) for i in range(100)]
+        [future.result() for future in futures]
+        print("  commAsync", "{0:.3f}ms".format(10.0 * (time.perf_counter() - start)))
+        rs232.shutDown()
+    loopback.close()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
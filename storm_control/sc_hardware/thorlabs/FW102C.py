@@ -17,6 +17,10 @@ class FW102C(RS232.RS232):
     """
     def __init__(self, **kwds):
         self.live = True
+
+        # The filter wheel echoes the command, then sends the response
+        # followed by a '>' prompt.
+        kwds["response_terminator"] = ">"
         try:
             # open port
             super().__init__(**kwds)
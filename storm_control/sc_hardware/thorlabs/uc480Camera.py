@@ -645,6 +645,12 @@ class CameraQPDScipyFit(CameraQPD):
 
         self.fit_mutex = fit_mutex
 
+        # One fitter for each half of the picture, so that each fit starts
+        # from the previous result for the same spot.
+        shape = (2*self.fit_size, 2*self.fit_size)
+        self.fitters = [npLPF.GaussianFitter(shape = shape, sigma = self.sigma),
+                        npLPF.GaussianFitter(shape = shape, sigma = self.sigma)]
+
     def doFit(self, data):
         dist1 = 0
         dist2 = 0
@@ -657,7 +663,7 @@ class CameraQPDScipyFit(CameraQPD):
         #
         # Fit first gaussian to data in the left half of the picture.
         total_good =0
-        [max_x, max_y, params, status] = self.fitGaussian(data[:,:self.half_x])
+        [max_x, max_y, params, status] = self.fitGaussian(data[:,:self.half_x], self.fitters[0])
         if status:
             total_good += 1
             self.x_off1 = float(max_x) + params[2] - self.half_y
@@ -665,7 +671,7 @@ class CameraQPDScipyFit(CameraQPD):
             dist1 = abs(self.y_off1)
 
         # Fit second gaussian to data in the right half of the picture.
-        [max_x, max_y, params, status] = self.fitGaussian(data[:,-self.half_x:])
+        [max_x, max_y, params, status] = self.fitGaussian(data[:,-self.half_x:], self.fitters[1])
         if status:
             total_good += 1
             self.x_off2 = float(max_x) + params[2] - self.half_y
@@ -674,7 +680,7 @@ class CameraQPDScipyFit(CameraQPD):
 
         return [total_good, dist1, dist2]
         
-    def fitGaussian(self, data):
+    def fitGaussian(self, data, fitter):
         if (numpy.max(data) < 25):
             return [False, False, False, False]
         x_width = data.shape[0]
@@ -687,9 +693,13 @@ class CameraQPDScipyFit(CameraQPD):
                 self.fit_mutex.lock()
             #[params, status] = npLPF.fitSymmetricGaussian(data[max_x-self.fit_size:max_x+self.fit_size,max_y-self.fit_size:max_y+self.fit_size], 8.0)
             #[params, status] = npLPF.fitFixedEllipticalGaussian(data[max_x-self.fit_size:max_x+self.fit_size,max_y-self.fit_size:max_y+self.fit_size], 8.0)
-            [params, status] = npLPF.fitFixedEllipticalGaussian(data[max_x-self.fit_size:max_x+self.fit_size,max_y-self.fit_size:max_y+self.fit_size], self.sigma)
+            #[params, status] = npLPF.fitFixedEllipticalGaussian(data[max_x-self.fit_size:max_x+self.fit_size,max_y-self.fit_size:max_y+self.fit_size], self.sigma)
+            [params, status, iterations] = fitter.fit(data[max_x-self.fit_size:max_x+self.fit_size,max_y-self.fit_size:max_y+self.fit_size],
+                                                      corner = [max_x, max_y])
             if self.fit_mutex:
                 self.fit_mutex.unlock()
+            if params is None:
+                return [False, False, False, False]
             params[2] -= self.fit_size
             params[3] -= self.fit_size
             return [max_x, max_y, params, status]
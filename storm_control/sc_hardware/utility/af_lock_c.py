@@ -15,7 +15,11 @@ import storm_control.c_libraries.loadclib as loadclib
 
 
 # Load C library.
-af = loadclib.loadCLibrary("af_lock")
+try:
+    af = loadclib.loadCLibrary("af_lock")
+except OSError:
+    print("C af_lock library not found, only the Python versions are available.")
+    af = None
 
 
 #
@@ -57,74 +61,75 @@ class afLockData(ctypes.Structure):
 
     
 # C interface definition.
-af.aflCalcShift.argtypes = [ctypes.POINTER(afLockData)]
+if af is not None:
+    af.aflCalcShift.argtypes = [ctypes.POINTER(afLockData)]
 
-af.aflCleanup.argtypes = [ctypes.POINTER(afLockData)]
+    af.aflCleanup.argtypes = [ctypes.POINTER(afLockData)]
 
-af.aflCost.argtypes = [ctypes.POINTER(afLockData),
-                       ctypes.c_double,
-                       ctypes.c_double]
+    af.aflCost.argtypes = [ctypes.POINTER(afLockData),
+                           ctypes.c_double,
+                           ctypes.c_double]
 
-af.aflCostGradient.argtypes = [ctypes.POINTER(afLockData),
-                               ctypes.c_double,
-                               ctypes.c_double]
+    af.aflCostGradient.argtypes = [ctypes.POINTER(afLockData),
+                                   ctypes.c_double,
+                                   ctypes.c_double]
 
-af.aflCostHessian.argtypes = [ctypes.POINTER(afLockData),
-                              ctypes.c_double,
-                              ctypes.c_double]
+    af.aflCostHessian.argtypes = [ctypes.POINTER(afLockData),
+                                  ctypes.c_double,
+                                  ctypes.c_double]
 
-af.aflGetCost.argtypes = [ctypes.POINTER(afLockData),
-                          ndpointer(dtype=numpy.float64)]
+    af.aflGetCost.argtypes = [ctypes.POINTER(afLockData),
+                              ndpointer(dtype=numpy.float64)]
 
-af.aflGetCostGradient.argtypes = [ctypes.POINTER(afLockData),
-                                  ndpointer(dtype=numpy.float64)]
+    af.aflGetCostGradient.argtypes = [ctypes.POINTER(afLockData),
+                                      ndpointer(dtype=numpy.float64)]
 
-af.aflGetCostHessian.argtypes = [ctypes.POINTER(afLockData),
-                                 ndpointer(dtype=numpy.float64)]
+    af.aflGetCostHessian.argtypes = [ctypes.POINTER(afLockData),
+                                     ndpointer(dtype=numpy.float64)]
 
-af.aflGetMag.argtypes = [ctypes.POINTER(afLockData),
-                         ndpointer(dtype=numpy.float64)]
+    af.aflGetMag.argtypes = [ctypes.POINTER(afLockData),
+                             ndpointer(dtype=numpy.float64)]
 
-af.aflGetOffset.argtypes = [ctypes.POINTER(afLockData),
-                            ndpointer(dtype=numpy.float64)]
+    af.aflGetOffset.argtypes = [ctypes.POINTER(afLockData),
+                                ndpointer(dtype=numpy.float64)]
 
-af.aflGetVector.argtypes = [ctypes.POINTER(afLockData),
-                            ndpointer(dtype=numpy.float64),
-                            ctypes.c_int]
+    af.aflGetVector.argtypes = [ctypes.POINTER(afLockData),
+                                ndpointer(dtype=numpy.float64),
+                                ctypes.c_int]
 
-af.aflInitialize.argtypes = [ctypes.c_int,
-                             ctypes.c_int,
-                             ctypes.c_int]
-af.aflInitialize.restype = ctypes.POINTER(afLockData)
+    af.aflInitialize.argtypes = [ctypes.c_int,
+                                 ctypes.c_int,
+                                 ctypes.c_int]
+    af.aflInitialize.restype = ctypes.POINTER(afLockData)
 
-af.aflMinimizeNM.argtypes = [ctypes.POINTER(afLockData),
-                             ctypes.c_double,
-                             ctypes.c_int]
-af.aflMinimizeNM.restype = ctypes.c_int
+    af.aflMinimizeNM.argtypes = [ctypes.POINTER(afLockData),
+                                 ctypes.c_double,
+                                 ctypes.c_int]
+    af.aflMinimizeNM.restype = ctypes.c_int
 
-af.aflNewImage.argtypes = [ctypes.POINTER(afLockData),
-                           ndpointer(dtype=numpy.float64),
-                           ndpointer(dtype=numpy.float64),
-                           ctypes.c_double,
-                           ctypes.c_double]
+    af.aflNewImage.argtypes = [ctypes.POINTER(afLockData),
+                               ndpointer(dtype=numpy.float64),
+                               ndpointer(dtype=numpy.float64),
+                               ctypes.c_double,
+                               ctypes.c_double]
 
-af.aflNewImageU16.argtypes = [ctypes.POINTER(afLockData),
-                              ndpointer(dtype=numpy.uint16),
-                              ndpointer(dtype=numpy.uint16),
-                              ctypes.c_double,
-                              ctypes.c_double]
+    af.aflNewImageU16.argtypes = [ctypes.POINTER(afLockData),
+                                  ndpointer(dtype=numpy.uint16),
+                                  ndpointer(dtype=numpy.uint16),
+                                  ctypes.c_double,
+                                  ctypes.c_double]
 
-af.aflRebin.argtypes = [ctypes.POINTER(afLockData),
-                        ndpointer(dtype=numpy.float64),
-                        ctypes.c_double]
+    af.aflRebin.argtypes = [ctypes.POINTER(afLockData),
+                            ndpointer(dtype=numpy.float64),
+                            ctypes.c_double]
 
-af.aflRebinU16.argtypes = [ctypes.POINTER(afLockData),
-                           ndpointer(dtype=numpy.float64),
-                           ctypes.c_double]
+    af.aflRebinU16.argtypes = [ctypes.POINTER(afLockData),
+                               ndpointer(dtype=numpy.float64),
+                               ctypes.c_double]
 
-af.aflSolveStep.argtypes = [ctypes.POINTER(afLockData),
-                            ndpointer(dtype=numpy.float64)]
-af.aflSolveStep.restype = ctypes.c_int
+    af.aflSolveStep.argtypes = [ctypes.POINTER(afLockData),
+                                ndpointer(dtype=numpy.float64)]
+    af.aflSolveStep.restype = ctypes.c_int
 
     
 class AFLockC(object):
@@ -295,23 +300,31 @@ class AFLockPy(object):
     """
     The Python reference version of the 2D autofocus lock function.
     """
-    def __init__(self, offset = 0.0, **kwds):
+    def __init__(self, downsample = 1, offset = 0.0, max_iters = 10, step_tol = 1.0e-6, **kwds):
         """
         offset - The background offset term.
+
+        downsample, max_iters and step_tol are only used by findOffsetU16NM().
         """
         super().__init__(**kwds)
 
+        self.downsample = downsample
         self.im1 = None
         self.im2_fft = None
+        self.max_iters = max_iters
         self.offset = offset
+        self.step_tol = step_tol
         self.x0 = None
         self.x_shift = None
         self.y0 = None
         self.y_shift = None
 
+    def cleanup(self):
+        pass
+
     def cost(self, p):
         tmp = self.im2_fft * numpy.exp(-self.x_shift*p[0]) * numpy.exp(-self.y_shift*p[1])
-        im2_shift = numpy.real(numpy.fft.ifft2(tmp))
+        im2_shift = numpy.fft.irfft2(tmp, s = self.im1.shape)
         return -numpy.sum(self.im1 * im2_shift)
 
     def findOffset(self, image1, image2):
@@ -328,14 +341,49 @@ class AFLockPy(object):
 
         return [res.x[0], res.x[1], res, mag]
 
+    def findOffsetU16NM(self, image1, image2, verbose = True):
+        """
+        This is the Python version of AFLockC.findOffsetU16NM(), it uses
+        the same downsampling, initial offset and Newton's method solver
+        as the C library.
+        """
+        image1 = self.rebin(image1)
+        image2 = self.rebin(image2)
+        self.initialize(image1, image2, subtract_offset = False)
+
+        # Offset to the nearest pixel.
+        [p, mag] = self.pixelOffset(image2)
+
+        # Determine offset at the sub-pixel level.
+        ret = -1
+        t1 = self.step_tol * self.step_tol
+        for i in range(self.max_iters):
+            last = numpy.copy(p)
+            step = self.solveStep(self.gradCost(p), self.hessCost(p))
+            if step is None:
+                ret = -2
+                break
+
+            p = p - step
+            if ((step[0]*step[0] + step[1]*step[1]) < t1):
+                ret = 0
+                last = p
+                break
+
+        success = (ret == 0)
+        if not success and verbose:
+            print("Python Newton solver failed with error code: ", ret)
+
+        return [last[0], last[1], success, mag]
+
     def gradCost(self, p):
         tmp = self.im2_fft * numpy.exp(-self.x_shift*p[0]) * numpy.exp(-self.y_shift*p[1])
 
-        ft_dx = numpy.fft.ifft2(tmp * -self.x_shift)
-        s_dx = -numpy.sum(self.im1 * numpy.real(ft_dx))
+        ft_dx = numpy.fft.irfft2(tmp * -self.x_shift, s = self.im1.shape)
+        s_dx = -numpy.sum(self.im1 * ft_dx)
 
-        ft_dy = numpy.fft.ifft2(tmp * -self.y_shift)
-        s_dy = -numpy.sum(self.im1 * numpy.real(ft_dy))
+        ft_dy = numpy.fft.irfft2(tmp * -self.y_shift, s = self.im1.shape)
+        s_dy = -numpy.sum(self.im1 * ft_dy)
 
         return numpy.array([s_dx, s_dy])
 
@@ -344,34 +392,38 @@ class AFLockPy(object):
 
         hess = numpy.zeros((2,2))
         
-        ft_dx_dx = numpy.fft.ifft2(tmp * self.x_shift * self.x_shift)
-        hess[0,0] = -numpy.sum(self.im1 * numpy.real(ft_dx_dx))
+        ft_dx_dx = numpy.fft.irfft2(tmp * self.x_shift * self.x_shift, s = self.im1.shape)
+        hess[0,0] = -numpy.sum(self.im1 * ft_dx_dx)
 
-        ft_dx_dy = numpy.fft.ifft2(tmp * self.x_shift * self.y_shift)
-        hess[0,1] = -numpy.sum(self.im1 * numpy.real(ft_dx_dy))
+        ft_dx_dy = numpy.fft.irfft2(tmp * self.x_shift * self.y_shift, s = self.im1.shape)
+        hess[0,1] = -numpy.sum(self.im1 * ft_dx_dy)
         hess[1,0] = hess[0,1]
                 
-        ft_dy_dy = numpy.fft.ifft2(tmp * self.y_shift * self.y_shift)
-        hess[1,1] = -numpy.sum(self.im1 * numpy.real(ft_dy_dy))
+        ft_dy_dy = numpy.fft.irfft2(tmp * self.y_shift * self.y_shift, s = self.im1.shape)
+        hess[1,1] = -numpy.sum(self.im1 * ft_dy_dy)
 
         return hess
 
-    def initialize(self, image1, image2):
+    def initialize(self, image1, image2, subtract_offset = True):
 
         assert(image1.shape[0] == image2.shape[0])
         assert(image1.shape[1] == image2.shape[1])
 
-        image1 = image1.astype(numpy.float) - self.offset
-        image2 = image2.astype(numpy.float) - self.offset
+        if subtract_offset:
+            image1 = image1.astype(numpy.float64) - self.offset
+            image2 = image2.astype(numpy.float64) - self.offset
         
         self.im1 = numpy.pad(image1, [[0, image1.shape[0]], [0, image1.shape[1]]], 'constant')
 
         im2 = numpy.pad(image2, [[0, image2.shape[0]], [0, image2.shape[1]]], 'constant')
-        self.im2_fft = numpy.fft.fft2(im2)
+        self.im2_fft = numpy.fft.rfft2(im2)
                              
         if self.x_shift is None:
-            x_freq = numpy.repeat(numpy.fft.fftfreq(im2.shape[0])[:, numpy.newaxis], im2.shape[1], axis = 1)
-            y_freq = numpy.repeat(numpy.fft.fftfreq(im2.shape[1])[numpy.newaxis, :], im2.shape[0], axis = 0)
+            # Real FFTs and the same sign for the Nyquist frequency as the C library.
+            fy = numpy.fft.rfftfreq(im2.shape[1])
+            fy[-1] = -fy[-1]
+            x_freq = numpy.repeat(numpy.fft.fftfreq(im2.shape[0])[:, numpy.newaxis], fy.size, axis = 1)
+            y_freq = numpy.repeat(fy[numpy.newaxis, :], im2.shape[0], axis = 0)
 
             self.x_shift = 1j * 2.0 * numpy.pi * x_freq
             self.y_shift = 1j * 2.0 * numpy.pi * y_freq
@@ -380,8 +432,8 @@ class AFLockPy(object):
             self.y0 = image1.shape[1] - 1
             
         else:
-            assert(self.im1.shape[0] == self.x_shift.shape[0])
-            assert(self.im1.shape[1] == self.x_shift.shape[1])
+            assert(self.im2_fft.shape[0] == self.x_shift.shape[0])
+            assert(self.im2_fft.shape[1] == self.x_shift.shape[1])
 
     def pixelOffset(self, image2):
         im1_fft = numpy.fft.fft2(self.im1)
@@ -392,7 +444,36 @@ class AFLockPy(object):
 
         conv = numpy.real(numpy.fft.ifft2(im1_fft*im2_fft))
         [ix, iy] = numpy.unravel_index(conv.argmax(), conv.shape)
-        return [numpy.array([ix - self.x0, iy - self.y0], dtype = numpy.float), conv[ix,iy]]
+        return [numpy.array([ix - self.x0, iy - self.y0], dtype = numpy.float64), conv[ix,iy]]
+
+    def rebin(self, image):
+        """
+        Subtract the offset and downsample, as in the C library.
+        """
+        image = image.astype(numpy.float64) - self.offset
+        if (self.downsample > 1):
+            ds = self.downsample
+            sx = image.shape[0]//ds
+            sy = image.shape[1]//ds
+            image = image[:sx*ds,:sy*ds].reshape(sx, ds, sy, ds).sum(axis = (1,3))
+        return image
+
+    def solveStep(self, grad, hess):
+        """
+        Solve for the update step in the same way as the C library.
+        Returns None if there is no solution.
+        """
+        if (hess[0,0] == 0.0):
+            return None
+
+        t1 = -(hess[0,1]*hess[0,1])/hess[0,0] + hess[1,1]
+        if (t1 == 0.0):
+            return None
+
+        step = numpy.zeros(2)
+        step[1] = (grad[1] - hess[0,1]*grad[0]/hess[0,0])/t1
+        step[0] = (grad[0] - hess[0,1]*step[1])/hess[0,0]
+        return step
 
 
 class AFLockPy1D(object):
@@ -420,10 +501,10 @@ class AFLockPy1D(object):
     def findOffset(self, image1, image2):
 
         # Compress to 1D.
-        image1 = image1.astype(numpy.float) - self.offset
+        image1 = image1.astype(numpy.float64) - self.offset
         image1 = numpy.sum(image1, axis = 0)
         
-        image2 = image2.astype(numpy.float) - self.offset
+        image2 = image2.astype(numpy.float64) - self.offset
         image2 = numpy.sum(image2, axis = 0)
 
         # Initialize.
@@ -479,5 +560,5 @@ class AFLockPy1D(object):
         conv = numpy.real(numpy.fft.ifft(im1_fft*im2_fft))
         iy = numpy.argmax(conv)
     
-        return [numpy.array([iy - self.y0], dtype = numpy.float), conv[iy]]
+        return [numpy.array([iy - self.y0], dtype = numpy.float64), conv[iy]]
     
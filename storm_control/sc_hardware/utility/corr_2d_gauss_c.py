@@ -10,13 +10,15 @@ from numpy.ctypeslib import ndpointer
 import scipy
 import scipy.optimize
 
-import storm_analysis.simulator.draw_gaussians_c as dg
-
 import storm_control.c_libraries.loadclib as loadclib
 
 
 # Load C library.
-c2dg = loadclib.loadCLibrary("corr_2d_gauss")
+try:
+    c2dg = loadclib.loadCLibrary("corr_2d_gauss")
+except OSError:
+    print("C corr_2d_gauss library not found, only the Python versions are available.")
+    c2dg = None
 
 # corr2DData structure definition.
 class corr2DData(ctypes.Structure):
@@ -52,40 +54,41 @@ class corr2DData(ctypes.Structure):
                 ('yi', ctypes.POINTER(ctypes.c_double))]
 
 # C interface definition.
-c2dg.cleanup.argtypes = [ctypes.POINTER(corr2DData)]
+if c2dg is not None:
+    c2dg.cleanup.argtypes = [ctypes.POINTER(corr2DData)]
 
-c2dg.ddx.argtypes = [ctypes.POINTER(corr2DData),
-                     ctypes.c_double,
-                     ctypes.c_double]
-c2dg.ddx.restype = ctypes.c_double
+    c2dg.ddx.argtypes = [ctypes.POINTER(corr2DData),
+                         ctypes.c_double,
+                         ctypes.c_double]
+    c2dg.ddx.restype = ctypes.c_double
 
-c2dg.ddy.argtypes = [ctypes.POINTER(corr2DData),
-                     ctypes.c_double,
-                     ctypes.c_double]
-c2dg.ddy.restype = ctypes.c_double
+    c2dg.ddy.argtypes = [ctypes.POINTER(corr2DData),
+                         ctypes.c_double,
+                         ctypes.c_double]
+    c2dg.ddy.restype = ctypes.c_double
 
-c2dg.dx.argtypes = [ctypes.POINTER(corr2DData),
-                    ctypes.c_double,
-                    ctypes.c_double]
-c2dg.dx.restype = ctypes.c_double
+    c2dg.dx.argtypes = [ctypes.POINTER(corr2DData),
+                        ctypes.c_double,
+                        ctypes.c_double]
+    c2dg.dx.restype = ctypes.c_double
 
-c2dg.dy.argtypes = [ctypes.POINTER(corr2DData),
-                    ctypes.c_double,
-                    ctypes.c_double]
-c2dg.dy.restype = ctypes.c_double
+    c2dg.dy.argtypes = [ctypes.POINTER(corr2DData),
+                        ctypes.c_double,
+                        ctypes.c_double]
+    c2dg.dy.restype = ctypes.c_double
 
-c2dg.fn.argtypes = [ctypes.POINTER(corr2DData),
-                    ctypes.c_double,
-                    ctypes.c_double]
-c2dg.fn.restype = ctypes.c_double
+    c2dg.fn.argtypes = [ctypes.POINTER(corr2DData),
+                        ctypes.c_double,
+                        ctypes.c_double]
+    c2dg.fn.restype = ctypes.c_double
 
-c2dg.initialize.argtypes = [ctypes.c_double,
-                            ctypes.c_int,
-                            ctypes.c_int]
-c2dg.initialize.restype = ctypes.POINTER(corr2DData)
+    c2dg.initialize.argtypes = [ctypes.c_double,
+                                ctypes.c_int,
+                                ctypes.c_int]
+    c2dg.initialize.restype = ctypes.POINTER(corr2DData)
 
-c2dg.setImage.argtypes = [ctypes.POINTER(corr2DData),
-                          ndpointer(dtype=numpy.float64)]
+    c2dg.setImage.argtypes = [ctypes.POINTER(corr2DData),
+                              ndpointer(dtype=numpy.float64)]
 
 
 class Corr2DGaussC(object):
@@ -223,10 +226,11 @@ class Corr2DGaussPy(object):
     def translate(self, x):
         
         if (self.g_image is None) or (not numpy.allclose(self.g_x, x, atol = 1.0e-12, rtol = 1.0e-12)):
-            self.g_image = dg.drawGaussiansXY((self.x_size, self.y_size),
-                                              numpy.array([self.cx + x[0]]),
-                                              numpy.array([self.cy + x[1]]),
-                                              sigma = self.sigma)
+            # Separable Gaussian, calculated the same way as in the C library.
+            sg_term = 1.0/(self.sigma*self.sigma)
+            gx = numpy.exp(-0.5 * (self.xi[:,0] - x[0])**2 * sg_term)
+            gy = numpy.exp(-0.5 * (self.yi[0,:] - x[1])**2 * sg_term)
+            self.g_image = numpy.outer(gx, gy)
             self.g_x = numpy.copy(x)
 
         return self.g_image
@@ -25,8 +25,10 @@ class CorrLockFitter(object):
         self.sigma = sigma
 
         size = (2*self.roi_size, 2*self.roi_size)
-        #self.c2dg = corr2DGauss.Corr2DGaussPyNCG(size = size, sigma = sigma)
-        self.c2dg = corr2DGauss.Corr2DGaussCNCG(size = size, sigma = sigma)
+        if corr2DGauss.c2dg is not None:
+            self.c2dg = corr2DGauss.Corr2DGaussCNCG(size = size, sigma = sigma)
+        else:
+            self.c2dg = corr2DGauss.Corr2DGaussPyNCG(size = size, sigma = sigma)
 
         self.mxf = iaUtilsC.MaximaFinder(margin = self.roi_size,
                                          radius = 2 * self.sigma,
@@ -3,6 +3,11 @@
 Peak finder for use by the camera based focus locks. This 
 version uses numpy/scipy only.
 
+GaussianFitter is the fast fitter, it uses analytic Jacobians,
+coordinate grids that are only created once and starts from the
+previous result. fitAFunctionLS() and the functions that use it
+are the original scipy.optimize.leastsq() versions.
+
 Hazen 11/17
 """
 import numpy
@@ -79,3 +84,260 @@ def fitFixedEllipticalGaussian(data, sigma):
     return fitAFunctionLS(data, params, fixedEllipticalGaussian)
 
 
+def momentFit(data, symmetric = False):
+    """
+    Closed form estimate of the gaussian parameters from the moments
+    of the data. This is used as the starting point for the fitting
+    and if the fitting fails.
+
+    Returns [params, good].
+    """
+    background = float(numpy.min(data))
+    weights = data - background
+    total = float(numpy.sum(weights))
+    height = float(numpy.max(data)) - background
+    if (total <= 0.0) or (height <= 0.0):
+        return [None, False]
+
+    px = numpy.sum(weights, axis = 1)
+    py = numpy.sum(weights, axis = 0)
+    xi = numpy.arange(data.shape[0])
+    yi = numpy.arange(data.shape[1])
+    center_x = float(numpy.dot(px, xi))/total
+    center_y = float(numpy.dot(py, yi))/total
+
+    # For this gaussian the width is 2 sigma.
+    width_x = 2.0 * numpy.sqrt(max(float(numpy.dot(px, (xi - center_x)**2))/total, 0.25))
+    width_y = 2.0 * numpy.sqrt(max(float(numpy.dot(py, (yi - center_y)**2))/total, 0.25))
+    if symmetric:
+        params = numpy.array([background, height, center_x, center_y, 0.5*(width_x + width_y)])
+    else:
+        params = numpy.array([background, height, center_x, center_y, width_x, width_y])
+    return [params, True]
+
+
+class GaussianFitter(object):
+    """
+    Levenberg-Marquardt fitting of a gaussian to the focus lock spot. The
+    parameters are the same as for symmetricGaussian() (symmetric = True)
+    or fixedEllipticalGaussian().
+
+    The gaussian is separable, so the model and the Jacobian are calculated
+    from 1D gaussians. If the fit fails the result is the moment estimate,
+    and if the last fit worked it is used as the starting point for the
+    next fit.
+    """
+    def __init__(self,
+                 max_iterations = 20,
+                 min_width = 0.5,
+                 shape = None,
+                 sigma = None,
+                 symmetric = False,
+                 tolerance = 1.0e-3,
+                 **kwds):
+        """
+        shape - The shape of the data that will be fit.
+        sigma - The expected sigma. This is not used by the fitter as the spot
+                size changes with focus, the widths are only checked against the
+                size of the data.
+        min_width - Steps that would make a width smaller than this (pixels) are
+                    rejected, the gaussian is not defined at zero width.
+        tolerance - The fit has converged when the center moves less than this (pixels).
+        """
+        super().__init__(**kwds)
+        self.last_corner = None
+        self.last_params = None
+        self.max_iterations = max_iterations
+        self.min_width = min_width
+        self.n_fallback = 0
+        self.n_fits = 0
+        self.shape = shape
+        self.sigma = sigma
+        self.symmetric = symmetric
+        self.tolerance = tolerance
+
+        self.n_params = 5 if symmetric else 6
+        self.xi = numpy.arange(shape[0], dtype = numpy.float64)
+        self.yi = numpy.arange(shape[1], dtype = numpy.float64)
+
+        # Two buffers, one for the Jacobian at the current parameters and
+        # one for the Jacobian at the trial parameters. These are swapped
+        # when the trial step is accepted.
+        self.jacobians = numpy.zeros((2, self.n_params, shape[0], shape[1]))
+        self.jacobians[:,0] = 1.0
+
+    def fit(self, data, corner = None, params = None):
+        """
+        Fit the data. If params is None this starts from the result of the
+        previous fit, or the moment estimate if there isn't one.
+
+        corner - If data is a ROI from a larger image, the position of the
+                 ROI in the image. This is used to correct the starting
+                 point from the previous fit when the ROI moves.
+
+        Returns [params, good, iterations].
+        """
+        self.n_fits += 1
+        data = numpy.asarray(data, dtype = numpy.float64)
+
+        if (params is None) and (self.last_params is not None):
+            params = self.last_params.copy()
+            if (corner is not None) and (self.last_corner is not None):
+                params[2] += self.last_corner[0] - corner[0]
+                params[3] += self.last_corner[1] - corner[1]
+        self.last_corner = corner
+
+        if params is None:
+            [params, good] = momentFit(data, symmetric = self.symmetric)
+            if not good:
+                return [None, False, 0]
+        params = numpy.array(params, dtype = numpy.float64)
+
+        [result, good, iterations] = self.levenbergMarquardt(data, params)
+        if good and self.isReasonable(result):
+            self.last_params = result
+            return [result.copy(), True, iterations]
+
+        # Closed form fallback.
+        self.n_fallback += 1
+        self.last_params = None
+        [result, good] = momentFit(data, symmetric = self.symmetric)
+        return [result, good, iterations]
+
+    def getStatistics(self):
+        """
+        Returns [number of fits, number that used the moment estimate].
+        """
+        return [self.n_fits, self.n_fallback]
+
+    def isReasonable(self, params):
+        if (params[1] <= 0.0) or numpy.any(params[4:] <= 0.0):
+            return False
+        if (params[2] < 0.0) or (params[2] > (self.shape[0] - 1)):
+            return False
+        if (params[3] < 0.0) or (params[3] > (self.shape[1] - 1)):
+            return False
+        return numpy.all(params[4:] < 2.0 * max(self.shape))
+
+    def levenbergMarquardt(self, data, params):
+        """
+        Returns [params, converged, iterations].
+        """
+        if numpy.any(params[4:] < self.min_width):
+            return [params, False, 0]
+        cur = 0
+        [residual, jacobian] = self.residualAndJacobian(data, params, cur)
+        cost = numpy.dot(residual, residual)
+        lambda_lm = 1.0e-3
+        for i in range(self.max_iterations):
+            jtj = numpy.dot(jacobian, jacobian.T)
+            jtr = numpy.dot(jacobian, residual)
+            try:
+                delta = numpy.linalg.solve(jtj + lambda_lm * numpy.diag(numpy.diag(jtj)), -jtr)
+            except numpy.linalg.LinAlgError:
+                return [params, False, i+1]
+
+            new_params = params + delta
+            if numpy.all(new_params[4:] >= self.min_width):
+                [new_residual, new_jacobian] = self.residualAndJacobian(data, new_params, 1 - cur)
+                new_cost = numpy.dot(new_residual, new_residual)
+            else:
+                new_cost = numpy.inf
+            if (new_cost <= cost):
+                cur = 1 - cur
+                params = new_params
+                residual = new_residual
+                jacobian = new_jacobian
+                cost = new_cost
+                lambda_lm = max(0.1 * lambda_lm, 1.0e-7)
+                if (numpy.max(numpy.abs(delta[2:4])) < self.tolerance):
+                    return [params, True, i+1]
+            else:
+                lambda_lm *= 10.0
+                if (lambda_lm > 1.0e7):
+                    break
+        return [params, False, self.max_iterations]
+
+    def residualAndJacobian(self, data, params, buffer = 0):
+        """
+        Returns the residual and the Jacobian, both flattened. The Jacobian
+        is a view of self.jacobians[buffer], so it is only valid until the
+        next call with the same buffer.
+        """
+        if self.symmetric:
+            [background, height, center_x, center_y, width_x] = params
+            width_y = width_x
+        else:
+            [background, height, center_x, center_y, width_x, width_y] = params
+
+        dx = self.xi - center_x
+        dy = self.yi - center_y
+        gx = numpy.exp(-2.0 * (dx/width_x)**2)
+        gy = numpy.exp(-2.0 * (dy/width_y)**2)
+        gauss = numpy.outer(gx, gy)
+        hgauss = height * gauss
+
+        # d/d(center) of exp(-2 (d/w)^2) is 4 d/w^2 times the gaussian, and
+        # d/d(width) is 4 d^2/w^3 times the gaussian.
+        jacobian = self.jacobians[buffer]
+        jacobian[1] = gauss
+        jacobian[2] = hgauss * (4.0 * dx/(width_x * width_x))[:,None]
+        jacobian[3] = hgauss * (4.0 * dy/(width_y * width_y))[None,:]
+        wx = (4.0 * dx * dx/(width_x * width_x * width_x))[:,None]
+        wy = (4.0 * dy * dy/(width_y * width_y * width_y))[None,:]
+        if self.symmetric:
+            jacobian[4] = hgauss * (wx + wy)
+        else:
+            jacobian[4] = hgauss * wx
+            jacobian[5] = hgauss * wy
+
+        residual = background + hgauss - data
+        return [residual.ravel(), jacobian.reshape(self.n_params, -1)]
+
+    def reset(self):
+        self.last_corner = None
+        self.last_params = None
+
+
+class LockPeakFinder(object):
+    """
+    Finds and fits the brightest peak in the image, this has the same
+    interface as sa_lock_peak_finder.LockPeakFinder.
+    """
+    def __init__(self, offset = None, sigma = None, threshold = None, symmetric = True, **kwds):
+        super().__init__(**kwds)
+        self.fitter = None
+        self.fit_size = max(2, int(1.5 * sigma))
+        self.offset = offset
+        self.sigma = sigma
+        self.symmetric = symmetric
+        self.threshold = threshold
+
+    def cleanup(self):
+        pass
+
+    def findFitPeak(self, image):
+        """
+        Returns the gaussian fit to the brightest peak in the image
+        as [x, y, success], x is the position along the first axis.
+        """
+        image = numpy.asarray(image)
+        max_i = numpy.argmax(image)
+        [max_x, max_y] = numpy.unravel_index(max_i, image.shape)
+        if ((image.flat[max_i] - numpy.median(image)) < self.threshold):
+            return [0, 0, False]
+
+        fs = self.fit_size
+        if (max_x < fs) or (max_x > (image.shape[0] - fs)) or (max_y < fs) or (max_y > (image.shape[1] - fs)):
+            return [0, 0, False]
+
+        if self.fitter is None:
+            self.fitter = GaussianFitter(shape = (2*fs, 2*fs),
+                                         sigma = self.sigma,
+                                         symmetric = self.symmetric)
+
+        roi = image[max_x-fs:max_x+fs,max_y-fs:max_y+fs]
+        [params, good, iterations] = self.fitter.fit(roi, corner = [max_x - fs, max_y - fs])
+        if not good:
+            return [0, 0, False]
+        return [float(max_x - fs) + params[2], float(max_y - fs) + params[3], True]
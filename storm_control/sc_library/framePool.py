@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+A pool of pre-allocated frame buffers.
+
+Cameras and feeds get the storage for new frames from a pool so that
+during steady state acquisition there are no (large) memory allocations.
+
+Buffers are reference counted using Python's own reference counting. A
+buffer is in use as long as something other than the pool refers to it,
+this includes numpy views of the buffer (such as the slices created by
+the feeds) as these keep a reference to the buffer in their 'base'
+attribute. Consumers of frames (writers, feeds, display, spot counter,
+focus lock, etc.) 'release' a frame simply by no longer holding onto it.
+
+Note that each pool is expected to have a single producer, i.e. only one
+thread should be calling getBuffer().
+"""
+
+import numpy
+import sys
+
+
+class FramePoolException(Exception):
+    pass
+
+
+class FramePool(object):
+    """
+    A pool of numpy.uint16 buffers all of the same size.
+    """
+    def __init__(self, frame_size = None, max_buffers = 200, n_buffers = 10, **kwds):
+        """
+        frame_size - The size of each buffer in pixels.
+        max_buffers - The maximum number of buffers in the pool. If all of
+                      these are in use then getBuffer() will return buffers
+                      that are not part of the pool.
+        n_buffers - The number of buffers to allocate initially.
+        """
+        super().__init__(**kwds)
+        self.buffers = []
+        self.frame_size = frame_size
+        self.max_buffers = max_buffers
+        self.next_buffer = 0
+        self.number_misses = 0
+
+        if (n_buffers > max_buffers):
+            raise FramePoolException("Initial number of buffers is larger than the maximum number of buffers.")
+
+        for i in range(n_buffers):
+            self.buffers.append(self.newBuffer())
+
+    def getBuffer(self):
+        """
+        Return a buffer that is not currently in use. The contents of the
+        buffer are whatever was in it the last time it was used.
+        """
+        # Look for a free buffer starting from the one after the last
+        # buffer that we handed out.
+        n_buffers = len(self.buffers)
+        for i in range(n_buffers):
+            index = (self.next_buffer + i) % n_buffers
+            if not self.inUse(index):
+                self.next_buffer = (index + 1) % n_buffers
+                return self.buffers[index]
+
+        # All the buffers are in use so (if possible) add another one.
+        a_buffer = self.newBuffer()
+        if (n_buffers < self.max_buffers):
+            self.buffers.append(a_buffer)
+            self.next_buffer = 0
+        else:
+            self.number_misses += 1
+        return a_buffer
+
+    def getFrameSize(self):
+        return self.frame_size
+
+    def getNumberBuffers(self):
+        return len(self.buffers)
+
+    def getNumberInUse(self):
+        n_in_use = 0
+        for i in range(len(self.buffers)):
+            if self.inUse(i):
+                n_in_use += 1
+        return n_in_use
+
+    def getNumberMisses(self):
+        """
+        The number of times a buffer was requested when all the
+        buffers were in use and the pool could not grow.
+        """
+        return self.number_misses
+
+    def inUse(self, index):
+        """
+        The references are the buffers list and the argument to
+        sys.getrefcount(). Anything more than this and the buffer
+        is in use.
+        """
+        return (sys.getrefcount(self.buffers[index]) > 2)
+
+    def newBuffer(self):
+        return numpy.empty(self.frame_size, dtype = numpy.uint16)
+
+    def resize(self, frame_size):
+        """
+        Change the size of the buffers. Buffers that are still in use
+        are simply dropped from the pool.
+        """
+        if (frame_size != self.frame_size):
+            n_buffers = len(self.buffers)
+            self.frame_size = frame_size
+            self.buffers = []
+            self.next_buffer = 0
+            for i in range(n_buffers):
+                self.buffers.append(self.newBuffer())
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
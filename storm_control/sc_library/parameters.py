@@ -3,6 +3,12 @@
 Handles parsing settings xml files and getting/setting 
 the resulting settings.
 
+StormXMLObject.copy() is copy-on-write. The copy shares the
+sub-sections and Parameters of the original, these are only
+copied when they are changed in (or handed out by) either
+object. This makes copies cheap, and difference() can skip
+anything that is still shared as it must be the same.
+
 Hazen 06/15
 """
 
@@ -68,7 +74,7 @@ def copyParametersAddNew(original_parameters, new_parameters, allow_new):
     unrecognized = []
     for attr in new_parameters.getAttrs():
 
-        prop = new_parameters.getp(attr)
+        prop = new_parameters.parameters[attr]
         if isinstance(prop, StormXMLObject):
             if not original_parameters.has(attr):
                 if allow_new or not prop._validate_:
@@ -79,13 +85,13 @@ def copyParametersAddNew(original_parameters, new_parameters, allow_new):
 
             # Allow new parameters for all sub-objects.
             if allow_new:
-                unrecognized.extend(copyParametersAddNew(original_parameters.get(attr),
+                unrecognized.extend(copyParametersAddNew(original_parameters.getpOwned(attr),
                                                          prop,
                                                          True))
 
             # Otherwise it depends on the current objects _validate_ attribute.
             else:
-                unrecognized.extend(copyParametersAddNew(original_parameters.get(attr),
+                unrecognized.extend(copyParametersAddNew(original_parameters.getpOwned(attr),
                                                          prop,
                                                          not prop._validate_))
 
@@ -104,51 +110,59 @@ def copyParametersReplace(root, original, new):
     A helper function for copyParameters().
 
     This replaces all the parameters in original with their values
-    from new, if new has a corresponding value. The idea is that
-    the new parameters only need to specify what is different.
+    from new, if original has a corresponding parameter. The idea is
+    that the new parameters only need to specify what is different.
+
+    This walks new, which is usually much smaller than original, and
+    only the parts of original that actually change get copied.
 
     Note: This no longer supports flat parameter trees for new.
     """
-    for attr in original.getAttrs():
+    for attr in new.getAttrs():
+
+        prop = new.parameters[attr]
 
-        prop = original.get(attr)
+        attr_fullname = attr
+        if (len(root) > 0):
+            attr_fullname = root + "." + attr
 
         # Recurse if this a branch.
         if isinstance(prop, StormXMLObject):
-            if (len(root) > 0):
-                copyParametersReplace(root + "." + attr, prop, new)
-            else:
-                copyParametersReplace(attr, prop, new)
+            copyParametersReplace(attr_fullname, original, prop)
 
-        # Otherwise check for the corresponding node in new.
-        else:
-            attr_fullname = attr
-            if (len(root) > 0):
-                attr_fullname = root + "." + attr
-            if new.has(attr_fullname):
-                original.set(attr, new.get(attr_fullname))
+        # Otherwise check for the corresponding parameter in original.
+        elif original.has(attr_fullname) and isinstance(original.getpShared(attr_fullname), Parameter):
+            original.set(attr_fullname, prop.getv())
 
 
 def difference(params1, params2):
     """
-    Return which parameters in params1 are different / don't 
+    Return which parameters in params1 are different / don't
     exist in params2.
+
+    Sub-sections and parameters that params1 and params2 still
+    share (because one is a copy of the other) are skipped, so
+    this only has to look at what was changed.
     """
     differences = []
-    
+
     def diffRecurse(root, p1, p2):
         for attr in p1.getAttrs():
-            prop = p1.get(attr)
+            prop1 = p1.parameters[attr]
+            prop2 = p2.parameters.get(attr)
 
-            if isinstance(prop, StormXMLObject):
-                if p2.has(attr):
-                    diffRecurse(root + attr + ".", prop, p2.get(attr))
+            if prop1 is prop2:
+                continue
+
+            if isinstance(prop1, StormXMLObject):
+                if isinstance(prop2, StormXMLObject):
+                    diffRecurse(root + attr + ".", prop1, prop2)
                 else:
                     differences.append(root + attr)
             else:
-                if not p2.has(attr):
+                if not isinstance(prop2, Parameter):
                     differences.append(root + attr)
-                elif (prop != p2.get(attr)):
+                elif (prop1.getv() != prop2.getv()):
                     differences.append(root + attr)
 
     diffRecurse("", params1, params2)
@@ -527,10 +541,18 @@ class StormXMLObject(object):
     A collection of Parameters objects that are (usually) created 
     dynamically by parsing an XML file. All parameter names must 
     be unique for each section.
+
+    Sub-sections and Parameters can be shared with copies of this
+    object (copy-on-write). _owned_ is the names of the properties
+    that are not shared, so they can be changed in place. _lent_ is
+    the names of the properties that have been handed out, a reference
+    to these might be kept elsewhere so they are never shared.
     """
     def __init__(self, nodes = None, recurse = False, validate = True, **kwds):
         super().__init__(**kwds)
 
+        self._lent_ = set()
+        self._owned_ = set()
         self._validate_ = validate
         self.parameters = {}
 
@@ -633,10 +655,13 @@ class StormXMLObject(object):
             # This handles sub-nodes.
             elif recurse and (len(node) > 0):
                 self.parameters[node.tag] = StormXMLObject(node, True)
+                self._owned_.add(node.tag)
 
             # If we were able to make a parameter object add it to the record.
+            # Nothing else has a reference to it, so it can be shared.
             if param is not None:
                 self.addParameter(node.tag, param)
+                self._lent_.discard(node.tag)
 
     def add(self, pname, pvalue = None):
         """
@@ -655,11 +680,9 @@ class StormXMLObject(object):
 
         pnames = pname.split(".")
         if (len(pnames) > 1):
-            try:
-                prop = self.get(pnames[0])
-            except ParametersExceptionGet:
+            if not pnames[0] in self.parameters:
                 self.addSubSection(pnames[0])
-            prop = self.get(pnames[0])
+            prop = self.getpOwned(pnames[0])
             prop.add(".".join(pnames[1:]), pvalue)
         else:
             self.addParameter(pname, pvalue)
@@ -673,8 +696,10 @@ class StormXMLObject(object):
         else:
             if isinstance(pvalue, Parameter):
                 self.parameters[pname] = pvalue
+                self._lent_.add(pname)
             else:
                 self.parameters[pname] = ParameterSimple(pname, pvalue)
+            self._owned_.add(pname)
 
     def addSubSection(self, sname, svalue = None, overwrite = False):
         """
@@ -689,9 +714,9 @@ class StormXMLObject(object):
         snames = sname.split(".")
         if (len(snames) > 1):
             if not snames[0] in self.parameters:
-                cur_section = self.parameters[snames[0]] = StormXMLObject()
-            else:
-                cur_section = self.parameters[snames[0]]
+                self.parameters[snames[0]] = StormXMLObject()
+                self._owned_.add(snames[0])
+            cur_section = self.getp(snames[0])
             return cur_section.addSubSection(".".join(snames[1:]),
                                              svalue = svalue,
                                              overwrite = overwrite)
@@ -709,10 +734,26 @@ class StormXMLObject(object):
                 else:
                     raise ParametersException("Object is a " + type(svalue) + " not a StormXMLObject")
 
+            self._owned_.add(sname)
+            self._lent_.add(sname)
             return self.parameters[sname]
 
     def copy(self):
-        return copy.deepcopy(self)
+        """
+        Returns a copy-on-write copy, this only has to copy the
+        properties that have been handed out.
+        """
+        new_object = StormXMLObject(validate = self._validate_)
+        for pname, prop in self.parameters.items():
+            if pname in self._lent_:
+                new_object.parameters[pname] = prop.copy()
+                new_object._owned_.add(pname)
+            else:
+                new_object.parameters[pname] = prop
+
+        # Everything that was not handed out is now shared.
+        self._owned_ &= self._lent_
+        return new_object
 
     def delete(self, name):
         """
@@ -721,9 +762,11 @@ class StormXMLObject(object):
         if self.has(name):
             names = name.split(".")
             if (len(names) > 1):
-                self.get(".".join(names[:-1])).delete(names[-1])
+                self.getpOwned(".".join(names[:-1])).delete(names[-1])
             else:
                 del self.parameters[name]
+                self._lent_.discard(name)
+                self._owned_.discard(name)
 
     def get(self, pname, default = None):
         """
@@ -731,7 +774,7 @@ class StormXMLObject(object):
         the corresponding StormXMLObject.
         """
         try:
-            prop = self.getp(pname)
+            prop = self.getpShared(pname)
         except ParametersException:
             if default is not None:
                 return default
@@ -739,7 +782,7 @@ class StormXMLObject(object):
                 raise ParametersExceptionGet("Requested property " + pname + " not found and no default was specified.")
         else:
             if isinstance(prop, StormXMLObject):
-                return prop
+                return self.getp(pname)
             else:
                 return prop.getv()
 
@@ -758,24 +801,48 @@ class StormXMLObject(object):
     def getp(self, pname):
         """
         Return the property specified by pname.
+
+        The caller can keep and change the property, so it won't be
+        shared with copies of this object.
         """
-        # Check for sub-property.
-        pnames = pname.split(".")
-        if (len(pnames) > 1):
-            xml_object = self.getp(pnames[0])
-            #print pnames, type(xml_object)
-            return xml_object.getp(".".join(pnames[1:]))
+        return self.getpOwned(pname, lend = True)
 
-        if pname in self.parameters:
-            return self.parameters[pname]
-        else:
-            raise ParametersExceptionGet("Requested property " + pname + " not found")
+    def getpOwned(self, pname, lend = False):
+        """
+        Return the property specified by pname so that it can be changed,
+        any part of the path to it that is shared with a copy of this
+        object is copied first.
+        """
+        prop = self
+        for name in pname.split("."):
+            if not isinstance(prop, StormXMLObject) or not (name in prop.parameters):
+                raise ParametersExceptionGet("Requested property " + pname + " not found")
+            parent = prop
+            prop = parent.parameters[name]
+            if not (name in parent._owned_):
+                prop = parent.parameters[name] = prop.copy()
+                parent._owned_.add(name)
+            if lend:
+                parent._lent_.add(name)
+        return prop
+
+    def getpShared(self, pname):
+        """
+        Return the property specified by pname without copying anything,
+        this might be shared with copies of this object so don't change it.
+        """
+        prop = self
+        for name in pname.split("."):
+            if not isinstance(prop, StormXMLObject) or not (name in prop.parameters):
+                raise ParametersExceptionGet("Requested property " + pname + " not found")
+            prop = prop.parameters[name]
+        return prop
 
     def getProps(self):
         """
         Return all the properties.
         """
-        return self.parameters.values()
+        return [self.getp(pname) for pname in self.parameters]
 
     def getSortedAttrs(self):
         """
@@ -789,7 +856,7 @@ class StormXMLObject(object):
         Return true if this object has a particular Parameter.
         """
         try:
-            prop = self.getp(pname)
+            prop = self.getpShared(pname)
         except ParametersExceptionGet:
             return False
         return True
@@ -818,13 +885,12 @@ class StormXMLObject(object):
 
         # If the parameter does not already exist a ParameterSimple
         # is created to hold the value of the parameter.
-        try:
-            temp = self.getp(pname)
+        if self.has(pname):
             if isinstance(pvalue, Parameter):
-                temp.setv(pvalue.getv())
+                self.setv(pname, pvalue.getv())
             else:
-                temp.setv(pvalue)
-        except ParametersExceptionGet:
+                self.setv(pname, pvalue)
+        else:
             self.add(pname, pvalue)
 
     def setv(self, pname, value):
@@ -845,7 +911,17 @@ class StormXMLObject(object):
                 raise ParametersException(msg)
             return
 
-        self.getp(pname).setv(value)
+        # Don't copy the parameter if the value is not going to change.
+        prop = self.getpShared(pname)
+        if isinstance(prop, Parameter) and isinstance(value, (bool, float, int, str)):
+            try:
+                new_value = prop.toType(value)
+                if (type(new_value) == type(prop.getv())) and (new_value == prop.getv()):
+                    return
+            except (AttributeError, TypeError, ValueError):
+                pass
+
+        self.getpOwned(pname).setv(value)
 
     def toString(self, all_params = False):
         """
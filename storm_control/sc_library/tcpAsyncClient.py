@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+"""
+An asyncio TCP client for scripting HAL (or Kilroy) without Qt.
+
+Several requests can be in flight at the same time on a single
+connection, the responses are matched to the requests using the
+TCPMessage ID. The frames are the same as those used by the Qt
+TCPClient / TCPServer classes (see tcpCommunications.py).
+
+Example:
+
+async def main():
+    async with TCPAsyncClient(port = 9000) as hal:
+        await hal.moveStage(10.0, 20.0)
+        await hal.takeMovie("movie_01", 100, directory = "/data")
+
+asyncio.run(main())
+
+This also includes StandInServer, an asyncio server that responds to
+messages a bit like HAL would, for testing scripts without HAL.
+"""
+import asyncio
+import struct
+
+import storm_control.sc_library.tcpCommunications as tcpCommunications
+
+from storm_control.sc_library.tcpMessage import TCPMessage, TCPMessageException
+
+
+# The asyncio default (64 KiB) is too small for the JSON encoding of
+# messages with large responses, such as HAL's parameters.
+stream_limit = 16 * 1024 * 1024
+
+class TCPAsyncClientException(Exception):
+    pass
+
+
+async def readFrame(reader, encoding = "utf-8"):
+    """
+    Read a single frame from an asyncio.StreamReader.
+
+    Returns [message, is_binary], or [None, None] at the end of the stream.
+    """
+    while True:
+        try:
+            first = await reader.readexactly(1)
+            if (first == b"\x00"):
+                header = await reader.readexactly(tcpCommunications.binary_header_size - 1)
+                [size] = struct.unpack("<I", header)
+                data = await reader.readexactly(size)
+                return [TCPMessage.fromBinary(data), True]
+            else:
+                line = first + await reader.readline()
+                if (len(line.strip()) == 0):
+                    continue
+                return [TCPMessage.fromJSON(str(line, encoding)), False]
+
+        except asyncio.IncompleteReadError:
+            return [None, None]
+
+
+class TCPAsyncClient(object):
+    """
+    An asyncio TCP client. Requests are sent with sendMessage(), or one
+    of the convenience methods, and the coroutine completes when the
+    response is received.
+    """
+    def __init__(self,
+                 binary = False,
+                 encoding = "utf-8",
+                 host = "127.0.0.1",
+                 limit = stream_limit,
+                 port = 9000,
+                 timeout = None,
+                 **kwds):
+        """
+        binary - Use the compact binary encoding instead of JSON.
+        limit - The maximum size of a JSON message in bytes.
+        timeout - The default time to wait for a response in seconds,
+                  None is no limit.
+        """
+        super().__init__(**kwds)
+        self.binary = binary
+        self.encoding = encoding
+        self.host = host
+        self.limit = limit
+        self.pending = {}
+        self.port = port
+        self.reader = None
+        self.reader_task = None
+        self.timeout = timeout
+        self.writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, etype, value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the connection. Any requests that are still waiting for
+        a response fail with a TCPAsyncClientException.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.writer = None
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+            self.reader_task = None
+        self.failPending("Connection closed.")
+
+    async def connect(self):
+        if self.isConnected():
+            return
+        [self.reader, self.writer] = await asyncio.open_connection(self.host, self.port, limit = self.limit)
+        self.reader_task = asyncio.ensure_future(self.readResponses())
+
+    def failPending(self, error_message):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(TCPAsyncClientException(error_message))
+        self.pending = {}
+
+    async def checkParameters(self, parameters, timeout = None):
+        """
+        Check that HAL has the requested parameters (an index or a name),
+        this does not change HAL's current parameters.
+        """
+        return await self.sendChecked(TCPMessage(message_type = "Set Parameters",
+                                                 message_data = {"parameters" : parameters},
+                                                 test_mode = True),
+                                      timeout = timeout)
+
+    async def getStagePosition(self, timeout = None):
+        """
+        Returns [stage_x, stage_y].
+        """
+        response = await self.sendChecked(TCPMessage(message_type = "Get Stage Position"),
+                                          timeout = timeout)
+        return [response.getResponse("stage_x"), response.getResponse("stage_y")]
+
+    def isConnected(self):
+        return (self.writer is not None) and (not self.writer.is_closing())
+
+    async def moveStage(self, stage_x, stage_y, test_mode = False, timeout = None):
+        return await self.sendChecked(TCPMessage(message_type = "Move Stage",
+                                                 message_data = {"stage_x" : stage_x,
+                                                                 "stage_y" : stage_y},
+                                                 test_mode = test_mode),
+                                      timeout = timeout)
+
+    async def readResponses(self):
+        """
+        Read responses and pass them to the requests that are waiting for them.
+        """
+        error_message = "Connection lost."
+        try:
+            while True:
+                [message, is_binary] = await readFrame(self.reader, encoding = self.encoding)
+                if message is None:
+                    break
+                if message.isType("Busy"):
+                    error_message = "The server is busy with another client."
+                    break
+                future = self.pending.pop(message.getID(), None)
+                if (future is not None) and not future.done():
+                    future.set_result(message)
+
+        except (ConnectionError, TCPMessageException, UnicodeDecodeError, ValueError) as exception:
+            error_message = "Connection error, " + str(exception)
+
+        if self.writer is not None:
+            self.writer.close()
+        self.failPending(error_message)
+
+    async def sendChecked(self, message, timeout = None):
+        """
+        Like sendMessage() but raises a TCPAsyncClientException if the
+        response has an error.
+        """
+        response = await self.sendMessage(message, timeout = timeout)
+        if response.hasError():
+            raise TCPAsyncClientException(response.getType() + " failed, " + str(response.getErrorMessage()))
+        return response
+
+    async def sendMessage(self, message, timeout = None):
+        """
+        Send a TCPMessage and return the response. This raises a
+        TCPAsyncClientException if there is no response within
+        timeout seconds (the default timeout if this is None).
+        """
+        if not self.isConnected():
+            raise TCPAsyncClientException("Not connected to " + self.host + ":" + str(self.port))
+
+        if timeout is None:
+            timeout = self.timeout
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message.getID()] = future
+        try:
+            self.writer.write(tcpCommunications.encodeFrame(message, binary = self.binary, encoding = self.encoding))
+            await self.writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TCPAsyncClientException("No response to '" + message.getType() + "' after " + str(timeout) + " seconds.")
+        finally:
+            self.pending.pop(message.getID(), None)
+
+    async def takeMovie(self,
+                        name,
+                        length,
+                        directory = None,
+                        overwrite = False,
+                        parameters = None,
+                        test_mode = False,
+                        timeout = None):
+        """
+        Take a movie. In test mode this returns HAL's estimate of the
+        movie duration and disk usage instead.
+        """
+        message_data = {"name" : name,
+                        "length" : length,
+                        "overwrite" : overwrite}
+        if directory is not None:
+            message_data["directory"] = directory
+        if parameters is not None:
+            message_data["parameters"] = parameters
+        return await self.sendChecked(TCPMessage(message_type = "Take Movie",
+                                                 message_data = message_data,
+                                                 test_mode = test_mode),
+                                      timeout = timeout)
+
+
+class TCPAsyncClientPool(object):
+    """
+    Shares one connection per server between all the tasks of a script.
+
+    HAL only accepts one client at a time, but as requests are matched
+    to responses by ID several tasks can use the same connection.
+    """
+    def __init__(self, binary = False, timeout = None, **kwds):
+        super().__init__(**kwds)
+        self.binary = binary
+        self.clients = {}
+        self.lock = None
+        self.timeout = timeout
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, etype, value, traceback):
+        await self.close()
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.close()
+        self.clients = {}
+
+    async def getClient(self, port, host = "127.0.0.1"):
+        """
+        Returns a connected client, re-connecting if the connection was lost.
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            key = (host, port)
+            if not key in self.clients:
+                self.clients[key] = TCPAsyncClient(binary = self.binary,
+                                                   host = host,
+                                                   port = port,
+                                                   timeout = self.timeout)
+            client = self.clients[key]
+            await client.connect()
+            return client
+
+
+class StandInServer(object):
+    """
+    An asyncio TCP server that stands in for HAL when testing scripts.
+
+    By default it handles 'Move Stage', 'Get Stage Position', 'Set Parameters'
+    and 'Take Movie'. Other message types are returned with an error. A
+    different handler can be provided, this is a function (or coroutine)
+    that is called with the message and that should add the responses.
+
+    Messages are handled concurrently, so if the handler is a coroutine
+    the responses can be sent in a different order from the requests.
+    """
+    def __init__(self, handler = None, host = "127.0.0.1", limit = stream_limit, port = 0, **kwds):
+        """
+        limit - The maximum size of a JSON message in bytes.
+        port - The port to listen on, 0 is any free port, see getPort().
+        """
+        super().__init__(**kwds)
+        self.handler = handler
+        self.host = host
+        self.limit = limit
+        self.n_clients = 0
+        self.port = port
+        self.received = []
+        self.server = None
+        self.stage_x = 0.0
+        self.stage_y = 0.0
+
+        if self.handler is None:
+            self.handler = self.handleMessage
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, etype, value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def getPort(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handleClient(self, reader, writer):
+
+        # Like HAL only one client at a time.
+        if (self.n_clients > 0):
+            writer.write(tcpCommunications.encodeFrame(TCPMessage(message_type = "Busy")))
+            writer.close()
+            return
+
+        self.n_clients += 1
+        tasks = set()
+        try:
+            while True:
+                [message, is_binary] = await readFrame(reader)
+                if message is None:
+                    break
+                self.received.append(message)
+                task = asyncio.ensure_future(self.respond(writer, message, is_binary))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, TCPMessageException, ValueError):
+            pass
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            writer.close()
+            self.n_clients -= 1
+
+    def handleMessage(self, message):
+        """
+        The default message handler.
+        """
+        if message.isType("Move Stage"):
+            if not message.isTest():
+                self.stage_x = message.getData("stage_x")
+                self.stage_y = message.getData("stage_y")
+
+        elif message.isType("Get Stage Position"):
+            if not message.isTest():
+                message.addResponse("stage_x", self.stage_x)
+                message.addResponse("stage_y", self.stage_y)
+
+        elif message.isType("Set Parameters"):
+            pass
+
+        elif message.isType("Take Movie"):
+            length = message.getData("length")
+            if (length is None) or (length < 1):
+                message.setError(True, str(length) + " is an invalid movie length.")
+            elif message.isTest():
+                message.addResponse("duration", 0.01 * length)
+                message.addResponse("disk_usage", 0.5 * length)
+
+        else:
+            message.setError(True, "This message was not handled.")
+
+    async def respond(self, writer, message, is_binary):
+        response = self.handler(message)
+        if asyncio.iscoroutine(response):
+            await response
+        writer.write(tcpCommunications.encodeFrame(message, binary = is_binary))
+        await writer.drain()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handleClient, self.host, self.port, limit = self.limit)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
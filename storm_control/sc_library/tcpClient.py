@@ -46,6 +46,7 @@ class TCPClient(QtCore.QObject, tcpCommunications.TCPCommunicationsMixin):
             print(string)
 
         # Attempt to connect to host.
+        self.resetBuffer()
         self.socket.connectToHost(self.address, self.port)
 
         if not self.socket.waitForConnected(1000):
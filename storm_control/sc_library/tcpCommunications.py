@@ -2,16 +2,45 @@
 """
 A TCP communications class that provides the basic methods for relaying TCP messages.
 
+Each message is sent in it's own frame, which is either:
+
+  text   - The message as JSON followed by a newline. JSON strings
+           never contain a (unescaped) newline.
+
+  binary - A zero byte, the (uint32) size of the message and then
+           the message in the compact binary encoding of
+           TCPMessage.toBinary(). A JSON text never starts with a
+           zero byte, so both kinds of frames can be mixed.
+
+Messages are identified by their ID, so a client can send several
+messages without waiting for a response, and the responses do not
+have to arrive in the same order as the messages.
+
 Jeffrey Moffitt
 3/16/14
 jeffmoffitt@gmail.com
 
 Hazen 05/14
 """
+import struct
 
 from PyQt5 import QtCore, QtNetwork
 
-from storm_control.sc_library.tcpMessage import TCPMessage
+from storm_control.sc_library.tcpMessage import TCPMessage, TCPMessageException
+
+
+binary_header_size = 5
+
+
+def encodeFrame(message, binary = False, encoding = "utf-8"):
+    """
+    Return a frame containing the message.
+    """
+    if binary:
+        data = message.toBinary()
+        return b"\x00" + struct.pack("<I", len(data)) + data
+    else:
+        return (message.toJSON() + "\n").encode(encoding)
 
 
 class TCPCommunicationsMixin(object):
@@ -24,6 +53,7 @@ class TCPCommunicationsMixin(object):
     """
     def __init__(self,
                  address = QtNetwork.QHostAddress(QtNetwork.QHostAddress.LocalHost),
+                 binary = False,
                  encoding = 'utf-8',
                  port = 9500,
                  server_name = "default",
@@ -33,8 +63,11 @@ class TCPCommunicationsMixin(object):
 
         # Initialize internal attributes
         self.address = address
+        self.binary = binary
         self.encoding = encoding
-        self.port = port 
+        self.match_peer = False
+        self.port = port
+        self.read_buffer = bytearray()
         self.server_name = server_name
         self.socket = None
         self.verbose = verbose
@@ -47,6 +80,12 @@ class TCPCommunicationsMixin(object):
             self.socket.close()
             if self.verbose:
                 print("Closing TCP communications: " + self.server_name)
+
+    def encodeMessage(self, message):
+        """
+        Return a frame containing the message.
+        """
+        return encodeFrame(message, binary = self.binary, encoding = self.encoding)
             
     def handleBusy(self):
         """
@@ -54,24 +93,26 @@ class TCPCommunicationsMixin(object):
         """
         pass
 
-    def handleReadyRead(self):
+    def handleMessage(self, message):
         """
-        Create TCP message class from JSON message and forward as appropriate
+        Forward a message that was received.
         """
-        message_str = ""
-        while self.socket.canReadLine():
-            # Read data line
-            message_str += str(self.socket.readLine(), self.encoding)
+        self.messageReceived.emit(message)
 
-        # Create message.
-        message = TCPMessage.fromJSON(message_str)
-        if self.verbose:
-            print("Received: \n" + str(message))
+    def handleReadyRead(self):
+        """
+        Create TCP messages from the complete frames that have been
+        received and forward them as appropriate.
+        """
+        self.read_buffer += bytes(self.socket.readAll())
+        for message in self.readFrames():
+            if self.verbose:
+                print("Received: \n" + str(message))
 
-        if (message.getType() == "Busy"):
-            self.handleBusy()
-        else:
-            self.messageReceived.emit(message)
+            if (message.getType() == "Busy"):
+                self.handleBusy()
+            else:
+                self.handleMessage(message)
     
     def isConnected(self):
         """
@@ -82,14 +123,60 @@ class TCPCommunicationsMixin(object):
         else:
             return False
 
+    def readFrames(self):
+        """
+        Remove all the complete frames from the read buffer and return
+        a list of the messages that they contained. Frames that do not
+        contain a valid message are skipped.
+        """
+        messages = []
+        while (len(self.read_buffer) > 0):
+            is_binary = (self.read_buffer[0] == 0)
+            try:
+                if is_binary:
+                    if (len(self.read_buffer) < binary_header_size):
+                        break
+                    [size] = struct.unpack("<I", self.read_buffer[1:binary_header_size])
+                    frame_size = binary_header_size + size
+                    if (len(self.read_buffer) < frame_size):
+                        break
+                    frame = bytes(self.read_buffer[binary_header_size:frame_size])
+                    del self.read_buffer[:frame_size]
+                    messages.append(TCPMessage.fromBinary(frame))
+                else:
+                    index = self.read_buffer.find(b"\n")
+                    if (index == -1):
+                        break
+                    frame = bytes(self.read_buffer[:index])
+                    del self.read_buffer[:index+1]
+                    if (len(frame.strip()) == 0):
+                        continue
+                    messages.append(TCPMessage.fromJSON(str(frame, self.encoding)))
+
+            except (TCPMessageException, UnicodeDecodeError, ValueError) as exception:
+                print(self.server_name + " received an invalid message, " + str(exception))
+                continue
+
+            # Servers respond in the same format as the client.
+            if self.match_peer:
+                self.binary = is_binary
+
+        return messages
+
+    def resetBuffer(self):
+        """
+        Discard any partial frames, this is called when a new connection is made.
+        """
+        self.read_buffer = bytearray()
+
     def sendMessage(self, message):
         """
-        Send TCP message as JSON string if the socket is connected.
+        Send TCP message if the socket is connected. The socket is not
+        flushed, so messages that are sent one after another are written
+        together when control returns to the event loop.
         """
         if self.isConnected():
-            message_str = message.toJSON() + "\n"
-            self.socket.write(message_str.encode(self.encoding))
-            self.socket.flush()
+            self.socket.write(self.encodeMessage(message))
             if self.verbose:
                 print("Sent: \n" + str(message))
         else:
@@ -11,6 +11,127 @@ Hazen 05/14
 
 import copy
 import json
+import struct
+
+
+class TCPMessageException(Exception):
+    pass
+
+
+def packValue(value, chunks):
+    """
+    Compact binary encoding of the (JSON compatible) contents of a
+    message. The encoded value is added to the list chunks.
+
+    Each value is a one byte type code followed by the value. Integers
+    and the sizes of strings, lists and dictionaries are stored as
+    variable length integers, floats as 8 byte doubles.
+    """
+    if value is None:
+        chunks.append(b"N")
+    elif value is True:
+        chunks.append(b"T")
+    elif value is False:
+        chunks.append(b"F")
+    elif isinstance(value, int):
+        # Zig-zag encoding so that small negative numbers are also small.
+        if (value >= 0):
+            chunks.append(b"i" + packVarint(2 * value))
+        else:
+            chunks.append(b"i" + packVarint(-2 * value - 1))
+    elif isinstance(value, float):
+        chunks.append(b"d" + struct.pack("<d", value))
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        chunks.append(b"s" + packVarint(len(data)) + data)
+    elif isinstance(value, (list, tuple)):
+        chunks.append(b"l" + packVarint(len(value)))
+        for elt in value:
+            packValue(elt, chunks)
+    elif isinstance(value, dict):
+        chunks.append(b"m" + packVarint(len(value)))
+        for key in value:
+            packValue(str(key), chunks)
+            packValue(value[key], chunks)
+    else:
+        raise TCPMessageException("Cannot encode values of type " + str(type(value)))
+
+def packVarint(value):
+    """
+    Encode a positive integer 7 bits at a time.
+    """
+    data = bytearray()
+    while (value > 127):
+        data.append((value & 127) | 128)
+        value = value >> 7
+    data.append(value)
+    return bytes(data)
+
+def unpackValue(data, offset):
+    """
+    Decode a value that was encoded with packValue().
+
+    Returns [value, offset of the next value].
+    """
+    if (offset >= len(data)):
+        raise TCPMessageException("Truncated message.")
+    code = data[offset:offset+1]
+    offset += 1
+    if (code == b"N"):
+        return [None, offset]
+    elif (code == b"T"):
+        return [True, offset]
+    elif (code == b"F"):
+        return [False, offset]
+    elif (code == b"i"):
+        [value, offset] = unpackVarint(data, offset)
+        if (value & 1):
+            return [-((value + 1) >> 1), offset]
+        else:
+            return [value >> 1, offset]
+    elif (code == b"d"):
+        if (offset + 8 > len(data)):
+            raise TCPMessageException("Truncated message.")
+        return [struct.unpack_from("<d", data, offset)[0], offset + 8]
+    elif (code == b"s"):
+        [size, offset] = unpackVarint(data, offset)
+        if (offset + size > len(data)):
+            raise TCPMessageException("Truncated message.")
+        return [bytes(data[offset:offset+size]).decode("utf-8"), offset + size]
+    elif (code == b"l"):
+        [size, offset] = unpackVarint(data, offset)
+        value = []
+        for i in range(size):
+            [elt, offset] = unpackValue(data, offset)
+            value.append(elt)
+        return [value, offset]
+    elif (code == b"m"):
+        [size, offset] = unpackVarint(data, offset)
+        value = {}
+        for i in range(size):
+            [key, offset] = unpackValue(data, offset)
+            [value[key], offset] = unpackValue(data, offset)
+        return [value, offset]
+    else:
+        raise TCPMessageException("Unknown type code " + str(code))
+
+def unpackVarint(data, offset):
+    """
+    Decode an integer that was encoded with packVarint().
+
+    Returns [value, offset of the next value].
+    """
+    value = 0
+    shift = 0
+    while True:
+        if (offset >= len(data)):
+            raise TCPMessageException("Truncated message.")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 127) << shift
+        shift += 7
+        if (byte < 128):
+            return [value, offset]
 
 
 class TCPMessage(object):
@@ -52,14 +173,34 @@ class TCPMessage(object):
         self.response[key_name] = value
 
     @staticmethod
-    def fromJSON(json_string):
+    def fromDict(message_dict):
         """
-        Creates a Message from a JSON string.
+        Creates a Message from a dictionary, see toDict().
         """
         message = TCPMessage(message_type = True)
-        message.__dict__.update(json.loads(json_string))
+        message.__dict__.update(message_dict)
         return message
 
+    @staticmethod
+    def fromBinary(data):
+        """
+        Creates a Message from it's compact binary encoding, see toBinary().
+        """
+        try:
+            [message_dict, offset] = unpackValue(data, 0)
+        except (RecursionError, TypeError, UnicodeDecodeError):
+            raise TCPMessageException("Invalid message.")
+        if not isinstance(message_dict, dict) or (offset != len(data)):
+            raise TCPMessageException("Invalid message.")
+        return TCPMessage.fromDict(message_dict)
+
+    @staticmethod
+    def fromJSON(json_string):
+        """
+        Creates a Message from a JSON string.
+        """
+        return TCPMessage.fromDict(json.loads(json_string))
+
     def getData(self, key_name, default = None):
         """
         Access elements of the message data by name.
@@ -136,6 +277,23 @@ class TCPMessage(object):
         """
         self.test_mode = test_boolean
 
+    def toBinary(self):
+        """
+        Serialize using a compact binary encoding. This is faster to
+        create and to parse than JSON, and smaller for messages with
+        a lot of numbers.
+        """
+        chunks = []
+        packValue(self.__dict__, chunks)
+        return b"".join(chunks)
+
+    def toDict(self):
+        """
+        Return the message as a dictionary, this is used to include
+        messages in the data of other messages.
+        """
+        return copy.deepcopy(self.__dict__)
+
     def toJSON(self):
         """
         Serialize using JSON.
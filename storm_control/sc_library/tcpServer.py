@@ -28,6 +28,9 @@ class TCPServer(QtNetwork.QTcpServer, tcpCommunications.TCPCommunicationsMixin):
     def __init__(self, **kwds):
         super().__init__(**kwds)
 
+        # Respond to each client in the same format that it uses.
+        self.match_peer = True
+
         # Connect new connection signal
         self.newConnection.connect(self.handleClientConnection)
         
@@ -67,6 +70,7 @@ class TCPServer(QtNetwork.QTcpServer, tcpCommunications.TCPCommunicationsMixin):
         socket = self.nextPendingConnection()
 
         if not self.isConnected():
+            self.resetBuffer()
             self.socket = socket
             self.socket.readyRead.connect(self.handleReadyRead)
             self.socket.disconnected.connect(self.handleClientDisconnect)
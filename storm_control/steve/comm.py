@@ -23,14 +23,16 @@ class Comm(QtCore.QObject):
 
     The TCP/IP connection should be broken is Steve is idle so that
     user is not locked out of some of the features of HAL.
+
+    More than one message can be sent at a time, HAL handles them in
+    order and the responses are matched to the messages by their ID.
     """
     
     @hdebug.debug
     def __init__(self, **kwds):
         super().__init__(**kwds)
         
-        self.busy = False
-        self.current_message = None
+        self.messages = {}
 
 #        # Back stops breaking connections if a module fails
 #        # to do this for some reason.
@@ -49,51 +51,39 @@ class Comm(QtCore.QObject):
 
     @hdebug.debug        
     def handleMessageReceived(self, message):
-        self.busy = False
-
-        # Save this property of the message as the message finalizer
-        # could change self.current_message by creating a new message.
-        disconnect = self.current_message.getDisconnect()
-
-        # HAL only sends messages in response to requests, so we can
-        # assume that the message we received is a response to the
-        # last message that we sent.
-        if not (message.getID() == self.current_message.getMessageID()):
-            warnings.warn("Received a response to a different message.")
-        elif message.hasError():
+
+        # HAL only sends messages in response to requests.
+        comm_message = self.messages.pop(message.getID(), None)
+        if comm_message is None:
+            warnings.warn("Received a response to an unknown message.")
+            return
+        
+        if message.hasError():
             err_msg = "tcp error: " + message.getErrorMessage()
             warnings.warn(err_msg)
             hdebug.logText(err_msg)
         else:
-            # Warning! This can change self.current_message.
-            self.current_message.finalizer(message)
+            # This can send more messages.
+            comm_message.finalizer(message)
 
-        # Disconnect from HAL if requested. Note that if the message
-        # finalizer created a new message this will be a NOP.
-        if disconnect:
+        # Disconnect from HAL if requested. Note that if there are other
+        # messages that HAL has not responded to yet this will be a NOP.
+        if comm_message.getDisconnect():
             self.stopCommunication()
             
     @hdebug.debug
     def isBusy(self):
-        return self.busy
+        return (len(self.messages) > 0)
     
     @hdebug.debug
     def sendMessage(self, comm_message):
 
-        # Ignore messages if we're already busy. Only one message at
-        # a time..
-        if self.isBusy():
-            return
-        
-        self.busy = True
-        self.current_message = comm_message
-
         # This method is a NOP if we're already connected.
         if self.tcp_client.startCommunication():
-            self.tcp_client.sendMessage(self.current_message.getMessage())
+            self.messages[comm_message.getMessageID()] = comm_message
+            self.tcp_client.sendMessage(comm_message.getMessage())
             return True
         else:
-            self.current_message = None
             warnings.warn("Cannot connect to HAL.")
             return False
 
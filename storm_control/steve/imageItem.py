@@ -5,8 +5,16 @@ This module handles:
 1. The images that Steve displays.
 2. Loading images from the disk.
 
+Each image has a level of detail pyramid (the image binned by 2,
+4, 8, etc.) that is created the first time the image is drawn.
+The pixmaps are only created when the image is actually drawn,
+at the pyramid level that matches the current zoom, and are kept
+in QPixmapCache.
+
 Hazen 10/18
 """
+import itertools
+import math
 import numpy
 import os
 import pickle
@@ -19,6 +27,12 @@ import storm_control.steve.movieReader as movieReader
 import storm_control.steve.steveItems as steveItems
 
 
+# Used to create unique QPixmapCache keys.
+cache_id = itertools.count()
+
+gray_color_table = [QtGui.QColor(i,i,i).rgb() for i in range(256)]
+
+
 def getCameraExtension(movie_xml):
     ext = movie_xml.get("camera1.extension", "")
     if (len(ext) > 0):
@@ -27,6 +41,76 @@ def getCameraExtension(movie_xml):
         return ""
 
 
+def createPyramid(numpy_data, min_size = 32):
+    """
+    Returns a list of images, the first is numpy_data, each following
+    image is the previous image binned 2x2. Odd rows / columns are
+    dropped. Binning stops when the image is smaller than min_size.
+    """
+    pyramid = [numpy_data]
+    image = numpy.asarray(numpy_data, dtype = numpy.float32)
+    while (min(image.shape) >= 2 * min_size):
+        h = 2 * (image.shape[0]//2)
+        w = 2 * (image.shape[1]//2)
+        image = image[:h,:w].reshape(h//2, 2, w//2, 2).mean(axis = (1,3), dtype = numpy.float32)
+        pyramid.append(image)
+    return pyramid
+
+def imageToPixmap(image, pixmap_min, pixmap_max):
+    """
+    Rescale an image to 8 bit using pixmap_min and pixmap_max
+    and return it as a QtGui.QPixmap.
+    """
+    # Rescale & convert to 8bit
+    scale = 255.0/float(max(pixmap_max - pixmap_min, 1))
+    image = numpy.asarray(image, dtype = numpy.float32) - float(pixmap_min)
+    image *= scale
+    numpy.clip(image, 0.0, 255.0, out = image)
+    image = image.astype(numpy.uint8)
+
+    # Create the pixmap
+    h, w = image.shape
+    q_image = QtGui.QImage(image.data, w, h, w, QtGui.QImage.Format_Indexed8)
+    q_image.ndarray = image
+    q_image.setColorTable(gray_color_table)
+    return QtGui.QPixmap.fromImage(q_image)
+
+
+class ImageGraphicsItem(QtWidgets.QGraphicsItem):
+    """
+    Draws an ImageItem. The item is the same size as the original
+    image, but it is drawn using the pixmap for the pyramid level
+    that best matches the current zoom.
+    """
+    def __init__(self, image_item = None, **kwds):
+        super().__init__(**kwds)
+        self.image_item = image_item
+
+    def boundingRect(self):
+        [w, h] = self.image_item.getImageSize()
+        return QtCore.QRectF(0, 0, w, h)
+
+    def imageChanged(self):
+        """
+        This must be called when the size of the image changes.
+        """
+        self.prepareGeometryChange()
+        self.update()
+
+    def paint(self, painter, option, widget):
+        level_of_detail = option.levelOfDetailFromTransform(painter.worldTransform())
+        pixmap = self.image_item.getPixmap(level_of_detail)
+        if pixmap is not None:
+            painter.drawPixmap(self.boundingRect(), pixmap, QtCore.QRectF(pixmap.rect()))
+
+    def pixmap(self):
+        """
+        For compatibility with QGraphicsPixmapItem, this returns the
+        full resolution pixmap.
+        """
+        return self.image_item.getPixmap(1.0)
+
+
 class ImageItem(steveItems.SteveItem):
     """
     Base class for image items, this is also the default single
@@ -37,11 +121,13 @@ class ImageItem(steveItems.SteveItem):
     def __init__(self, numpy_data = None, objective_name = None, x_um = None, y_um = None, zvalue = None, **kwds):
         super().__init__(**kwds)
 
+        self.cache_key = "steve_" + str(next(cache_id))
         self.magnification = 1.0
         self.numpy_data = numpy_data
         self.objective_name = objective_name
         self.pixmap_max = 0
         self.pixmap_min = 0
+        self.pyramid = None
         self.x_pix = 0
         self.x_offset_pix = 0
         self.x_um = x_um
@@ -56,32 +142,18 @@ class ImageItem(steveItems.SteveItem):
         if y_um is not None:
             self.y_pix = coord.umToPix(y_um)
         
-        self.graphics_item = QtWidgets.QGraphicsPixmapItem()
+        self.graphics_item = ImageGraphicsItem(image_item = self)
 
     def dataToPixmap(self, pixmap_min, pixmap_max):
         """
-        Create a QtGui.QPixmap item from the numpy data.
+        Set the contrast of the pixmap. The pixmap itself is not 
+        created until the image is drawn.
         """
         self.pixmap_min = pixmap_min
         self.pixmap_max = pixmap_max
-
-        image = self.numpy_data.copy()
-
-        # Rescale & convert to 8bit
-        image = numpy.ascontiguousarray(image, dtype = numpy.float32)
-        image = 255.0 * (image - float(self.pixmap_min))/float(self.pixmap_max - self.pixmap_min)
-        image[(image > 255.0)] = 255.0
-        image[(image < 0.0)] = 0.0
-        image = image.astype(numpy.uint8)
-
-        # Create the pixmap
-        w, h = image.shape
-        q_image = QtGui.QImage(image.data, h, w, QtGui.QImage.Format_Indexed8)
-        q_image.ndarray = image
-        for i in range(256):
-            q_image.setColor(i, QtGui.QColor(i,i,i).rgb())
-        q_pixmap = QtGui.QPixmap.fromImage(q_image)
-        self.graphics_item.setPixmap(q_pixmap)
+        self.cache_key = "steve_" + str(next(cache_id))
+        self.pyramid = None
+        self.graphics_item.imageChanged()
 
     def getContrast(self):
         """
@@ -92,15 +164,63 @@ class ImageItem(steveItems.SteveItem):
     def getDict(self):
         """
         Return the attributes of ImageItem as a dictionary minus the 
-        graphics_item attribute.
+        attributes that are only used for drawing.
         """
         save_dict = self.__dict__.copy()
-        del save_dict["graphics_item"]
+        for key in ["cache_key", "graphics_item", "pyramid"]:
+            del save_dict[key]
         return save_dict
 
+    def getSaveData(self):
+        """
+        Return the image and it's attributes for saving in a mosaic
+        container file.
+        """
+        metadata = self.getDict()
+        for key in ["item_id", "numpy_data"]:
+            del metadata[key]
+        return [self.numpy_data, metadata]
+
+    def getImageSize(self):
+        """
+        Return the size of the image as [width, height] in pixels.
+        """
+        if self.numpy_data is None:
+            return [0, 0]
+        return [self.numpy_data.shape[1], self.numpy_data.shape[0]]
+
     def getObjectiveName(self):
         return self.objective_name
 
+    def getPixmap(self, level_of_detail):
+        """
+        Return the pixmap to use at level_of_detail (screen pixels 
+        per image pixel). This is the smallest pyramid level that has
+        at least as many pixels as will be displayed.
+        """
+        if self.numpy_data is None:
+            return None
+        
+        if self.pyramid is None:
+            self.pyramid = createPyramid(self.numpy_data)
+
+        level = 0
+        if (level_of_detail > 0.0):
+            level = int(math.floor(-math.log2(min(level_of_detail, 1.0))))
+        level = min(level, len(self.pyramid) - 1)
+
+        # The contrast is part of the key so that contrast changes don't
+        # need to invalidate the cache.
+        key = "{0:s}_{1:d}_{2:d}_{3:d}".format(self.cache_key,
+                                               level,
+                                               int(self.pixmap_min),
+                                               int(self.pixmap_max))
+        pixmap = QtGui.QPixmapCache.find(key)
+        if pixmap is None:
+            pixmap = imageToPixmap(self.pyramid[level], self.pixmap_min, self.pixmap_max)
+            QtGui.QPixmapCache.insert(key, pixmap)
+        return pixmap
+
 #    def getPos(self):
 #        return coord.Point(self.x_um, self.y_um, "um")
 
@@ -108,9 +228,9 @@ class ImageItem(steveItems.SteveItem):
         return [self.x_um, self.y_um]
     
     def getSizeUm(self):
-        pixmap = self.graphics_item.pixmap()
-        width_um = coord.pixToUm(pixmap.width()/self.magnification)
-        height_um = coord.pixToUm(pixmap.height()/self.magnification)
+        [width, height] = self.getImageSize()
+        width_um = coord.pixToUm(width/self.magnification)
+        height_um = coord.pixToUm(height/self.magnification)
         return (width_um, height_um)
         
     def getZValue(self):
@@ -142,6 +262,14 @@ class ImageItem(steveItems.SteveItem):
         self.setPos()
         self.setZValue(self.zvalue)
 
+    def loadIntoMemory(self):
+        """
+        Copy the image into memory if it is memory mapped from a mosaic file.
+        """
+        if isinstance(self.numpy_data, numpy.ndarray) and not self.numpy_data.flags.owndata:
+            self.numpy_data = numpy.array(self.numpy_data)
+            self.pyramid = None
+
     def saveItem(self, directory, name_no_extension):
         """
         Save an ImageItem in a mosaic file.
@@ -153,9 +281,12 @@ class ImageItem(steveItems.SteveItem):
 
     def setContrast(self, pixmap_min, pixmap_max):
         """
-        Set the displayed pixmap's contrast.
+        Set the displayed pixmap's contrast. Only the visible images
+        will actually be re-drawn.
         """
-        self.dataToPixmap(pixmap_min, pixmap_max)
+        self.pixmap_min = pixmap_min
+        self.pixmap_max = pixmap_max
+        self.graphics_item.update()
 
     def setMagnification(self, obj_um_per_pixel):
         """
@@ -180,9 +311,9 @@ class ImageItem(steveItems.SteveItem):
         self.setPos()
 
     def setPos(self):
-        pixmap = self.graphics_item.pixmap()
-        x_pix = self.x_pix - (pixmap.width() * 0.5 / self.magnification)
-        y_pix = self.y_pix - (pixmap.height() * 0.5 / self.magnification)
+        [width, height] = self.getImageSize()
+        x_pix = self.x_pix - (width * 0.5 / self.magnification)
+        y_pix = self.y_pix - (height * 0.5 / self.magnification)
         self.graphics_item.setPos(x_pix + self.x_offset_pix, y_pix + self.y_offset_pix)
 
     def setTransform(self):
@@ -205,6 +336,13 @@ class ImageItemLoader(steveItems.SteveItemLoader):
         image_item.initializeWithDictionary(image_item_dict)
         return image_item
 
+    def loadData(self, numpy_data, metadata):
+        image_item_dict = dict(metadata)
+        image_item_dict["numpy_data"] = numpy_data
+        image_item = ImageItem()
+        image_item.initializeWithDictionary(image_item_dict)
+        return image_item
+
         
 class ImageItemLoaderHAL(object):
     """
@@ -305,7 +443,7 @@ class ImageItemLoaderHAL(object):
         #
         # FIXME: Untested.
         elif os.path.exists(no_ext_name + ".inf"):
-            xml = movieReader.infToStormXml(no_ext_name + ".inf")
+            xml = movieReader.infToStormXML(no_ext_name + ".inf")
 
         # Fail.
         else:
@@ -323,8 +461,14 @@ class ImageItemLoaderHAL(object):
         self.objectives.changeObjective(self.getObjectiveName(xml))
 
         # Load movie numpy data.
-        mv_reader = movieReader.inferReader(no_ext_name + getCameraExtension(xml) + xml.get("film.filetype"))
-        numpy_data = mv_reader.loadAFrame(frame_number)
+        #
+        # The movie is memory mapped (if it is a .dax file) so that we only read
+        # the frame we want. The frame is copied so that the image item does not
+        # keep the movie open.
+        #
+        mv_reader = movieReader.inferReader(no_ext_name + getCameraExtension(xml) + xml.get("film.filetype"),
+                                            use_memmap = True)
+        numpy_data = numpy.array(mv_reader.loadAFrame(frame_number))
         mv_reader.close()
 
         # Orient.
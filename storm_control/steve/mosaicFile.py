@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""
+Single file mosaic container.
+
+The file is laid out as:
+
+  header - 8 byte magic string followed by the (uint32) format version
+           and the (uint64) offset and size of the index.
+
+  images - The raw data of each image in C order.
+
+  index  - A JSON dictionary with the following keys:
+             "images" - For each image it's data type (i.e. "image"),
+                        offset in the file, dtype, shape and metadata.
+             "items" - For each of the other (text only) items it's
+                       data type and it's text.
+
+New images are appended to the end of the file followed by a new index.
+The old index is left as it is until the new one is on the disk, then
+the header is changed to point at the new one. This is a single small
+write, so if saving is interrupted the file still has a complete index,
+the old one. Images can be loaded lazily as numpy.memmap objects or in
+parallel into memory.
+
+Version 1 files (index offset in a footer) can still be read.
+
+Unlike the legacy .msc format (a text file plus one pickled .stv file
+per image) no pickle is involved, so loading a mosaic file cannot run
+arbitrary code.
+"""
+import concurrent.futures
+import json
+import numpy
+import os
+import struct
+
+
+extension = ".smc"
+magic = b"STEVEMSC"
+version = 2
+
+footer_size = 8 + len(magic)
+
+
+class MosaicFileException(Exception):
+    pass
+
+
+def getVersion(filename):
+    """
+    Returns the format version of a mosaic container file, or
+    None if filename is not a mosaic container file.
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "rb") as fp:
+        if (fp.read(len(magic)) != magic):
+            return None
+        return struct.unpack("<I", fp.read(4))[0]
+
+def isMosaicFile(filename):
+    """
+    Returns True if filename is a mosaic container file.
+    """
+    return (getVersion(filename) is not None)
+
+def jsonDefault(obj):
+    """
+    Convert numpy scalars in the metadata to Python types.
+    """
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+    raise TypeError("Cannot save " + str(type(obj)) + " in a mosaic file.")
+
+
+class MosaicFile(object):
+    """
+    Mosaic file reader / writer.
+
+    mode is one of:
+      'r' - Read an existing file.
+      'w' - Create a new file (over-writing any existing file).
+      'a' - Append images to an existing file. The text items are
+            not kept, the caller is expected to add all of them again.
+    """
+    def __init__(self, filename = None, mode = "r", **kwds):
+        super().__init__(**kwds)
+        self.file_version = version
+        self.filename = filename
+        self.fp = None
+        self.images = []
+        self.items = []
+        self.mode = mode
+        self.np_memmap = None
+
+        if (mode == "w"):
+            self.fp = open(filename, "wb")
+            self.fp.write(magic + struct.pack("<IQQ", version, 0, 0))
+
+        elif (mode in ["a", "r"]):
+            if (mode == "a"):
+                self.fp = open(filename, "r+b")
+            else:
+                self.fp = open(filename, "rb")
+            self.readIndex()
+
+            # New images are added after the old index. The file is
+            # never truncated as this is not possible on Windows if some
+            # of the images are memory mapped.
+            if (mode == "a"):
+                if (self.file_version != version):
+                    raise MosaicFileException("Cannot add to " + filename + ", it is version " + str(self.file_version))
+                self.fp.seek(0, os.SEEK_END)
+                self.items = []
+
+        else:
+            raise MosaicFileException("Unknown mode '" + str(mode) + "'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, value, traceback):
+        self.close()
+
+    def addImage(self, data_type, numpy_data, metadata):
+        """
+        Add an image with it's metadata (a JSON serializable dictionary).
+        """
+        assert (self.mode in ["a", "w"])
+        numpy_data = numpy.ascontiguousarray(numpy_data)
+        self.images.append({"data_type" : data_type,
+                            "dtype" : numpy_data.dtype.str,
+                            "metadata" : metadata,
+                            "offset" : self.fp.tell(),
+                            "shape" : list(numpy_data.shape)})
+        self.fp.write(numpy_data.tobytes())
+
+    def addItem(self, data_type, text):
+        """
+        Add a (text only) item, for example a position.
+        """
+        assert (self.mode in ["a", "w"])
+        self.items.append([data_type, text])
+
+    def close(self, write_index = True):
+        """
+        Set write_index to False to discard the changes, the file
+        then still has it's old index.
+        """
+        if self.fp is None:
+            return
+
+        if (self.mode in ["a", "w"]) and write_index:
+            index_offset = self.fp.tell()
+            index = json.dumps({"images" : self.images, "items" : self.items}, default = jsonDefault).encode("utf-8")
+            self.fp.write(index)
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+
+            # Point the header at the new index.
+            self.fp.seek(len(magic) + 4)
+            self.fp.write(struct.pack("<QQ", index_offset, len(index)))
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+        self.fp.close()
+        self.fp = None
+
+        # Any images that were loaded lazily keep the memory map open.
+        self.np_memmap = None
+
+    def getImages(self):
+        """
+        Returns a list of the image entries. Each entry is a dictionary.
+        """
+        return self.images
+
+    def getItems(self):
+        """
+        Returns a list of the text items as [data type, text] lists.
+        """
+        return self.items
+
+    def getNumberImages(self):
+        return len(self.images)
+
+    def loadImage(self, image, lazy = True):
+        """
+        Load an image, image is one of the entries from getImages(). If
+        lazy is True this returns a read-only view of a memory map of the
+        file, so nothing is actually read from the disk until the data is
+        used.
+        """
+        dtype = numpy.dtype(image["dtype"])
+        shape = tuple(image["shape"])
+        if lazy:
+
+            # All of the images are views of a single memory map of the file.
+            if self.np_memmap is None:
+                self.np_memmap = numpy.memmap(self.filename, dtype = numpy.uint8, mode = "r")
+            n_bytes = int(numpy.prod(shape)) * dtype.itemsize
+            start = image["offset"]
+            return self.np_memmap[start:start + n_bytes].view(dtype).reshape(shape)
+        else:
+            count = int(numpy.prod(shape))
+            with open(self.filename, "rb") as fp:
+                fp.seek(image["offset"])
+                numpy_data = numpy.fromfile(fp, dtype = dtype, count = count)
+            if (numpy_data.size != count):
+                raise MosaicFileException("Image data is truncated in " + self.filename)
+            return numpy_data.reshape(shape)
+
+    def loadImages(self, lazy = True, max_workers = 4):
+        """
+        Load all the images. If lazy is False they are read into memory
+        using max_workers threads.
+        """
+        if lazy:
+            return [self.loadImage(image) for image in self.images]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = max_workers) as executor:
+            return list(executor.map(lambda x: self.loadImage(x, lazy = False), self.images))
+
+    def readIndex(self):
+        """
+        Read the index.
+        """
+        if (self.fp.read(len(magic)) != magic):
+            raise MosaicFileException(self.filename + " is not a mosaic file.")
+        [self.file_version] = struct.unpack("<I", self.fp.read(4))
+        if (self.file_version > version):
+            raise MosaicFileException(self.filename + " is version " + str(self.file_version) + ", expected " + str(version) + " or less.")
+
+        if (self.file_version == 1):
+            self.fp.seek(-footer_size, os.SEEK_END)
+            footer = self.fp.read(footer_size)
+            if (footer[8:] != magic):
+                raise MosaicFileException(self.filename + " is incomplete or corrupt.")
+            [index_offset] = struct.unpack("<Q", footer[:8])
+            index_size = os.path.getsize(self.filename) - index_offset - footer_size
+        else:
+            [index_offset, index_size] = struct.unpack("<QQ", self.fp.read(16))
+            if (index_offset == 0):
+                raise MosaicFileException(self.filename + " is incomplete or corrupt.")
+
+        self.fp.seek(index_offset)
+        index = json.loads(self.fp.read(index_size).decode("utf-8"))
+        self.images = index["images"]
+        self.items = index["items"]
+
+    def setMetadata(self, index, metadata):
+        """
+        Change the metadata of an image, for example if it's contrast changed.
+        """
+        assert (self.mode in ["a", "w"])
+        self.images[index]["metadata"] = metadata
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
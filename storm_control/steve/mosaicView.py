@@ -88,6 +88,11 @@ class MosaicView(QtWidgets.QGraphicsView):
         self.setRubberBandSelectionMode(QtCore.Qt.IntersectsItemShape)
         self.setToolTip("Hot keys are 'space','3','5','7','9','g','p','s','h','y','n'")
 
+        # The image pixmaps are created when they are first drawn, at the
+        # resolution that matches the current scale, and then stored in
+        # the pixmap cache. This is the size of the cache in KB.
+        QtGui.QPixmapCache.setCacheLimit(256 * 1024)
+
         self.cursor_mode = 'Pointer' # The cursor mode controls how the mouse modifies the view. Possible values are Pointer, Drag, Select
 
     def dragEnterEvent(self, event):
@@ -13,18 +13,21 @@ import numpy
 import os
 import re
 import tifffile
+import warnings
 
 import storm_control.sc_library.parameters as parameters
 
 
-def inferReader(movie_filename, verbose = False):
+def inferReader(movie_filename, verbose = False, use_memmap = False):
     """
     Given a file name this will try to return the appropriate
     reader based on the file extension.
+
+    use_memmap is only relevant for .dax files, see DaxReader.
     """
     ext = os.path.splitext(movie_filename)[1]
     if (ext == ".dax"):
-        return DaxReader(movie_filename, verbose = verbose)
+        return DaxReader(movie_filename, verbose = verbose, use_memmap = use_memmap)
     elif (ext == ".tif") or (ext == ".tiff"):
         return TifReader(movie_filename, verbose = verbose)
     else:
@@ -142,9 +145,13 @@ class Reader(object):
 
      2. loadAFrame(self, frame_number)
         Load the requested frame and return it as numpy array.
+
+    Subclasses can also override loadFrames() if they have a
+    faster way to load a range of frames.
     """
     def __init__(self, filename, verbose = False):
         super(Reader, self).__init__()
+        self.chunk_size = 64 * 1024 * 1024
         self.filename = filename
         self.fileptr = None
         self.verbose = verbose
@@ -162,20 +169,7 @@ class Reader(object):
         """
         Average multiple frames in a movie.
         """
-        if (not start):
-            start = 0
-        if (not end):
-            end = self.number_frames 
-
-        length = end - start
-        average = numpy.zeros((self.image_height, self.image_width), numpy.float)
-        for i in range(length):
-            if self.verbose and ((i%10)==0):
-                print(" processing frame:", i, " of", self.number_frames)
-            average += self.loadAFrame(i + start)
-            
-        average = average/float(length)
-        return average
+        return self.projectFrames(start = start, end = end, projection = "mean")
 
     def close(self):
         if self.fileptr is not None:
@@ -198,12 +192,78 @@ class Reader(object):
         assert frame_number >= 0, "Frame_number must be greater than or equal to 0, it is " + str(frame_number)
         assert frame_number < self.number_frames, "Frame number must be less than " + str(self.number_frames)
 
+    def loadFrames(self, start = None, stop = None, step = None):
+        """
+        Load a range of frames, the range is specified as in a Python
+        slice. Returns a numpy array of shape (frames, height, width).
+
+        Sub-classes should override this if they can do something
+        better than loading the frames one at a time.
+        """
+        frames = range(*slice(start, stop, step).indices(self.number_frames))
+        stack = numpy.empty((len(frames), self.image_height, self.image_width), dtype = numpy.uint16)
+        for i, frame_number in enumerate(frames):
+            stack[i,:,:] = self.loadAFrame(frame_number)
+        return stack
+
+    def projectFrames(self, start = False, end = False, projection = "mean"):
+        """
+        Project multiple frames in a movie. projection is one of 'max',
+        'mean', 'min' or 'sum'. 'mean' and 'sum' return a numpy.float64
+        array, 'max' and 'min' return a numpy.uint16 array.
+
+        The frames are loaded in chunks of (roughly) self.chunk_size
+        bytes so that we don't need to load the entire movie into
+        memory, and also don't need to process one frame at a time.
+        """
+        if (not start):
+            start = 0
+        if (not end):
+            end = self.number_frames
+
+        assert (end > start), "No frames to project."
+        assert projection in ["max", "mean", "min", "sum"], "Unknown projection " + str(projection)
+
+        frame_bytes = 2 * self.image_height * self.image_width
+        chunk_frames = max(1, int(self.chunk_size / frame_bytes))
+
+        result = None
+        for i in range(start, end, chunk_frames):
+            if self.verbose:
+                print(" processing frame:", i - start, " of", end - start)
+            chunk = self.loadFrames(i, min(i + chunk_frames, end))
+            if (projection == "max"):
+                chunk_result = numpy.max(chunk, axis = 0)
+                if result is not None:
+                    numpy.maximum(result, chunk_result, out = result)
+            elif (projection == "min"):
+                chunk_result = numpy.min(chunk, axis = 0)
+                if result is not None:
+                    numpy.minimum(result, chunk_result, out = result)
+            else:
+                chunk_result = numpy.sum(chunk, axis = 0, dtype = numpy.float64)
+                if result is not None:
+                    result += chunk_result
+                    
+            if result is None:
+                result = numpy.array(chunk_result)
+
+        if (projection == "mean"):
+            result = result/float(end - start)
+        return result
+
 
 class DaxReader(Reader):
     """
     Dax reader class. This is a Zhuang lab custom format.
+
+    If use_memmap is True the movie is memory mapped with numpy.memmap()
+    and the frames returned by loadAFrame() and loadFrames() are read-only
+    views into the file, i.e. nothing is read until the data is used.
+    Big endian movies are the exception as these have to be byte swapped,
+    which means copying them.
     """
-    def __init__(self, filename, verbose = False):
+    def __init__(self, filename, verbose = False, use_memmap = False):
         super(DaxReader, self).__init__(filename, verbose = verbose)
         
         # save the filenames
@@ -213,6 +273,8 @@ class DaxReader(Reader):
         self.inf_filename = dirname + os.path.splitext(os.path.basename(filename))[0] + ".inf"
 
         # defaults
+        self.bigendian = 0
+        self.image_data = None
         self.image_height = None
         self.image_width = None
 
@@ -247,17 +309,50 @@ class DaxReader(Reader):
 
         # Open the dax file
         if os.path.exists(filename):
-            self.fileptr = open(filename, "rb")
+
+            # Don't trust the .inf file, the movie might be truncated (or
+            # still being written).
+            frame_bytes = self.image_height * self.image_width * 2
+            n_frames = os.path.getsize(filename) // frame_bytes
+            if (n_frames == 0):
+                raise IOError(filename + " does not contain any complete frames!")
+            if (n_frames < self.number_frames):
+                warnings.warn(filename + " only contains " + str(n_frames) + " of " + str(self.number_frames) + " frames.")
+                self.number_frames = n_frames
+
+            if use_memmap:
+                if self.bigendian:
+                    dtype = numpy.dtype(">u2")
+                else:
+                    dtype = numpy.dtype("<u2")
+                self.image_data = numpy.memmap(filename,
+                                               dtype = dtype,
+                                               mode = "r",
+                                               shape = (self.number_frames, self.image_height, self.image_width))
+            else:
+                self.fileptr = open(filename, "rb")
         else:
             if self.verbose:
                 print("dax data not found", filename)
 
+    def close(self):
+        super(DaxReader, self).close()
+
+        # Views of the memory map that are still in use will keep the file open.
+        self.image_data = None
+
     def loadAFrame(self, frame_number):
         """
         Load a frame & return it as a numpy array.
         """
         super(DaxReader, self).loadAFrame(frame_number)
 
+        if self.image_data is not None:
+            image_data = self.image_data[frame_number]
+            if self.bigendian:
+                image_data = image_data.astype(numpy.uint16)
+            return image_data
+
         self.fileptr.seek(frame_number * self.image_height * self.image_width * 2)
         image_data = numpy.fromfile(self.fileptr, dtype='uint16', count = self.image_height * self.image_width)
         image_data = numpy.reshape(image_data, [self.image_height, self.image_width])
@@ -265,6 +360,32 @@ class DaxReader(Reader):
             image_data.byteswap(True)
         return image_data
 
+    def loadFrames(self, start = None, stop = None, step = None):
+        """
+        Load a range of frames, the range is specified as in a Python
+        slice. Returns a numpy array of shape (frames, height, width).
+        """
+        if self.image_data is not None:
+            image_data = self.image_data[start:stop:step]
+            if self.bigendian:
+                image_data = image_data.astype(numpy.uint16)
+            return image_data
+
+        # Without a memory map we can read a contiguous range of frames
+        # with a single call to numpy.fromfile().
+        [start, stop, step] = slice(start, stop, step).indices(self.number_frames)
+        if (step != 1):
+            return super(DaxReader, self).loadFrames(start, stop, step)
+
+        n_frames = max(0, stop - start)
+        frame_size = self.image_height * self.image_width
+        self.fileptr.seek(start * frame_size * 2)
+        image_data = numpy.fromfile(self.fileptr, dtype='uint16', count = n_frames * frame_size)
+        image_data = numpy.reshape(image_data, [n_frames, self.image_height, self.image_width])
+        if self.bigendian:
+            image_data.byteswap(True)
+        return image_data
+
 
 class TifReader(Reader):
     """
@@ -190,7 +190,7 @@ class Window(QtWidgets.QMainWindow):
         mosaic_filename = QtWidgets.QFileDialog.getOpenFileName(self,
                                                                 "Load Mosaic",
                                                                 self.parameters.get("directory"),
-                                                                "*.msc")[0]
+                                                                "*.smc *.msc")[0]
         if mosaic_filename:
             self.loadMosaic(mosaic_filename)
 
@@ -243,7 +243,7 @@ class Window(QtWidgets.QMainWindow):
             self.image_capture.loadMovies(filenames_list, 0)
 
         # Check for mosaic files.
-        elif (file_type == '.msc'):
+        elif (file_type == '.smc') or (file_type == '.msc'):
             for filename in sorted(filenames_list):
                 self.loadMosaic(filename)
 
@@ -310,7 +310,7 @@ class Window(QtWidgets.QMainWindow):
         mosaic_filename = QtWidgets.QFileDialog.getSaveFileName(self,
                                                                 "Save Mosaic", 
                                                                 self.parameters.get("directory"),
-                                                                "*.msc")[0]
+                                                                "*.smc;;*.msc")[0]
         if mosaic_filename:
             self.item_store.saveMosaic(mosaic_filename)
 
@@ -10,6 +10,8 @@ import warnings
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
+import storm_control.steve.mosaicFile as mosaicFile
+
 
 item_id = 0
 
@@ -37,6 +39,22 @@ class SteveItem(object):
     def getItemID(self):
         return self.item_id
 
+    def getSaveData(self):
+        """
+        Sub-classes that have image data should override this to return
+        [numpy_data, metadata] for saving in a mosaic container file. The
+        metadata must be a JSON serializable dictionary. Items that
+        return None are saved using saveItem().
+        """
+        return None
+
+    def loadIntoMemory(self):
+        """
+        Sub-classes that load their data lazily from a mosaic container
+        file should override this to read it into memory.
+        """
+        pass
+
     def saveItem(self, directory, name_no_extension):
         """
         Sub-classes should override to specify how to save. At
@@ -61,6 +79,13 @@ class SteveItemLoader(object):
         current instance of SteveItemsStore().
         """
         assert False, "load() not implemented!"
+
+    def loadData(self, numpy_data, metadata):
+        """
+        This should load and return a SteveItem or None from data saved
+        in a mosaic container file, see SteveItem.getSaveData().
+        """
+        assert False, "loadData() not implemented!"
         
             
 class SteveItemsStore(object):
@@ -75,6 +100,12 @@ class SteveItemsStore(object):
         self.margin = 8000
         self.q_scene = QtWidgets.QGraphicsScene()
 
+        # The last mosaic container file that was loaded or saved, and
+        # the index of each of it's images keyed by item ID. This is
+        # used to only append new images when re-saving a mosaic.
+        self.mosaic_filename = None
+        self.mosaic_images = {}
+
     def addItem(self, item):
         """
         This will add the SteveItem to our data store and also to the
@@ -122,6 +153,66 @@ class SteveItemsStore(object):
         the different types of SteveItems specify the function to use in
         order to properly load a particular type of SteveItem.
         """
+        if mosaicFile.isMosaicFile(mosaic_filename):
+            return self.loadMosaicContainer(mosaic_filename)
+        else:
+            return self.loadMosaicLegacy(mosaic_filename)
+
+    def loadMosaicContainer(self, mosaic_filename):
+        """
+        Load a mosaic container file. The images are memory mapped, so
+        they are only read from the disk when they are drawn.
+        """
+        with mosaicFile.MosaicFile(mosaic_filename) as mf:
+            items = mf.getItems()
+            images = mf.getImages()
+            progress_bar = QtWidgets.QProgressDialog("Loading Files...",
+                                                     "Abort Load",
+                                                     0,
+                                                     len(items) + len(images))
+            progress_bar.setWindowModality(QtCore.Qt.WindowModal)
+
+            directory = os.path.dirname(mosaic_filename)
+            for i, [data_type, text] in enumerate(items):
+                progress_bar.setValue(i)
+                if progress_bar.wasCanceled():
+                    progress_bar.close()
+                    return False
+
+                if data_type in self.item_loaders:
+                    steve_item = self.item_loaders[data_type].load(directory, *text.split(","))
+                    if steve_item is not None:
+                        self.addItem(steve_item)
+                else:
+                    warnings.warn("No loading function for '" + data_type + "'")
+
+            mosaic_images = {}
+            for i, image in enumerate(images):
+                progress_bar.setValue(len(items) + i)
+                if progress_bar.wasCanceled():
+                    progress_bar.close()
+                    return False
+
+                data_type = image["data_type"]
+                if data_type in self.item_loaders:
+                    steve_item = self.item_loaders[data_type].loadData(mf.loadImage(image), image["metadata"])
+                    if steve_item is not None:
+                        self.addItem(steve_item)
+                        mosaic_images[steve_item.getItemID()] = i
+                else:
+                    warnings.warn("No loading function for '" + data_type + "'")
+
+        progress_bar.close()
+
+        # Later saves to the same file only need to add the new images.
+        self.mosaic_filename = os.path.abspath(mosaic_filename)
+        self.mosaic_images = mosaic_images
+        return True
+
+    def loadMosaicLegacy(self, mosaic_filename):
+        """
+        Load a .msc mosaic file, with the images saved in .stv files.
+        """
         # Figure out how many lines for a progress bar.
         line_count = 0
         with open(mosaic_filename) as fp:
@@ -140,6 +231,7 @@ class SteveItemsStore(object):
             for i, line in enumerate(fp):
                 progress_bar.setValue(i)
                 if progress_bar.wasCanceled():
+                    progress_bar.close()
                     return False
 
                 # Skip any blank lines.
@@ -155,6 +247,7 @@ class SteveItemsStore(object):
                 else:
                     warnings.warn("No loading function for '" + data_type + "'")
 
+        progress_bar.close()
         return True
 
     def removeItem(self, item_id):
@@ -176,7 +269,89 @@ class SteveItemsStore(object):
 
     def saveMosaic(self, mosaic_filename):
         """
-        Save the current SteveItems in mosaic file.
+        Save the current SteveItems in a mosaic file. This is a mosaic
+        container file unless the extension is '.msc'.
+        """
+        if (os.path.splitext(mosaic_filename)[1] == ".msc"):
+            self.saveMosaicLegacy(mosaic_filename)
+        else:
+            self.saveMosaicContainer(mosaic_filename)
+
+    def saveMosaicContainer(self, mosaic_filename):
+        """
+        Save the current SteveItems in a mosaic container file.
+
+        If this is the file that was last loaded or saved, and none of it's
+        images have been removed, then only the new images are written.
+
+        If the save is aborted the file is not changed.
+        """
+        mosaic_filename = os.path.abspath(mosaic_filename)
+        append = (mosaic_filename == self.mosaic_filename)
+        append = append and (mosaicFile.getVersion(mosaic_filename) == mosaicFile.version)
+        append = append and all(item_id in self.items for item_id in self.mosaic_images)
+
+        progress_bar = QtWidgets.QProgressDialog("Saving Files...",
+                                                 "Abort Save",
+                                                 0,
+                                                 len(self.items))
+        progress_bar.setWindowModality(QtCore.Qt.WindowModal)
+
+        directory = os.path.dirname(mosaic_filename)
+        name_no_extension = os.path.splitext(os.path.basename(mosaic_filename))[0]
+
+        # Otherwise we write a new file and then replace the old one,
+        # so that the old file is never left half written. Images that
+        # are memory mapped from the old file have to be read first.
+        if append:
+            mosaic_images = dict(self.mosaic_images)
+            mf = mosaicFile.MosaicFile(mosaic_filename, mode = "a")
+        else:
+            for elt in self.itemIterator():
+                elt.loadIntoMemory()
+            mosaic_images = {}
+            mf = mosaicFile.MosaicFile(mosaic_filename + ".tmp", mode = "w")
+
+        # The new index is only written if all the items were saved.
+        completed = False
+        try:
+            for i, elt in enumerate(self.itemIterator()):
+                progress_bar.setValue(i)
+                if progress_bar.wasCanceled():
+                    break
+
+                save_data = elt.getSaveData()
+                if save_data is not None:
+                    [numpy_data, metadata] = save_data
+                    if elt.getItemID() in mosaic_images:
+                        mf.setMetadata(mosaic_images[elt.getItemID()], metadata)
+                    else:
+                        mosaic_images[elt.getItemID()] = mf.getNumberImages()
+                        mf.addImage(elt.data_type, numpy_data, metadata)
+                else:
+                    line = elt.saveItem(directory, name_no_extension)
+                    if line is not None:
+                        mf.addItem(elt.data_type, line)
+            else:
+                completed = True
+        finally:
+            mf.close(write_index = completed)
+            progress_bar.close()
+            if not completed and not append:
+                os.remove(mosaic_filename + ".tmp")
+
+        if not completed:
+            return
+
+        if not append:
+            os.replace(mosaic_filename + ".tmp", mosaic_filename)
+        self.mosaic_filename = mosaic_filename
+        self.mosaic_images = mosaic_images
+
+    def saveMosaicLegacy(self, mosaic_filename):
+        """
+        Save the current SteveItems in a .msc mosaic file, with the
+        images saved in .stv files.
         """
         progress_bar = QtWidgets.QProgressDialog("Saving Files...",
                                                  "Abort Save",
@@ -0,0 +1,566 @@
+#!/usr/bin/env python
+"""
+Benchmark of HAL's frame hot path.
+
+This drives frames from the emulated camera (NoneCameraControl)
+through the same code that HAL uses for feeds, display rescaling,
+spot counting and saving movies, but without the rest of HAL. The
+camera, spot counter and film writer settings come from a HAL
+configuration file (hal4000/xml/none_config.xml by default) and the
+feeds come from an (optional) settings file with a 'feeds' section,
+for example test/hal/feed_test.xml.
+
+For each frame size, frame rate and file format this reports:
+
+ 1. The sustained frame rate, this is the number of frames divided
+    by the time from the first frame being acquired to the last
+    stage finishing with the last frame.
+
+ 2. The number of dropped frames (by the writers and the spot
+    counter) and the number of camera frame pool misses.
+
+ 3. The processing time and the latency (the time from the camera
+    thread creating the frame to the stage finishing with it) for
+    each stage in milliseconds.
+
+ 4. The memory high-water mark (RSS) in MB, if this is available.
+
+Usage:
+  python -m storm_control.test.hal.frameBenchmark --sizes 512 1024x512 --rates 50 100 --frames 500
+"""
+
+import argparse
+import gc
+import glob
+import numpy
+import os
+import sys
+import tempfile
+import time
+
+from PyQt5 import QtCore, QtGui
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.noneCameraControl as noneCameraControl
+import storm_control.hal4000.feeds.feeds as feeds
+import storm_control.hal4000.film.filmSettings as filmSettings
+import storm_control.hal4000.halLib.c_image_manipulation_c as c_image
+import storm_control.hal4000.halLib.imagewriters as imagewriters
+import storm_control.hal4000.spotCounter.findSpots as findSpots
+
+
+def currentMemory():
+    """
+    Returns the current resident set size in MB, or None if this
+    is not available (it is only available on Linux).
+    """
+    try:
+        with open("/proc/self/statm") as fp:
+            pages = int(fp.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def parseSize(size):
+    """
+    Convert a size string like '512' or '1024x512' to [x, y].
+    """
+    sizes = list(map(int, size.lower().split("x")))
+    if (len(sizes) == 1):
+        sizes.append(sizes[0])
+    return sizes
+
+def printResults(results):
+    """
+    Print the results of a single benchmark run.
+    """
+    print("size {0:d}x{1:d}, {2:.1f} fps requested, file type '{3:s}'".format(results["size"][0],
+                                                                               results["size"][1],
+                                                                               results["fps"],
+                                                                               results["filetype"]))
+    print("  {0:d} of {1:d} frames, acquired at {2:.1f} fps, sustained {3:.1f} fps".format(results["frames received"],
+                                                                                           results["frames"],
+                                                                                           results["acquired fps"],
+                                                                                           results["sustained fps"]))
+    print("  dropped: " + ", ".join(map(lambda x: "{0:s} {1:d}".format(x, results["dropped"][x]),
+                                        sorted(results["dropped"]))))
+    if results["memory peak"] is not None:
+        print("  memory: peak {0:.1f}MB, increase {1:.1f}MB".format(results["memory peak"],
+                                                                     results["memory increase"]))
+
+    print("  {0:30s} {1:>6s} {2:>10s} {3:>10s} {4:>10s} {5:>10s} {6:>10s}".format("stage", "count",
+                                                                                   "mean (ms)", "max (ms)",
+                                                                                   "lat. mean", "lat. p95",
+                                                                                   "lat. max"))
+    for name in sorted(results["stages"]):
+        stats = results["stages"][name]
+        values = []
+        for field in ["mean", "max", "latency mean", "latency p95", "latency max"]:
+            if stats[field] is None:
+                values.append("{0:>10s}".format("NA"))
+            else:
+                values.append("{0:10.3f}".format(stats[field]))
+        print("  {0:30s} {1:6d} ".format(name, stats["count"]) + " ".join(values))
+    print()
+
+def timestamp():
+    return time.perf_counter()
+
+
+class StageTimer(object):
+    """
+    Records the processing times and the latencies of a single
+    stage. This may be called from more than one thread.
+    """
+    def __init__(self, name = None, **kwds):
+        super().__init__(**kwds)
+        self.durations = []
+        self.latencies = []
+        self.name = name
+        self.t_last = None
+
+    def getStats(self):
+        """
+        Returns a dictionary with the number of frames, the mean and
+        maximum processing time, and the mean, 95th percentile and
+        maximum latency, all in milliseconds.
+        """
+        stats = {"count" : max(len(self.durations), len(self.latencies))}
+        for [name, values] in [["", self.durations], ["latency ", self.latencies]]:
+            if (len(values) > 0):
+                values = 1000.0 * numpy.array(values)
+                stats[name + "mean"] = float(numpy.mean(values))
+                stats[name + "max"] = float(numpy.max(values))
+                stats[name + "p95"] = float(numpy.percentile(values, 95))
+            else:
+                for field in ["mean", "max", "p95"]:
+                    stats[name + field] = None
+        return stats
+
+    def record(self, start, stop, t_acquired = None):
+        """
+        start is None if the stage processing time is not known,
+        t_acquired is None if the frame latency is not known.
+        """
+        if start is not None:
+            self.durations.append(stop - start)
+        if t_acquired is not None:
+            self.latencies.append(stop - t_acquired)
+        self.t_last = stop
+
+
+class FrameBenchmark(QtCore.QObject):
+    """
+    A single benchmark run at a fixed frame size, rate and file type.
+    """
+    def __init__(self,
+                 config = None,
+                 directory = None,
+                 display = True,
+                 feeds_parameters = None,
+                 filetype = None,
+                 fps = None,
+                 n_frames = None,
+                 size = None,
+                 spots = True,
+                 **kwds):
+        """
+        config - A HAL configuration (from params.config()).
+        directory - Where to save the movies.
+        display - Rescale frames for display.
+        feeds_parameters - The 'feeds' section of a settings file, or None.
+        filetype - The movie file type, or None to not save the frames.
+        fps - The camera frame rate.
+        n_frames - The number of frames to acquire.
+        size - The frame size as [x, y].
+        spots - Count spots.
+        """
+        super().__init__(**kwds)
+        self.feed_controller = None
+        self.filetype = filetype
+        self.fps = fps
+        self.memory = []
+        self.n_frames = n_frames
+        self.n_received = 0
+        self.size = size
+        self.spot_counter = None
+        self.stages = {}
+        self.t_acquired = {}
+        self.writers = []
+
+        modules = config.get("modules")
+
+        #
+        # Create the emulated camera. The chip size and the minimum exposure time
+        # are adjusted so that we can get the frame size and rate that we want.
+        #
+        self.camera_name = None
+        for module_name in modules.getAttrs():
+            module = modules.get(module_name)
+            if module.has("camera") and (module.get("camera").get("class_name") == "NoneCameraControl"):
+                self.camera_name = module_name
+                break
+        if self.camera_name is None:
+            raise Exception("No emulated camera found in the configuration.")
+
+        camera_config = modules.get(self.camera_name).get("camera").get("parameters").copy()
+        camera_config.set("chip_size", max(self.size))
+        camera_config.set("mean_pause", 0.001)
+        camera_config.set("min_exposure_time", min(0.010, 1.0/self.fps))
+
+        self.camera_control = noneCameraControl.NoneCameraControl(camera_name = self.camera_name,
+                                                                  config = camera_config,
+                                                                  is_master = True)
+        parameters = self.camera_control.getParameters().copy()
+        parameters.setv("x_end", self.size[0])
+        parameters.setv("y_end", self.size[1])
+        parameters.setv("exposure_time", 1.0/self.fps)
+        parameters.setv("saved", True)
+        self.camera_control.newParameters(parameters)
+
+        # This is called in the camera thread so that we know when each frame was created.
+        self.camera_control.newData.connect(self.handleNewData, QtCore.Qt.DirectConnection)
+
+        self.cam_fn = self.camera_control.getCameraFunctionality()
+        self.cam_fn.newFrames.connect(self.handleNewFrames)
+        self.functionalities = [self.cam_fn]
+
+        #
+        # Feeds.
+        #
+        if feeds_parameters is not None:
+            self.feed_controller = feeds.FeedController(parameters = feeds_parameters.copy())
+            for feed in self.feed_controller.getFeeds():
+                if (feed.getParameter("source") == self.camera_name):
+                    feed.setCameraFunctionality(self.cam_fn)
+                    feed.processFrame = self.timeFeed(feed.processFrame,
+                                                      self.addStage("feed " + feed.getFeedName()))
+                    self.functionalities.append(feed)
+
+        #
+        # Display.
+        #
+        if display:
+            self.display_range = [self.cam_fn.getParameter("default_min"),
+                                  self.cam_fn.getParameter("default_max")]
+            self.max_intensity = self.cam_fn.getParameter("max_intensity")
+            self.display_stage = self.addStage("display")
+            self.cam_fn.newFrames.connect(self.handleDisplay)
+
+        #
+        # Spot counter.
+        #
+        if spots:
+            sc_kwds = {"max_threads" : 4, "max_size" : 263000}
+            if modules.has("spotcounter"):
+                sc_config = modules.get("spotcounter").get("configuration")
+                for name in ["batch_size", "drop_policy", "engine", "max_pending", "max_threads", "max_size"]:
+                    if sc_config.has(name):
+                        sc_kwds[name] = sc_config.get(name)
+            self.spot_counter = findSpots.SpotCounter(**sc_kwds)
+            self.spot_counter.imageProcessed.connect(self.handleSpotsDone)
+            self.spot_stage = self.addStage("spots")
+            self.cam_fn.newFrames.connect(self.handleSpots)
+
+        #
+        # Writers, these use the same configuration as film.film.
+        #
+        self.film_settings = filmSettings.FilmSettings(basename = os.path.join(directory, "benchmark"),
+                                                       filetype = "" if filetype is None else filetype,
+                                                       film_length = self.n_frames)
+        if filetype is not None:
+            writer_config = None
+            if modules.has("film") and modules.get("film").has("configuration"):
+                film_config = modules.get("film").get("configuration")
+                writer_config = {"drop_frames" : film_config.get("writer_drop_frames", False),
+                                 "queue_depth" : film_config.get("writer_queue_depth", 0)}
+
+            for fn in self.functionalities:
+                if fn.getParameter("saved"):
+                    writer = imagewriters.createFileWriter(fn,
+                                                           self.film_settings,
+                                                           writer_config = writer_config)
+                    stage = self.addStage("writer " + fn.getCameraName())
+                    writer.writeFrames = self.timeWriter(writer.writeFrames, stage, (fn is self.cam_fn))
+                    self.writers.append(writer)
+
+        # Memory usage sampling.
+        self.memory_timer = QtCore.QTimer(self)
+        self.memory_timer.setInterval(20)
+        self.memory_timer.timeout.connect(self.handleMemoryTimer)
+
+    def addStage(self, name):
+        self.stages[name] = StageTimer(name = name)
+        return self.stages[name]
+
+    def cleanUp(self):
+        self.camera_control.cleanUp()
+        if self.feed_controller is not None:
+            self.feed_controller.disconnectFeeds()
+
+    def getResults(self):
+        """
+        Returns a dictionary with the results of the run.
+        """
+        results = {"dropped" : {"frame pool" : self.camera_control.frame_pool.getNumberMisses()},
+                   "filetype" : "none" if self.filetype is None else self.filetype,
+                   "fps" : self.fps,
+                   "frames" : self.n_frames,
+                   "frames received" : self.n_received,
+                   "memory increase" : None,
+                   "memory peak" : None,
+                   "size" : self.size,
+                   "stages" : {}}
+
+        # Frame rates.
+        results["acquired fps"] = 0.0
+        results["sustained fps"] = 0.0
+        if (len(self.t_acquired) > 1):
+            t_first = min(self.t_acquired.values())
+            t_last = max(self.t_acquired.values())
+            results["acquired fps"] = (len(self.t_acquired) - 1)/(t_last - t_first)
+
+            t_done = [stage.t_last for stage in self.stages.values() if stage.t_last is not None]
+            if (len(t_done) > 0):
+                results["sustained fps"] = self.n_received/(max(t_done) - t_first)
+
+        # Dropped frames.
+        if self.spot_counter is not None:
+            results["dropped"]["spots"] = self.spot_counter.dropped
+        for writer in self.writers:
+            results["dropped"]["writer " + writer.cam_fn.getCameraName()] = writer.getNumberDropped()
+
+        # Stages.
+        for name in self.stages:
+            results["stages"][name] = self.stages[name].getStats()
+
+        # Memory.
+        memory = [x for x in self.memory if x is not None]
+        if (len(memory) > 0):
+            results["memory peak"] = max(memory)
+            results["memory increase"] = max(memory) - memory[0]
+
+        return results
+
+    def getTAcquired(self, frame_number):
+        return self.t_acquired.get(frame_number, None)
+
+    def handleDisplay(self, frame_batch):
+        """
+        Like the display, we only show the most recent frame.
+        """
+        start = timestamp()
+        frame = frame_batch.getFrames()[-1]
+        w = frame.image_x
+        h = frame.image_y
+        [temp, image_min, image_max] = c_image.rescaleImage(frame.getData().reshape((h,w)),
+                                                            False,
+                                                            False,
+                                                            False,
+                                                            self.display_range,
+                                                            self.max_intensity)
+        q_image = QtGui.QImage(temp.data, w, h, QtGui.QImage.Format_Indexed8)
+        self.display_stage.record(start, timestamp(), self.getTAcquired(frame.frame_number))
+
+    def handleMemoryTimer(self):
+        self.memory.append(currentMemory())
+
+    def handleNewData(self, frames):
+        t_acquired = timestamp()
+        for frame in frames:
+            self.t_acquired[frame.frame_number] = t_acquired
+
+    def handleNewFrames(self, frame_batch):
+        self.n_received += len(frame_batch)
+
+    def handleSpots(self, frame_batch):
+        self.spot_counter.newFramesToAnalyze(self.camera_name,
+                                             frame_batch.getFrames(),
+                                             250)
+
+    def handleSpotsDone(self, frame_analysis):
+        self.spot_stage.record(None, timestamp(), self.getTAcquired(frame_analysis.getFrameNumber()))
+
+    def handleStopped(self):
+        self.event_loop.quit()
+
+    def run(self):
+        """
+        Acquire the frames and wait for all of the stages to finish.
+        """
+        self.memory.append(currentMemory())
+        self.memory_timer.start()
+
+        self.event_loop = QtCore.QEventLoop()
+        self.cam_fn.stopped.connect(self.handleStopped)
+        self.camera_control.startFilm(self.film_settings, True)
+        self.camera_control.startCamera()
+        self.event_loop.exec_()
+        self.camera_control.stopFilm()
+
+        # Wait for the spot counter to finish.
+        if self.spot_counter is not None:
+            while self.spot_counter.isBusy():
+                QtCore.QCoreApplication.processEvents()
+                time.sleep(0.001)
+            QtCore.QCoreApplication.processEvents()
+            self.spot_counter.cleanUp()
+
+        # Wait for the writers to finish.
+        for writer in self.writers:
+            writer.closeWriter()
+
+        self.memory_timer.stop()
+        self.memory.append(currentMemory())
+        self.cleanUp()
+
+    def timeFeed(self, process_frame, stage):
+        """
+        Wrap a feeds processFrame() method to record how long it took.
+        """
+        def timedProcessFrame(new_frame):
+            start = timestamp()
+            feed_frame = process_frame(new_frame)
+            stage.record(start, timestamp(), self.getTAcquired(new_frame.frame_number))
+            return feed_frame
+        return timedProcessFrame
+
+    def timeWriter(self, write_frames, stage, is_camera):
+        """
+        Wrap a writers writeFrames() method to record how long it took. This
+        may be called from the writer thread. Only frames directly from the
+        camera have a known latency.
+        """
+        def timedWriteFrames(frame_batch):
+            start = timestamp()
+            write_frames(frame_batch)
+            t_acquired = None
+            if is_camera:
+                t_acquired = self.getTAcquired(frame_batch.getLastFrameNumber())
+            stage.record(start, timestamp(), t_acquired)
+        return timedWriteFrames
+
+
+def benchmark(config_file = None,
+              directory = None,
+              display = True,
+              feeds_file = None,
+              filetypes = None,
+              keep = False,
+              n_frames = 200,
+              rates = None,
+              sizes = None,
+              spots = True,
+              verbose = True):
+    """
+    Run the benchmark for all combinations of frame sizes, frame rates
+    and file types and return a list of the results.
+    """
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        app = QtCore.QCoreApplication(sys.argv)
+
+    config = params.config(config_file)
+
+    feeds_parameters = None
+    if feeds_file is not None:
+        feeds_parameters = params.halParameters(feeds_file).get("feeds")
+
+    all_results = []
+    for size in sizes:
+        for fps in rates:
+            for filetype in filetypes:
+                frame_benchmark = FrameBenchmark(config = config,
+                                                 directory = directory,
+                                                 display = display,
+                                                 feeds_parameters = feeds_parameters,
+                                                 filetype = filetype,
+                                                 fps = fps,
+                                                 n_frames = n_frames,
+                                                 size = size,
+                                                 spots = spots)
+                frame_benchmark.run()
+                results = frame_benchmark.getResults()
+                all_results.append(results)
+                if verbose:
+                    printResults(results)
+
+                # Free the frames from this run so that they don't count against the next one.
+                frame_benchmark = None
+                gc.collect()
+
+                if not keep:
+                    for filename in glob.glob(os.path.join(directory, "benchmark*")):
+                        os.remove(filename)
+
+    return all_results
+
+
+if (__name__ == "__main__"):
+
+    default_config = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  "hal4000", "xml", "none_config.xml")
+
+    parser = argparse.ArgumentParser(description = 'HAL frame hot path benchmark.')
+    parser.add_argument('--config', dest='config', type=str, required=False, default=default_config,
+                        help = "The HAL configuration file to use, this must have an emulated camera.")
+    parser.add_argument('--feeds', dest='feeds', type=str, required=False, default=None,
+                        help = "A settings file with a 'feeds' section (optional).")
+    parser.add_argument('--sizes', dest='sizes', type=str, nargs='+', required=False,
+                        default=["256", "512", "1024", "2048"],
+                        help = "The frame sizes to test, either 'N' or 'NxM'. The x size must be a multiple of 4.")
+    parser.add_argument('--rates', dest='rates', type=float, nargs='+', required=False, default=[100.0],
+                        help = "The camera frame rates to test.")
+    parser.add_argument('--frames', dest='frames', type=int, required=False, default=200,
+                        help = "The number of frames in each test.")
+    parser.add_argument('--formats', dest='formats', type=str, nargs='+', required=False,
+                        default=imagewriters.availableFileFormats(False) + ["none"],
+                        help = "The file formats to test, 'none' means don't save.")
+    parser.add_argument('--directory', dest='directory', type=str, required=False, default=tempfile.gettempdir(),
+                        help = "Where to save the movies, this should be on the disk you want to test.")
+    parser.add_argument('--no-display', dest='display', action='store_false',
+                        help = "Don't rescale the frames for display.")
+    parser.add_argument('--no-spots', dest='spots', action='store_false',
+                        help = "Don't count spots.")
+    parser.add_argument('--keep', dest='keep', action='store_true',
+                        help = "Don't delete the movies.")
+
+    args = parser.parse_args()
+
+    filetypes = [None if (x == "none") else x for x in args.formats]
+    benchmark(config_file = args.config,
+              directory = args.directory,
+              display = args.display,
+              feeds_file = args.feeds,
+              filetypes = filetypes,
+              keep = args.keep,
+              n_frames = args.frames,
+              rates = args.rates,
+              sizes = list(map(parseSize, args.sizes)),
+              spots = args.spots)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2026 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
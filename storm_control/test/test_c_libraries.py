@@ -3,6 +3,40 @@
 Tests of the C libraries.
 """
 import numpy
+import pytest
+
+
+def lockSpot(size, dx, dy, sigma):
+    [x, y] = numpy.mgrid[0:size, 0:size]
+    x = x - (0.5 * size + dx)
+    y = y - (0.5 * size + dy)
+    image = 1000.0 * numpy.exp(-(x*x + y*y)/(2.0 * sigma * sigma))
+    return (numpy.random.poisson(100, size = (size, size)) + image).astype(numpy.uint16)
+
+
+def testAFLock():
+    """
+    Test that the Python autofocus lock fitter matches the C library.
+    """
+    import storm_control.sc_hardware.utility.af_lock_c as afLC
+
+    if afLC.af is None:
+        pytest.skip("The C af_lock library is not available.")
+
+    for downsample in [1, 2]:
+        afc = afLC.AFLockC(downsample = downsample, offset = 100.0)
+        afp = afLC.AFLockPy(downsample = downsample, offset = 100.0)
+        for [dx, dy] in [[1.3, -2.4], [0.0, 0.5], [-3.7, 2.2]]:
+            image1 = lockSpot(64, 0.0, 0.0, 6.0)
+            image2 = lockSpot(64, dx, dy, 6.0)
+            [cx, cy, c_success, c_mag] = afc.findOffsetU16NM(image1, image2)
+            [px, py, p_success, p_mag] = afp.findOffsetU16NM(image1, image2)
+            assert c_success and p_success
+            assert (abs(cx - px) < 1.0e-9)
+            assert (abs(cy - py) < 1.0e-9)
+            assert numpy.allclose(c_mag, p_mag, rtol = 1.0e-9)
+        afc.cleanup()
+        afp.cleanup()
 
 
 def testCImageManipulation():
@@ -29,8 +63,8 @@ def testCImageManipulation():
 
             # Convert to integer so that we don't have overflow issues when we
             # compare for differences between the two images.
-            c_nim = c_nim.astype(numpy.int)
-            py_nim = py_nim.astype(numpy.int)
+            c_nim = c_nim.astype(numpy.int64)
+            py_nim = py_nim.astype(numpy.int64)
 
             assert(c_image_min == py_image_min)
             assert(c_image_max == py_image_max)
@@ -86,9 +120,57 @@ def testLMMoment():
     lof.cleanUp()
 
 
+def testLMMomentNumpy():
+    import storm_control.hal4000.camera.frame as frame
+    import storm_control.hal4000.spotCounter.lmmObjectFinder as lof
+    
+    lof.initialize()
+
+    image_x = 200
+    image_y = 100
+
+    image = numpy.random.poisson(20, size = (image_y, image_x)).astype(numpy.uint16)
+    for i in range(40):
+        x = numpy.random.randint(image_x)
+        y = numpy.random.randint(image_y)
+        image[max(0,y-1):y+2, max(0,x-1):x+2] += 300
+
+    a_frame = frame.Frame(image.flatten(), 0, image_x, image_y, "na")
+
+    [x1, y1, n1] = lof.findObjects(a_frame, 50)
+    [x2, y2, n2] = lof.findObjects(a_frame, 50, use_numpy = True)
+    assert(n1 == n2)
+    assert(numpy.array_equal(x1, x2))
+    assert(numpy.array_equal(y1, y2))
+
+    lof.cleanUp()
+
+
+def testNumpyVersions():
+    import storm_control.hal4000.camera.frame as frame
+    import storm_control.hal4000.focusLock.focusQuality as fq
+    import storm_control.hal4000.halLib.c_image_manipulation_c as cIM
+
+    nim = numpy.random.randint(2000, size = (64,48)).astype(numpy.uint16)
+    a_frame = frame.Frame(nim.flatten(), 0, 48, 64, "na")
+    
+    assert(fq.imageGradient(a_frame) == fq.imageGradient(a_frame, use_numpy = True))
+
+    for transpose in [False, True]:
+        [c_nim, c_image_min, c_image_max] = cIM.rescaleImage(nim, True, False, transpose, [100, 1500], 1800)
+        [py_nim, py_image_min, py_image_max] = cIM.rescaleImage(nim, True, False, transpose, [100, 1500], 1800, True)
+        assert(numpy.array_equal(c_nim, py_nim))
+        assert(c_image_min == py_image_min)
+        assert(c_image_max == py_image_max)
+
+    
 if (__name__ == "__main__"):
+    testAFLock()
     testCImageManipulation()
+    testCorr2DGauss()
     testFocusQuality()
     testLMMoment()
+    testLMMomentNumpy()
+    testNumpyVersions()
     
     
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Test rendering camera frames for display.
+"""
+import numpy
+
+from PyQt5 import QtGui, QtWidgets
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.halLib.c_image_manipulation_c as c_image
+import storm_control.hal4000.qtWidgets.qtCameraGraphicsScene as qtCameraGraphicsScene
+
+
+def makeFrame(image_x, image_y, number = 0):
+    image = numpy.random.randint(100, 1000, size = image_x * image_y).astype(numpy.uint16)
+    return frame.Frame(image, number, image_x, image_y, "camera1")
+
+
+def test_render_frame_1():
+    """
+    Test rendering with and without binning.
+    """
+    a_frame = makeFrame(130, 90)
+    image = a_frame.getData().reshape(90, 130)
+    image[10, 20] = 4000
+    lut = [QtGui.qRgb(i, 0, 255 - i) for i in range(256)]
+
+    # No binning.
+    image_info = qtCameraGraphicsScene.renderFrame(a_frame,
+                                                   click_pos = (20, 10),
+                                                   color_lut = lut,
+                                                   display_range = (100, 1100))
+    q_image = image_info["q_image"]
+    assert (q_image.width() == 130) and (q_image.height() == 90)
+    assert (image_info["image_max"] == 4000)
+    assert (image_info["image_min"] == numpy.min(image))
+    assert (image_info["intensity_info"] == 4000)
+    assert (q_image.pixel(20, 10) == lut[255])
+
+    # Binning, this uses the maximum of each bin.
+    image_info = qtCameraGraphicsScene.renderFrame(a_frame,
+                                                   bin_size = 4,
+                                                   display_range = (100, 1100))
+    q_image = image_info["q_image"]
+    assert (image_info["bin_size"] == 4)
+    assert (q_image.width() == 32) and (q_image.height() == 22)
+    assert (image_info["image_max"] == 4000)
+    assert (image_info["image_min"] == numpy.min(image))
+
+    binned = image[:88,:128].reshape(22, 4, 32, 4).max(axis = (1, 3))
+    [expected, i_min, i_max] = c_image.rescaleImage(binned, False, False, False, (100, 1100), None)
+    for [x, y] in [[0, 0], [5, 2], [31, 21]]:
+        assert (QtGui.qGray(q_image.pixel(x, y)) == expected[y, x])
+
+    # Wrong size frame.
+    a_frame.image_x = 100
+    assert qtCameraGraphicsScene.renderFrame(a_frame) is None
+
+
+def test_render_worker_1(qtbot):
+    """
+    Test that the worker only renders the most recent frame.
+    """
+    render_worker = qtCameraGraphicsScene.RenderWorker()
+    rendered = []
+    render_worker.rw_signaler.imageReady.connect(lambda x : rendered.append(x["frame_number"]))
+
+    for i in range(20):
+        render_worker.render(makeFrame(512, 512, i), {"bin_size" : 2})
+    qtbot.waitUntil(lambda : not render_worker.isBusy(), timeout = 2000)
+    qtbot.wait(10)
+
+    assert (rendered[-1] == 19)
+    assert (len(rendered) + render_worker.getDropped() == 20)
+    assert (rendered == sorted(rendered))
+
+    # Frames are ignored after clean up.
+    render_worker.cleanUp()
+    render_worker.render(makeFrame(64, 64, 20), {})
+    assert not render_worker.isBusy()
+
+
+class FakeCamera(object):
+
+    def getChipSize(self):
+        return [1024, 1024]
+
+    def getFrameScale(self):
+        return [1, 1]
+
+    def getFrameZeroZero(self):
+        return [0, 0]
+
+    def getParameter(self, pname):
+        return 4096
+
+
+def test_camera_item_1(qtbot):
+    """
+    Test that the frame is binned to the view resolution.
+    """
+    scene = qtCameraGraphicsScene.QtCameraGraphicsScene()
+    view = QtWidgets.QGraphicsView(scene)
+    camera_item = qtCameraGraphicsScene.QtCameraGraphicsItem()
+    scene.addItem(camera_item)
+    camera_item.newConfiguration(FakeCamera())
+    view.scale(0.25, 0.25)
+    qtbot.addWidget(view)
+
+    camera_item.updateImageWithFrame(makeFrame(1024, 1024))
+    qtbot.waitUntil(lambda : camera_item.getImage() is not None, timeout = 2000)
+    assert (camera_item.getImage().width() == 1024//int(4.0/view.devicePixelRatioF()))
+
+    # Paint the binned image.
+    assert not view.grab().isNull()
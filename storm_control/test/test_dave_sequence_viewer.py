@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Test Dave's sequence model.
+"""
+import os
+import pytestqt
+import random
+
+import storm_control.test as test
+
+import storm_control.dave.daveActions as daveActions
+import storm_control.dave.sequenceViewer as sequenceViewer
+
+
+def bruteForceEstimates(model, start = 0):
+    est_time = 0
+    est_space = 0
+    for i, item in enumerate(model.dave_actions_cur):
+        if item.isValid():
+            if (i >= start):
+                est_time += item.getDaveAction().getDuration()
+            est_space += item.getDaveAction().getUsage()
+    return [est_time, est_space]
+
+
+def test_prefix_sum_1():
+    values = [random.randint(0, 100) for i in range(37)]
+    prefix_sum = sequenceViewer.PrefixSum()
+    for value in values:
+        prefix_sum.append(value)
+
+    for i in range(50):
+        index = random.randint(0, len(values) - 1)
+        values[index] = random.randint(0, 100)
+        prefix_sum.set(index, values[index])
+
+    for i in range(len(values) + 1):
+        assert (prefix_sum.prefix(i) == sum(values[:i]))
+    assert (prefix_sum.total() == sum(values))
+
+
+def test_sequence_model_1(qtbot):
+    """
+    Test that the time and size estimates are updated correctly.
+    """
+    filename = os.path.join(test.dataDirectory(), "sequence_model_1.xml")
+    with open(filename, "w") as fp:
+        fp.write("<sequence>\n")
+        for i in range(20):
+            fp.write("<branch name=\"b" + str(i) + "\">\n")
+            fp.write("<DAMoveStage><stage_x>" + str(i) + "</stage_x><stage_y>0.0</stage_y></DAMoveStage>\n")
+            fp.write("<DASetParameters><parameters type=\"int\">" + str(i%3) + "</parameters></DASetParameters>\n")
+            fp.write("<DADelay><delay>100</delay></DADelay>\n")
+            fp.write("</branch>\n")
+        fp.write("</sequence>\n")
+
+    model = sequenceViewer.parseSequenceFile(filename)
+    assert (model.getNumberItems() == 60)
+    assert (model.getRemainingTime() == 0)
+
+    # Validation.
+    model.setTestMode(True)
+    assert (model.getNumberItems() == 23)
+    for i in range(model.getNumberItems()):
+        model.getCurrentItem().getDaveAction().setDuration(i)
+        model.getCurrentItem().getDaveAction().setDiskUsage(2*i)
+        model.updateEstimates()
+        if ((i%5) == 0):
+            model.setCurrentItemValid(False)
+        assert (model.getRemainingTime(i) == bruteForceEstimates(model, i)[0])
+        model.getNextItem(False)
+    model.setTestMode(False)
+
+    # Run.
+    assert (model.getRunSize() == bruteForceEstimates(model)[1])
+    for i in range(model.getNumberItems()):
+        assert (model.getRemainingTime(i) == bruteForceEstimates(model, i)[0])
+
+    model.setAllValid(True)
+    assert (model.getRunSize() == bruteForceEstimates(model)[1])
+    assert (model.getRemainingTime(10) == bruteForceEstimates(model, 10)[0])
+
+
+def test_sequence_model_2(qtbot, monkeypatch):
+    """
+    Test that loading a sequence doesn't create the DaveActions.
+    """
+    filename = os.path.join(test.dataDirectory(), "sequence_model_2.xml")
+    with open(filename, "w") as fp:
+        fp.write("<sequence>\n")
+        fp.write("<DAValveProtocol>Hybridize</DAValveProtocol>\n")
+        fp.write("<DASetDirectory><directory>c:/data</directory></DASetDirectory>\n")
+        fp.write("<DACheckFocus><num_focus_checks>20</num_focus_checks></DACheckFocus>\n")
+        fp.write("<DAClearWarnings/>\n")
+        fp.write("<DAEmail><subject>done</subject><body>all done</body></DAEmail>\n")
+        fp.write("<DAFindSum><min_sum>100.0</min_sum></DAFindSum>\n")
+        fp.write("<DAMoveStage><stage_x>1.0</stage_x><stage_y>2.0</stage_y></DAMoveStage>\n")
+        fp.write("<DAPause/>\n")
+        fp.write("<DARecenterPiezo/>\n")
+        fp.write("<DASetFocusLockTarget><lock_target>0.5</lock_target></DASetFocusLockTarget>\n")
+        fp.write("<DASetParameters><parameters type=\"str\">p1</parameters></DASetParameters>\n")
+        fp.write("<DASetProgression><type>file</type><filename>prog.xml</filename></DASetProgression>\n")
+        fp.write("<DATakeMovie><name>movie</name><length>10</length><min_spots>5</min_spots>")
+        fp.write("<parameters>p1</parameters></DATakeMovie>\n")
+        fp.write("<DADelay><delay>100</delay></DADelay>\n")
+        fp.write("</sequence>\n")
+
+    created = []
+    original_init = daveActions.DaveAction.__init__
+    def countingInit(self):
+        created.append(self)
+        original_init(self)
+    monkeypatch.setattr(daveActions.DaveAction, "__init__", countingInit)
+
+    model = sequenceViewer.parseSequenceFile(filename)
+    assert (model.getNumberItems() == 14)
+    assert (len(created) == 0)
+
+    # The item labels must match those of the DaveActions.
+    for item in model.dave_actions_cur:
+        dave_action = item.getDaveAction()
+        assert (item.getDaveActionID() == dave_action.getID())
+        assert (item.getActionType() == dave_action.getActionType())
+        assert (item.text() == dave_action.getDescriptor())
+    assert (len(created) == 14)
+    assert (model.getActionTypes() == ["kilroy", "hal", "dave", "NA"])
+
+
+if (__name__ == "__main__"):
+    test_prefix_sum_1()
+    test_sequence_model_1(None)
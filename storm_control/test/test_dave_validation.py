@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+Test validating sequences in Dave with a stand-in for HAL.
+"""
+import os
+import pytestqt
+
+import storm_control.sc_library.hdebug as hdebug
+import storm_control.sc_library.parameters as params
+import storm_control.sc_library.tcpMessage as tcpMessage
+import storm_control.sc_library.tcpServer as tcpServer
+import storm_control.test as test
+
+import storm_control.dave.dave as dave
+
+
+class FakeHal(object):
+    """
+    Responds to test messages like HAL would.
+    """
+    def __init__(self, bad_x = None, batches = True, found_spots = None, **kwds):
+        """
+        bad_x - Reply with an error to moves to this stage x position.
+        found_spots - The response to 'Take Movie' messages.
+        """
+        super().__init__(**kwds)
+        self.bad_x = bad_x
+        self.batches = batches
+        self.found_spots = found_spots
+        self.received = []
+        self.server = tcpServer.TCPServer(port = 9000,
+                                          server_name = "HAL",
+                                          verbose = False)
+        self.server.messageReceived.connect(self.handleMessageReceived)
+
+    def close(self):
+        self.server.close()
+
+    def handleMessageReceived(self, tcp_message):
+        self.received.append(tcp_message)
+        if tcp_message.isType("Validate Batch"):
+            if self.batches:
+                responses = []
+                for message_dict in tcp_message.getData("messages"):
+                    message = tcpMessage.TCPMessage.fromDict(message_dict)
+                    self.respond(message)
+                    responses.append(message.toDict())
+                tcp_message.addResponse("messages", responses)
+            else:
+                tcp_message.setError(True, "This message was not handled.")
+        else:
+            self.respond(tcp_message)
+        self.server.sendMessage(tcp_message)
+
+    def respond(self, tcp_message):
+        tcp_message.addResponse("duration", 2.0)
+        if tcp_message.isType("Take Movie"):
+            tcp_message.addResponse("found_spots", self.found_spots)
+        elif tcp_message.isType("Move Stage") and (tcp_message.getData("stage_x") == self.bad_x):
+            tcp_message.setError(True, "Bad position.")
+
+
+def saveSequence(filename, stage_x, take_movie = False):
+    with open(filename, "w") as fp:
+        fp.write("<sequence>\n")
+        for x in stage_x:
+            fp.write("<DAMoveStage><stage_x>" + str(x) + "</stage_x><stage_y>0.0</stage_y></DAMoveStage>\n")
+        if take_movie:
+            fp.write("<DATakeMovie><name>movie</name><length>10</length><min_spots>20</min_spots></DATakeMovie>\n")
+        fp.write("<DASetParameters><parameters type=\"str\">p1</parameters></DASetParameters>\n")
+        fp.write("</sequence>\n")
+    return filename
+
+
+def validate(qtbot, mainw, fake_hal, filename):
+    mainw.newSequence(filename)
+    mainw.handleValidateCommandSequence(False)
+    qtbot.waitUntil(lambda : mainw.sequence_validated, timeout = 5000)
+    assert mainw.ui.commandSequenceTreeView.isAllValid()
+
+    # Dave disconnects from HAL at the end of validation.
+    qtbot.wait(100)
+    qtbot.waitUntil(lambda : not fake_hal.server.isConnected(), timeout = 5000)
+
+
+def test_dave_validation_1(qtbot):
+    """
+    Test batches and that only changed commands are re-validated.
+    """
+    parameters = params.parameters(test.daveXmlFilePathAndName("test_default.xml"))
+    hdebug.startLogging(test.logDirectory(), "dave")
+    mainw = dave.Dave(parameters)
+    qtbot.addWidget(mainw)
+    fake_hal = FakeHal()
+
+    # Four unique commands, sent as a single batch.
+    filename = saveSequence(os.path.join(test.dataDirectory(), "sequence_1.xml"), [0.0, 1.0, 2.0, 0.0])
+    validate(qtbot, mainw, fake_hal, filename)
+    assert (len(fake_hal.received) == 1)
+    assert (len(fake_hal.received[0].getData("messages")) == 4)
+    assert (mainw.ui.commandSequenceTreeView.getEstimates()[0] == 10.0)
+
+    # Nothing changed, so nothing is sent.
+    validate(qtbot, mainw, fake_hal, filename)
+    assert (len(fake_hal.received) == 1)
+    assert (mainw.ui.commandSequenceTreeView.getEstimates()[0] == 10.0)
+
+    # Only the new stage position is sent.
+    filename = saveSequence(os.path.join(test.dataDirectory(), "sequence_2.xml"), [0.0, 1.0, 3.0])
+    validate(qtbot, mainw, fake_hal, filename)
+    assert (len(fake_hal.received) == 2)
+    assert fake_hal.received[1].isType("Move Stage")
+
+    fake_hal.close()
+
+
+def test_dave_validation_2(qtbot):
+    """
+    Test validating one command at a time if HAL does not support batches.
+    """
+    parameters = params.parameters(test.daveXmlFilePathAndName("test_default.xml"))
+    hdebug.startLogging(test.logDirectory(), "dave")
+    mainw = dave.Dave(parameters)
+    qtbot.addWidget(mainw)
+    fake_hal = FakeHal(batches = False)
+
+    filename = saveSequence(os.path.join(test.dataDirectory(), "sequence_3.xml"), [0.0, 1.0, 2.0])
+    validate(qtbot, mainw, fake_hal, filename)
+    assert (len(fake_hal.received) == 5)
+    assert fake_hal.received[0].isType("Validate Batch")
+    assert (mainw.ui.commandSequenceTreeView.getEstimates()[0] == 8.0)
+
+    fake_hal.close()
+
+
+def test_dave_validation_3(qtbot, monkeypatch):
+    """
+    Test that the responses in a batch are checked by the commands.
+    """
+    parameters = params.parameters(test.daveXmlFilePathAndName("test_default.xml"))
+    hdebug.startLogging(test.logDirectory(), "dave")
+    mainw = dave.Dave(parameters)
+    qtbot.addWidget(mainw)
+    fake_hal = FakeHal(bad_x = 1.0, found_spots = 10)
+
+    # Don't show the warning dialog.
+    mainw.skip_warning = True
+    monkeypatch.setattr(mainw, "handleValidateCommandSequence", lambda x: None)
+
+    problems = []
+    monkeypatch.setattr(mainw, "handleInvalidItem", lambda x, y: problems.append(y))
+
+    filename = saveSequence(os.path.join(test.dataDirectory(), "sequence_4.xml"), [0.0, 1.0, 2.0], take_movie = True)
+    mainw.newSequence(filename)
+    mainw.running = True
+    mainw.test_mode = True
+    mainw.ui.commandSequenceTreeView.setTestMode(True)
+    mainw.validateAndStartTCP()
+    mainw.validateNext()
+    qtbot.waitUntil(lambda : mainw.sequence_validated, timeout = 5000)
+
+    # One batch with two errors, the second from DATakeMovie.handleReply().
+    assert (len(fake_hal.received) == 1)
+    assert (len(fake_hal.received[0].getData("messages")) == 5)
+    assert (len(problems) == 2)
+    assert ("1.0" in problems[0]) and ("Bad position." in problems[0])
+    assert ("movie" in problems[1]) and ("less than the target" in problems[1])
+    assert mainw.use_batches
+
+    qtbot.wait(100)
+    fake_hal.close()
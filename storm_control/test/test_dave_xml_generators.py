@@ -3,10 +3,13 @@
 Test Dave XML generators.
 """
 import os
+import pytestqt
 
 import storm_control.test as test
 
+import storm_control.dave.sequenceViewer as sequenceViewer
 import storm_control.dave.xml_generators.v1Generator as v1Generator
+import storm_control.dave.xml_generators.v2Generator as v2Generator
 
 
 def test_v1_1():
@@ -21,3 +24,55 @@ def test_v1_1():
 
     v1Generator.generate(None, input_xml, input_positions, output_xml)
 
+
+
+def test_v2_1(qtbot):
+    """
+    Test that a recipe with a loop over a positions file is expanded correctly
+    and that the result can be loaded by Dave without creating all the actions.
+    """
+    positions = os.path.join(test.dataDirectory(), "v2_generator_positions.txt")
+    with open(positions, "w") as fp:
+        for i in range(500):
+            fp.write(str(i) + ".0,0.0\n")
+
+    input_xml = os.path.join(test.dataDirectory(), "v2_generator_recipe.xml")
+    with open(input_xml, "w") as fp:
+        fp.write("<recipe>\n")
+        fp.write("<command_sequence>\n")
+        fp.write("<valve_protocol>Hybridize 1</valve_protocol>\n")
+        fp.write("<loop name = \"Position Loop\">\n")
+        fp.write("<item name = \"Movie\"></item>\n")
+        fp.write("</loop>\n")
+        fp.write("</command_sequence>\n")
+        fp.write("<item name = \"Movie\">\n")
+        fp.write("<movie>\n")
+        fp.write("<name increment = \"Yes\">movie</name>\n")
+        fp.write("<length>10</length>\n")
+        fp.write("<variable_entry name = \"Position Loop\"></variable_entry>\n")
+        fp.write("</movie>\n")
+        fp.write("</item>\n")
+        fp.write("<loop_variable name = \"Position Loop\">\n")
+        fp.write("<file_path>v2_generator_positions.txt</file_path>\n")
+        fp.write("</loop_variable>\n")
+        fp.write("</recipe>\n")
+
+    output_xml = os.path.join(test.dataDirectory(), "v2_generator_sequence.xml")
+    parser = v2Generator.XMLRecipeParser(xml_filename = input_xml,
+                                         output_filename = output_xml,
+                                         verbose = False)
+    assert (parser.parseXML() == output_xml)
+
+    # A valve protocol, then a move stage and a take movie for each position.
+    model = sequenceViewer.parseSequenceFile(output_xml)
+    assert (model.getNumberItems() == 1001)
+    assert (model.getActionTypes() == ["kilroy", "hal"])
+    assert all(x.dave_action is None for x in model.dave_actions_all)
+
+    item = model.dave_actions_all[-1]
+    assert (item.getParentName() == "movie_499")
+    assert (item.getDaveAction().getMessage().getData("name") == "movie_499")
+
+    # Validation only needs the valve protocol, the movie and the stage positions.
+    model.setTestMode(True)
+    assert (model.getNumberItems() == 502)
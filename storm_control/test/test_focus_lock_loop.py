@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Test the focus lock control loop.
+"""
+import threading
+import time
+
+from PyQt5 import QtCore
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.focusLock.lockLoop as lockLoop
+import storm_control.hal4000.focusLock.lockModes as lockModes
+
+
+class FakeQPD(QtCore.QObject):
+    """
+    The QPD offset is the distance of the z stage from 1.0 microns.
+    """
+    qpdUpdate = QtCore.pyqtSignal(dict)
+
+    def __init__(self, z_stage = None, **kwds):
+        super().__init__(**kwds)
+        self.n_polls = 0
+        self.z_stage = z_stage
+
+    def getOffset(self):
+        self.n_polls += 1
+        self.qpdUpdate.emit({"is_good" : True,
+                             "offset" : self.z_stage.z - 1.0,
+                             "sum" : 100.0})
+
+
+class FakeZStage(object):
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.threads = set()
+        self.z = 0.0
+
+    def getCenterPosition(self):
+        return 0.0
+
+    def getCurrentPosition(self):
+        return self.z
+
+    def goAbsolute(self, z):
+        self.z = z
+
+    def goRelative(self, dz):
+        self.threads.add(threading.get_ident())
+        self.z += dz
+
+    def recenter(self):
+        self.z = 0.0
+
+
+def makeLockMode(z_stage):
+    parameters = params.StormXMLObject()
+    lockModes.FindSumMixin.addParameters(parameters)
+    lockModes.LockedMixin.addParameters(parameters)
+    lockModes.ScanMixin.addParameters(parameters)
+    lock_mode = lockModes.JumpLockMode(parameters = parameters)
+    lock_mode.newParameters(parameters)
+    lock_mode.setZStageFunctionality(z_stage)
+    return lock_mode
+
+
+def test_lock_loop_1(qtbot):
+    """
+    Test that the loop locks in its own thread.
+    """
+    z_stage = FakeZStage()
+    qpd = FakeQPD(z_stage = z_stage)
+    lock_mode = makeLockMode(z_stage)
+
+    lock_loop = lockLoop.LockLoop()
+    lock_loop.setLockMode(lock_mode)
+    lock_loop.start(qpd)
+    qtbot.waitUntil(lambda : (lock_loop.getQPDState()[0] > 10), timeout = 2000)
+
+    with lockModes.LockMode.mutex:
+        lock_mode.startLockBehavior("locked", {"target" : 0.0})
+    qtbot.waitUntil(lambda : lock_mode.isGoodLock(), timeout = 2000)
+    assert (abs(z_stage.z - 1.0) < 0.02)
+
+    # The z stage should only have been moved from the loop thread.
+    assert (len(z_stage.threads) == 1)
+    assert not (threading.get_ident() in z_stage.threads)
+
+    [counter, qpd_state] = lock_loop.getQPDState()
+    assert (abs(qpd_state["offset"]) < 0.02)
+
+    lock_loop.cleanUp()
+    stats = lock_loop.getStatistics()
+    assert (stats["control"]["count"] == lock_loop.getQPDState()[0])
+    assert (stats["period"]["count"] > 10)
+
+
+def test_lock_loop_2(qtbot):
+    """
+    Test the fixed update period.
+    """
+    z_stage = FakeZStage()
+    qpd = FakeQPD(z_stage = z_stage)
+
+    lock_loop = lockLoop.LockLoop(update_period = 20)
+    lock_loop.setLockMode(makeLockMode(z_stage))
+    lock_loop.start(qpd)
+    qtbot.wait(500)
+    lock_loop.cleanUp()
+
+    stats = lock_loop.getStatistics()
+    assert (abs(stats["period"]["mean"] - 20.0) < 5.0)
+    assert (qpd.n_polls <= 27)
+
+
+def test_lock_loop_3(qtbot, qtlog):
+    """
+    Test that the loop does not depend on the GUI thread.
+    """
+    z_stage = FakeZStage()
+    qpd = FakeQPD(z_stage = z_stage)
+
+    lock_loop = lockLoop.LockLoop(update_period = 20)
+    lock_loop.setLockMode(makeLockMode(z_stage))
+    lock_loop.start(qpd)
+    qtbot.wait(200)
+
+    # Block the GUI thread.
+    time.sleep(0.3)
+    qtbot.wait(200)
+    lock_loop.cleanUp()
+
+    stats = lock_loop.getStatistics()
+    assert (stats["period"]["count"] > 25)
+    assert (stats["period"]["max"] < 100.0)
+    assert (stats["qpd"]["max"] < 100.0)
+
+    # The QPD is back in the main thread and the loop stopped cleanly.
+    assert (qpd.thread() == QtCore.QThread.currentThread())
+    assert not [record for record in qtlog.records if "Timers cannot" in record.message]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Test the focus quality metrics and the optimal lock scan.
+"""
+import numpy
+import scipy.ndimage
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.focusLock.focusQuality as focusQuality
+import storm_control.hal4000.focusLock.lockModes as lockModes
+
+
+def makeFrame(image, number = 0):
+    [image_y, image_x] = image.shape
+    return frame.Frame(image.astype(numpy.uint16).flatten(), number, image_x, image_y, "camera1")
+
+
+def makeImage(blur):
+    """
+    Some spots, more blur is worse focus.
+    """
+    numpy.random.seed(1)
+    image = numpy.zeros((128, 160))
+    image[numpy.random.randint(128, size = 100), numpy.random.randint(160, size = 100)] = 5000.0
+    image = scipy.ndimage.gaussian_filter(image, 1.0 + blur) + 100.0
+    return numpy.random.poisson(image)
+
+
+def test_focus_quality_1():
+    """
+    Test that the metrics are better for the sharper image.
+    """
+    sharp = makeFrame(makeImage(0.0))
+    blurred = makeFrame(makeImage(2.0))
+
+    # Whole frame gradient is the same as the original version.
+    assert numpy.allclose(focusQuality.gradient(focusQuality.focusImage(sharp)),
+                          focusQuality.imageGradientNumpy(sharp),
+                          rtol = 1.0e-5)
+
+    image = focusQuality.focusImage(sharp, roi_size = 64, subsample = 2)
+    assert (image.shape == (32, 32))
+    assert numpy.array_equal(image, sharp.getData().reshape(128, 160)[32:96:2,48:112:2])
+
+    for metric in focusQuality.metrics:
+        for [roi_size, subsample] in [[0, 1], [96, 1], [0, 2]]:
+            q_sharp = focusQuality.focusQuality(sharp, metric, roi_size, subsample)
+            q_blurred = focusQuality.focusQuality(blurred, metric, roi_size, subsample)
+            assert (q_sharp > q_blurred)
+
+
+def test_focus_scan_1():
+    """
+    Test finding the peak of a noisy gaussian.
+    """
+    numpy.random.seed(0)
+    for center in [-0.35, 0.0, 0.42]:
+        scan = focusQuality.FocusScan()
+        bracketed = False
+        z = -1.0
+        while not bracketed and (z < 1.0):
+            for i in range(5):
+                q = 1.0 + 0.5 * numpy.exp(-4.0 * (z - center)**2) + numpy.random.normal(scale = 0.005)
+                scan.addMeasurement(z + numpy.random.normal(scale = 0.001), q)
+            bracketed = scan.nextStep()
+            z += 0.1
+        assert bracketed
+        assert (scan.getNumberSteps() < 20)
+        assert (abs(scan.fitPeak() - center) < 0.05)
+        assert (abs(scan.fitPeakGaussian() - center) < 0.05)
+
+    # Noise is not a peak.
+    scan = focusQuality.FocusScan()
+    for z in numpy.arange(-1.0, 1.0, 0.1):
+        for i in range(5):
+            scan.addMeasurement(z, 1.0 + numpy.random.normal(scale = 0.01))
+        assert not scan.nextStep()
+
+
+class FakeZStage(object):
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.z = 0.0
+
+    def getCenterPosition(self):
+        return 0.0
+
+    def getCurrentPosition(self):
+        return self.z
+
+    def goRelative(self, dz):
+        self.z += dz
+
+
+def test_optimal_lock_1():
+    """
+    Test that the optimal lock scan stops early at the best focus.
+    """
+    parameters = params.StormXMLObject()
+    lockModes.FindSumMixin.addParameters(parameters)
+    lockModes.LockedMixin.addParameters(parameters)
+    lockModes.ScanMixin.addParameters(parameters)
+    lock_mode = lockModes.OptimalLockMode(parameters = parameters)
+    parameters.setv("optimal_mode.quality_metric", "laplacian")
+    parameters.setv("optimal_mode.scan_hold", 2)
+    parameters.setv("optimal_mode.subsample", 2)
+    lock_mode.newParameters(parameters)
+
+    z_stage = FakeZStage()
+    lock_mode.setZStageFunctionality(z_stage)
+    lock_mode.handleQPDUpdate({"is_good" : True, "offset" : 0.0, "sum" : 100.0})
+    lock_mode.startLock()
+    lock_mode.startFilm()
+
+    # The best focus is at z = 0.3 microns.
+    images = {}
+    for i in range(200):
+        lock_mode.handleQPDUpdate({"is_good" : True, "offset" : z_stage.z, "sum" : 100.0})
+        blur = round(4.0 * abs(z_stage.z - 0.3), 2)
+        if not blur in images:
+            images[blur] = makeImage(blur)
+        lock_mode.handleNewFrame(makeFrame(images[blur], i))
+        if lock_mode.amLocked():
+            break
+
+    # The scan should stop soon after it passes the peak.
+    assert lock_mode.amLocked()
+    assert (i < 20)
+    assert (abs(lock_mode.getLockTarget() - 0.3) < 0.05)
+
+
+if (__name__ == "__main__"):
+    test_focus_quality_1()
+    test_focus_scan_1()
+    test_optimal_lock_1()
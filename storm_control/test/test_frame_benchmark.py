@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""
+Test of the frame hot path benchmark.
+"""
+import os
+
+import storm_control.test as test
+import storm_control.test.hal.frameBenchmark as frameBenchmark
+
+
+def test_frame_benchmark_1():
+    """
+    Test that all the frames make it through each stage and are saved.
+    """
+    n_frames = 20
+    [results] = frameBenchmark.benchmark(config_file = test.halXmlFilePathAndName("none_classic_config.xml"),
+                                         directory = test.dataDirectory(),
+                                         feeds_file = test.halXmlFilePathAndName("feed_test.xml"),
+                                         filetypes = [".dax"],
+                                         keep = True,
+                                         n_frames = n_frames,
+                                         rates = [50.0],
+                                         sizes = [[256, 256]],
+                                         verbose = False)
+
+    assert (results["frames received"] == n_frames)
+    assert (results["sustained fps"] > 0.0)
+    for name in ["display", "feed slice1", "writer camera1", "writer camera1.slice1"]:
+        assert (results["stages"][name]["count"] == n_frames)
+    assert (results["stages"]["spots"]["count"] + results["dropped"]["spots"] == n_frames)
+    assert (results["dropped"]["writer camera1"] == 0)
+
+    # The slice feed is 128 x 128.
+    movie_size = os.path.getsize(os.path.join(test.dataDirectory(), "benchmark_slice1.dax"))
+    assert (movie_size == n_frames * 128 * 128 * 2)
+
+
+if (__name__ == "__main__"):
+    test_frame_benchmark_1()
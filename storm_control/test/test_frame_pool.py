@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Tests of the frame pool.
+"""
+import numpy
+
+import storm_control.sc_library.framePool as framePool
+
+
+def test_frame_pool_1():
+    """
+    Test that buffers are recycled once they are no longer used.
+    """
+    pool = framePool.FramePool(frame_size = 16, n_buffers = 2)
+
+    b1 = pool.getBuffer()
+    b2 = pool.getBuffer()
+    assert (pool.getNumberInUse() == 2)
+    assert not (b1 is b2)
+
+    # Release b1, we should get it back.
+    b1_id = id(b1)
+    del b1
+    assert (pool.getNumberInUse() == 1)
+    b3 = pool.getBuffer()
+    assert (id(b3) == b1_id)
+    assert (pool.getNumberBuffers() == 2)
+
+
+def test_frame_pool_2():
+    """
+    Test that views keep buffers in use.
+    """
+    pool = framePool.FramePool(frame_size = 16, n_buffers = 1)
+
+    view = pool.getBuffer().reshape((4,4))[1:3,1:3]
+    assert (pool.getNumberInUse() == 1)
+
+    # The pool should grow.
+    b2 = pool.getBuffer()
+    assert not numpy.may_share_memory(view, b2)
+    assert (pool.getNumberBuffers() == 2)
+
+    del view
+    assert (pool.getNumberInUse() == 1)
+
+
+def test_frame_pool_3():
+    """
+    Test pool size limit.
+    """
+    pool = framePool.FramePool(frame_size = 16, max_buffers = 2, n_buffers = 1)
+
+    buffers = []
+    for i in range(4):
+        buffers.append(pool.getBuffer())
+    assert (pool.getNumberBuffers() == 2)
+    assert (pool.getNumberMisses() == 2)
+
+    # Resizing.
+    pool.resize(32)
+    assert (pool.getBuffer().size == 32)
+    assert (buffers[0].size == 16)
+
+
+if (__name__ == "__main__"):
+    test_frame_pool_1()
+    test_frame_pool_2()
+    test_frame_pool_3()
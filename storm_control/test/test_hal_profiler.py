@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Tests of the HAL message profiler.
+"""
+import numpy
+import os
+
+import storm_control.hal4000.halLib.halMessage as halMessage
+import storm_control.hal4000.halLib.halProfiler as halProfiler
+import storm_control.hal4000.profiler.profiler as profiler
+import storm_control.sc_library.tcpMessage as tcpMessage
+
+import storm_control.test as test
+
+
+class FakeMessage(object):
+
+    def __init__(self, m_id, m_type):
+        self.m_id = m_id
+        self.m_type = m_type
+        self.t_queued = halProfiler.timestamp()
+        self.t_sent = self.t_queued + 0.001
+
+    def getSourceName(self):
+        return "core"
+
+
+class FakeModule(object):
+    module_name = "tcp_control"
+
+
+class FakeParams(object):
+
+    def has(self, name):
+        return False
+
+
+def test_ring_buffer_1():
+    """
+    Test that the oldest records are overwritten.
+    """
+    ring = halProfiler.RingBuffer(dtype = numpy.int64, size = 5)
+    for i in range(8):
+        ring.add(i)
+
+    assert (ring.getNumberAdded() == 8)
+    assert numpy.array_equal(ring.getData(), numpy.arange(3, 8))
+
+
+def test_profiler_1():
+    """
+    Test module handling statistics.
+    """
+    profiler = halProfiler.startProfiling(size = 100)
+    try:
+        for i in range(10):
+            message = FakeMessage(i, "new parameters")
+            start = halProfiler.timestamp()
+            halProfiler.recordHandled(message, "camera1", start - 0.002)
+            halProfiler.recordHandled(message, "display", start, worker = True)
+            halProfiler.recordMessage(message)
+
+        stats = profiler.getHandlingStats()
+        assert (stats["camera1"]["count"] == 10)
+        assert (stats["camera1"]["mean"] > stats["display"]["mean"])
+        assert (stats["camera1"]["mean"] >= 2.0)
+
+        stats = profiler.getMessageStats()
+        assert (stats["new parameters"]["count"] == 10)
+
+        [counts, bins] = profiler.getHistogram(module_name = "camera1")
+        assert (numpy.sum(counts) == 10)
+    finally:
+        halProfiler.stopProfiling()
+
+    assert not halProfiler.isProfiling()
+
+
+def test_profiler_2():
+    """
+    Test saving a trace.
+    """
+    profiler = halProfiler.HalProfiler(size = 10)
+    for i in range(20):
+        message = FakeMessage(i, "test")
+        start = halProfiler.timestamp()
+        profiler.addHandled(message, "camera1", start, start + 0.001, False)
+        profiler.addMessage(message, start + 0.002)
+
+    csv_name = os.path.join(test.dataDirectory(), "profile.csv")
+    profiler.saveTrace(csv_name)
+    with open(csv_name) as fp:
+        assert (len(fp.readlines()) == 21)
+
+    npz_name = os.path.join(test.dataDirectory(), "profile.npz")
+    profiler.saveTrace(npz_name)
+    data = numpy.load(npz_name)
+    assert (data["handled"].size == 10)
+    assert (data["handled"]["m_id"][0] == 10)
+
+
+def test_profiler_3(qtbot):
+    """
+    Test querying the histograms with HAL and TCP messages.
+    """
+    halMessage.initializeMessages()
+    profiler_module = profiler.Profiler(module_name = "profiler",
+                                        module_params = FakeParams())
+    try:
+        for i in range(10):
+            message = FakeMessage(i, "new parameters")
+            start = halProfiler.timestamp()
+            halProfiler.recordHandled(message, "camera1", start - 0.002)
+            halProfiler.recordHandled(FakeMessage(i, "start film"), "display", start)
+
+        validator = halMessage.valid_messages["get histogram"]
+        for [data, total] in [[None, 20],
+                              [{"module name" : "camera1"}, 10],
+                              [{"message type" : "start film"}, 10],
+                              [{"module name" : "camera1", "message type" : "start film"}, 0]]:
+            message = halMessage.HalMessage(m_type = "get histogram",
+                                            data = data,
+                                            source = FakeModule())
+            halMessage.validateData(validator["data"], message)
+            profiler_module.processMessage(message)
+
+            response = message.getResponses()[0]
+            halMessage.validateResponse(validator["resp"], message, response)
+            assert (sum(response.getData()["counts"]) == total)
+            assert (len(response.getData()["bins"]) == len(response.getData()["counts"]) + 1)
+
+        tcp_message = tcpMessage.TCPMessage(message_type = "Get Histogram",
+                                            message_data = {"module_name" : "display"})
+        message = halMessage.HalMessage(m_type = "tcp message",
+                                        data = {"tcp message" : tcp_message},
+                                        source = FakeModule())
+        profiler_module.processMessage(message)
+        assert message.getResponses()[0].getData()["handled"]
+        assert (sum(tcp_message.getResponse("counts")) == 10)
+
+        # The response must survive the trip to the client.
+        tcp_message = tcpMessage.TCPMessage.fromJSON(tcp_message.toJSON())
+        assert (len(tcp_message.getResponse("bins")) == 29)
+    finally:
+        profiler_module.cleanUp(None)
+
+    assert not halProfiler.isProfiling()
+
+
+if (__name__ == "__main__"):
+    test_ring_buffer_1()
+    test_profiler_1()
+    test_profiler_2()
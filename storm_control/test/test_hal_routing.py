@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Tests of HAL core message routing.
+"""
+from PyQt5 import QtCore
+
+import storm_control.hal4000.hal4000 as hal4000
+import storm_control.hal4000.halLib.halModule as halModule
+
+
+class FakeCore(QtCore.QObject):
+    """
+    Just the routing part of HalCore.
+    """
+    getRecipients = hal4000.HalCore.getRecipients
+    handleSubscriptionsChanged = hal4000.HalCore.handleSubscriptionsChanged
+
+    def __init__(self, modules, **kwds):
+        super().__init__(**kwds)
+        self.modules = modules
+        self.routes = {}
+        for module in self.modules:
+            module.subscriptionsChanged.connect(self.handleSubscriptionsChanged)
+
+
+def makeModules():
+    modules = []
+    for i, subscriptions in enumerate([None, {"start film"}, {"stop film", "new frame"}, set()]):
+        module = halModule.HalModule(module_name = "module" + str(i))
+        module.subscriptions = subscriptions
+        modules.append(module)
+    return modules
+
+
+def uncached(modules, m_type):
+    return [x for x in modules if x.isSubscribed(m_type)]
+
+
+def test_hal_routing_1():
+    """
+    Test that the cached routes match the uncached ones.
+    """
+    modules = makeModules()
+    core = FakeCore(modules)
+
+    m_types = ["start film", "stop film", "new frame", "configuration"]
+    for i in range(2):
+        for m_type in m_types:
+            assert (core.getRecipients(m_type) == uncached(modules, m_type))
+    assert (sorted(core.routes) == sorted(m_types))
+    assert ([x.module_name for x in core.getRecipients("stop film")] == ["module0", "module2"])
+
+
+def test_hal_routing_2():
+    """
+    Test that the cache is invalidated when modules change their subscriptions.
+    """
+    modules = makeModules()
+    core = FakeCore(modules)
+
+    assert not (modules[3] in core.getRecipients("start film"))
+    modules[3].subscribe("start film")
+    assert (core.routes == {})
+    assert (modules[3] in core.getRecipients("start film"))
+
+    assert (modules[1] in core.getRecipients("start film"))
+    modules[1].unsubscribe("start film")
+    assert (core.getRecipients("start film") == uncached(modules, "start film"))
+    assert not (modules[1] in core.getRecipients("start film"))
+
+    assert not (modules[2] in core.getRecipients("configuration"))
+    modules[2].setSubscriptions(None)
+    assert (modules[2] in core.getRecipients("configuration"))
+    modules[2].setSubscriptions(["new frame"])
+    assert not (modules[2] in core.getRecipients("configuration"))
+
+    for m_type in ["start film", "stop film", "new frame", "configuration"]:
+        assert (core.getRecipients(m_type) == uncached(modules, m_type))
+
+
+if (__name__ == "__main__"):
+    test_hal_routing_1()
+    test_hal_routing_2()
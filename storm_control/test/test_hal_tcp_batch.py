@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Test validating a batch of TCP messages with a single 'Validate Batch' message.
+"""
+import pytestqt
+
+from PyQt5 import QtCore
+
+import storm_control.sc_library.tcpMessage as tcpMessage
+
+import storm_control.hal4000.tcpControl.tcpControl as tcpControl
+
+import storm_control.test as test
+
+
+class FakeServer(QtCore.QObject):
+    """
+    Stands in for tcpServer.TCPServer.
+    """
+    comGotConnection = QtCore.pyqtSignal()
+    comLostConnection = QtCore.pyqtSignal()
+    messageReceived = QtCore.pyqtSignal(object)
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.sent = []
+
+    def sendMessage(self, tcp_message):
+        self.sent.append(tcp_message)
+
+
+class FakeTCPControl(QtCore.QObject):
+    """
+    Stands in for the TCPControl module, this handles the actions one at a time.
+    """
+    def __init__(self, controller = None, **kwds):
+        super().__init__(**kwds)
+        self.control_action = None
+        self.controller = controller
+        self.controller.controlAction.connect(self.handleControlAction)
+        self.n_actions = 0
+
+    def finalizeControlAction(self):
+        self.controller.actionDone(self.control_action)
+        self.control_action = None
+
+    def handleControlAction(self, action):
+        assert (self.control_action is None)
+        self.control_action = action
+        self.n_actions += 1
+        action.tcp_message.addResponse("duration", 1.0)
+        action.was_handled = True
+        QtCore.QTimer.singleShot(10, self.finalizeControlAction)
+
+
+def test_hal_tcp_batch_1(qtbot):
+    server = FakeServer()
+    controller = tcpControl.Controller(server = server, verbose = False)
+    tcp_control = FakeTCPControl(controller = controller)
+
+    messages = [tcpMessage.TCPMessage(message_type = "Set Directory",
+                                      message_data = {"directory" : test.dataDirectory()},
+                                      test_mode = True),
+                tcpMessage.TCPMessage(message_type = "Move Stage",
+                                      message_data = {"stage_x" : 1.0, "stage_y" : 0.0},
+                                      test_mode = True),
+                tcpMessage.TCPMessage(message_type = "Move Stage",
+                                      message_data = {"stage_x" : 2.0, "stage_y" : 0.0},
+                                      test_mode = True),
+                tcpMessage.TCPMessage(message_type = "Set Directory",
+                                      message_data = {"directory" : "/no/such/directory"},
+                                      test_mode = True),
+                tcpMessage.TCPMessage(message_type = "Move Stage",
+                                      message_data = {"stage_x" : 3.0, "stage_y" : 0.0},
+                                      test_mode = False)]
+
+    batch = tcpMessage.TCPMessage(message_type = "Validate Batch",
+                                  message_data = {"messages" : [x.toDict() for x in messages]},
+                                  test_mode = True)
+
+    server.messageReceived.emit(tcpMessage.TCPMessage.fromJSON(batch.toJSON()))
+    qtbot.waitUntil(lambda : (len(server.sent) == 1), timeout = 2000)
+
+    # The response is a single message.
+    response = server.sent[0]
+    assert (response.getID() == batch.getID())
+    assert not response.hasError()
+    assert (tcp_control.n_actions == 2)
+
+    responses = [tcpMessage.TCPMessage.fromDict(x) for x in response.getResponse("messages")]
+    assert ([x.getID() for x in responses] == [x.getID() for x in messages])
+    assert ([x.hasError() for x in responses] == [False, False, False, True, True])
+    assert (responses[1].getResponse("duration") == 1.0)
+
+    # Only test messages can be batched.
+    batch.setTestMode(False)
+    server.messageReceived.emit(tcpMessage.TCPMessage.fromJSON(batch.toJSON()))
+    assert (len(server.sent) == 2)
+    assert server.sent[1].hasError()
+
+
+def test_hal_tcp_queue_1(qtbot):
+    """
+    Test that messages which arrive before the response to the previous
+    message are queued and handled one at a time.
+    """
+    server = FakeServer()
+    controller = tcpControl.Controller(server = server, verbose = False)
+    tcp_control = FakeTCPControl(controller = controller)
+
+    messages = []
+    for i in range(3):
+        messages.append(tcpMessage.TCPMessage(message_type = "Move Stage",
+                                              message_data = {"stage_x" : float(i), "stage_y" : 0.0}))
+        server.messageReceived.emit(messages[-1])
+    assert (tcp_control.n_actions == 1)
+
+    qtbot.waitUntil(lambda : (len(server.sent) == 3), timeout = 2000)
+    assert (tcp_control.n_actions == 3)
+    assert ([x.getID() for x in server.sent] == [x.getID() for x in messages])
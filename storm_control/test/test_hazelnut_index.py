@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Test the Hazelnut directory index.
+"""
+import os
+import sqlite3
+
+import storm_control.hazelnut.dirIndex as dirIndex
+
+
+def makeTree(root):
+    """
+    Make some movies in some directories, with 'old' time stamps.
+    """
+    for day in ["day1", "day2", os.path.join("day2", "sample1")]:
+        os.makedirs(os.path.join(root, day))
+        for i in range(3):
+            for ext in [".dax", ".inf", ".xml"]:
+                with open(os.path.join(root, day, "movie_" + str(i) + ext), "w") as fp:
+                    fp.write("data " + str(i))
+    for [path, dirs, files] in os.walk(root):
+        for name in files + dirs:
+            os.utime(os.path.join(path, name), (1.0e9, 1.0e9))
+    os.utime(root, (1.0e9, 1.0e9))
+
+
+def setOld(path):
+    os.utime(path, (1.1e9, 1.1e9))
+
+
+def test_dir_index_1(tmpdir):
+    """
+    Test that reconcile() only lists the directories that changed.
+    """
+    root = str(tmpdir.mkdir("data"))
+    makeTree(root)
+    index_file = str(tmpdir.join("index.db"))
+
+    index = dirIndex.DirIndex(root, index_file = index_file)
+    assert (index.reconcile() == 4)
+    assert (len(index.getFiles()) == 27)
+
+    # Nothing changed.
+    assert (index.reconcile() == 0)
+
+    # Add a file, this changes one directory.
+    with open(os.path.join(root, "day2", "movie_3.dax"), "w") as fp:
+        fp.write("data")
+    setOld(os.path.join(root, "day2"))
+    assert (index.reconcile() == 1)
+    assert (os.path.join("day2", "movie_3.dax") in index.getFiles())
+
+    # Remove a directory.
+    for name in os.listdir(os.path.join(root, "day1")):
+        os.remove(os.path.join(root, "day1", name))
+    os.rmdir(os.path.join(root, "day1"))
+    setOld(root)
+    assert (index.reconcile() == 1)
+    assert (len(index.getFiles()) == 19)
+
+    # The index is persistent.
+    index.close()
+    index = dirIndex.DirIndex(root, index_file = index_file)
+    assert (len(index.getFiles()) == 19)
+    assert (index.reconcile() == 0)
+
+
+def test_dir_index_2(tmpdir):
+    """
+    Test updates from (watchdog) events and the transferred state.
+    """
+    root = str(tmpdir.mkdir("data"))
+    makeTree(root)
+    index = dirIndex.DirIndex(root, index_file = str(tmpdir.join("index.db")))
+    index.reconcile()
+
+    # Mark a file as transferred.
+    dax_path = os.path.join("day2", "sample1", "movie_1.dax")
+    assert index.markTransferred(dax_path, "dest1", "1234", mtime = 1.0e9)
+    assert index.isTransferred(dax_path, "dest1")
+    assert not (dax_path in index.getFiles(destination = "dest1"))
+    assert (dax_path in index.getFiles())
+    assert (index.getTransferred("dest1") == [dax_path])
+
+    # Changing the file in place (does not change the directory) clears this.
+    with open(os.path.join(root, dax_path), "w") as fp:
+        fp.write("more data")
+    assert not index.markTransferred(dax_path, "dest1", "1234", mtime = 1.0e9)
+    index.update(os.path.join(root, dax_path))
+    assert index.isTransferred(dax_path, "dest1")
+    index.flush()
+    assert not index.isTransferred(dax_path, "dest1")
+    assert (dax_path in index.getFiles(destination = "dest1"))
+
+    # Deleted files and directories.
+    inf_path = os.path.join("day1", "movie_0.inf")
+    os.remove(os.path.join(root, inf_path))
+    index.update(os.path.join(root, inf_path))
+    index.flush()
+    assert not (inf_path in index.getFiles())
+    assert (len(index.getFiles()) == 26)
+
+    sample_dir = os.path.join(root, "day2", "sample1")
+    for name in os.listdir(sample_dir):
+        os.remove(os.path.join(sample_dir, name))
+    os.rmdir(sample_dir)
+    index.update(sample_dir)
+    index.flush()
+    assert (len(index.getFiles()) == 17)
+
+    # These changed day1 and day2.
+    assert (index.reconcile() == 2)
+    assert (len(index.getFiles()) == 17)
+
+
+def test_dir_index_3(tmpdir):
+    """
+    Test that the transferred state is kept for each destination.
+    """
+    root = str(tmpdir.mkdir("data"))
+    makeTree(root)
+    index_file = str(tmpdir.join("index.db"))
+    index = dirIndex.DirIndex(root, index_file = index_file)
+    index.reconcile()
+
+    paths = index.getFiles()
+    for path in paths[:10]:
+        assert index.markTransferred(path, "dest1", "1234")
+    for path in paths[5:15]:
+        assert index.markTransferred(path, "dest2", "1234")
+
+    assert (sorted(index.getFiles(destination = "dest1")) == sorted(paths[10:]))
+    assert (sorted(index.getFiles(destination = "dest2")) == sorted(paths[:5] + paths[15:]))
+    assert (len(index.getFiles(destination = "dest3")) == len(paths))
+    assert index.isTransferred(paths[0], "dest1")
+    assert not index.isTransferred(paths[0], "dest2")
+
+    # This is persistent.
+    index.close()
+    index = dirIndex.DirIndex(root, index_file = index_file)
+    assert (index.reconcile() == 0)
+    assert (sorted(index.getFiles(destination = "dest1")) == sorted(paths[10:]))
+    assert (sorted(index.getTransferred("dest2")) == sorted(paths[5:15]))
+
+    # Deleting a file also deletes it's transfers.
+    os.remove(os.path.join(root, paths[5]))
+    index.update(os.path.join(root, paths[5]))
+    index.flush()
+    assert not (paths[5] in index.getTransferred("dest1"))
+    assert (index.db.execute("SELECT COUNT(*) FROM transfers").fetchone()[0] == 18)
+    index.close()
+
+
+def test_dir_index_4(tmpdir):
+    """
+    Test that an index from an older version is rebuilt.
+    """
+    root = str(tmpdir.mkdir("data"))
+    makeTree(root)
+    index_file = str(tmpdir.join("index.db"))
+
+    db = sqlite3.connect(index_file)
+    db.execute("CREATE TABLE files (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, " +
+               "mtime INTEGER, checksum TEXT, transferred INTEGER)")
+    db.execute("CREATE TABLE dirs (path TEXT PRIMARY KEY, mtime INTEGER)")
+    db.commit()
+    db.close()
+
+    index = dirIndex.DirIndex(root, index_file = index_file)
+    assert (index.reconcile() == 4)
+    assert (len(index.getFiles(destination = "dest1")) == 27)
+    index.close()
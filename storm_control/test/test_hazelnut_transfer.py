@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Test the Hazelnut file transfer engine.
+"""
+import hashlib
+import os
+import time
+
+import storm_control.hazelnut.transferEngine as transferEngine
+
+
+def makeFile(filename, size):
+    data = os.urandom(size)
+    with open(filename, "wb") as fp:
+        fp.write(data)
+    return data
+
+
+def test_copy_file_1(tmpdir):
+    """
+    Test copying with progress and verification.
+    """
+    src = str(tmpdir.join("movie.dax"))
+    dest = str(tmpdir.join("copy.dax"))
+    data = makeFile(src, 5 * 1024 * 1024 + 17)
+    os.utime(src, (1.0e9, 1.0e9))
+
+    progress = []
+    checksum = transferEngine.copyFile(src, dest, callback = progress.append, chunk_size = 1024 * 1024)
+
+    with open(dest, "rb") as fp:
+        assert (fp.read() == data)
+    assert (checksum == hashlib.sha1(data).hexdigest())
+    assert (os.path.getmtime(dest) == 1.0e9)
+    assert not os.path.exists(dest + ".partial")
+    assert (progress == sorted(progress)) and (progress[-1] == 100) and (len(progress) > 5)
+
+
+def test_copy_file_2(tmpdir):
+    """
+    Test resuming from a partial copy, including a bad partial copy.
+    """
+    src = str(tmpdir.join("movie.dax"))
+    dest = str(tmpdir.join("copy.dax"))
+    data = makeFile(src, 4 * 1024 * 1024)
+    os.utime(src, (1.0e9, 1.0e9))
+
+    # Good partial copy, only the rest is copied.
+    with open(dest + ".partial", "wb") as fp:
+        fp.write(data[:3 * 1024 * 1024])
+    progress = []
+    transferEngine.copyFile(src, dest, callback = progress.append, chunk_size = 1024 * 1024)
+    with open(dest, "rb") as fp:
+        assert (fp.read() == data)
+    assert (progress == [100, 100])
+
+    # Bad partial copy, the copy starts again from the beginning.
+    os.remove(dest)
+    with open(dest + ".partial", "wb") as fp:
+        fp.write(b"x" * 1024)
+    progress = []
+    transferEngine.copyFile(src, dest, callback = progress.append, chunk_size = 1024 * 1024)
+    with open(dest, "rb") as fp:
+        assert (fp.read() == data)
+    assert (progress[0] < 50)
+
+
+def test_throttle_1(tmpdir):
+    """
+    Test transfer rate limiting.
+    """
+    src = str(tmpdir.join("movie.dax"))
+    makeFile(src, 2 * 1024 * 1024)
+
+    throttle = transferEngine.Throttle(rate = 10.0e6)
+    start = time.perf_counter()
+    transferEngine.copyFile(src, str(tmpdir.join("copy.dax")), chunk_size = 256 * 1024, throttle = throttle)
+    elapsed = time.perf_counter() - start
+    assert (elapsed > 0.15)
+
+
+class FakeDirObject(object):
+
+    def __init__(self, directory, **kwds):
+        super().__init__(**kwds)
+        self.directory = directory
+
+    def shouldTransfer(self, file_object):
+        return True
+
+    def transferFile(self, file_object, callback, throttle = None):
+        if file_object.getFullPathName().endswith(".bad"):
+            raise ValueError()
+        transferEngine.copyFile(file_object.getFullPathName(),
+                                os.path.join(self.directory, os.path.basename(file_object.getFullPathName())),
+                                callback = callback,
+                                chunk_size = 256 * 1024,
+                                throttle = throttle)
+
+
+class FakeFileObject(object):
+
+    def __init__(self, fullpath_name, **kwds):
+        super().__init__(**kwds)
+        self.fullpath_name = fullpath_name
+
+    def getFullPathName(self):
+        return self.fullpath_name
+
+
+class FakeTQItem(object):
+
+    def __init__(self, file_object, **kwds):
+        super().__init__(**kwds)
+        self.file_object = file_object
+
+    def getFileObject(self):
+        return self.file_object
+
+
+def test_transfer_engine_1(qtbot, tmpdir):
+    """
+    Test transferring several files with a pool of workers.
+    """
+    src_dir = tmpdir.mkdir("src")
+    dest_dir = tmpdir.mkdir("dest")
+
+    tr_engine = transferEngine.TransferEngine(max_workers = 3)
+    completed = []
+    tr_engine.transferComplete.connect(lambda x, y : completed.append([x, y]))
+
+    items = []
+    for i in range(6):
+        src = str(src_dir.join("movie_" + str(i) + ".dax"))
+        makeFile(src, 1024 * 1024)
+        items.append(FakeTQItem(FakeFileObject(src)))
+        tr_engine.transfer(FakeDirObject(str(dest_dir)), items[-1])
+    for name in ["missing.dax", "movie.bad"]:
+        items.append(FakeTQItem(FakeFileObject(str(src_dir.join(name)))))
+        tr_engine.transfer(FakeDirObject(str(dest_dir)), items[-1])
+
+    # Errors of any type are reported.
+    qtbot.waitUntil(tr_engine.isIdle, timeout = 5000)
+    assert (len(completed) == 8)
+    for [tq_item, error] in completed:
+        if (tq_item in items[-2:]):
+            assert error
+        else:
+            assert not error
+    assert (len(dest_dir.listdir()) == 6)
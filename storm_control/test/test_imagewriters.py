@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Tests of the image writers.
+"""
+import numpy
+import os
+
+import storm_control.sc_library.parameters as params
+
+import storm_control.hal4000.camera.cameraFunctionality as cameraFunctionality
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.film.filmSettings as filmSettings
+import storm_control.hal4000.halLib.imagewriters as imagewriters
+
+import storm_control.test as test
+
+
+def createCameraFunctionality(x_pixels, y_pixels):
+    parameters = params.StormXMLObject()
+    parameters.add(params.ParameterInt(name = "bytes_per_frame", value = 2 * x_pixels * y_pixels))
+    parameters.add(params.ParameterString(name = "extension", value = ""))
+    parameters.add(params.ParameterInt(name = "x_pixels", value = x_pixels))
+    parameters.add(params.ParameterInt(name = "y_pixels", value = y_pixels))
+    return cameraFunctionality.CameraFunctionality(camera_name = "camera1",
+                                                   parameters = parameters)
+
+def saveMovie(basename, writer_config, n_frames = 20, batch_size = 3):
+    x_pixels = 32
+    y_pixels = 16
+
+    cam_fn = createCameraFunctionality(x_pixels, y_pixels)
+    film_settings = filmSettings.FilmSettings(basename = os.path.join(test.dataDirectory(), basename),
+                                              filetype = ".dax")
+    writer = imagewriters.createFileWriter(cam_fn, film_settings, writer_config = writer_config)
+
+    images = []
+    frames = []
+    for i in range(n_frames):
+        image = numpy.random.randint(1000, size = (y_pixels, x_pixels)).astype(numpy.uint16)
+        images.append(image)
+        frames.append(frame.Frame(image.flatten(), i, x_pixels, y_pixels, "camera1"))
+        if (len(frames) == batch_size):
+            cam_fn.emitFrames(frames)
+            frames = []
+    cam_fn.emitFrames(frames)
+    cam_fn.stopped.emit()
+    writer.closeWriter()
+
+    movie = numpy.fromfile(film_settings.getBasename() + ".dax", dtype = numpy.uint16)
+    movie = movie.reshape((-1, y_pixels, x_pixels))
+    return [writer, images, movie]
+
+
+def test_writer_1():
+    """
+    Test saving frames without a writer thread.
+    """
+    [writer, images, movie] = saveMovie("writer_1", None)
+
+    assert not writer.isQueued()
+    assert (movie.shape[0] == len(images))
+    for i, image in enumerate(images):
+        assert numpy.array_equal(movie[i], image)
+
+
+def test_writer_2():
+    """
+    Test saving frames with a writer thread.
+    """
+    [writer, images, movie] = saveMovie("writer_2", {"queue_depth" : 4})
+
+    assert writer.isQueued()
+    assert (writer.getNumberDropped() == 0)
+    assert (movie.shape[0] == len(images))
+    for i, image in enumerate(images):
+        assert numpy.array_equal(movie[i], image)
+
+    with open(os.path.join(test.dataDirectory(), "writer_2.inf")) as inf_fp:
+        assert ("number of frames = 20" in inf_fp.read())
+
+
+def test_writer_3():
+    """
+    Test that dropped frames are counted and not saved.
+    """
+    [writer, images, movie] = saveMovie("writer_3", {"drop_frames" : True, "queue_depth" : 1}, n_frames = 200, batch_size = 1)
+
+    assert (writer.number_frames + writer.getNumberDropped() == len(images))
+    assert (movie.shape[0] == writer.number_frames)
+
+
+def test_frame_batch_1():
+    """
+    Test frame batch contiguous data.
+    """
+    frames = []
+    for i in range(3):
+        image = numpy.random.randint(1000, size = (8, 12)).astype(numpy.uint16)
+        frames.append(frame.Frame(image.flatten(), i, 12, 8, "camera1"))
+    frame_batch = frame.FrameBatch(frames)
+
+    assert (len(frame_batch) == 3)
+    assert (frame_batch.getLastFrameNumber() == 2)
+    assert (frame_batch.getData().shape == (3, 8, 12))
+    for i in range(3):
+        assert numpy.array_equal(frame_batch.getData()[i].flatten(), frames[i].getData())
+    
+
+if (__name__ == "__main__"):
+    test_writer_1()
+    test_writer_2()
+    test_writer_3()
+    test_frame_batch_1()
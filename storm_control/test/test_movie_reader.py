@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Tests of Steve's movie reader.
+"""
+import numpy
+import os
+import pytest
+
+import storm_control.steve.movieReader as movieReader
+
+import storm_control.test as test
+
+
+def saveDax(basename, movie, big_endian = False):
+    [n_frames, h, w] = movie.shape
+    if big_endian:
+        movie.astype(">u2").tofile(basename + ".dax")
+        endian = "big"
+    else:
+        movie.astype("<u2").tofile(basename + ".dax")
+        endian = "little"
+
+    with open(basename + ".inf", "w") as inf_fp:
+        inf_fp.write("data type = 16 bit integers (binary, " + endian + " endian)\n")
+        inf_fp.write("frame dimensions = " + str(w) + " x " + str(h) + "\n")
+        inf_fp.write("number of frames = " + str(n_frames) + "\n")
+    return basename + ".dax"
+
+
+def test_dax_reader_1():
+    """
+    Test loading frames with and without a memory map.
+    """
+    movie = numpy.random.randint(60000, size = (20, 16, 24)).astype(numpy.uint16)
+    for big_endian in [False, True]:
+        filename = saveDax(os.path.join(test.dataDirectory(), "reader_1"), movie, big_endian = big_endian)
+        for use_memmap in [False, True]:
+            with movieReader.DaxReader(filename, use_memmap = use_memmap) as dax:
+                assert (dax.filmSize() == [24, 16, 20])
+                assert numpy.array_equal(dax.loadAFrame(3), movie[3])
+                assert numpy.array_equal(dax.loadFrames(), movie)
+                assert numpy.array_equal(dax.loadFrames(2, 11), movie[2:11])
+                assert numpy.array_equal(dax.loadFrames(1, 19, 3), movie[1:19:3])
+                assert (dax.loadFrames(5, 11).dtype == numpy.uint16)
+
+
+def test_dax_reader_2():
+    """
+    Test averages and projections, using chunks that don't evenly divide the movie.
+    """
+    movie = numpy.random.randint(60000, size = (25, 16, 24)).astype(numpy.uint16)
+    filename = saveDax(os.path.join(test.dataDirectory(), "reader_2"), movie)
+    for use_memmap in [False, True]:
+        with movieReader.DaxReader(filename, use_memmap = use_memmap) as dax:
+            dax.chunk_size = 4 * 16 * 24 * 2
+
+            assert numpy.allclose(dax.averageFrames(), numpy.mean(movie, axis = 0))
+            assert numpy.allclose(dax.averageFrames(start = 3, end = 17), numpy.mean(movie[3:17], axis = 0))
+            assert numpy.array_equal(dax.projectFrames(projection = "max"), numpy.max(movie, axis = 0))
+            assert numpy.array_equal(dax.projectFrames(projection = "min"), numpy.min(movie, axis = 0))
+            assert numpy.allclose(dax.projectFrames(projection = "sum"), numpy.sum(movie, axis = 0, dtype = numpy.float64))
+
+
+def test_dax_reader_3():
+    """
+    Test truncated and empty movies.
+    """
+    movie = numpy.random.randint(60000, size = (10, 16, 24)).astype(numpy.uint16)
+    filename = saveDax(os.path.join(test.dataDirectory(), "reader_3"), movie)
+
+    # Truncate part way through the 7th frame.
+    with open(filename, "r+b") as fp:
+        fp.truncate(6 * 16 * 24 * 2 + 100)
+    for use_memmap in [False, True]:
+        with pytest.warns(UserWarning):
+            dax = movieReader.DaxReader(filename, use_memmap = use_memmap)
+        assert (dax.filmSize() == [24, 16, 6])
+        assert numpy.array_equal(dax.loadFrames(), movie[:6])
+        dax.close()
+
+    # Empty.
+    with open(filename, "r+b") as fp:
+        fp.truncate(0)
+    for use_memmap in [False, True]:
+        with pytest.raises(IOError):
+            movieReader.DaxReader(filename, use_memmap = use_memmap)
+
+
+if (__name__ == "__main__"):
+    test_dax_reader_1()
+    test_dax_reader_2()
+    test_dax_reader_3()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Test the numpy focus lock peak fitting.
+"""
+import numpy
+
+import storm_control.sc_hardware.utility.np_lock_peak_finder as npLPF
+
+
+def drawGaussian(shape, center_x, center_y, width_x, width_y, background = 20.0, height = 200.0):
+    [xi, yi] = numpy.indices(shape)
+    image = background + height * numpy.exp(-2.0 * (((center_x - xi)/width_x)**2 + ((center_y - yi)/width_y)**2))
+    return numpy.random.poisson(image).astype(numpy.float64)
+
+
+def test_gaussian_fitter_1():
+    """
+    Test that the results are the same as scipy.optimize.leastsq().
+    """
+    fitters = [[npLPF.GaussianFitter(shape = (24, 24), sigma = 8.0), npLPF.fitFixedEllipticalGaussian],
+               [npLPF.GaussianFitter(shape = (24, 24), sigma = 8.0, symmetric = True), npLPF.fitSymmetricGaussian]]
+    for i in range(10):
+        image = drawGaussian((24, 24),
+                             numpy.random.uniform(10.0, 14.0),
+                             numpy.random.uniform(10.0, 14.0),
+                             16.0,
+                             18.0)
+        for [fitter, fit_fn] in fitters:
+            [params, good, iterations] = fitter.fit(image)
+            [ls_params, ls_good] = fit_fn(image, 8.0)
+            assert good and ls_good
+            assert numpy.allclose(params[2:4], ls_params[2:4], atol = 1.0e-2)
+
+    # All of the fits should start from the previous fit.
+    for [fitter, fit_fn] in fitters:
+        assert (fitter.getStatistics() == [10, 0])
+
+
+def test_gaussian_fitter_2():
+    """
+    Test the moment estimate fallback.
+    """
+    fitter = npLPF.GaussianFitter(shape = (20, 20), sigma = 4.0)
+
+    # No signal.
+    [params, good, iterations] = fitter.fit(numpy.ones((20, 20)))
+    assert not good
+
+    # A single bright pixel can't be fit with a gaussian.
+    image = numpy.zeros((20, 20))
+    image[5, 7] = 100.0
+    [params, good, iterations] = fitter.fit(image, params = [0.0, 1.0, 15.0, 15.0, -1.0, 1.0])
+    assert good
+    assert numpy.allclose(params[2:4], [5.0, 7.0])
+    assert (fitter.getStatistics() == [2, 1])
+
+
+def test_lock_peak_finder_1():
+    """
+    Test finding and fitting a moving spot.
+    """
+    lpf = npLPF.LockPeakFinder(offset = 0.0, sigma = 6.0, threshold = 50)
+    for i in range(20):
+        center_x = 40.0 + 0.4 * i
+        center_y = 60.0 - 0.7 * i
+        image = drawGaussian((100, 120), center_x, center_y, 12.0, 12.0)
+        [x, y, success] = lpf.findFitPeak(image)
+        assert success
+        assert (abs(x - center_x) < 0.3)
+        assert (abs(y - center_y) < 0.3)
+
+    # No spot.
+    [x, y, success] = lpf.findFitPeak(numpy.random.poisson(20.0, size = (100, 120)))
+    assert not success
+
+
+def test_gaussian_fitter_3():
+    """
+    Test that a trial step doesn't overwrite the current Jacobian, and that
+    steps which collapse the widths are rejected without numpy warnings.
+    """
+    fitter = npLPF.GaussianFitter(shape = (20, 20), sigma = 4.0)
+    image = drawGaussian((20, 20), 9.5, 10.5, 6.0, 7.0)
+    params = numpy.array([20.0, 200.0, 9.0, 10.0, 6.0, 7.0])
+    [r1, j1] = fitter.residualAndJacobian(image, params, 0)
+    j1_copy = j1.copy()
+    [r2, j2] = fitter.residualAndJacobian(image, params + 1.0, 1)
+    assert not numpy.shares_memory(j1, j2)
+    assert numpy.allclose(j1, j1_copy)
+
+    # A very narrow spot, starting from widths that are much too large.
+    for i in range(20):
+        image = drawGaussian((20, 20),
+                             numpy.random.uniform(8.0, 12.0),
+                             numpy.random.uniform(8.0, 12.0),
+                             0.3,
+                             0.3,
+                             height = 2000.0)
+        with numpy.errstate(divide = "raise", invalid = "raise", over = "raise"):
+            [params, good, iterations] = fitter.fit(image, params = [20.0, 200.0, 10.0, 10.0, 8.0, 8.0])
+            assert good
+            assert numpy.all(numpy.isfinite(params))
+
+
+if (__name__ == "__main__"):
+    test_gaussian_fitter_1()
+    test_gaussian_fitter_2()
+    test_gaussian_fitter_3()
+    test_lock_peak_finder_1()
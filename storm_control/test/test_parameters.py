@@ -155,7 +155,67 @@ def test_parameters_8():
 
     assert(s1.getSortedAttrs() == ['dd', 'bb', 'aa', 'cc'])
 
-        
+
+def test_parameters_9():
+
+    # Load parameters.
+    p1 = params.parameters(test.xmlFilePathAndName("test_parameters.xml"), recurse = True)
+
+    # Copies share everything until it changes.
+    p2 = p1.copy()
+    assert (p2.getpShared("camera1") is p1.getpShared("camera1"))
+
+    # Setting the same value doesn't change anything.
+    p2.setv("camera1.exposure_time", 0.01)
+    assert (p2.getpShared("camera1") is p1.getpShared("camera1"))
+
+    # Change a value in p2, this only copies camera1.
+    p2.setv("camera1.flip_horizontal", True)
+    assert not p1.get("camera1.flip_horizontal")
+    assert (p2.getpShared("camera1") is not p1.getpShared("camera1"))
+    assert (p2.getpShared("camera1.exposure_time") is p1.getpShared("camera1.exposure_time"))
+    assert (p2.getpShared("display00") is p1.getpShared("display00"))
+    assert (params.difference(p2, p1) == ["camera1.flip_horizontal"])
+
+    # Changing p1 doesn't change p2.
+    p1.setv("display00.camera1.display_max", 200)
+    assert (p2.get("display00.camera1.display_max") == 300)
+    assert (params.difference(p1, p2) == ["camera1.flip_horizontal", "display00.camera1.display_max"])
+
+    # Parameters and sub-sections that were handed out are not shared.
+    c1 = p1.get("display00.camera1")
+    e1 = p1.getp("camera1.exposure_time")
+    p3 = p1.copy()
+    c1.set("colortable", "gray.ctbl")
+    e1.setv(0.1)
+    assert (p3.get("display00.camera1.colortable") == "idl5.ctbl")
+    assert (p3.get("camera1.exposure_time") == 0.01)
+
+    # Including changes to things that were handed out by the copy.
+    p3.get("display00").setv("feed_name", "camera2")
+    p3.getp("camera1.default_max").setv(100)
+    assert (p1.get("display00.feed_name") == "camera1")
+    assert (p1.get("camera1.default_max") == 300)
+
+
+def test_parameters_10():
+
+    # Load parameters.
+    p1 = params.parameters(test.xmlFilePathAndName("test_parameters.xml"), recurse = True)
+
+    # Only the sections with changed parameters are copied.
+    p2 = params.StormXMLObject()
+    p2.addSubSection("display00.camera1").add(params.ParameterInt(name = "display_max", value = 200))
+    p2.add(params.ParameterString(name = "test_param", value = "foo"))
+    [p3, ur] = params.copyParameters(p1, p2)
+
+    assert (len(ur) == 0)
+    assert (p3.get("display00.camera1.display_max") == 200)
+    assert (p3.getpShared("camera1") is p1.getpShared("camera1"))
+    assert (p3.getpShared("test_param") is p1.getpShared("test_param"))
+    assert (params.difference(p3, p1) == ["display00.camera1.display_max"])
+
+
 if (__name__ == "__main__"):
     test_parameters_1()
     test_parameters_2()
@@ -165,3 +225,5 @@ if (__name__ == "__main__"):
     test_parameters_6()
     test_parameters_7()
     test_parameters_8()
+    test_parameters_9()
+    test_parameters_10()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Test the RS232 class using the loopback device.
+"""
+import os
+import pytest
+import time
+
+if (os.name != "posix"):
+    pytest.skip("The loopback device needs a pseudo-terminal.", allow_module_level = True)
+
+import storm_control.sc_hardware.serial.loopback as loopback
+import storm_control.sc_hardware.serial.RS232 as RS232
+
+
+def test_rs232_1():
+    """
+    Test reading until the response terminator.
+    """
+    device = loopback.Loopback(responses = {"pos" : "1 2\r", "ver" : "1.0\r"})
+    rs232 = RS232.RS232(baudrate = 9600, port = device.getPort(), response_terminator = "\r")
+    assert rs232.getStatus()
+
+    start = time.perf_counter()
+    assert (rs232.commWithResp("pos") == "1 2\r")
+    assert (time.perf_counter() - start < 0.05)
+    assert (rs232.commWithResp("ver") == "1.0\r")
+
+    # No response.
+    start = time.perf_counter()
+    assert (rs232.commWithResp("foo") is None)
+    assert (time.perf_counter() - start >= rs232.response_timeout)
+
+    rs232.shutDown()
+    device.close()
+
+
+def test_rs232_2():
+    """
+    Test multi-line responses without a terminator.
+    """
+    device = loopback.Loopback(responses = {"?" : "a\rb\rc\r"})
+    rs232 = RS232.RS232(baudrate = 9600, port = device.getPort())
+    assert (rs232.commWithResp("?").split("\r")[:-1] == ["a", "b", "c"])
+
+    # waitResponse() returns everything that is available.
+    rs232.sendCommand("?")
+    assert (rs232.waitResponse() == "a\rb\rc\r")
+
+    rs232.shutDown()
+    device.close()
+
+
+def test_rs232_3():
+    """
+    Test responses that pause part way through.
+    """
+    def response(command):
+        os.write(device.master, b"echo\r")
+        time.sleep(0.04)
+        return "answer\r"
+
+    device = loopback.Loopback(responses = response)
+    rs232 = RS232.RS232(baudrate = 9600, port = device.getPort())
+    assert (rs232.commWithResp("?") == "echo\ranswer\r")
+    assert (rs232.commWithResp("?") == "echo\ranswer\r")
+
+    rs232.shutDown()
+    device.close()
+
+
+def test_rs232_4():
+    """
+    Test queued (pipelined) commands.
+    """
+    device = loopback.Loopback(delay = 1.0e-3, responses = lambda x: "ok " + x + "\r")
+    rs232 = RS232.RS232(baudrate = 9600, port = device.getPort(), response_terminator = "\r")
+
+    responses = []
+    futures = []
+    for i in range(20):
+        futures.append(rs232.commAsync(str(i), callback = responses.append))
+    assert ([future.result(timeout = 5.0) for future in futures] == ["ok " + str(i) + "\r" for i in range(20)])
+    assert (responses == ["ok " + str(i) + "\r" for i in range(20)])
+    assert (device.getCommands() == [str(i) for i in range(20)])
+
+    # Synchronous commands still work.
+    assert (rs232.commWithResp("a") == "ok a\r")
+
+    rs232.shutDown()
+    assert (rs232.io_thread is None)
+    device.close()
+
+
+def test_rs232_5():
+    """
+    Test that errors in the I/O thread are passed to the futures.
+    """
+    device = loopback.Loopback(responses = {"bad" : "\u00e9\r", "good" : "ok\r"})
+    rs232 = RS232.RS232(baudrate = 9600, encoding = "ascii", port = device.getPort(), response_terminator = "\r")
+
+    with pytest.raises(UnicodeDecodeError):
+        rs232.commAsync("bad").result(timeout = 5.0)
+    assert (rs232.commAsync("good").result(timeout = 5.0) == "ok\r")
+
+    rs232.shutDown()
+    device.close()
+
+
+def test_rs232_6():
+    """
+    Test that a driver with a fixed response terminator doesn't wait for
+    the response timeout.
+    """
+    import storm_control.sc_hardware.appliedScientificInstrumentation.tiger as tiger
+
+    device = loopback.Loopback(responses = {"WHO" : "At 1: Comm\rAt 2: X:XYMotor,Y:XYMotor\r\n",
+                                            "W X Y" : ":A 100 200 \r\n"})
+    controller = tiger.Tiger(baudrate = 9600, port = device.getPort())
+    assert controller.getStatus()
+
+    start = time.perf_counter()
+    for i in range(5):
+        assert (controller.position() == {"x" : 10.0, "y" : 20.0})
+    assert (time.perf_counter() - start < 5 * controller.response_timeout)
+
+    controller.shutDown()
+    device.close()
+
+
+if (__name__ == "__main__"):
+    test_rs232_1()
+    test_rs232_2()
+    test_rs232_3()
+    test_rs232_4()
+    test_rs232_5()
+    test_rs232_6()
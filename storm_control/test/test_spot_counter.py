@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Test the spot counter analysis engine.
+"""
+import numpy
+import pytest
+import pytestqt
+
+import storm_control.hal4000.camera.frame as frame
+import storm_control.hal4000.spotCounter.findSpots as findSpots
+import storm_control.hal4000.spotCounter.lmmObjectFinder as lof
+
+
+def makeImages(n_images, image_x, image_y, n_spots):
+    images = numpy.random.poisson(20, size = (n_images, image_y, image_x)).astype(numpy.uint16)
+    for i in range(n_images):
+        for j in range(n_spots):
+            x = numpy.random.randint(image_x)
+            y = numpy.random.randint(image_y)
+            images[i, max(0,y-1):y+2, max(0,x-1):x+2] += 300
+    return images
+
+
+def test_find_objects_batch_1():
+    """
+    Test that the batch version gives the same results as the C library
+    one frame at a time.
+    """
+    lof.initialize()
+    if lof.lmmoment is None:
+        pytest.skip("The C LMMoment library is not available.")
+
+    images = makeImages(6, 400, 300, 100)
+
+    # More objects than max_locs, and a saturated region.
+    images[2,10:290:10,10:390:10] += 500
+    images[4,:20,:20] = 65000
+
+    results = lof.findObjectsBatch(images, 5)
+    assert (len(results) == images.shape[0])
+    assert (results[2][2] == lof.max_locs)
+    for i in range(images.shape[0]):
+        a_frame = frame.Frame(images[i].flatten(), i, 400, 300, "na")
+        [x, y, n] = lof.findObjects(a_frame, 5)
+        assert (n == results[i][2])
+        assert numpy.array_equal(x, results[i][0])
+        assert numpy.array_equal(y, results[i][1])
+
+    lof.cleanUp()
+
+
+def test_spot_counter_1(qtbot):
+    """
+    Test analyzing frames in batches with the numpy engine.
+    """
+    images = makeImages(20, 64, 48, 10)
+    spot_counter = findSpots.SpotCounter(batch_size = 4,
+                                         engine = "numpy",
+                                         max_pending = 100,
+                                         max_threads = 2,
+                                         max_size = 10000)
+    analyzed = []
+    spot_counter.imageProcessed.connect(lambda x : analyzed.append(x))
+
+    frames = [frame.Frame(images[i].flatten(), i, 64, 48, "camera1") for i in range(20)]
+    spot_counter.newFramesToAnalyze("camera1", frames[:15], 50)
+    spot_counter.newFrameToAnalyze("camera1", frames[15], 50)
+    spot_counter.newFramesToAnalyze("camera1", frames[16:], 50)
+    qtbot.waitUntil(lambda : (len(analyzed) == 20), timeout = 2000)
+
+    analyzed = sorted(analyzed, key = lambda x : x.getFrameNumber())
+    for i, frame_analysis in enumerate(analyzed):
+        assert (frame_analysis.getCameraName() == "camera1")
+        assert (frame_analysis.getFrameNumber() == i)
+        [x, y, n] = lof.findObjects(frames[i], 50, use_numpy = True)
+        assert (frame_analysis.getCounts() == n)
+        assert numpy.array_equal(frame_analysis.getLocalizations()[0], x[:n])
+
+    spot_counter.cleanUp()
+    assert (spot_counter.dropped == 0)
+    assert (spot_counter.total == 20)
+
+
+def test_spot_counter_2():
+    """
+    Test the drop policies. There are no workers, so the queue fills up.
+    """
+    images = makeImages(10, 64, 48, 2)
+    frames = [frame.Frame(images[i].flatten(), i, 64, 48, "camera1") for i in range(10)]
+
+    for [policy, expected] in [["newest", [0, 1, 2, 3]], ["oldest", [6, 7, 8, 9]]]:
+        spot_counter = findSpots.SpotCounter(drop_policy = policy,
+                                             max_pending = 4,
+                                             max_threads = 0,
+                                             max_size = 10000)
+        spot_counter.newFramesToAnalyze("camera1", frames, 50)
+        assert ([x.getFrameNumber() for x in spot_counter.pending] == expected)
+        assert (spot_counter.dropped == 6)
+
+
+if (__name__ == "__main__"):
+    test_find_objects_batch_1()
+    test_spot_counter_2()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Tests of Steve's image items.
+"""
+import numpy
+import pytestqt
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+import storm_control.steve.coord as coord
+import storm_control.steve.imageItem as imageItem
+
+
+def test_pyramid_1(qtbot):
+    """
+    Test the level of detail pyramid.
+    """
+    numpy_data = numpy.random.randint(1000, size = (300, 516)).astype(numpy.uint16)
+    pyramid = imageItem.createPyramid(numpy_data)
+
+    assert (len(pyramid) == 4)
+    assert (pyramid[0] is numpy_data)
+    assert (pyramid[1].shape == (150, 258))
+    assert (pyramid[3].shape == (37, 64))
+    assert numpy.allclose(pyramid[1][10,20], numpy.mean(numpy_data[20:22,40:42]))
+
+
+def test_image_item_1(qtbot):
+    """
+    Test that the pixmaps are created at the right level of detail.
+    """
+    numpy_data = numpy.random.randint(1000, size = (300, 516)).astype(numpy.uint16)
+    image_item = imageItem.ImageItem(numpy_data = numpy_data,
+                                     objective_name = "obj1",
+                                     x_um = 0.0,
+                                     y_um = 0.0)
+    image_item.dataToPixmap(100, 900)
+    assert image_item.pyramid is None
+
+    pixmap = image_item.getPixmap(1.0)
+    assert (pixmap.width() == 516) and (pixmap.height() == 300)
+    assert (image_item.getSizeUm() == (coord.pixToUm(516), coord.pixToUm(300)))
+
+    pixmap = image_item.getPixmap(0.3)
+    assert (pixmap.width() == 258) and (pixmap.height() == 150)
+
+    # Check the rescaling.
+    image = pixmap.toImage().convertToFormat(QtGui.QImage.Format_Grayscale8)
+    expected = numpy.clip(255.0 * (image_item.pyramid[1] - 100.0)/800.0, 0.0, 255.0).astype(numpy.uint8)
+    assert (abs(image.pixelColor(10, 20).red() - int(expected[20,10])) <= 1)
+
+    # Check that the pixmaps are cached, and that contrast changes don't use old pixmaps.
+    assert (image_item.getPixmap(0.3).cacheKey() == pixmap.cacheKey())
+    image_item.setContrast(0, 1000)
+    assert (image_item.getPixmap(0.3).cacheKey() != pixmap.cacheKey())
+
+    # Check that the image is drawn.
+    scene = QtWidgets.QGraphicsScene()
+    scene.addItem(image_item.getGraphicsItem())
+    assert (scene.itemsBoundingRect().width() == 516)
+
+    q_image = QtGui.QImage(129, 75, QtGui.QImage.Format_RGB32)
+    q_image.fill(QtGui.QColor(255, 0, 0))
+    painter = QtGui.QPainter(q_image)
+    scene.render(painter, QtCore.QRectF(0, 0, 129, 75), scene.itemsBoundingRect())
+    painter.end()
+    assert (q_image.pixelColor(64, 37).red() == q_image.pixelColor(64, 37).green())
+
+
+if (__name__ == "__main__"):
+    app = QtWidgets.QApplication([])
+    test_pyramid_1(None)
+    test_image_item_1(None)
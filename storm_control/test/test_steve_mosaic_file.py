@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Tests of Steve's mosaic container file.
+"""
+import numpy
+import os
+import pytestqt
+
+from PyQt5 import QtWidgets
+
+import storm_control.steve.imageItem as imageItem
+import storm_control.steve.mosaicFile as mosaicFile
+import storm_control.steve.positions as positions
+import storm_control.steve.steveItems as steveItems
+
+import storm_control.test as test
+
+
+def test_mosaic_file_1():
+    """
+    Test writing, reading and appending.
+    """
+    filename = os.path.join(test.dataDirectory(), "mosaic_1.smc")
+    images = [numpy.random.randint(1000, size = (20, 30)).astype(numpy.uint16),
+              numpy.random.uniform(size = (10, 5)).astype(numpy.float32)]
+
+    with mosaicFile.MosaicFile(filename, mode = "w") as mf:
+        mf.addImage("image", images[0], {"x_um" : numpy.float64(1.5)})
+        mf.addItem("position", "1.00,2.00")
+
+    assert mosaicFile.isMosaicFile(filename)
+
+    with mosaicFile.MosaicFile(filename, mode = "a") as mf:
+        assert (mf.getNumberImages() == 1)
+        mf.setMetadata(0, {"x_um" : 2.5})
+        mf.addImage("image", images[1], {"x_um" : 3.5})
+        mf.addItem("position", "3.00,4.00")
+
+    with mosaicFile.MosaicFile(filename) as mf:
+        assert (mf.getItems() == [["position", "3.00,4.00"]])
+        assert ([x["metadata"]["x_um"] for x in mf.getImages()] == [2.5, 3.5])
+        for lazy in [False, True]:
+            loaded = mf.loadImages(lazy = lazy)
+            for i in range(len(images)):
+                assert (loaded[i].dtype == images[i].dtype)
+                assert numpy.array_equal(loaded[i], images[i])
+
+
+def test_mosaic_file_2():
+    """
+    Test that an interrupted append leaves the old index.
+    """
+    filename = os.path.join(test.dataDirectory(), "mosaic_2.smc")
+    image = numpy.arange(12, dtype = numpy.uint16).reshape(3, 4)
+
+    with mosaicFile.MosaicFile(filename, mode = "w") as mf:
+        mf.addImage("image", image, {"text" : "a" * 100})
+
+    mf = mosaicFile.MosaicFile(filename, mode = "a")
+    mf.setMetadata(0, {})
+    mf.addImage("image", image, {})
+    mf.close(write_index = False)
+
+    with mosaicFile.MosaicFile(filename) as mf:
+        assert (mf.getNumberImages() == 1)
+        assert (mf.getImages()[0]["metadata"] == {"text" : "a" * 100})
+        assert numpy.array_equal(mf.loadImage(mf.getImages()[0]), image)
+
+    with mosaicFile.MosaicFile(filename, mode = "a") as mf:
+        mf.setMetadata(0, {})
+
+    with mosaicFile.MosaicFile(filename) as mf:
+        assert (mf.getImages()[0]["metadata"] == {})
+        assert numpy.array_equal(mf.loadImage(mf.getImages()[0]), image)
+
+
+def test_mosaic_file_3(qtbot, monkeypatch):
+    """
+    Test saving and loading a mosaic with SteveItemsStore.
+    """
+    filename = os.path.join(test.dataDirectory(), "mosaic_3.smc")
+
+    def createStore():
+        item_store = steveItems.SteveItemsStore()
+        item_store.addLoader(imageItem.ImageItem.data_type, imageItem.ImageItemLoader())
+        item_store.addLoader(positions.PositionItem.data_type, positions.PositionItemLoader())
+        return item_store
+
+    def addImage(item_store, x_um):
+        numpy_data = numpy.random.randint(1000, size = (64, 48)).astype(numpy.uint16)
+        image_item = imageItem.ImageItem(numpy_data = numpy_data,
+                                         objective_name = "obj1",
+                                         x_um = x_um,
+                                         y_um = 0.0,
+                                         zvalue = 0.0)
+        image_item.dataToPixmap(100, 900)
+        item_store.addItem(image_item)
+        return numpy_data
+
+    item_store = createStore()
+    images = [addImage(item_store, 0.0), addImage(item_store, 10.0)]
+    item_store.saveMosaic(filename)
+    file_size = os.path.getsize(filename)
+
+    # Only the new image should be added.
+    images.append(addImage(item_store, 20.0))
+    item_store.saveMosaic(filename)
+    assert (os.path.getsize(filename) - file_size < 2 * images[2].nbytes)
+
+    # Aborting a save does not change the file.
+    with open(filename, "rb") as fp:
+        saved = fp.read()
+    addImage(item_store, 30.0)
+    for remove in [False, True]:
+        if remove:
+            item_store.removeItem(list(item_store.itemIterator(item_type = imageItem.ImageItem))[0].getItemID())
+        monkeypatch.setattr(QtWidgets.QProgressDialog, "wasCanceled", lambda x: True)
+        item_store.saveMosaic(filename)
+        monkeypatch.undo()
+        assert not os.path.exists(filename + ".tmp")
+        with open(filename, "rb") as fp:
+            assert (fp.read() == saved)
+
+    # Load.
+    item_store = createStore()
+    assert item_store.loadMosaic(filename)
+    image_items = list(item_store.itemIterator(item_type = imageItem.ImageItem))
+    assert (len(image_items) == 3)
+    for i, image_item in enumerate(image_items):
+        assert numpy.array_equal(image_item.numpy_data, images[i])
+        assert (image_item.getPosUm() == [10.0 * i, 0.0])
+        assert (image_item.getContrast() == [100, 900])
+
+    # Removing an image re-writes the whole file.
+    item_store.removeItem(image_items[0].getItemID())
+    item_store.saveMosaic(filename)
+    item_store = createStore()
+    assert item_store.loadMosaic(filename)
+    image_items = list(item_store.itemIterator(item_type = imageItem.ImageItem))
+    assert (len(image_items) == 2)
+    assert numpy.array_equal(image_items[0].numpy_data, images[1])
+
+
+if (__name__ == "__main__"):
+    app = QtWidgets.QApplication([])
+    test_mosaic_file_1()
+    test_mosaic_file_2()
+    test_mosaic_file_3(None)
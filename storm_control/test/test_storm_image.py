@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Test accumulating localizations into a STORM image.
+"""
+import numpy
+import os
+import tifffile
+
+import storm_control.hal4000.illumination.xmlParser as xmlParser
+import storm_control.hal4000.spotCounter.stormImage as stormImage
+
+import storm_control.test as test
+
+
+def test_storm_image_1():
+    """
+    Test that the image is the histogram of the localizations.
+    """
+    shutters_info = xmlParser.ShuttersInfo(color_data = [[255, 0, 0], None, [0, 255, 0]],
+                                           frames = 3)
+    storm_image = stormImage.STORMImage(batch_size = 100,
+                                        image_x = 100,
+                                        image_y = 70,
+                                        shutters_info = shutters_info,
+                                        tile_pixels = 16,
+                                        zoom = 4)
+    assert (storm_image.getColors() == [(255, 0, 0), (0, 255, 0)])
+
+    expected = [numpy.zeros((280, 400), dtype = numpy.uint32), numpy.zeros((280, 400), dtype = numpy.uint32)]
+    for i in range(30):
+        x = numpy.random.uniform(-1.0, 101.0, size = 50).astype(numpy.float32)
+        y = numpy.random.uniform(0.0, 70.0, size = 50).astype(numpy.float32)
+        x[0] = -1.0
+        y[0] = -1.0
+        storm_image.addLocalizations(i, [x, y])
+
+        if ((i%3) != 1):
+            ix = numpy.floor(x * 4).astype(int)
+            iy = numpy.floor(y * 4).astype(int)
+            mask = (x >= 0.0) & (ix < 400) & (iy < 280)
+            numpy.add.at(expected[(i%3)//2], (iy[mask], ix[mask]), 1)
+
+    assert (storm_image.getNumberLocalizations() == 1000)
+    for i, color in enumerate(storm_image.getColors()):
+        assert numpy.array_equal(storm_image.getImage(color), expected[i])
+
+        # The default preview is 2x the camera image size.
+        preview = storm_image.getPreview(color)
+        assert numpy.array_equal(preview, expected[i].reshape(140, 2, 200, 2).sum(axis = (1, 3)))
+
+    rgb = storm_image.getRGBPreview()
+    assert (rgb.shape == (140, 200, 3))
+    assert (numpy.max(rgb[:,:,2]) == 0)
+
+    storm_image.clear()
+    assert (numpy.max(storm_image.getImage((255, 0, 0))) == 0)
+
+
+def test_storm_image_2():
+    """
+    Test saving.
+    """
+    shutters_info = xmlParser.ShuttersInfo(color_data = [[255, 255, 255]], frames = 1)
+    storm_image = stormImage.STORMImage(image_x = 50,
+                                        image_y = 60,
+                                        shutters_info = shutters_info,
+                                        zoom = 3)
+
+    storm_image.addLocalizations(0, [numpy.array([1.0, 1.1, 40.0]), numpy.array([2.0, 2.1, 50.0])])
+
+    basename = os.path.join(test.dataDirectory(), "storm_image")
+    storm_image.save(basename)
+    image = tifffile.imread(basename + "_storm.tif")
+    assert (image.shape == (180, 150))
+    assert (image[6,3] == 2)
+    assert (image[150,120] == 1)
+    assert (numpy.sum(image) == 3)
+
+
+if (__name__ == "__main__"):
+    test_storm_image_1()
+    test_storm_image_2()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Test the asyncio TCP client with the stand-in server, and with the Qt server.
+"""
+import asyncio
+import pytestqt
+
+from PyQt5 import QtCore
+
+import storm_control.sc_library.tcpAsyncClient as tcpAsyncClient
+import storm_control.sc_library.tcpMessage as tcpMessage
+import storm_control.sc_library.tcpServer as tcpServer
+
+
+class FailingWriter(object):
+    """
+    A stream writer whose connection fails when it is drained.
+    """
+    def __init__(self, writer):
+        self.writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    async def drain(self):
+        raise ConnectionResetError("Connection lost.")
+
+
+def test_tcp_async_client_1():
+    """
+    Test the convenience methods and running several requests at once.
+    """
+    async def delayedHandler(message):
+        await asyncio.sleep(0.1 * message.getData("delay"))
+        message.addResponse("delay", message.getData("delay"))
+
+    async def run():
+        async with tcpAsyncClient.StandInServer() as server:
+            for binary in [False, True]:
+                async with tcpAsyncClient.TCPAsyncClient(port = server.getPort(), binary = binary) as hal:
+                    await hal.moveStage(10.0, 20.0)
+                    assert ((await hal.getStagePosition()) == [10.0, 20.0])
+
+                    response = await hal.takeMovie("movie", 100, test_mode = True)
+                    assert (response.getResponse("duration") == 1.0)
+
+                    try:
+                        await hal.takeMovie("movie", 0)
+                    except tcpAsyncClient.TCPAsyncClientException:
+                        pass
+                    else:
+                        assert False
+
+                    # Moves run concurrently on the same connection.
+                    await asyncio.gather(*[hal.moveStage(float(i), 0.0) for i in range(20)])
+                    assert (len(server.received) == 24 * (int(binary) + 1))
+
+                # Wait for the server to notice that the client disconnected.
+                while (server.n_clients > 0):
+                    await asyncio.sleep(0.01)
+
+        # Responses that arrive out of order, and timeouts.
+        async with tcpAsyncClient.StandInServer(handler = delayedHandler) as server:
+            async with tcpAsyncClient.TCPAsyncClient(port = server.getPort(), timeout = 2.0) as hal:
+                messages = [tcpMessage.TCPMessage(message_type = "Delay", message_data = {"delay" : x}) for x in [3, 1, 2]]
+                responses = await asyncio.gather(*[hal.sendMessage(x) for x in messages])
+                assert ([x.getResponse("delay") for x in responses] == [3, 1, 2])
+                assert ([x.getID() for x in responses] == [x.getID() for x in messages])
+
+                try:
+                    await hal.sendMessage(tcpMessage.TCPMessage(message_type = "Delay",
+                                                                message_data = {"delay" : 5}),
+                                          timeout = 0.1)
+                except tcpAsyncClient.TCPAsyncClientException:
+                    pass
+                else:
+                    assert False
+                assert (len(hal.pending) == 0)
+
+    asyncio.run(run())
+
+
+def test_tcp_async_client_2():
+    """
+    Test the connection pool.
+    """
+    async def run():
+        async with tcpAsyncClient.StandInServer() as server:
+            async with tcpAsyncClient.TCPAsyncClientPool() as pool:
+                clients = await asyncio.gather(*[pool.getClient(server.getPort()) for i in range(3)])
+                assert (clients[0] is clients[1]) and (clients[0] is clients[2])
+                await clients[0].moveStage(1.0, 2.0)
+
+                # A second connection is refused, like HAL.
+                async with tcpAsyncClient.TCPAsyncClient(port = server.getPort()) as other:
+                    try:
+                        await other.moveStage(1.0, 2.0, timeout = 2.0)
+                    except tcpAsyncClient.TCPAsyncClientException:
+                        pass
+                    else:
+                        assert False
+
+                # Re-connect after the connection is closed.
+                await clients[0].close()
+                client = await pool.getClient(server.getPort())
+                assert ((await client.getStagePosition()) == [1.0, 2.0])
+
+    asyncio.run(run())
+
+
+def test_tcp_async_client_4():
+    """
+    Test that a failed send does not leave the message pending.
+    """
+    async def run():
+        async with tcpAsyncClient.StandInServer() as server:
+            async with tcpAsyncClient.TCPAsyncClient(port = server.getPort()) as hal:
+                writer = hal.writer
+                hal.writer = FailingWriter(writer)
+                try:
+                    await hal.moveStage(1.0, 2.0)
+                except ConnectionResetError:
+                    pass
+                else:
+                    assert False
+                assert (len(hal.pending) == 0)
+                hal.writer = writer
+
+    asyncio.run(run())
+
+
+def test_tcp_async_client_5():
+    """
+    Test messages that are larger than the asyncio default stream limit,
+    and checking parameters.
+    """
+    def bigHandler(message):
+        if message.isType("Get Parameters"):
+            message.addResponse("parameters", "x" * 200000)
+        else:
+            server.handleMessage(message)
+
+    async def run():
+        nonlocal server
+        server = tcpAsyncClient.StandInServer(handler = bigHandler)
+        async with server:
+            async with tcpAsyncClient.TCPAsyncClient(port = server.getPort(), timeout = 5.0) as hal:
+                response = await hal.sendMessage(tcpMessage.TCPMessage(message_type = "Get Parameters",
+                                                                       message_data = {"parameters" : "y" * 100000}))
+                assert (len(response.getResponse("parameters")) == 200000)
+
+                response = await hal.checkParameters("default")
+                assert response.isTest()
+                assert (server.received[-1].getType() == "Set Parameters")
+
+    server = None
+    asyncio.run(run())
+
+
+def test_tcp_async_client_3(qtbot):
+    """
+    Test that the client works with the Qt server.
+    """
+    server = tcpServer.TCPServer(port = 9601, server_name = "Test")
+    server.messageReceived.connect(lambda x: server.sendMessage(x))
+
+    results = []
+    def runClient():
+        async def run():
+            async with tcpAsyncClient.TCPAsyncClient(port = 9601, binary = True, timeout = 5.0) as hal:
+                response = await hal.moveStage(1.0, 2.0)
+                results.append(response.getData("stage_y"))
+        asyncio.run(run())
+
+    # The client runs in a thread so that the Qt event loop can run.
+    thread = QtCore.QThread()
+    thread.run = runClient
+    thread.start()
+    qtbot.waitUntil(lambda : thread.isFinished(), timeout = 5000)
+    assert (results == [2.0])
+    server.close()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Test the framing of TCP messages and sending messages without waiting for responses.
+"""
+import pytestqt
+
+import storm_control.sc_library.tcpClient as tcpClient
+import storm_control.sc_library.tcpCommunications as tcpCommunications
+import storm_control.sc_library.tcpMessage as tcpMessage
+import storm_control.sc_library.tcpServer as tcpServer
+
+
+def test_tcp_binary_1():
+    """
+    Test the compact binary encoding.
+    """
+    message = tcpMessage.TCPMessage(message_type = "Move Stage",
+                                    message_data = {"stage_x" : 1.5,
+                                                    "stage_y" : -2,
+                                                    "big" : 2**70,
+                                                    "name" : "µm",
+                                                    "list" : [None, True, False, [1, 2], {"a" : "b"}]},
+                                    test_mode = True)
+    message.addResponse("duration", 2.0)
+    message.setError(True, "An error")
+
+    data = message.toBinary()
+    copy = tcpMessage.TCPMessage.fromBinary(data)
+    assert (copy.__dict__ == message.__dict__)
+    assert (len(data) < len(message.toJSON().encode("utf-8")))
+
+    for bad_data in [data[:-1], data + b"N", b"x"]:
+        try:
+            tcpMessage.TCPMessage.fromBinary(bad_data)
+        except tcpMessage.TCPMessageException:
+            pass
+        else:
+            assert False
+
+
+def test_tcp_frames_1():
+    """
+    Test splitting a stream of bytes into messages.
+    """
+    messages = [tcpMessage.TCPMessage(message_type = "Get Stage Position"),
+                tcpMessage.TCPMessage(message_type = "Move Stage",
+                                      message_data = {"stage_x" : 1.0, "stage_y" : 2.0})]
+
+    com = tcpCommunications.TCPCommunicationsMixin()
+    data = com.encodeMessage(messages[0]) + b"not json\n"
+    com.binary = True
+    data += com.encodeMessage(messages[1])
+    com.binary = False
+    data += com.encodeMessage(messages[0])
+
+    # Add the data a few bytes at a time.
+    received = []
+    for i in range(0, len(data), 7):
+        com.read_buffer += data[i:i+7]
+        received.extend(com.readFrames())
+
+    assert (len(com.read_buffer) == 0)
+    assert ([x.getID() for x in received] == [messages[0].getID(), messages[1].getID(), messages[0].getID()])
+    assert (received[1].getData("stage_y") == 2.0)
+
+
+def test_tcp_pipeline_1(qtbot):
+    """
+    Test sending messages without waiting for responses, with the
+    responses arriving in a different order.
+    """
+    for binary in [False, True]:
+        server = tcpServer.TCPServer(port = 9600, server_name = "Test")
+        client = tcpClient.TCPClient(port = 9600, server_name = "Test", binary = binary)
+
+        server_received = []
+        server.messageReceived.connect(lambda x: server_received.append(x))
+        client_received = []
+        client.messageReceived.connect(lambda x: client_received.append(x))
+
+        assert client.startCommunication()
+        messages = []
+        for i in range(5):
+            messages.append(tcpMessage.TCPMessage(message_type = "Move Stage",
+                                                  message_data = {"stage_x" : float(i), "stage_y" : 0.0}))
+            client.sendMessage(messages[-1])
+        qtbot.waitUntil(lambda : (len(server_received) == 5), timeout = 2000)
+        assert (server.binary == binary)
+
+        for message in reversed(server_received):
+            message.addResponse("x", message.getData("stage_x"))
+            server.sendMessage(message)
+        qtbot.waitUntil(lambda : (len(client_received) == 5), timeout = 2000)
+
+        responses = {x.getID() : x for x in client_received}
+        for message in messages:
+            assert (responses[message.getID()].getResponse("x") == message.getData("stage_x"))
+
+        client.stopCommunication()
+        qtbot.waitUntil(lambda : not server.isConnected(), timeout = 2000)
+        server.close()